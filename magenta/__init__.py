@@ -36,7 +36,9 @@ import magenta.pipelines.lead_sheet_pipelines
 import magenta.pipelines.melody_pipelines
 import magenta.pipelines.note_sequence_pipelines
 import magenta.pipelines.pipeline
+import magenta.pipelines.pipeline_cache
 import magenta.pipelines.pipelines_common
+import magenta.pipelines.profiling
 import magenta.pipelines.statistics
 import magenta.version
 from magenta.version import __version__
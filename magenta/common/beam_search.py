@@ -25,7 +25,8 @@ BeamEntry = collections.namedtuple('BeamEntry', ['sequence', 'state', 'score'])
 
 
 def _generate_branches(beam_entries, generate_step_fn, branch_factor,
-                       num_steps):
+                       num_steps, copy_sequence_fn=copy.deepcopy,
+                       copy_state_fn=copy.deepcopy, reuse_entries=True):
   """Performs a single iteration of branch generation for beam search.
 
   This method generates `branch_factor` branches for each sequence in the beam,
@@ -42,21 +43,29 @@ def _generate_branches(beam_entries, generate_step_fn, branch_factor,
         and scores in place, but should also return the modified values.
     branch_factor: The integer branch factor to use.
     num_steps: The integer number of steps to take per branch.
+    copy_sequence_fn: A function that returns a copy of a sequence that can be
+        extended without modifying the original.
+    copy_state_fn: A function that returns a copy of a state that can be
+        updated without modifying the original.
+    reuse_entries: If True, the first branch of each beam entry extends the
+        entry's own sequence and state in place rather than a copy. This is
+        safe when no other beam entry refers to them.
 
   Returns:
     The updated beam, with `branch_factor` times as many BeamEntry tuples.
   """
-  if branch_factor > 1:
-    branched_entries = beam_entries * branch_factor
-    all_sequences = [copy.deepcopy(entry.sequence)
-                     for entry in branched_entries]
-    all_states = [copy.deepcopy(entry.state) for entry in branched_entries]
-    all_scores = [entry.score for entry in branched_entries]
-  else:
-    # No need to make copies if there's no branching.
-    all_sequences = [entry.sequence for entry in beam_entries]
-    all_states = [entry.state for entry in beam_entries]
-    all_scores = [entry.score for entry in beam_entries]
+  all_sequences = []
+  all_states = []
+  all_scores = []
+  for branch in range(branch_factor):
+    for entry in beam_entries:
+      if branch == 0 and reuse_entries:
+        all_sequences.append(entry.sequence)
+        all_states.append(entry.state)
+      else:
+        all_sequences.append(copy_sequence_fn(entry.sequence))
+        all_states.append(copy_state_fn(entry.state))
+      all_scores.append(entry.score)
 
   for _ in range(num_steps):
     all_sequences, all_states, all_scores = generate_step_fn(
@@ -75,7 +84,8 @@ def _prune_branches(beam_entries, k):
 
 
 def beam_search(initial_sequence, initial_state, generate_step_fn, num_steps,
-                beam_size, branch_factor, steps_per_iteration):
+                beam_size, branch_factor, steps_per_iteration,
+                copy_sequence_fn=copy.deepcopy, copy_state_fn=copy.deepcopy):
   """Generates a sequence using beam search.
 
   Initially, the beam is filled with `beam_size` copies of the initial sequence.
@@ -108,26 +118,36 @@ def beam_search(initial_sequence, initial_state, generate_step_fn, num_steps,
     beam_size: The integer beam size to use.
     branch_factor: The integer branch factor to use.
     steps_per_iteration: The integer number of steps to take per iteration.
+    copy_sequence_fn: A function that returns a copy of a sequence that can be
+        extended without modifying the original. Copies are only made when a
+        sequence in the beam branches, and each sequence surviving a pruning
+        phase is extended in place by one of its branches. Defaults to
+        `copy.deepcopy`; a function that shares immutable events between
+        copies can be much faster for long sequences.
+    copy_state_fn: A function that returns a copy of a state that can be
+        updated without modifying the original. Defaults to `copy.deepcopy`.
+        States that `generate_step_fn` replaces rather than modifies in place
+        do not need to be copied deeply.
 
   Returns:
     A tuple containing a) the highest-scoring sequence as computed by the beam
     search, b) the state corresponding to this sequence, and c) the score of
     this sequence.
   """
-  sequences = [copy.deepcopy(initial_sequence) for _ in range(beam_size)]
-  states = [copy.deepcopy(initial_state) for _ in range(beam_size)]
-  scores = [0] * beam_size
-
-  beam_entries = [BeamEntry(sequence, state, score)
-                  for sequence, state, score
-                  in zip(sequences, states, scores)]
+  # The beam starts as `beam_size` identical entries, so branching a single
+  # entry `beam_size * branch_factor` times is equivalent and avoids copying
+  # the initial sequence `beam_size` extra times. The caller's sequence and
+  # state are copied rather than extended in place.
+  beam_entries = [BeamEntry(initial_sequence, initial_state, 0)]
 
   # Choose the number of steps for the first iteration such that subsequent
   # iterations can all take the same number of steps.
   first_iteration_num_steps = (num_steps - 1) % steps_per_iteration + 1
 
   beam_entries = _generate_branches(
-      beam_entries, generate_step_fn, branch_factor, first_iteration_num_steps)
+      beam_entries, generate_step_fn, beam_size * branch_factor,
+      first_iteration_num_steps, copy_sequence_fn=copy_sequence_fn,
+      copy_state_fn=copy_state_fn, reuse_entries=False)
 
   num_iterations = (num_steps -
                     first_iteration_num_steps) // steps_per_iteration
@@ -135,7 +155,8 @@ def beam_search(initial_sequence, initial_state, generate_step_fn, num_steps,
   for _ in range(num_iterations):
     beam_entries = _prune_branches(beam_entries, k=beam_size)
     beam_entries = _generate_branches(
-        beam_entries, generate_step_fn, branch_factor, steps_per_iteration)
+        beam_entries, generate_step_fn, branch_factor, steps_per_iteration,
+        copy_sequence_fn=copy_sequence_fn, copy_state_fn=copy_state_fn)
 
   # Prune to the single best beam entry.
   beam_entry = _prune_branches(beam_entries, k=1)[0]
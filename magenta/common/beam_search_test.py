@@ -85,6 +85,38 @@ class BeamSearchTest(tf.test.TestCase):
     self.assertEqual(state, 1)
     self.assertEqual(score, 16)
 
+  def testInitialSequenceNotModified(self):
+    initial_sequence = [0]
+    sequence, _, _ = beam_search(
+        initial_sequence=initial_sequence, initial_state=1,
+        generate_step_fn=self._generate_step_fn, num_steps=3, beam_size=2,
+        branch_factor=2, steps_per_iteration=1)
+
+    self.assertEqual(initial_sequence, [0])
+    self.assertLen(sequence, 4)
+
+  def testCopyFunctions(self):
+    num_copies = [0]
+
+    def copy_sequence_fn(sequence):
+      num_copies[0] += 1
+      return list(sequence)
+
+    expected = beam_search(
+        initial_sequence=[], initial_state=1,
+        generate_step_fn=self._generate_step_fn, num_steps=5, beam_size=32,
+        branch_factor=2, steps_per_iteration=1)
+    actual = beam_search(
+        initial_sequence=[], initial_state=1,
+        generate_step_fn=self._generate_step_fn, num_steps=5, beam_size=32,
+        branch_factor=2, steps_per_iteration=1,
+        copy_sequence_fn=copy_sequence_fn, copy_state_fn=lambda state: state)
+
+    self.assertEqual(actual, expected)
+    # Every branch of the initial sequence is a copy. After that, only one of
+    # the two branches of each of the 32 surviving entries is a copy.
+    self.assertEqual(num_copies[0], 64 + 4 * 32)
+
 
 if __name__ == '__main__':
   tf.test.main()
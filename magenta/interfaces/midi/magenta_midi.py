@@ -104,6 +104,11 @@ tf.app.flags.DEFINE_boolean(
     'allow_overlap',
     False,
     'Whether to allow the call to overlap with the response.')
+tf.app.flags.DEFINE_boolean(
+    'anticipate_response',
+    True,
+    'Whether to generate responses in the background while listening, so '
+    'that they are ready as soon as the call ends.')
 tf.app.flags.DEFINE_boolean(
     'enable_metronome',
     True,
@@ -373,7 +378,8 @@ def main(unused_argv):
       tempo_control_number=control_map['tempo'],
       temperature_control_number=control_map['temperature'],
       loop_control_number=control_map['loop'],
-      state_control_number=control_map['state'])
+      state_control_number=control_map['state'],
+      anticipate_response=FLAGS.anticipate_response)
 
   _print_instructions()
 
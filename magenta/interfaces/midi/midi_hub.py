@@ -17,9 +17,11 @@
 # TODO(adarob): Use flattened imports.
 
 import abc
+import bisect
 import collections
+import heapq
+from multiprocessing import pool as multiprocessing_pool
 import queue
-import re
 import threading
 import time
 
@@ -37,6 +39,15 @@ _DEFAULT_METRONOME_MESSAGES = [
     mido.Message(type='note_on', note=35, velocity=64),
 ]
 _DEFAULT_METRONOME_CHANNEL = 1
+# How long before a tick the metronome hands it to the scheduler.
+_METRONOME_SCHEDULE_AHEAD = 0.05
+
+# Messages due within this many seconds are sent together by the scheduler,
+# which spins until the send time of each.
+_DEFAULT_SCHEDULER_LOOKAHEAD = 0.002
+# Upper edges in seconds of the default latency histogram bins.
+_DEFAULT_LATENCY_BIN_EDGES = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
 
 # 0-indexed.
 _DRUM_CHANNEL = 9
@@ -150,6 +161,31 @@ class MidiSignal(object):
     self._type = type_
     self._inferred_types = inferred_types
 
+    # Compile the signal into the message types it matches and the values they
+    # must have, for matching without formatting messages as strings.
+    if msg is not None:
+      value_names = mido.messages.SPEC_BY_TYPE[msg.type]['value_names']
+      self._match_types = frozenset([msg.type])
+      self._match_values = tuple(
+          (name, getattr(msg, name)) for name in value_names)
+    else:
+      value_names = mido.messages.SPEC_BY_TYPE[inferred_types[0]][
+          'value_names']
+      if type_ is not None:
+        self._match_types = frozenset([type_])
+      else:
+        # Any type with the same values matches the wildcard type.
+        self._match_types = frozenset(
+            name for name, spec in mido.messages.SPEC_BY_TYPE.items()
+            if spec['value_names'] == value_names)
+      self._match_values = tuple(
+          (name, kwargs[name]) for name in value_names if name in kwargs)
+    match_values = dict(self._match_values)
+    self._dispatch_keys = tuple(
+        (type_name, match_values.get('channel'),
+         match_values.get('note', match_values.get('control')))
+        for type_name in sorted(self._match_types))
+
   def to_message(self):
     """Returns a message using the signal's specifications, if possible."""
     if self._msg:
@@ -158,6 +194,23 @@ class MidiSignal(object):
       raise MidiHubError('Cannot build message if type is not inferrable.')
     return mido.Message(self._type, **self._kwargs)
 
+  def matches(self, msg):
+    """Returns whether the mido.Message matches the signal, ignoring time."""
+    if msg.type not in self._match_types:
+      return False
+    for name, value in self._match_values:
+      if getattr(msg, name) != value:
+        return False
+    return True
+
+  def dispatch_keys(self):
+    """Returns the dispatch keys of the messages the signal may match.
+
+    Each key is a (type, channel, note or control number) tuple where the
+    channel and number are None if the signal matches any value.
+    """
+    return self._dispatch_keys
+
   def __str__(self):
     """Returns a regex pattern for matching against a mido.Message string."""
     if self._msg is not None:
@@ -176,9 +229,313 @@ class MidiSignal(object):
     return regex_pattern
 
 
+def _message_dispatch_keys(msg):
+  """Returns the dispatch keys under which signals matching `msg` are found."""
+  channel = getattr(msg, 'channel', None)
+  number = getattr(msg, 'note', getattr(msg, 'control', None))
+  keys = [(msg.type, None, None)]
+  if channel is not None:
+    keys.append((msg.type, channel, None))
+  if number is not None:
+    keys.append((msg.type, None, number))
+    if channel is not None:
+      keys.append((msg.type, channel, number))
+  return keys
+
+
+class _MidiSignalTable(object):
+  """A dispatch table from MidiSignals to values.
+
+  Signals are indexed by their dispatch keys, so that finding the signals that
+  match a message only checks signals of the same type, channel and note or
+  control number. Signals are identified by their string pattern, so equal
+  signals share an entry.
+
+  Not thread-safe.
+  """
+
+  def __init__(self):
+    # A dictionary mapping signal patterns to (signal, value) tuples, in order
+    # of insertion.
+    self._entries = collections.OrderedDict()
+    # A dictionary mapping dispatch keys to the set of patterns of the signals
+    # under the key.
+    self._index = collections.defaultdict(set)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, signal, default=None):
+    """Returns the value for the signal, or `default` if there is none."""
+    entry = self._entries.get(str(signal))
+    return default if entry is None else entry[1]
+
+  def set(self, signal, value):
+    """Sets the value for the signal."""
+    pattern = str(signal)
+    if pattern not in self._entries:
+      for key in signal.dispatch_keys():
+        self._index[key].add(pattern)
+    self._entries[pattern] = (signal, value)
+
+  def _pop_pattern(self, pattern):
+    signal, value = self._entries.pop(pattern)
+    for key in signal.dispatch_keys():
+      patterns = self._index[key]
+      patterns.discard(pattern)
+      if not patterns:
+        del self._index[key]
+    return value
+
+  def pop(self, signal):
+    """Removes and returns the value for the signal."""
+    return self._pop_pattern(str(signal))
+
+  def pop_all(self):
+    """Removes all signals, returning their values."""
+    values = [value for _, value in self._entries.values()]
+    self._entries.clear()
+    self._index.clear()
+    return values
+
+  def pop_matching(self, msg):
+    """Removes the signals that match the message, returning their values.
+
+    Args:
+      msg: The mido.Message to match.
+
+    Returns:
+      The values of the matching signals, in the order they were added.
+    """
+    if not self._entries:
+      return []
+    candidates = set()
+    for key in _message_dispatch_keys(msg):
+      patterns = self._index.get(key)
+      if patterns:
+        candidates.update(patterns)
+    if not candidates:
+      return []
+    matched = [pattern for pattern in self._entries
+               if pattern in candidates and
+               self._entries[pattern][0].matches(msg)]
+    return [self._pop_pattern(pattern) for pattern in matched]
+
+
+class LatencyStats(object):
+  """A thread-safe summary and histogram of recorded latencies.
+
+  Args:
+    max_samples: The number of most recent latencies to summarize.
+    bin_edges: The ascending upper edges in float seconds of the histogram
+        bins. A last bin counts the latencies above the last edge.
+  """
+
+  def __init__(self, max_samples=1000, bin_edges=_DEFAULT_LATENCY_BIN_EDGES):
+    self._lock = threading.Lock()
+    self._latencies = collections.deque(maxlen=max_samples)
+    self._count = 0
+    self._max = 0.0
+    self._bin_edges = tuple(bin_edges)
+    self._bin_counts = [0] * (len(self._bin_edges) + 1)
+
+  def add(self, latency):
+    """Records a latency in float seconds."""
+    with self._lock:
+      self._latencies.append(latency)
+      self._count += 1
+      self._max = max(self._max, latency)
+      self._bin_counts[bisect.bisect_left(self._bin_edges, latency)] += 1
+
+  def histogram(self):
+    """Returns the histogram of all recorded latencies.
+
+    Returns:
+      A list of (upper_edge, count) tuples, one per bin in ascending order,
+      where the last upper edge is infinity.
+    """
+    with self._lock:
+      return list(zip(self._bin_edges + (float('inf'),), self._bin_counts))
+
+  def summary(self):
+    """Returns a dictionary summarizing the recorded latencies.
+
+    Returns:
+      A dictionary with the total 'count' and 'max' of all recorded latencies,
+      and the 'mean', 'p50', 'p90' and 'p99' of the most recent ones, all in
+      float seconds. The summary values are 0.0 if nothing was recorded.
+    """
+    with self._lock:
+      latencies = sorted(self._latencies)
+      count = self._count
+      max_latency = self._max
+    summary = {'count': count, 'max': max_latency}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+      summary[name] = (
+          latencies[min(int(fraction * len(latencies)), len(latencies) - 1)]
+          if latencies else 0.0)
+    summary['mean'] = sum(latencies) / len(latencies) if latencies else 0.0
+    return summary
+
+
+class _ScheduledMessage(object):
+  """A message waiting in a MidiScheduler to be sent."""
+
+  __slots__ = ['send_time', 'outport', 'msg', 'on_send', 'cancelled']
+
+  def __init__(self, send_time, outport, msg, on_send):
+    self.send_time = send_time
+    self.outport = outport
+    self.msg = msg
+    self.on_send = on_send
+    self.cancelled = False
+
+
+class MidiScheduler(threading.Thread):
+  """A thread that sends MIDI messages at their scheduled wall times.
+
+  Keeps the pending messages of all players and metronomes in a single
+  min-heap. Waits on a condition variable until the next message is due within
+  `lookahead` seconds, then pops all messages due by then and spins until the
+  send time of each. The lateness of each sent message relative to its
+  scheduled time is recorded in `lateness_stats`.
+
+  Args:
+    lookahead: The float time in seconds before their send time that messages
+        are popped and sent together.
+  """
+  daemon = True
+
+  def __init__(self, lookahead=_DEFAULT_SCHEDULER_LOOKAHEAD):
+    self._lookahead = lookahead
+    self._lock = threading.Lock()
+    self._wake_cv = threading.Condition(self._lock)
+    # A min-heap of (send_time, sequence number, _ScheduledMessage) tuples.
+    # The sequence number keeps messages with the same time in order.
+    self._heap = []
+    self._sequence_number = 0
+    self._stopped = False
+    self._lateness_stats = LatencyStats()
+    super(MidiScheduler, self).__init__()
+
+  @property
+  def lateness_stats(self):
+    """The LatencyStats of the actual minus the scheduled send times."""
+    return self._lateness_stats
+
+  def schedule(self, outport, msg, send_time, on_send=None):
+    """Schedules a message to be sent.
+
+    Args:
+      outport: The Mido port to send the message on.
+      msg: The mido.Message to send.
+      send_time: The float wall time in seconds to send the message at. Past
+          times are sent immediately.
+      on_send: An optional function called with the returned handle in the
+          scheduler thread right after the message is sent. Must not block.
+
+    Returns:
+      A handle to the scheduled message that can be passed to `cancel`.
+    """
+    scheduled = _ScheduledMessage(send_time, outport, msg, on_send)
+    with self._lock:
+      heapq.heappush(self._heap, (send_time, self._sequence_number, scheduled))
+      self._sequence_number += 1
+      if self._heap[0][2] is scheduled:
+        self._wake_cv.notify()
+    return scheduled
+
+  def cancel(self, scheduled_messages):
+    """Cancels scheduled messages that have not been sent yet.
+
+    Args:
+      scheduled_messages: An iterable of handles returned by `schedule`.
+
+    Returns:
+      The list of handles that were cancelled before being sent.
+    """
+    cancelled = []
+    with self._lock:
+      for scheduled in scheduled_messages:
+        # Sent messages have their outport cleared.
+        if not scheduled.cancelled and scheduled.outport is not None:
+          scheduled.cancelled = True
+          cancelled.append(scheduled)
+    return cancelled
+
+  def stop(self, block=True):
+    """Stops the thread without sending the pending messages.
+
+    Args:
+      block: If true, blocks until thread terminates.
+    """
+    with self._lock:
+      self._stopped = True
+      self._wake_cv.notify()
+    if block:
+      self.join()
+
+  def _pop_due(self):
+    """Waits until messages are due and pops them, or returns None on stop."""
+    with self._lock:
+      while not self._stopped:
+        if self._heap:
+          timeout = self._heap[0][0] - self._lookahead - time.time()
+          if timeout <= 0:
+            break
+        else:
+          timeout = None
+        self._wake_cv.wait(timeout)
+      if self._stopped:
+        return None
+      due_time = time.time() + self._lookahead
+      batch = []
+      while self._heap and self._heap[0][0] <= due_time:
+        scheduled = heapq.heappop(self._heap)[2]
+        if not scheduled.cancelled:
+          batch.append(scheduled)
+      return batch
+
+  def run(self):
+    """Sends messages at their scheduled times until stopped."""
+    while True:
+      batch = self._pop_due()
+      if batch is None:
+        break
+      for scheduled in batch:
+        while time.time() < scheduled.send_time:
+          time.sleep(0)
+        with self._lock:
+          if scheduled.cancelled:
+            continue
+          outport = scheduled.outport
+          scheduled.outport = None
+        self._lateness_stats.add(time.time() - scheduled.send_time)
+        outport.send(scheduled.msg)
+        if scheduled.on_send is not None:
+          scheduled.on_send(scheduled)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def _get_default_scheduler():
+  """Returns the running MidiScheduler shared by players without a hub."""
+  global _default_scheduler
+  with _default_scheduler_lock:
+    if _default_scheduler is None:
+      _default_scheduler = MidiScheduler()
+      _default_scheduler.start()
+    return _default_scheduler
+
+
 class Metronome(threading.Thread):
   """A thread implementing a MIDI metronome.
 
+  Ticks are handed to a MidiScheduler shortly before they are due, which sends
+  them and their ends at the precise times.
+
   Args:
     outport: The Mido port for sending messages.
     qpm: The integer quarters per minute to signal on.
@@ -193,6 +550,8 @@ class Metronome(threading.Thread):
         used in place of a MidiSignal to output nothing on a given tick.
     duration: The duration of the metronome's tick.
     channel: The MIDI channel to output on.
+    scheduler: The running MidiScheduler to send messages with, or None to use
+        one shared by all players created without one.
   """
   daemon = True
 
@@ -204,8 +563,16 @@ class Metronome(threading.Thread):
                program=_DEFAULT_METRONOME_PROGRAM,
                signals=None,
                duration=_DEFAULT_METRONOME_TICK_DURATION,
-               channel=None):
+               channel=None,
+               scheduler=None):
     self._outport = outport
+    self._scheduler = scheduler or _get_default_scheduler()
+    self._cv = threading.Condition()
+    # The scheduled ticks that have not been sent yet.
+    self._pending_ticks = set()
+    # The number of scheduled messages that are neither sent nor cancelled.
+    self._num_outstanding = 0
+    self._last_tick_time = float('-inf')
     self.update(
         qpm, start_time, stop_time, program, signals, duration, channel)
     super(Metronome, self).__init__()
@@ -219,50 +586,80 @@ class Metronome(threading.Thread):
              duration=_DEFAULT_METRONOME_TICK_DURATION,
              channel=None):
     """Updates Metronome options."""
-    # Locking is not required since variables are independent and assignment is
-    # atomic.
-    self._channel = _DEFAULT_METRONOME_CHANNEL if channel is None else channel
+    with self._cv:
+      self._channel = (
+          _DEFAULT_METRONOME_CHANNEL if channel is None else channel)
+
+      # Set the program number for the channels.
+      self._outport.send(
+          mido.Message(
+              type='program_change', program=program, channel=self._channel))
+      self._period = 60. / qpm
+      self._start_time = start_time
+      self._stop_time = stop_time
+      if signals is None:
+        self._messages = _DEFAULT_METRONOME_MESSAGES
+      else:
+        self._messages = [s.to_message() if s else None for s in signals]
+      self._duration = duration
+      self._cv.notify()
+
+  def _tick_sent(self, scheduled_tick):
+    """Schedules the end of a sent tick. Called by the scheduler."""
+    with self._cv:
+      self._pending_ticks.discard(scheduled_tick)
+      tick_message = scheduled_tick.msg
+      if tick_message.type == 'note_on':
+        end_tick_message = mido.Message(
+            'note_off', note=tick_message.note, channel=tick_message.channel)
+        self._scheduler.schedule(
+            self._outport, end_tick_message,
+            scheduled_tick.send_time + self._duration,
+            on_send=self._tick_ended)
+      else:
+        self._num_outstanding -= 1
+        self._cv.notify()
 
-    # Set the program number for the channels.
-    self._outport.send(
-        mido.Message(
-            type='program_change', program=program, channel=self._channel))
-    self._period = 60. / qpm
-    self._start_time = start_time
-    self._stop_time = stop_time
-    if signals is None:
-      self._messages = _DEFAULT_METRONOME_MESSAGES
-    else:
-      self._messages = [s.to_message() if s else None for s in signals]
-    self._duration = duration
+  def _tick_ended(self, unused_scheduled_message):
+    """Called by the scheduler when the end of a tick is sent."""
+    with self._cv:
+      self._num_outstanding -= 1
+      self._cv.notify()
 
   def run(self):
     """Sends message on the qpm interval until stop signal received."""
-    sleeper = concurrency.Sleeper()
-    while True:
-      now = time.time()
-      tick_number = max(0, int((now - self._start_time) // self._period) + 1)
-      tick_time = tick_number * self._period + self._start_time
-
-      if self._stop_time is not None and self._stop_time < tick_time:
-        break
+    with self._cv:
+      while True:
+        # Never schedule the same tick twice.
+        now = max(time.time(), self._last_tick_time + self._period / 2)
+        tick_number = max(
+            0, int((now - self._start_time) // self._period) + 1)
+        tick_time = tick_number * self._period + self._start_time
+
+        if self._stop_time is not None and self._stop_time < tick_time:
+          break
 
-      sleeper.sleep_until(tick_time)
+        # Wait until shortly before the tick, or until the options change.
+        timeout = tick_time - _METRONOME_SCHEDULE_AHEAD - time.time()
+        if timeout > 0:
+          self._cv.wait(timeout)
+          continue
 
-      metric_position = tick_number % len(self._messages)
-      tick_message = self._messages[metric_position]
+        self._last_tick_time = tick_time
+        metric_position = tick_number % len(self._messages)
+        tick_message = self._messages[metric_position]
 
-      if tick_message is None:
-        continue
+        if tick_message is None:
+          continue
 
-      tick_message.channel = self._channel
-      self._outport.send(tick_message)
+        self._num_outstanding += 1
+        self._pending_ticks.add(self._scheduler.schedule(
+            self._outport, tick_message.copy(channel=self._channel),
+            tick_time, on_send=self._tick_sent))
 
-      if tick_message.type == 'note_on':
-        sleeper.sleep(self._duration)
-        end_tick_message = mido.Message(
-            'note_off', note=tick_message.note, channel=self._channel)
-        self._outport.send(end_tick_message)
+      # Let scheduled ticks end before terminating.
+      while self._num_outstanding:
+        self._cv.wait()
 
   def stop(self, stop_time=0, block=True):
     """Signals for the metronome to stop.
@@ -272,7 +669,13 @@ class Metronome(threading.Thread):
           stop. By default, stops at next tick.
       block: If true, blocks until thread terminates.
     """
-    self._stop_time = stop_time
+    with self._cv:
+      self._stop_time = stop_time
+      cancelled = self._scheduler.cancel(
+          [t for t in self._pending_ticks if t.send_time > stop_time])
+      self._pending_ticks.difference_update(cancelled)
+      self._num_outstanding -= len(cancelled)
+      self._cv.notify()
     if block:
       self.join()
 
@@ -282,7 +685,8 @@ class MidiPlayer(threading.Thread):
 
   The NoteSequence times must be based on the wall time. The playhead matches
   the wall clock. The playback sequence may be updated at any time if
-  `allow_updates` is set to True.
+  `allow_updates` is set to True. Messages are sent at their times by a
+  MidiScheduler.
 
   Args:
     outport: The Mido port for sending messages.
@@ -296,22 +700,31 @@ class MidiPlayer(threading.Thread):
         called, allowing for additional updates via `update_sequence`.
     channel: The MIDI channel to send playback events.
     offset: The float time in seconds to adjust the playback event times by.
+    scheduler: The running MidiScheduler to send messages with, or None to use
+        one shared by all players created without one.
   """
 
   def __init__(self, outport, sequence, start_time=time.time(),
-               allow_updates=False, channel=0, offset=0.0):
+               allow_updates=False, channel=0, offset=0.0, scheduler=None):
     self._outport = outport
     self._channel = channel
     self._offset = offset
+    self._scheduler = scheduler or _get_default_scheduler()
 
     # Set of notes (pitches) that are currently on.
     self._open_notes = set()
     # Lock for serialization.
     self._lock = threading.RLock()
-    # A control variable to signal when the sequence has been updated.
+    # A control variable to signal when the sequence has been updated or a
+    # scheduled message has been sent.
     self._update_cv = threading.Condition(self._lock)
-    # The queue of mido.Message objects to send, sorted by ascending time.
+    # The queue of mido.Message objects to send, sorted by ascending time,
+    # until they are handed to the scheduler by `run`.
     self._message_queue = collections.deque()
+    # The scheduled messages that have not been sent yet.
+    self._scheduled_messages = set()
+    # Whether `run` has handed the messages to the scheduler.
+    self._playing = False
     # An event that is set when `stop` has been called.
     self._stop_signal = threading.Event()
 
@@ -378,8 +791,30 @@ class MidiPlayer(threading.Thread):
 
     self._message_queue = collections.deque(
         sorted(new_message_list, key=lambda msg: (msg.time, msg.note)))
+    if self._playing:
+      self._schedule_message_queue()
     self._update_cv.notify()
 
+  def _schedule_message_queue(self):
+    """Replaces the scheduled messages with the message queue."""
+    self._scheduled_messages.difference_update(
+        self._scheduler.cancel(self._scheduled_messages))
+    while self._message_queue:
+      msg = self._message_queue.popleft()
+      self._scheduled_messages.add(self._scheduler.schedule(
+          self._outport, msg, msg.time, on_send=self._message_sent))
+
+  def _message_sent(self, scheduled_message):
+    """Tracks the open notes. Called by the scheduler."""
+    with self._lock:
+      self._scheduled_messages.discard(scheduled_message)
+      msg = scheduled_message.msg
+      if msg.type == 'note_on':
+        self._open_notes.add(msg.note)
+      elif msg.type == 'note_off':
+        self._open_notes.discard(msg.note)
+      self._update_cv.notify()
+
   @concurrency.serialized
   def run(self):
     """Plays messages in the queue until empty and _allow_updates is False."""
@@ -389,24 +824,12 @@ class MidiPlayer(threading.Thread):
     while self._message_queue and self._message_queue[0].time < time.time():
       self._message_queue.popleft()
 
-    while True:
-      while self._message_queue:
-        delta = self._message_queue[0].time - time.time()
-        if delta > 0:
-          self._update_cv.wait(timeout=delta)
-        else:
-          msg = self._message_queue.popleft()
-          if msg.type == 'note_on':
-            self._open_notes.add(msg.note)
-          elif msg.type == 'note_off':
-            self._open_notes.discard(msg.note)
-          self._outport.send(msg)
-
-      # Either keep player alive and wait for sequence update, or return.
-      if self._allow_updates:
-        self._update_cv.wait()
-      else:
-        break
+    self._playing = True
+    self._schedule_message_queue()
+    # Either keep player alive and wait for sequence updates, or return once
+    # all scheduled messages are sent.
+    while self._scheduled_messages or self._allow_updates:
+      self._update_cv.wait()
 
   def stop(self, block=True):
     """Signals for the playback to stop and ends all open notes.
@@ -424,6 +847,8 @@ class MidiPlayer(threading.Thread):
         for note in self._open_notes:
           self._message_queue.append(
               mido.Message(type='note_off', note=note, time=time.time()))
+        if self._playing:
+          self._schedule_message_queue()
         self._update_cv.notify()
     if block:
       self.join()
@@ -456,7 +881,7 @@ class MidiCaptor(threading.Thread):
     self._captured_sequence.tempos.add(qpm=qpm)
     self._start_time = start_time
     self._stop_time = stop_time
-    self._stop_regex = re.compile(str(stop_signal))
+    self._stop_midi_signal = stop_signal
     # A set of active MidiSignals being used by iterators.
     self._iter_signals = []
     # An event that is set when `stop` has been called.
@@ -549,13 +974,13 @@ class MidiCaptor(threading.Thread):
       if msg.time <= self._start_time:
         continue
 
-      if self._stop_regex.match(str(msg)) is not None:
+      if (self._stop_midi_signal is not None and
+          self._stop_midi_signal.matches(msg)):
         break
 
       with self._lock:
-        msg_str = str(msg)
-        for regex, queue_ in self._iter_signals:
-          if regex.match(msg_str) is not None:
+        for signal, queue_ in self._iter_signals:
+          if signal.matches(msg):
             queue_.put(msg.copy())
 
       self._capture_message(msg)
@@ -568,7 +993,7 @@ class MidiCaptor(threading.Thread):
       # Set final captured sequence.
       self._captured_sequence = self.captured_sequence(end_time)
       # Wake up all generators.
-      for regex, queue_ in self._iter_signals:
+      for _, queue_ in self._iter_signals:
         queue_.put(MidiCaptor._WAKE_MESSAGE)
 
   def stop(self, stop_time=None, block=True):
@@ -668,10 +1093,9 @@ class MidiCaptor(threading.Thread):
       sleeper = concurrency.Sleeper()
       next_yield_time = time.time() + period
     else:
-      regex = re.compile(str(signal))
       capture_queue = queue.Queue()
       with self._lock:
-        self._iter_signals.append((regex, capture_queue))
+        self._iter_signals.append((signal, capture_queue))
 
     while self.is_alive():
       if signal is None:
@@ -871,10 +1295,17 @@ class MidiHub(object):
     playback_channel: The MIDI channel to send playback events.
     playback_offset: The float time in seconds to adjust the playback event
         times by.
+    num_callback_workers: The number of threads that call the functions
+        registered with `register_callback`.
+    scheduler_lookahead: The float time in seconds before their send time
+        that the scheduler of the player and metronome messages pops them to
+        be sent together.
   """
 
   def __init__(self, input_midi_ports, output_midi_ports, texture_type,
-               passthrough=True, playback_channel=0, playback_offset=0.0):
+               passthrough=True, playback_channel=0, playback_offset=0.0,
+               num_callback_workers=4,
+               scheduler_lookahead=_DEFAULT_SCHEDULER_LOOKAHEAD):
     self._texture_type = texture_type
     self._passthrough = passthrough
     self._playback_channel = playback_channel
@@ -883,13 +1314,17 @@ class MidiHub(object):
     self._open_notes = set()
     # This lock is used by the serialized decorator.
     self._lock = threading.RLock()
-    # A dictionary mapping a compiled MidiSignal regex to a condition variable
-    # that will be notified when a matching messsage is received.
-    self._signals = {}
-    # A dictionary mapping a compiled MidiSignal regex to a list of functions
-    # that will be called with the triggering message in individual threads when
-    # a matching message is received.
-    self._callbacks = collections.defaultdict(list)
+    # A table mapping MidiSignals to a condition variable that will be notified
+    # when a matching messsage is received.
+    self._signals = _MidiSignalTable()
+    # A table mapping MidiSignals to a list of functions that will be called
+    # with the triggering message by the callback workers when a matching
+    # message is received.
+    self._callbacks = _MidiSignalTable()
+    self._callback_pool = multiprocessing_pool.ThreadPool(num_callback_workers)
+    # Latencies of handling incoming messages, from when they are received
+    # until they have been passed through.
+    self._message_latency_stats = LatencyStats()
     # A dictionary mapping integer control numbers to most recently-received
     # integer value.
     self._control_values = {}
@@ -898,6 +1333,9 @@ class MidiHub(object):
     # Potentially active player threads.
     self._players = []
     self._metronome = None
+    # Sends the messages of the players and the metronome at their times.
+    self._scheduler = MidiScheduler(scheduler_lookahead)
+    self._scheduler.start()
 
     # Open MIDI ports.
 
@@ -944,6 +1382,8 @@ class MidiHub(object):
       captor.join()
     for player in self._players:
       player.join()
+    self._scheduler.stop()
+    self._callback_pool.close()
 
   @property
   @concurrency.serialized
@@ -965,9 +1405,56 @@ class MidiHub(object):
     """Stamps message with current time and passes it to the handler."""
     if msg.type == 'program_change':
       return
+    received_time = time.time()
     if not msg.time:
-      msg.time = time.time()
+      msg.time = received_time
     self._handle_message(msg)
+    self._message_latency_stats.add(time.time() - received_time)
+
+  def message_latency_summary(self):
+    """Returns a summary of the latencies of handling incoming messages.
+
+    The latency of a message is the time from when it is received until it
+    has been captured, passed through and its signals have been dispatched.
+
+    Returns:
+      A dictionary as returned by `LatencyStats.summary`.
+    """
+    return self._message_latency_stats.summary()
+
+  def send_lateness_summary(self):
+    """Returns a summary of the lateness of scheduled outgoing messages.
+
+    The lateness of a message sent by a player or the metronome is the time
+    from when it was scheduled to be sent until it was sent.
+
+    Returns:
+      A dictionary as returned by `LatencyStats.summary`.
+    """
+    return self._scheduler.lateness_stats.summary()
+
+  def send_lateness_histogram(self):
+    """Returns the histogram of the lateness of scheduled outgoing messages.
+
+    Returns:
+      A list of (upper_edge, count) tuples as returned by
+      `LatencyStats.histogram`.
+    """
+    return self._scheduler.lateness_stats.histogram()
+
+  def log_timing_stats(self):
+    """Logs the incoming message latency and outgoing message lateness."""
+    def _format_summary(summary):
+      return ', '.join(
+          '%s=%s' % (k, v if k == 'count' else '%.2fms' % (v * 1000))
+          for k, v in sorted(summary.items()))
+    tf.logging.info('Incoming message latency: %s',
+                    _format_summary(self.message_latency_summary()))
+    tf.logging.info('Outgoing message lateness: %s',
+                    _format_summary(self.send_lateness_summary()))
+    tf.logging.info('Outgoing message lateness histogram: %s', ', '.join(
+        '<=%gms: %d' % (edge * 1000, count)
+        for edge, count in self.send_lateness_histogram()))
 
   @concurrency.serialized
   def _handle_message(self, msg):
@@ -982,19 +1469,13 @@ class MidiHub(object):
       msg: The mido.Message MIDI message to handle.
     """
     # Notify any threads waiting for this message.
-    msg_str = str(msg)
-    for regex in list(self._signals):
-      if regex.match(msg_str) is not None:
-        self._signals[regex].notify_all()
-        del self._signals[regex]
+    for cond_var in self._signals.pop_matching(msg):
+      cond_var.notify_all()
 
     # Call any callbacks waiting for this message.
-    for regex in list(self._callbacks):
-      if regex.match(msg_str) is not None:
-        for fn in self._callbacks[regex]:
-          threading.Thread(target=fn, args=(msg,)).start()
-
-        del self._callbacks[regex]
+    for fns in self._callbacks.pop_matching(msg):
+      for fn in fns:
+        self._callback_pool.apply_async(fn, (msg,))
 
     # Remove any captors that are no longer alive.
     self._captors[:] = [t for t in self._captors if t.is_alive()]
@@ -1114,14 +1595,10 @@ class MidiHub(object):
       concurrency.Sleeper().sleep(timeout)
       return
 
-    signal_pattern = str(signal)
-    cond_var = None
-    for regex, cond_var in self._signals:
-      if regex.pattern == signal_pattern:
-        break
+    cond_var = self._signals.get(signal)
     if cond_var is None:
       cond_var = threading.Condition(self._lock)
-      self._signals[re.compile(signal_pattern)] = cond_var
+      self._signals.set(signal, cond_var)
 
     cond_var.wait()
 
@@ -1132,10 +1609,14 @@ class MidiHub(object):
     Args:
       signal: The MidiSignal to wake threads waiting on, or None to wake all.
     """
-    for regex in list(self._signals):
-      if signal is None or regex.pattern == str(signal):
-        self._signals[regex].notify_all()
-        del self._signals[regex]
+    if signal is None:
+      cond_vars = self._signals.pop_all()
+    elif self._signals.get(signal) is not None:
+      cond_vars = [self._signals.pop(signal)]
+    else:
+      cond_vars = []
+    for cond_var in cond_vars:
+      cond_var.notify_all()
     for captor in self._captors:
       captor.wake_signal_waiters(signal)
 
@@ -1157,7 +1638,8 @@ class MidiHub(object):
           qpm, start_time, signals=signals, channel=channel)
     else:
       self._metronome = Metronome(
-          self._outport, qpm, start_time, signals=signals, channel=channel)
+          self._outport, qpm, start_time, signals=signals, channel=channel,
+          scheduler=self._scheduler)
       self._metronome.start()
 
   @concurrency.serialized
@@ -1189,7 +1671,8 @@ class MidiHub(object):
       The MidiPlayer thread handling playback to enable updating.
     """
     player = MidiPlayer(self._outport, sequence, start_time, allow_updates,
-                        self._playback_channel, self._playback_offset)
+                        self._playback_channel, self._playback_offset,
+                        scheduler=self._scheduler)
     with self._lock:
       self._players.append(player)
     player.start()
@@ -1224,7 +1707,8 @@ class MidiHub(object):
     """Calls `fn` at the next signal message.
 
     The callback function must take exactly one argument, which will be the
-    message triggering the signal.
+    message triggering the signal. Callbacks are called by a fixed pool of
+    worker threads, so long-running callbacks delay the ones that follow.
 
     Survives until signal is called or the MidiHub is destroyed.
 
@@ -1233,4 +1717,8 @@ class MidiHub(object):
       signal: A MidiSignal to use as a signal to call `fn` on the triggering
           message.
     """
-    self._callbacks[re.compile(str(signal))].append(fn)
+    fns = self._callbacks.get(signal)
+    if fns is None:
+      fns = []
+      self._callbacks.set(signal, fns)
+    fns.append(fn)
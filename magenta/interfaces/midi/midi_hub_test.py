@@ -16,6 +16,7 @@
 
 import collections
 import queue
+import re
 import threading
 import time
 
@@ -130,6 +131,88 @@ class MidiHubTest(tf.test.TestCase):
         r'^control_change channel=\d+ control=\d+ value=2 time=\d+.\d+$',
         str(sig))
 
+  def testMidiSignal_MatchesLikeRegex(self):
+    signals = [
+        midi_hub.MidiSignal(msg=mido.Message(type='note_on', note=1)),
+        midi_hub.MidiSignal(
+            msg=mido.Message(type='control_change', channel=2, control=1)),
+        midi_hub.MidiSignal(type='note_off'),
+        midi_hub.MidiSignal(type='note_on', note=1, velocity=0),
+        midi_hub.MidiSignal(note=1),
+        midi_hub.MidiSignal(velocity=64),
+        midi_hub.MidiSignal(type='control_change', control=1),
+        midi_hub.MidiSignal(value=2),
+    ]
+    messages = [
+        mido.Message(type='note_on', note=1, time=1.5),
+        mido.Message(type='note_on', note=1, velocity=0, time=1.5),
+        mido.Message(type='note_on', note=1, channel=3, time=1.5),
+        mido.Message(type='note_off', note=1, time=1.5),
+        mido.Message(type='note_off', note=2, velocity=64, time=1.5),
+        mido.Message(type='control_change', control=1, time=1.5),
+        mido.Message(type='control_change', channel=2, control=1, time=1.5),
+        mido.Message(type='control_change', control=3, value=2, time=1.5),
+        mido.Message(type='polytouch', note=1, time=1.5),
+        mido.Message(type='clock', time=1.5),
+    ]
+    for sig in signals:
+      for msg in messages:
+        self.assertEqual(
+            re.match(str(sig), str(msg)) is not None, sig.matches(msg),
+            '%s %s' % (sig, msg))
+
+  def testMidiSignalTable(self):
+    table = midi_hub._MidiSignalTable()
+    table.set(midi_hub.MidiSignal(type='control_change', control=1), 'cc1')
+    table.set(midi_hub.MidiSignal(note=1), 'note1')
+    table.set(midi_hub.MidiSignal(type='note_on'), 'note_on')
+    self.assertEqual('note1', table.get(midi_hub.MidiSignal(note=1)))
+    self.assertIsNone(table.get(midi_hub.MidiSignal(note=2)))
+
+    self.assertEqual(
+        [], table.pop_matching(mido.Message(type='control_change', control=2)))
+    self.assertEqual(
+        ['note1', 'note_on'],
+        table.pop_matching(mido.Message(type='note_on', note=1)))
+    self.assertEqual(
+        [], table.pop_matching(mido.Message(type='note_off', note=1)))
+    self.assertEqual(1, len(table))
+    self.assertEqual(['cc1'], table.pop_all())
+    self.assertEqual(0, len(table))
+
+  def testLatencyStatsHistogram(self):
+    stats = midi_hub.LatencyStats(bin_edges=(0.001, 0.01))
+    for latency in (0.0, 0.001, 0.005, 0.02, 0.5):
+      stats.add(latency)
+    self.assertEqual(
+        [(0.001, 2), (0.01, 1), (float('inf'), 2)], stats.histogram())
+    self.assertEqual(5, stats.summary()['count'])
+    self.assertEqual(0.5, stats.summary()['max'])
+
+  def testMidiScheduler(self):
+    scheduler = midi_hub.MidiScheduler()
+    scheduler.start()
+    sent = []
+    start_time = time.time() + 0.05
+    # Scheduled out of order, including a message due in the past.
+    for offset, note in ((0.1, 2), (0.0, 1), (-1.0, 0), (0.1, 3), (0.05, 4)):
+      scheduled = scheduler.schedule(
+          self.port, mido.Message(type='note_on', note=note),
+          start_time + offset, on_send=sent.append)
+      if note == 4:
+        self.assertEqual([scheduled], scheduler.cancel([scheduled]))
+    time.sleep(0.3)
+    scheduler.stop()
+
+    self.assertEqual([0, 1, 2, 3], [s.msg.note for s in sent])
+    self.assertEqual([], scheduler.cancel(sent))
+    for scheduled in sent[1:]:
+      self.assertAlmostEqual(
+          scheduled.send_time, scheduled.msg.time, delta=0.01)
+    self.assertEqual(4, scheduler.lateness_stats.summary()['count'])
+    self.assertEqual(
+        4, sum(count for _, count in scheduler.lateness_stats.histogram()))
+
   def testMetronome(self):
     start_time = time.time() + 0.1
     qpm = 180
@@ -150,6 +233,7 @@ class MidiHubTest(tf.test.TestCase):
         next_tick_time += 60. / qpm
       else:
         self.assertEqual(msg.type, 'note_off')
+    self.assertEqual(6, self.midi_hub.send_lateness_summary()['count'])
 
   def testStartPlayback_NoUpdates(self):
     # Use a time in the past to test handling of past notes.
@@ -695,6 +779,32 @@ class MidiHubTest(tf.test.TestCase):
     self.midi_hub.wait_for_event(timeout=0.3)
     self.assertAlmostEqual(time.time() - wait_start, 0.3, delta=0.01)
 
+  def testRegisterCallback(self):
+    called = queue.Queue()
+    values = queue.Queue()
+    signal = midi_hub.MidiSignal(type='control_change', control=1)
+    self.midi_hub.register_callback(called.put, signal)
+    self.midi_hub.register_callback(lambda msg: values.put(msg.value), signal)
+
+    self.port.callback(mido.Message(type='note_on', note=1))
+    self.port.callback(
+        mido.Message(type='control_change', control=1, value=3))
+    # Callbacks are only called at the next signal.
+    self.port.callback(
+        mido.Message(type='control_change', control=1, value=4))
+
+    msg = called.get(timeout=1.0)
+    self.assertEqual(
+        mido.Message(type='control_change', control=1, value=3, time=msg.time),
+        msg)
+    self.assertEqual(3, values.get(timeout=1.0))
+    self.assertTrue(called.empty())
+    self.assertTrue(values.empty())
+
+    summary = self.midi_hub.message_latency_summary()
+    self.assertEqual(3, summary['count'])
+    self.assertLessEqual(summary['p50'], summary['max'])
+
   def testSendControlChange(self):
     self.midi_hub.send_control_change(0, 1)
 
@@ -707,5 +817,6 @@ class MidiHubTest(tf.test.TestCase):
         [mido.Message(type='control_change', control=0, value=1,
                       time=sent_messages[0].time)])
 
+
 if __name__ == '__main__':
   tf.test.main()
@@ -15,9 +15,11 @@
 """A module for implementing interaction between MIDI and SequenceGenerators."""
 
 import abc
+import collections
 import threading
 import time
 
+from magenta.interfaces.midi import midi_hub as midi_hub_lib
 import note_seq
 from note_seq.protobuf import generator_pb2
 from note_seq.protobuf import music_pb2
@@ -36,6 +38,128 @@ def adjust_sequence_times(sequence, delta_time):
   return retimed_sequence
 
 
+# A request to generate a response, with times relative to the start of the
+# input sequence.
+_ResponseRequest = collections.namedtuple(
+    '_ResponseRequest',
+    ['generator', 'temperature', 'input_sequence', 'response_start_time',
+     'response_end_time'])
+
+
+def _request_key(request):
+  """Returns a key identifying requests that generate the same response.
+
+  Times are rounded to milliseconds so that requests built from sequences
+  retimed by different amounts match. The response end time is not part of
+  the key since responses can be trimmed or extended.
+
+  Args:
+    request: The _ResponseRequest.
+
+  Returns:
+    A hashable key.
+  """
+  input_sequence = request.input_sequence
+  return (
+      id(request.generator),
+      request.temperature,
+      input_sequence.tempos[0].qpm if input_sequence.tempos else None,
+      round(request.response_start_time, 3),
+      tuple(sorted((note.pitch, note.velocity, round(note.start_time, 3),
+                    round(note.end_time, 3))
+                   for note in input_sequence.notes)))
+
+
+class _ResponseAnticipator(threading.Thread):
+  """A thread that generates responses before they are needed.
+
+  Only the most recently submitted request is generated. Requests that are
+  replaced before they are started and results that are not taken before the
+  next one finishes are discarded. A request that is being generated cannot be
+  interrupted, so `take` never waits for one that does not match.
+
+  Args:
+    generate_fn: The function that generates the response to a
+        _ResponseRequest.
+  """
+  daemon = True
+
+  def __init__(self, generate_fn):
+    self._generate_fn = generate_fn
+    self._cv = threading.Condition()
+    # The latest request that has not been started yet.
+    self._pending_request = None
+    # The request being generated.
+    self._running_request = None
+    # The (request, response) tuple of the latest finished request.
+    self._result = None
+    self._stopped = False
+    super(_ResponseAnticipator, self).__init__()
+
+  def submit(self, request):
+    """Replaces the pending request with `request`."""
+    with self._cv:
+      self._pending_request = request
+      self._cv.notify_all()
+
+  def take(self, request):
+    """Returns the anticipated response to a request, if any.
+
+    Waits for a request with the same key to finish if it is pending or being
+    generated. Drops any other pending request.
+
+    Args:
+      request: The _ResponseRequest that a response is needed for.
+
+    Returns:
+      The (anticipated_request, response) tuple of a finished request with the
+      same key as `request`, or None if there is none.
+    """
+    key = _request_key(request)
+    def _is_anticipating(request):
+      return request is not None and _request_key(request) == key
+    with self._cv:
+      if not _is_anticipating(self._pending_request):
+        self._pending_request = None
+      while (_is_anticipating(self._pending_request) or
+             _is_anticipating(self._running_request)):
+        self._cv.wait()
+      result = self._result
+      self._result = None
+    if result is None or _request_key(result[0]) != key:
+      return None
+    return result
+
+  def stop(self):
+    """Stops the thread once the running request, if any, finishes."""
+    with self._cv:
+      self._stopped = True
+      self._cv.notify_all()
+    self.join()
+
+  def run(self):
+    """Generates the latest pending request until stopped."""
+    while True:
+      with self._cv:
+        while self._pending_request is None and not self._stopped:
+          self._cv.wait()
+        if self._stopped:
+          break
+        self._running_request = self._pending_request
+        self._pending_request = None
+      try:
+        response = self._generate_fn(self._running_request)
+        result = (self._running_request, response)
+      except Exception as e:  # pylint:disable=broad-except
+        tf.logging.warn('Anticipatory generation failed: %s', e)
+        result = None
+      with self._cv:
+        if result is not None:
+          self._result = result
+        self._running_request = None
+        self._cv.notify_all()
+
+
 class MidiInteraction(threading.Thread):
   """Base class for handling interaction between MIDI and SequenceGenerator.
 
@@ -200,6 +324,10 @@ class CallAndResponseMidiInteraction(MidiInteraction):
     state_control_number: The optinal control change number to use for sending
         state update control changes. The values are 0 for `IDLE`, 1 for
         `LISTENING`, and 2 for `RESPONDING`.
+    anticipate_response: Whether to generate responses in the background
+        while listening, from the call captured so far, assuming that the call
+        ends after the following tick. The response is then ready when the
+        call ends with no further input.
 
     Raises:
       ValueError: If exactly one of `clock_signal` or `tick_duration` is not
@@ -237,7 +365,8 @@ class CallAndResponseMidiInteraction(MidiInteraction):
                tempo_control_number=None,
                temperature_control_number=None,
                loop_control_number=None,
-               state_control_number=None):
+               state_control_number=None,
+               anticipate_response=True):
     super(CallAndResponseMidiInteraction, self).__init__(
         midi_hub, sequence_generators, qpm, generator_select_control_number,
         tempo_control_number, temperature_control_number)
@@ -262,6 +391,21 @@ class CallAndResponseMidiInteraction(MidiInteraction):
     self._panic = threading.Event()
     # Even for signalling when to mutate response.
     self._mutate = threading.Event()
+    # Serializes the lazy initialization of the generators, which may first
+    # happen in the anticipator thread. Generation itself is not serialized,
+    # as initialized generators may generate concurrently (see
+    # `BaseSequenceGenerator.generate`), so that a response that was not
+    # anticipated is generated right away rather than after the stale
+    # anticipatory generation that may be running.
+    self._initialization_lock = threading.Lock()
+    self._anticipator = (
+        _ResponseAnticipator(self._generate_response)
+        if anticipate_response else None)
+    # The time from the end of each call until the first note of its response.
+    self._response_latency_stats = midi_hub_lib.LatencyStats()
+    # The number of responses that were and were not anticipated.
+    self.anticipation_hits = 0
+    self.anticipation_misses = 0
 
   def _update_state(self, state):
     """Logs and sends a control change with the state."""
@@ -303,9 +447,20 @@ class CallAndResponseMidiInteraction(MidiInteraction):
     return (self._loop_control_number and
             self._midi_hub.control_value(self._loop_control_number) == 127)
 
-  def _generate(self, input_sequence, zero_time, response_start_time,
-                response_end_time):
-    """Generates a response sequence with the currently-selected generator.
+  def response_latency_summary(self):
+    """Returns a summary of the latencies of the responses.
+
+    The latency of a response is the time from when the end of the call is
+    detected until the first note of the response is played.
+
+    Returns:
+      A dictionary as returned by `midi_hub.LatencyStats.summary`.
+    """
+    return self._response_latency_stats.summary()
+
+  def _response_request(self, input_sequence, zero_time, response_start_time,
+                        response_end_time):
+    """Returns a _ResponseRequest with the currently-selected generator.
 
     Args:
       input_sequence: The NoteSequence to use as a generation seed.
@@ -315,43 +470,141 @@ class CallAndResponseMidiInteraction(MidiInteraction):
       response_end_time: The float time in seconds for the end of generation.
 
     Returns:
-      The generated NoteSequence.
+      The _ResponseRequest, with times relative to `zero_time`.
     """
     # Generation is simplified if we always start at 0 time.
-    response_start_time -= zero_time
-    response_end_time -= zero_time
+    return _ResponseRequest(
+        generator=self._sequence_generator,
+        temperature=self._temperature(),
+        input_sequence=adjust_sequence_times(input_sequence, -zero_time),
+        response_start_time=response_start_time - zero_time,
+        response_end_time=response_end_time - zero_time)
+
+  def _generate_response(self, request):
+    """Generates the response to a _ResponseRequest.
+
+    Args:
+      request: The _ResponseRequest.
 
+    Returns:
+      The generated NoteSequence, with times relative to the start of the
+      input.
+    """
     generator_options = generator_pb2.GeneratorOptions()
     generator_options.input_sections.add(
         start_time=0,
-        end_time=response_start_time)
+        end_time=request.response_start_time)
     generator_options.generate_sections.add(
-        start_time=response_start_time,
-        end_time=response_end_time)
-
-    # Get current temperature setting.
-    generator_options.args['temperature'].float_value = self._temperature()
+        start_time=request.response_start_time,
+        end_time=request.response_end_time)
+    generator_options.args['temperature'].float_value = request.temperature
 
     # Generate response.
     tf.logging.info(
         "Generating sequence using '%s' generator.",
-        self._sequence_generator.details.id)
-    tf.logging.debug('Generator Details: %s',
-                     self._sequence_generator.details)
-    tf.logging.debug('Bundle Details: %s',
-                     self._sequence_generator.bundle_details)
+        request.generator.details.id)
+    tf.logging.debug('Generator Details: %s', request.generator.details)
+    tf.logging.debug('Bundle Details: %s', request.generator.bundle_details)
     tf.logging.debug('Generator Options: %s', generator_options)
-    response_sequence = self._sequence_generator.generate(
-        adjust_sequence_times(input_sequence, -zero_time), generator_options)
-    response_sequence = note_seq.trim_note_sequence(response_sequence,
-                                                    response_start_time,
-                                                    response_end_time)
+    with self._initialization_lock:
+      request.generator.initialize()
+    response_sequence = request.generator.generate(
+        request.input_sequence, generator_options)
+    return note_seq.trim_note_sequence(response_sequence,
+                                       request.response_start_time,
+                                       request.response_end_time)
+
+  def _generate(self, input_sequence, zero_time, response_start_time,
+                response_end_time):
+    """Generates a response sequence with the currently-selected generator.
+
+    Args:
+      input_sequence: The NoteSequence to use as a generation seed.
+      zero_time: The float time in seconds to treat as the start of the input.
+      response_start_time: The float time in seconds for the start of
+          generation.
+      response_end_time: The float time in seconds for the end of generation.
+
+    Returns:
+      The generated NoteSequence.
+    """
+    request = self._response_request(
+        input_sequence, zero_time, response_start_time, response_end_time)
+    return adjust_sequence_times(self._generate_response(request), zero_time)
+
+  def _anticipate(self, captured_sequence, tick_time, tick_duration):
+    """Starts generating the response to the call captured so far.
+
+    The request is the one that ends the call if the next tick is silent.
+
+    Args:
+      captured_sequence: The NoteSequence captured so far.
+      tick_time: The float time in seconds of the current tick.
+      tick_duration: The float duration in seconds of the current tick.
+    """
+    capture_start_time = self._captor.start_time
+    num_ticks = self._midi_hub.control_value(
+        self._response_ticks_control_number)
+    if num_ticks:
+      response_duration = num_ticks * tick_duration
+    else:
+      response_duration = tick_time - capture_start_time
+    self._anticipator.submit(self._response_request(
+        captured_sequence, capture_start_time, tick_time,
+        tick_time + response_duration))
+
+  def _respond(self, input_sequence, zero_time, response_start_time,
+               response_end_time):
+    """Returns the response to a call, anticipated if possible.
+
+    An anticipated response for the same input is trimmed to the response end
+    time, or extended to it if it is shorter. Otherwise the response is
+    generated.
+
+    Args:
+      input_sequence: The NoteSequence to use as a generation seed.
+      zero_time: The float time in seconds to treat as the start of the input.
+      response_start_time: The float time in seconds for the start of
+          generation.
+      response_end_time: The float time in seconds for the end of generation.
+
+    Returns:
+      The generated NoteSequence.
+    """
+    request = self._response_request(
+        input_sequence, zero_time, response_start_time, response_end_time)
+    anticipated = (
+        self._anticipator.take(request) if self._anticipator else None)
+    if anticipated is None:
+      self.anticipation_misses += 1
+      return adjust_sequence_times(self._generate_response(request), zero_time)
+
+    self.anticipation_hits += 1
+    anticipated_request, response_sequence = anticipated
+    if anticipated_request.response_end_time < request.response_end_time:
+      # Continue the anticipated response, primed with the call and the
+      # anticipated response.
+      primer_sequence = music_pb2.NoteSequence()
+      primer_sequence.CopyFrom(request.input_sequence)
+      primer_sequence.notes.extend(response_sequence.notes)
+      primer_sequence.total_time = anticipated_request.response_end_time
+      extension_sequence = self._generate_response(request._replace(
+          input_sequence=primer_sequence,
+          response_start_time=anticipated_request.response_end_time))
+      response_sequence.notes.extend(extension_sequence.notes)
+      response_sequence.total_time = extension_sequence.total_time
+    else:
+      response_sequence = note_seq.trim_note_sequence(
+          response_sequence, request.response_start_time,
+          request.response_end_time)
     return adjust_sequence_times(response_sequence, zero_time)
 
   def run(self):
     """The main loop for a real-time call and response interaction."""
     start_time = time.time()
     self._captor = self._midi_hub.start_capture(self._qpm, start_time)
+    if self._anticipator is not None:
+      self._anticipator.start()
 
     if not self._clock_signal and self._metronome_channel is not None:
       self._midi_hub.start_metronome(
@@ -452,7 +705,7 @@ class CallAndResponseMidiInteraction(MidiInteraction):
             response_duration = tick_time - capture_start_time
 
           response_start_time = tick_time
-          response_sequence = self._generate(
+          response_sequence = self._respond(
               captured_sequence,
               capture_start_time,
               response_start_time,
@@ -472,6 +725,15 @@ class CallAndResponseMidiInteraction(MidiInteraction):
           # initial events due to generation lag.
           player.update_sequence(
               response_sequence, start_time=response_start_time)
+          if response_sequence.notes:
+            first_note_time = max(
+                time.time(),
+                min(note.start_time for note in response_sequence.notes))
+            self._response_latency_stats.add(first_note_time - tick_time)
+            tf.logging.info(
+                'Response latency: %.3fs (%d anticipated, %d generated).',
+                first_note_time - tick_time, self.anticipation_hits,
+                self.anticipation_misses)
 
           # Optionally capture during playback.
           if self._allow_overlap:
@@ -485,6 +747,8 @@ class CallAndResponseMidiInteraction(MidiInteraction):
       else:
         # Continue listening.
         self._update_state(self.State.LISTENING)
+        if self._anticipator is not None:
+          self._anticipate(captured_sequence, tick_time, tick_duration)
 
       # Potentially loop or mutate previous response.
       if self._mutate.is_set() and not response_sequence.notes:
@@ -513,6 +777,8 @@ class CallAndResponseMidiInteraction(MidiInteraction):
       last_tick_time = tick_time
 
     player.stop()
+    if self._anticipator is not None:
+      self._anticipator.stop()
 
   def stop(self):
     self._stop_signal.set()
@@ -0,0 +1,252 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for midi_interaction."""
+
+import threading
+
+from magenta.interfaces.midi import midi_interaction
+from note_seq import testing_lib
+from note_seq.protobuf import generator_pb2
+from note_seq.protobuf import music_pb2
+import tensorflow.compat.v1 as tf
+
+
+class FakeMidiHub(object):
+  """A MidiHub with no control values set."""
+
+  def control_value(self, unused_control_number):
+    return None
+
+
+class FakeSequenceGenerator(object):
+  """Generates a half-second note every half second of each section.
+
+  The pitch of the generated notes is the number of notes in the input, so
+  that tests can tell how a response was primed. Generation of a section that
+  ends at `blocked_end_time` waits for `release` to be set.
+  """
+
+  def __init__(self, blocked_end_time=None):
+    self.details = generator_pb2.GeneratorDetails(id='fake')
+    self.bundle_details = None
+    self.requests = []
+    self.blocked_end_time = blocked_end_time
+    self.blocked = threading.Event()
+    self.release = threading.Event()
+
+  def initialize(self):
+    pass
+
+  def generate(self, input_sequence, generator_options):
+    self.requests.append((input_sequence, generator_options))
+    section = generator_options.generate_sections[0]
+    if section.end_time == self.blocked_end_time:
+      self.blocked.set()
+      self.release.wait()
+    sequence = music_pb2.NoteSequence()
+    sequence.CopyFrom(input_sequence)
+    start_time = section.start_time
+    while start_time < section.end_time:
+      sequence.notes.add(pitch=len(input_sequence.notes), velocity=100,
+                         start_time=start_time, end_time=start_time + 0.5)
+      start_time += 0.5
+    sequence.total_time = section.end_time
+    return sequence
+
+
+class ResponseAnticipatorTest(tf.test.TestCase):
+
+  def setUp(self):
+    self.generator = FakeSequenceGenerator()
+    self.input_sequence = music_pb2.NoteSequence()
+    testing_lib.add_track_to_sequence(
+        self.input_sequence, 0, [(60, 100, 0.0, 0.5), (62, 100, 0.5, 1.0)])
+
+  def _request(self, zero_time=0.0, response_start_time=1.0,
+               response_end_time=2.0, input_sequence=None):
+    """Returns a request for a call captured from `zero_time`.
+
+    The times of the request are shifted to `zero_time` and back, as they are
+    for captured calls, which introduces rounding errors.
+    """
+    if input_sequence is None:
+      input_sequence = self.input_sequence
+    return midi_interaction._ResponseRequest(  # pylint:disable=protected-access
+        generator=self.generator,
+        temperature=1.0,
+        input_sequence=midi_interaction.adjust_sequence_times(
+            midi_interaction.adjust_sequence_times(input_sequence, zero_time),
+            -zero_time),
+        response_start_time=(response_start_time + zero_time) - zero_time,
+        response_end_time=(response_end_time + zero_time) - zero_time)
+
+  def testRequestKey(self):
+    key = midi_interaction._request_key(self._request())  # pylint:disable=protected-access
+    # Captures that started at different times, such as the capture of a call
+    # that was extended by a silent tick, match despite rounding errors.
+    self.assertEqual(
+        key,
+        midi_interaction._request_key(self._request(zero_time=1234.567891)))  # pylint:disable=protected-access
+    # The response end time is not part of the key.
+    self.assertEqual(
+        key,
+        midi_interaction._request_key(self._request(response_end_time=3.0)))  # pylint:disable=protected-access
+    self.assertNotEqual(
+        key,
+        midi_interaction._request_key(self._request(response_start_time=1.5)))  # pylint:disable=protected-access
+    other_sequence = music_pb2.NoteSequence()
+    testing_lib.add_track_to_sequence(other_sequence, 0, [(60, 100, 0.0, 0.5)])
+    self.assertNotEqual(
+        key,
+        midi_interaction._request_key(  # pylint:disable=protected-access
+            self._request(input_sequence=other_sequence)))
+
+  def testTakeMatchingRequest(self):
+    anticipator = midi_interaction._ResponseAnticipator(lambda r: 'response')  # pylint:disable=protected-access
+    anticipator.start()
+    request = self._request()
+    anticipator.submit(request)
+    self.assertEqual((request, 'response'),
+                     anticipator.take(self._request(zero_time=10.0)))
+    # Results are only taken once.
+    self.assertIsNone(anticipator.take(request))
+    anticipator.stop()
+
+  def testTakeMismatchedRequest(self):
+    anticipator = midi_interaction._ResponseAnticipator(lambda r: 'response')  # pylint:disable=protected-access
+    anticipator.start()
+    anticipator.submit(self._request())
+    self.assertIsNone(anticipator.take(self._request(response_start_time=1.5)))
+    anticipator.stop()
+
+  def testTakeWaitsForMatchingRequestInFlight(self):
+    started = threading.Event()
+    release = threading.Event()
+
+    def generate(unused_request):
+      started.set()
+      release.wait()
+      return 'response'
+
+    anticipator = midi_interaction._ResponseAnticipator(generate)  # pylint:disable=protected-access
+    anticipator.start()
+    request = self._request()
+    anticipator.submit(request)
+    started.wait()
+
+    results = []
+    taker = threading.Thread(
+        target=lambda: results.append(anticipator.take(request)))
+    taker.start()
+    taker.join(0.1)
+    self.assertTrue(taker.is_alive())
+    release.set()
+    taker.join()
+    self.assertEqual([(request, 'response')], results)
+    anticipator.stop()
+
+  def testTakeDoesNotWaitForMismatchedRequestInFlight(self):
+    started = threading.Event()
+    release = threading.Event()
+
+    def generate(unused_request):
+      started.set()
+      release.wait()
+      return 'response'
+
+    anticipator = midi_interaction._ResponseAnticipator(generate)  # pylint:disable=protected-access
+    anticipator.start()
+    anticipator.submit(self._request())
+    started.wait()
+    # Returns while the stale request is still being generated.
+    self.assertIsNone(anticipator.take(self._request(response_start_time=1.5)))
+    release.set()
+    anticipator.stop()
+
+
+class CallAndResponseMidiInteractionTest(tf.test.TestCase):
+
+  def setUp(self):
+    # Anticipatory generations of responses ending at 14 seconds block.
+    self.generator = FakeSequenceGenerator(blocked_end_time=4.0)
+    self.interaction = midi_interaction.CallAndResponseMidiInteraction(
+        FakeMidiHub(), [self.generator], qpm=120,
+        generator_select_control_number=None, tick_duration=1.0)
+    self.interaction._anticipator.start()  # pylint:disable=protected-access
+    self.addCleanup(self.interaction._anticipator.stop)  # pylint:disable=protected-access
+    self.addCleanup(self.generator.release.set)
+    # A call from 10 to 11 seconds.
+    self.call_sequence = music_pb2.NoteSequence()
+    testing_lib.add_track_to_sequence(
+        self.call_sequence, 0, [(60, 100, 10.0, 10.5), (62, 100, 10.5, 11.0)])
+    self.call_sequence.total_time = 11.0
+
+  def _anticipate(self, response_end_time):
+    self.interaction._anticipator.submit(  # pylint:disable=protected-access
+        self.interaction._response_request(  # pylint:disable=protected-access
+            self.call_sequence, 10.0, 11.0, response_end_time))
+
+  def _response_notes(self, response_sequence):
+    return [(note.pitch, note.start_time, note.end_time)
+            for note in response_sequence.notes if note.start_time >= 11.0]
+
+  def testRespondTrimsLongerAnticipatedResponse(self):
+    self._anticipate(response_end_time=13.0)
+    response_sequence = self.interaction._respond(  # pylint:disable=protected-access
+        self.call_sequence, 10.0, 11.0, 12.0)
+    self.assertLen(self.generator.requests, 1)
+    self.assertEqual(1, self.interaction.anticipation_hits)
+    self.assertEqual([(2, 11.0, 11.5), (2, 11.5, 12.0)],
+                     self._response_notes(response_sequence))
+
+  def testRespondExtendsShorterAnticipatedResponse(self):
+    self._anticipate(response_end_time=12.0)
+    response_sequence = self.interaction._respond(  # pylint:disable=protected-access
+        self.call_sequence, 10.0, 11.0, 13.0)
+    self.assertLen(self.generator.requests, 2)
+    self.assertEqual(1, self.interaction.anticipation_hits)
+    # The extension is primed with the call and the anticipated response.
+    self.assertEqual(
+        [(2, 11.0, 11.5), (2, 11.5, 12.0), (4, 12.0, 12.5), (4, 12.5, 13.0)],
+        self._response_notes(response_sequence))
+    self.assertEqual(13.0, response_sequence.total_time)
+
+  def testRespondGeneratesUnanticipatedResponse(self):
+    self._anticipate(response_end_time=12.0)
+    response_sequence = self.interaction._respond(  # pylint:disable=protected-access
+        self.call_sequence, 10.0, 11.5, 12.5)
+    self.assertEqual(1, self.interaction.anticipation_misses)
+    self.assertEqual([(2, 11.5, 12.0), (2, 12.0, 12.5)],
+                     self._response_notes(response_sequence))
+
+  def testRespondDoesNotWaitForStaleAnticipatedResponse(self):
+    self._anticipate(response_end_time=14.0)
+    self.generator.blocked.wait()
+    responses = []
+    responder = threading.Thread(target=lambda: responses.append(
+        self.interaction._respond(  # pylint:disable=protected-access
+            self.call_sequence, 10.0, 11.5, 12.5)))
+    responder.start()
+    responder.join(5.0)
+    # The response was generated while the stale one is still being generated.
+    self.assertFalse(responder.is_alive())
+    self.assertEqual(1, self.interaction.anticipation_misses)
+    self.assertEqual([(2, 11.5, 12.0), (2, 12.0, 12.5)],
+                     self._response_notes(responses[0]))
+
+
+if __name__ == '__main__':
+  tf.test.main()
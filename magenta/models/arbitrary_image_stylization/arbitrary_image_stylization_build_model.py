@@ -162,35 +162,91 @@ def style_prediction(style_input_,
         bottleneck_feat = slim.conv2d(bottleneck_feat,
                                       style_prediction_bottleneck, [1, 1])
 
-    style_params = {}
-    with tf.variable_scope('style_params'):
-      for i in range(len(activation_depths)):
-        with tf.variable_scope(activation_names[i], reuse=reuse):
-          with slim.arg_scope(
-              [slim.conv2d],
-              activation_fn=None,
-              normalizer_fn=None,
-              trainable=trainable):
-
-            # Computing beta parameter of the style normalization for the
-            # activation_names[i] layer of the style transformer network.
-            # (batch_size, 1, 1, activation_depths[i])
-            beta = slim.conv2d(bottleneck_feat, activation_depths[i], [1, 1])
-            # (batch_size, activation_depths[i])
-            beta = tf.squeeze(beta, [1, 2], name='SpatialSqueeze')
-            style_params['{}/beta'.format(activation_names[i])] = beta
-
-            # Computing gamma parameter of the style normalization for the
-            # activation_names[i] layer of the style transformer network.
-            # (batch_size, 1, 1, activation_depths[i])
-            gamma = slim.conv2d(bottleneck_feat, activation_depths[i], [1, 1])
-            # (batch_size, activation_depths[i])
-            gamma = tf.squeeze(gamma, [1, 2], name='SpatialSqueeze')
-            style_params['{}/gamma'.format(activation_names[i])] = gamma
+    style_params = _style_params_from_bottleneck(
+        bottleneck_feat, activation_names, activation_depths, trainable,
+        reuse)
 
   return style_params, bottleneck_feat
 
 
+def _style_params_from_bottleneck(bottleneck_feat, activation_names,
+                                  activation_depths, trainable, reuse):
+  """Maps style embeddings to the beta and gamma parameters.
+
+  Must be called in the variable scope of the style prediction network.
+
+  Args:
+    bottleneck_feat: Tensor. Batch of style embeddings of shape
+        (batch_size, 1, 1, depth).
+    activation_names: string. Scope names of the activations of the transformer
+        network which are used to apply style normalization.
+    activation_depths: Shapes of the activations of the transformer network
+        which are used to apply style normalization.
+    trainable: bool. Should the parameters be marked as trainable?
+    reuse: bool. Whether to reuse model parameters.
+
+  Returns:
+    A dict mapping the names of the style normalization parameters to Tensors.
+  """
+  style_params = {}
+  with tf.variable_scope('style_params'):
+    for i in range(len(activation_depths)):
+      with tf.variable_scope(activation_names[i], reuse=reuse):
+        with slim.arg_scope(
+            [slim.conv2d],
+            activation_fn=None,
+            normalizer_fn=None,
+            trainable=trainable):
+
+          # Computing beta parameter of the style normalization for the
+          # activation_names[i] layer of the style transformer network.
+          # (batch_size, 1, 1, activation_depths[i])
+          beta = slim.conv2d(bottleneck_feat, activation_depths[i], [1, 1])
+          # (batch_size, activation_depths[i])
+          beta = tf.squeeze(beta, [1, 2], name='SpatialSqueeze')
+          style_params['{}/beta'.format(activation_names[i])] = beta
+
+          # Computing gamma parameter of the style normalization for the
+          # activation_names[i] layer of the style transformer network.
+          # (batch_size, 1, 1, activation_depths[i])
+          gamma = slim.conv2d(bottleneck_feat, activation_depths[i], [1, 1])
+          # (batch_size, activation_depths[i])
+          gamma = tf.squeeze(gamma, [1, 2], name='SpatialSqueeze')
+          style_params['{}/gamma'.format(activation_names[i])] = gamma
+  return style_params
+
+
+def stylize_with_bottleneck(content_input_, bottleneck_feat, trainable,
+                            is_training, reuse=None):
+  """Stylizes content images with given style embeddings.
+
+  Args:
+    content_input_: Tensor. Batch of content input images.
+    bottleneck_feat: Tensor. Batch of style embeddings of shape
+        (batch_size, 1, 1, style_prediction_bottleneck), one per content image,
+        as returned by `build_model`.
+    trainable: bool. Should the parameters be marked as trainable?
+    is_training: bool. Is it training phase or not?
+    reuse: bool. Whether to reuse model parameters. Defaults to False.
+
+  Returns:
+    Tensor for the output of the transformer network.
+  """
+  [activation_names,
+   activation_depths] = transformer_model.style_normalization_activations()
+  with tf.variable_scope(tf.get_variable_scope(), reuse=reuse):
+    style_params = _style_params_from_bottleneck(
+        bottleneck_feat, activation_names, activation_depths, trainable,
+        reuse)
+  return transformer_model.transform(
+      content_input_,
+      normalizer_fn=ops.conditional_style_norm,
+      reuse=reuse,
+      trainable=trainable,
+      is_training=is_training,
+      normalizer_params={'style_params': style_params})
+
+
 def _inception_v3_arg_scope(is_training=True,
                             weight_decay=0.00004,
                             stddev=0.1,
@@ -19,11 +19,17 @@ images with different strengths of stylization (interpolates between the
 identity transform parameters and the style parameters for the style image) and
 saves them to the given output_dir.
 See run_interpolation_with_identity.sh for example usage.
+
+The style embedding of each style image is computed once and reused for all
+content images, and the stylized images are computed in batches.
 """
 import ast
+import collections
+import itertools
 import os
 
 from magenta.models.arbitrary_image_stylization import arbitrary_image_stylization_build_model as build_model
+from magenta.models.arbitrary_image_stylization import style_embedding_cache
 from magenta.models.image_stylization import image_utils
 import numpy as np
 import tensorflow.compat.v1 as tf
@@ -50,8 +56,27 @@ flags.DEFINE_string('interpolation_weights', '[1.0]', 'List of weights'
                     'larger the weight is the strength of stylization is more.'
                     'Weight of 1.0 means the normal style transfer and weight'
                     'of 0.0 means identity transform.')
+flags.DEFINE_integer('batch_size', 8, 'Number of stylized images to compute '
+                     'in each session run.')
+flags.DEFINE_string('style_embedding_cache_dir', None, 'Optional directory to '
+                    'cache the style embeddings of the style images in, to '
+                    'reuse them in later runs.')
 FLAGS = flags.FLAGS
 
+# A stylized image to compute: the index of the content image in its group,
+# the name and style embedding of the style image, and the index and value of
+# the interpolation weight.
+_StylizationJob = collections.namedtuple(
+    '_StylizationJob',
+    ['content_i', 'style_img_name', 'style_params', 'interp_i', 'weight'])
+
+
+def _load_image(image_path):
+  """Returns the contents of an image file and the decoded RGB image."""
+  with tf.gfile.Open(image_path, 'rb') as f:
+    image_data = f.read()
+  return image_data, image_utils.load_np_image_uint8(image_path)[:, :, :3]
+
 
 def main(unused_argv=None):
   tf.logging.set_verbosity(tf.logging.INFO)
@@ -77,9 +102,14 @@ def main(unused_argv=None):
       content_img_preprocessed = image_utils.resize_image(
           content_img_ph, FLAGS.image_size)
 
-    # Defines the model.
-    stylized_images, _, _, bottleneck_feat = build_model.build_model(
-        content_img_preprocessed,
+    # Defines place holder for a batch of preprocessed content images of the
+    # same size.
+    content_batch_ph = tf.placeholder(tf.float32, shape=[None, None, None, 3])
+
+    # Defines the model. The bottleneck features of the single preprocessed
+    # style image are only used to compute style embeddings.
+    _, _, _, bottleneck_feat = build_model.build_model(
+        content_batch_ph,
         style_img_preprocessed,
         trainable=False,
         is_training=False,
@@ -87,6 +117,16 @@ def main(unused_argv=None):
         style_prediction_bottleneck=100,
         adds_losses=False)
 
+    # Defines place holder for the interpolated style embeddings of a batch of
+    # content images, and the transformer network that applies them.
+    bottleneck_batch_ph = tf.placeholder(tf.float32, shape=[None, 1, 1, 100])
+    stylized_images = build_model.stylize_with_bottleneck(
+        content_batch_ph,
+        bottleneck_batch_ph,
+        trainable=False,
+        is_training=False,
+        reuse=True)
+
     if tf.gfile.IsDirectory(FLAGS.checkpoint):
       checkpoint = tf.train.latest_checkpoint(FLAGS.checkpoint)
     else:
@@ -98,6 +138,12 @@ def main(unused_argv=None):
     sess.run([tf.local_variables_initializer()])
     init_fn(sess)
 
+    # Style embeddings of the style images, and of the content images for the
+    # identity transform.
+    style_cache = style_embedding_cache.StyleEmbeddingCache(
+        checkpoint, FLAGS.style_image_size, FLAGS.style_square_crop,
+        cache_dir=FLAGS.style_embedding_cache_dir)
+
     # Gets the list of the input style images.
     style_img_list = tf.gfile.Glob(FLAGS.style_images_paths)
     if len(style_img_list) > FLAGS.maximum_styles_to_evaluate:
@@ -105,72 +151,95 @@ def main(unused_argv=None):
       style_img_list = np.random.permutation(style_img_list)
       style_img_list = style_img_list[:FLAGS.maximum_styles_to_evaluate]
 
+    # Computes bottleneck features of the style prediction network for each
+    # style image once, and saves the preprocessed style images.
+    styles = []
+    for style_i, style_img_path in enumerate(style_img_list):
+      style_img_name = os.path.basename(style_img_path)[:-4]
+      style_img_data, style_image_np = _load_image(style_img_path)
+      style_params = style_cache.get(style_img_data)
+      if style_params is None:
+        style_img_croped_resized_np, style_params = sess.run(
+            [style_img_preprocessed, bottleneck_feat],
+            feed_dict={style_img_ph: style_image_np})
+        style_cache.put(style_img_data, style_params)
+      else:
+        style_img_croped_resized_np = sess.run(
+            style_img_preprocessed, feed_dict={style_img_ph: style_image_np})
+      image_utils.save_np_image(style_img_croped_resized_np,
+                                os.path.join(FLAGS.output_dir,
+                                             '%s.jpg' % (style_img_name)))
+      styles.append((style_img_name, style_params))
+      if style_i % 10 == 0:
+        tf.logging.info('Computed style embedding (%d) %s' %
+                        (style_i, style_img_name))
+
+    interpolation_weights = ast.literal_eval(FLAGS.interpolation_weights)
+
     # Gets list of input content images.
     content_img_list = tf.gfile.Glob(FLAGS.content_images_paths)
 
-    for content_i, content_img_path in enumerate(content_img_list):
-      content_img_np = image_utils.load_np_image_uint8(content_img_path)[:, :, :
-                                                                         3]
-      content_img_name = os.path.basename(content_img_path)[:-4]
-
-      # Saves preprocessed content image.
-      inp_img_croped_resized_np = sess.run(
-          content_img_preprocessed, feed_dict={
-              content_img_ph: content_img_np
-          })
-      image_utils.save_np_image(inp_img_croped_resized_np,
-                                os.path.join(FLAGS.output_dir,
-                                             '%s.jpg' % (content_img_name)))
-
-      # Computes bottleneck features of the style prediction network for the
-      # identity transform.
-      identity_params = sess.run(
-          bottleneck_feat, feed_dict={style_img_ph: content_img_np})
-
-      for style_i, style_img_path in enumerate(style_img_list):
-        if style_i > FLAGS.maximum_styles_to_evaluate:
-          break
-        style_img_name = os.path.basename(style_img_path)[:-4]
-        style_image_np = image_utils.load_np_image_uint8(style_img_path)[:, :, :
-                                                                         3]
-
-        if style_i % 10 == 0:
-          tf.logging.info('Stylizing (%d) %s with (%d) %s' %
-                          (content_i, content_img_name, style_i,
-                           style_img_name))
-
-        # Saves preprocessed style image.
-        style_img_croped_resized_np = sess.run(
-            style_img_preprocessed, feed_dict={
-                style_img_ph: style_image_np
+    # Content images are read FLAGS.batch_size at a time, and the stylized
+    # images of the content images of the same size are computed in batches.
+    for chunk_start in range(0, len(content_img_list), FLAGS.batch_size):
+      content_groups = collections.defaultdict(list)
+      for content_i, content_img_path in enumerate(
+          content_img_list[chunk_start:chunk_start + FLAGS.batch_size],
+          chunk_start):
+        content_img_data, content_img_np = _load_image(content_img_path)
+        content_img_name = os.path.basename(content_img_path)[:-4]
+        tf.logging.info('Stylizing (%d) %s' % (content_i, content_img_name))
+
+        # Saves preprocessed content image.
+        inp_img_croped_resized_np = sess.run(
+            content_img_preprocessed, feed_dict={
+                content_img_ph: content_img_np
             })
-        image_utils.save_np_image(style_img_croped_resized_np,
+        image_utils.save_np_image(inp_img_croped_resized_np,
                                   os.path.join(FLAGS.output_dir,
-                                               '%s.jpg' % (style_img_name)))
+                                               '%s.jpg' % (content_img_name)))
 
         # Computes bottleneck features of the style prediction network for the
-        # given style image.
-        style_params = sess.run(
-            bottleneck_feat, feed_dict={style_img_ph: style_image_np})
+        # identity transform.
+        identity_params = style_cache.get(content_img_data)
+        if identity_params is None:
+          identity_params = sess.run(
+              bottleneck_feat, feed_dict={style_img_ph: content_img_np})
+          style_cache.put(content_img_data, identity_params)
+
+        content_groups[inp_img_croped_resized_np.shape].append(
+            (content_img_name, inp_img_croped_resized_np[0], identity_params))
 
-        interpolation_weights = ast.literal_eval(FLAGS.interpolation_weights)
+      for contents in content_groups.values():
         # Interpolates between the parameters of the identity transform and
-        # style parameters of the given style image.
-        for interp_i, wi in enumerate(interpolation_weights):
-          stylized_image_res = sess.run(
+        # style parameters of each style image.
+        jobs = [
+            _StylizationJob(content_i, style_img_name, style_params, interp_i,
+                            wi)
+            for content_i, (style_img_name, style_params), (interp_i, wi)
+            in itertools.product(range(len(contents)), styles,
+                                 enumerate(interpolation_weights))
+        ]
+        for batch_start in range(0, len(jobs), FLAGS.batch_size):
+          batch = jobs[batch_start:batch_start + FLAGS.batch_size]
+          stylized_images_res = sess.run(
               stylized_images,
               feed_dict={
-                  bottleneck_feat:
-                      identity_params * (1 - wi) + style_params * wi,
-                  content_img_ph:
-                      content_img_np
+                  bottleneck_batch_ph: np.concatenate([
+                      contents[job.content_i][2] * (1 - job.weight) +
+                      job.style_params * job.weight for job in batch
+                  ]),
+                  content_batch_ph: np.stack(
+                      [contents[job.content_i][1] for job in batch])
               })
 
-          # Saves stylized image.
-          image_utils.save_np_image(
-              stylized_image_res,
-              os.path.join(FLAGS.output_dir, '%s_stylized_%s_%d.jpg' %
-                           (content_img_name, style_img_name, interp_i)))
+          # Saves stylized images.
+          for job, stylized_image_res in zip(batch, stylized_images_res):
+            image_utils.save_np_image(
+                stylized_image_res[None],
+                os.path.join(FLAGS.output_dir, '%s_stylized_%s_%d.jpg' %
+                             (contents[job.content_i][0], job.style_img_name,
+                              job.interp_i)))
 
 
 def console_entry_point():
@@ -0,0 +1,80 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for arbitrary_image_stylization_with_weights."""
+import os
+
+from absl.testing import flagsaver
+from magenta.models.arbitrary_image_stylization import arbitrary_image_stylization_build_model as build_model
+from magenta.models.arbitrary_image_stylization import arbitrary_image_stylization_with_weights as with_weights
+from magenta.models.image_stylization import image_utils
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+FLAGS = tf.app.flags.FLAGS
+
+
+class ArbitraryImageStylizationWithWeightsTest(tf.test.TestCase):
+
+  def _save_checkpoint(self):
+    """Saves a checkpoint of a randomly initialized model."""
+    checkpoint = os.path.join(self.get_temp_dir(), 'model.ckpt')
+    with tf.Graph().as_default(), tf.Session() as sess:
+      build_model.build_model(
+          tf.zeros([1, 64, 64, 3]),
+          tf.zeros([1, 96, 96, 3]),
+          trainable=False,
+          is_training=False,
+          inception_end_point='Mixed_6e',
+          style_prediction_bottleneck=100,
+          adds_losses=False)
+      sess.run(tf.global_variables_initializer())
+      tf.train.Saver().save(sess, checkpoint)
+    return checkpoint
+
+  def _save_images(self, name, num_images, image_size):
+    image_dir = os.path.join(self.get_temp_dir(), name)
+    tf.gfile.MakeDirs(image_dir)
+    for i in range(num_images):
+      image_utils.save_np_image(
+          np.random.uniform(size=(1, image_size, image_size, 3)),
+          os.path.join(image_dir, '%s_%d.jpg' % (name, i)))
+    return os.path.join(image_dir, '*.jpg')
+
+  def testStylizesInBatches(self):
+    output_dir = os.path.join(self.get_temp_dir(), 'output')
+    # 2 content images x 1 style image x 2 weights, computed in one batch.
+    with flagsaver.flagsaver(
+        checkpoint=self._save_checkpoint(),
+        style_images_paths=self._save_images('style', 1, 96),
+        content_images_paths=self._save_images('content', 2, 64),
+        output_dir=output_dir,
+        image_size=64,
+        style_image_size=96,
+        interpolation_weights='[0.5, 1.0]',
+        batch_size=4):
+      with_weights.main()
+
+    for content_i in range(2):
+      for interp_i in range(2):
+        self.assertTrue(tf.gfile.Exists(os.path.join(
+            output_dir,
+            'content_%d_stylized_style_0_%d.jpg' % (content_i, interp_i))))
+
+
+if __name__ == '__main__':
+  tf.test.main()
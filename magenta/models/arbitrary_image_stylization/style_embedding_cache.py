@@ -0,0 +1,124 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Cache of the style embeddings of style images.
+
+The style embedding (the bottleneck of the style prediction network) of an
+image only depends on the image, on how it is preprocessed and on the
+checkpoint, so it can be computed once and reused for every content image.
+Embeddings are kept in memory and, if a cache directory is given, stored as
+`.npy` files keyed by a hash of all of these.
+"""
+
+import hashlib
+import io
+import os
+
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+_CACHE_FILE_EXTENSION = '.npy'
+
+
+def style_embedding_key(image_data, checkpoint, image_size, square_crop):
+  """Returns the cache key of the style embedding of an image.
+
+  Args:
+    image_data: The contents of the image file.
+    checkpoint: Path of the model checkpoint that computes the embedding.
+    image_size: int. Size the image is resized to.
+    square_crop: bool. Whether the image is center cropped to a square.
+
+  Returns:
+    A hex digest of the image data and of the embedding settings.
+  """
+  hasher = hashlib.sha1()
+  hasher.update(('checkpoint=%s;image_size=%d;square_crop=%r;' % (
+      checkpoint, image_size, square_crop)).encode('utf-8'))
+  hasher.update(image_data)
+  return hasher.hexdigest()
+
+
+class StyleEmbeddingCache(object):
+  """In-memory and optional on-disk cache of style embeddings."""
+
+  def __init__(self, checkpoint, image_size, square_crop, cache_dir=None):
+    """Creates a StyleEmbeddingCache.
+
+    Args:
+      checkpoint: Path of the model checkpoint that computes the embeddings.
+      image_size: int. Size the images are resized to.
+      square_crop: bool. Whether the images are center cropped to a square.
+      cache_dir: Optional directory to store the embeddings in. It is created
+          if it does not exist.
+    """
+    self._checkpoint = checkpoint
+    self._image_size = image_size
+    self._square_crop = square_crop
+    self._cache_dir = cache_dir
+    if cache_dir and not tf.gfile.Exists(cache_dir):
+      tf.gfile.MakeDirs(cache_dir)
+    self._embeddings = {}
+    self.hits = 0
+    self.misses = 0
+
+  def _key(self, image_data):
+    return style_embedding_key(image_data, self._checkpoint, self._image_size,
+                               self._square_crop)
+
+  def _path(self, key):
+    return os.path.join(self._cache_dir, key + _CACHE_FILE_EXTENSION)
+
+  def get(self, image_data):
+    """Returns the cached style embedding of an image, or None on a miss.
+
+    Args:
+      image_data: The contents of the image file.
+
+    Returns:
+      The style embedding as a numpy array, or None if it is not cached.
+    """
+    key = self._key(image_data)
+    embedding = self._embeddings.get(key)
+    if embedding is None and self._cache_dir:
+      path = self._path(key)
+      if tf.gfile.Exists(path):
+        with tf.gfile.Open(path, 'rb') as f:
+          embedding = np.load(io.BytesIO(f.read()))
+        self._embeddings[key] = embedding
+    if embedding is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+    return embedding
+
+  def put(self, image_data, embedding):
+    """Stores the style embedding of an image in the cache.
+
+    Args:
+      image_data: The contents of the image file.
+      embedding: The style embedding as a numpy array.
+    """
+    key = self._key(image_data)
+    self._embeddings[key] = embedding
+    if self._cache_dir:
+      buf = io.BytesIO()
+      np.save(buf, embedding)
+      # Write to a temporary file first so that readers never see a partially
+      # written entry.
+      path = self._path(key)
+      with tf.gfile.Open(path + '.tmp', 'wb') as f:
+        f.write(buf.getvalue())
+      tf.gfile.Rename(path + '.tmp', path, overwrite=True)
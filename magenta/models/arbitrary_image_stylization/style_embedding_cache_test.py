@@ -0,0 +1,70 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for style_embedding_cache."""
+import os
+
+from magenta.models.arbitrary_image_stylization import style_embedding_cache
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+
+class StyleEmbeddingCacheTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(StyleEmbeddingCacheTest, self).setUp()
+    self.cache_dir = os.path.join(self.get_temp_dir(), 'style_embeddings')
+    self.embedding = np.random.RandomState(0).randn(1, 1, 1, 100).astype(
+        np.float32)
+
+  def testPutAndGet(self):
+    cache = style_embedding_cache.StyleEmbeddingCache(
+        '/path/to/model.ckpt', 256, False)
+    self.assertIsNone(cache.get(b'style'))
+    cache.put(b'style', self.embedding)
+    self.assertAllEqual(self.embedding, cache.get(b'style'))
+    self.assertIsNone(cache.get(b'other style'))
+    self.assertEqual(1, cache.hits)
+    self.assertEqual(2, cache.misses)
+
+  def testOnDiskRoundTrip(self):
+    cache = style_embedding_cache.StyleEmbeddingCache(
+        '/path/to/model.ckpt', 256, False, cache_dir=self.cache_dir)
+    cache.put(b'style', self.embedding)
+
+    reloaded_cache = style_embedding_cache.StyleEmbeddingCache(
+        '/path/to/model.ckpt', 256, False, cache_dir=self.cache_dir)
+    self.assertAllEqual(self.embedding, reloaded_cache.get(b'style'))
+    self.assertEqual(1, reloaded_cache.hits)
+
+    other_checkpoint_cache = style_embedding_cache.StyleEmbeddingCache(
+        '/path/to/other_model.ckpt', 256, False, cache_dir=self.cache_dir)
+    self.assertIsNone(other_checkpoint_cache.get(b'style'))
+
+  def testKeyDependsOnPreprocessing(self):
+    key = style_embedding_cache.style_embedding_key(
+        b'style', '/path/to/model.ckpt', 256, False)
+    self.assertEqual(key, style_embedding_cache.style_embedding_key(
+        b'style', '/path/to/model.ckpt', 256, False))
+    self.assertNotEqual(key, style_embedding_cache.style_embedding_key(
+        b'style', '/path/to/model.ckpt', 512, False))
+    self.assertNotEqual(key, style_embedding_cache.style_embedding_key(
+        b'style', '/path/to/model.ckpt', 256, True))
+    self.assertNotEqual(key, style_embedding_cache.style_embedding_key(
+        b'other style', '/path/to/model.ckpt', 256, False))
+
+
+if __name__ == '__main__':
+  tf.test.main()
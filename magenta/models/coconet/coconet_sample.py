@@ -46,6 +46,11 @@ flags.DEFINE_string("checkpoint", None, "Path to checkpoint file")
 flags.DEFINE_bool("midi_io", False, "Run in midi in and midi out mode."
                   "Does not write any midi or logs to disk.")
 flags.DEFINE_bool("tfsample", True, "Run sampling in Tensorflow graph.")
+flags.DEFINE_integer("ancestral_block_size", 1,
+                     "Number of variables that ancestral sampling strategies "
+                     "sample per model evaluation when not sampling in the "
+                     "Tensorflow graph. Larger blocks take fewer model "
+                     "evaluations at some cost in sample quality.")
 
 
 def main(unused_argv):
@@ -318,12 +323,19 @@ class BaseStrategy(lib_util.Factory):
     self.wmodel = wmodel
     self.logger = logger
     self.decoder = decoder
+    # The samplers made for the current run.
+    self._samplers = []
 
   def __call__(self, shape):
     label = "%s_strategy" % self.key
+    self._samplers = []
     with lib_util.timing(label):
       with self.logger.section(label):
-        return self.run(shape)
+        pianorolls = self.run(shape)
+    # Each model evaluation covers the whole batch.
+    tf.logging.info("%s: %d model evaluations", label, sum(
+        sampler.num_model_evaluations for sampler in self._samplers))
+    return pianorolls
 
   def blank_slate(self, shape):
     return (np.zeros(shape, dtype=np.float32), np.ones(shape, dtype=np.float32))
@@ -331,7 +343,9 @@ class BaseStrategy(lib_util.Factory):
   # convenience function to avoid passing the same arguments over and over
   def make_sampler(self, key, **kwargs):
     kwargs.update(wmodel=self.wmodel, logger=self.logger)
-    return lib_sampling.BaseSampler.make(key, **kwargs)
+    sampler = lib_sampling.BaseSampler.make(key, **kwargs)
+    self._samplers.append(sampler)
+    return sampler
 
 
 # pylint:disable=missing-docstring
@@ -519,7 +533,8 @@ class ChronologicalStrategy(BaseStrategy):
     sampler = self.make_sampler(
         "ancestral",
         temperature=FLAGS.temperature,
-        selector=lib_sampling.ChronologicalSelector())
+        selector=lib_sampling.ChronologicalSelector(),
+        block_size=FLAGS.ancestral_block_size)
     pianorolls, masks = self.blank_slate(shape)
     pianorolls = sampler(pianorolls, masks)
     return pianorolls
@@ -532,7 +547,36 @@ class OrderlessStrategy(BaseStrategy):
     sampler = self.make_sampler(
         "ancestral",
         temperature=FLAGS.temperature,
-        selector=lib_sampling.OrderlessSelector())
+        selector=lib_sampling.OrderlessSelector(),
+        block_size=FLAGS.ancestral_block_size)
+    pianorolls, masks = self.blank_slate(shape)
+    pianorolls = sampler(pianorolls, masks)
+    return pianorolls
+
+
+class StridedStrategy(BaseStrategy):
+  key = "strided"
+
+  def run(self, shape):
+    sampler = self.make_sampler(
+        "ancestral",
+        temperature=FLAGS.temperature,
+        selector=lib_sampling.StridedSelector(),
+        block_size=FLAGS.ancestral_block_size)
+    pianorolls, masks = self.blank_slate(shape)
+    pianorolls = sampler(pianorolls, masks)
+    return pianorolls
+
+
+class ConfidenceStrategy(BaseStrategy):
+  key = "confidence"
+
+  def run(self, shape):
+    sampler = self.make_sampler(
+        "ancestral",
+        temperature=FLAGS.temperature,
+        selector=lib_sampling.ConfidenceSelector(),
+        block_size=FLAGS.ancestral_block_size)
     pianorolls, masks = self.blank_slate(shape)
     pianorolls = sampler(pianorolls, masks)
     return pianorolls
@@ -563,6 +607,7 @@ class AgibbsStrategy(BaseStrategy):
         sampler=self.make_sampler(
             "ancestral",
             selector=lib_sampling.OrderlessSelector(),
+            block_size=FLAGS.ancestral_block_size,
             temperature=FLAGS.temperature),
         schedule=lib_sampling.YaoSchedule())
     pianorolls = sampler(pianorolls, masks)
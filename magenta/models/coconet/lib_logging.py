@@ -31,7 +31,7 @@ class NoLogger(object):
 
   @contextlib.contextmanager
   def section(self, *args, **kwargs):
-    pass
+    yield
 
 
 class Logger(object):
@@ -46,8 +46,12 @@ class BaseSampler(lib_util.Factory):
     self.wmodel = wmodel
     self.temperature = temperature
     self.logger = logger if logger is not None else lib_logging.NoLogger()
+    # Number of model evaluations made by this sampler, each of which covers
+    # the whole batch.
+    self.num_model_evaluations = 0
 
     def predictor(pianorolls, masks):
+      self.num_model_evaluations += 1
       predictions = self.wmodel.sess.run(self.wmodel.model.predictions, {
           self.wmodel.model.pianorolls: pianorolls,
           self.wmodel.model.masks: masks
@@ -70,6 +74,11 @@ class BaseSampler(lib_util.Factory):
       return lib_util.sample_bernoulli(
           0.5 * predictions, temperature=temperature)
 
+  @property
+  def total_model_evaluations(self):
+    """Number of model evaluations made by this sampler and inner samplers."""
+    return self.num_model_evaluations
+
   @classmethod
   def __repr__(cls, self):  # pylint: disable=unexpected-special-method-signature
     return "samplers.%s" % cls.key
@@ -166,11 +175,19 @@ class AncestralSampler(BaseSampler):
   def __init__(self, **kwargs):
     """Initialize an AncestralSampler instance.
 
+    Possible keyword arguments.
+    selector: an instance of BaseSelector; determines the causal order in which
+        variables are to be sampled.
+    block_size: number of variables to sample per model evaluation. Variables
+        in a block are sampled independently of each other, so larger blocks
+        take fewer model evaluations at some cost in sample quality. Defaults
+        to 1, which samples fully sequentially.
+
     Args:
-      **kwargs: selector: an instance of BaseSelector; determines the causal
-          order in which variables are to be sampled.
+      **kwargs: Possible keyword arguments listed above.
     """
     self.selector = kwargs.pop("selector")
+    self.block_size = kwargs.pop("block_size", 1)
     super(AncestralSampler, self).__init__(**kwargs)
 
   def _run(self, pianorolls, masks):
@@ -178,16 +195,21 @@ class AncestralSampler(BaseSampler):
     ii = pianorolls.shape[-1]
     assert self.separate_instruments or ii == 1
 
-    # determine how many model evaluations we need to make
-    mask_size = np.max(_numbers_of_masked_variables(masks))
+    # determine how many model evaluations we need to make. Without separate
+    # instruments, each pitch at each time step is a variable of its own.
+    mask_size = np.max(_numbers_of_masked_variables(
+        masks, separate_instruments=self.separate_instruments))
+    num_evaluations = int(np.ceil(mask_size / float(self.block_size)))
 
     with self.logger.section("sequence", subsample_factor=10):
-      for _ in range(mask_size):
+      for _ in range(num_evaluations):
         predictions = self.predictor(pianorolls, masks)
         samples = self.sample_predictions(predictions)
-        assert np.allclose(samples.max(axis=2), 1)
+        if self.separate_instruments:
+          assert np.allclose(samples.max(axis=2), 1)
         selection = self.selector(
-            predictions, masks, separate_instruments=self.separate_instruments)
+            predictions, masks, separate_instruments=self.separate_instruments,
+            num_variables=self.block_size)
         pianorolls = np.where(selection, samples, pianorolls)
         self.logger.log(
             pianorolls=pianorolls, masks=masks, predictions=predictions)
@@ -222,6 +244,10 @@ class GibbsSampler(BaseSampler):
     self.num_steps = kwargs.pop("num_steps", None)
     super(GibbsSampler, self).__init__(**kwargs)
 
+  @property
+  def total_model_evaluations(self):
+    return self.num_model_evaluations + self.sampler.total_model_evaluations
+
   def _run(self, pianorolls, masks):
     print("shape", pianorolls.shape)
     if self.num_steps is None:
@@ -267,6 +293,10 @@ class UpsamplingSampler(BaseSampler):
     self.desired_length = kwargs.pop("desired_length")
     super(UpsamplingSampler, self).__init__(**kwargs)
 
+  @property
+  def total_model_evaluations(self):
+    return self.num_model_evaluations + self.sampler.total_model_evaluations
+
   def _run(self, pianorolls, masks=1.):
     if not np.all(masks):
       raise NotImplementedError()
@@ -450,17 +480,20 @@ class ConstantSchedule(BaseSchedule):
 class BaseSelector(lib_util.Factory):
   """Base class for next variable selection in AncestralSampler."""
 
-  def __call__(self, predictions, masks, separate_instruments=True, **kwargs):
-    """Select the next variable to sample.
+  def __call__(self, predictions, masks, separate_instruments=True,
+               num_variables=1, **kwargs):
+    """Select the next variables to sample.
 
     Args:
       predictions: model outputs
       masks: masks within which to sample
       separate_instruments: whether instruments are separated
+      num_variables: number of variables to select in each example, or fewer
+          if fewer are masked
       **kwargs: Additional args.
 
     Returns:
-      mask indicating which variable to sample next
+      mask indicating which variables to sample next
     """
     raise NotImplementedError()
 
@@ -470,26 +503,14 @@ class ChronologicalSelector(BaseSelector):
 
   key = "chronological"
 
-  def __call__(self, predictions, masks, separate_instruments=True):
-    bb, tt, pp, ii = masks.shape
-    # determine which variable to update
-    if separate_instruments:
-      # find index of first (t, i) with mask[:, t, :, i] == 1
-      selection = np.argmax(
-          np.transpose(masks, axes=[0, 2, 1, 3]).reshape((bb, pp, tt * ii)),
-          axis=2)
-      selection = np.transpose(
-          np.eye(tt * ii)[selection].reshape((bb, pp, tt, ii)),
-          axes=[0, 2, 1, 3])
-    else:
-      # find index of first (t, p) with mask[:, t, p, :] == 1
-      selection = np.argmax(masks.reshape((bb, tt * pp)), axis=1)
-      selection = np.eye(tt * pp)[selection].reshape((bb, tt, pp, ii))
-    # Intersect with mask to avoid selecting outside of the mask, e.g. in case
-    # some masks[b] is zero everywhere.
-    # This can happen inside blocked Gibbs, where different examples have
-    # different block sizes.
-    return selection * masks
+  def __call__(self, predictions, masks, separate_instruments=True,
+               num_variables=1):
+    # Earlier variables score higher.
+    variable_masks = _variable_masks(masks, separate_instruments)
+    bb, num_all_variables = variable_masks.shape
+    scores = np.tile(-np.arange(num_all_variables), [bb, 1])
+    return _select_top_variables(
+        scores, masks, num_variables, separate_instruments)
 
 
 class OrderlessSelector(BaseSelector):
@@ -497,8 +518,15 @@ class OrderlessSelector(BaseSelector):
 
   key = "orderless"
 
-  def __call__(self, predictions, masks, separate_instruments=True):
+  def __call__(self, predictions, masks, separate_instruments=True,
+               num_variables=1):
     bb, tt, pp, ii = masks.shape
+    if num_variables > 1:
+      # Select a uniformly random subset of the masked variables.
+      scores = np.random.random(_variable_masks(
+          masks, separate_instruments).shape)
+      return _select_top_variables(
+          scores, masks, num_variables, separate_instruments)
     if separate_instruments:
       # select one variable to sample. sample according to normalized mask;
       # is uniform as all masked out variables have equal positive weight.
@@ -516,6 +544,100 @@ class OrderlessSelector(BaseSelector):
     return selection * masks
 
 
+class StridedSelector(BaseSelector):
+  """Selects variables spread out evenly in time.
+
+  The selected variables are spaced evenly among the masked variables in
+  chronological order, so that variables sampled together are far apart and
+  depend little on each other.
+  """
+
+  key = "strided"
+
+  def __call__(self, predictions, masks, separate_instruments=True,
+               num_variables=1):
+    variable_masks = _variable_masks(masks, separate_instruments)
+    scores = np.zeros(variable_masks.shape)
+    for b in range(len(variable_masks)):
+      indices = np.flatnonzero(variable_masks[b])
+      if not indices.size:
+        continue
+      num_selected = min(num_variables, indices.size)
+      strides = np.arange(num_selected) * indices.size // num_selected
+      scores[b, indices[strides]] = 1
+    return _select_top_variables(
+        scores, masks, num_variables, separate_instruments)
+
+
+class ConfidenceSelector(BaseSelector):
+  """Selects the variables that the model is most confident about.
+
+  A variable's confidence is the probability of its most likely value.
+  """
+
+  key = "confidence"
+
+  def __call__(self, predictions, masks, separate_instruments=True,
+               num_variables=1):
+    if separate_instruments:
+      confidences = predictions.max(axis=2)
+    else:
+      confidences = np.maximum(predictions, 1 - predictions)
+    scores = confidences.reshape([len(masks), -1])
+    return _select_top_variables(
+        scores, masks, num_variables, separate_instruments)
+
+
+def _selection_shape(masks, separate_instruments):
+  """Returns the shape of a selection of variables, broadcastable to masks."""
+  bb, tt, pp, ii = masks.shape
+  return [bb, tt, 1, ii] if separate_instruments else [bb, tt, pp, ii]
+
+
+def _variable_masks(masks, separate_instruments):
+  """Returns whether each variable is masked, flattened in chronological order.
+
+  Args:
+    masks: masks within which to sample
+    separate_instruments: whether instruments are separated, in which case a
+        variable is the pitch of an instrument at a time step, and otherwise is
+        whether a pitch is on at a time step
+
+  Returns:
+    An array of shape [batch, variables].
+  """
+  if separate_instruments:
+    masks = masks.max(axis=2)
+  return masks.reshape([len(masks), -1]) > 0
+
+
+def _select_top_variables(scores, masks, num_variables, separate_instruments):
+  """Selects the masked variables with the highest scores.
+
+  Args:
+    scores: array of shape [batch, variables] with a score for each variable,
+        in the order of `_variable_masks`
+    masks: masks within which to select
+    num_variables: number of variables to select in each example, or fewer
+        if fewer are masked
+    separate_instruments: whether instruments are separated
+
+  Returns:
+    mask indicating which variables are selected
+  """
+  variable_masks = _variable_masks(masks, separate_instruments)
+  scores = np.where(variable_masks, scores, -np.inf)
+  num_variables = min(num_variables, scores.shape[1])
+  # Ties are broken in favor of earlier variables.
+  top = np.argsort(-scores, axis=1, kind="stable")[:, :num_variables]
+  selection = np.zeros(scores.shape, dtype=masks.dtype)
+  np.put_along_axis(selection, top, 1, axis=1)
+  selection = selection.reshape(_selection_shape(masks, separate_instruments))
+  # Intersect with mask to avoid selecting outside of the mask, e.g. in case
+  # some masks[b] has fewer masked variables than `num_variables`.
+  return selection * masks
+
+
 def _numbers_of_masked_variables(masks, separate_instruments=True):
   if separate_instruments:
     return masks.max(axis=2).sum(axis=(1, 2))
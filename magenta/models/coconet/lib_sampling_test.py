@@ -0,0 +1,150 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for lib_sampling."""
+import collections
+
+from absl.testing import parameterized
+from magenta.models.coconet import lib_sampling
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+_FakeHparams = collections.namedtuple('_FakeHparams', ['separate_instruments'])
+_FakeModel = collections.namedtuple(
+    '_FakeModel', ['predictions', 'pianorolls', 'masks'])
+
+
+class _FakeSession(object):
+  """Returns fixed predictions for any pianorolls."""
+
+  def __init__(self, predictions):
+    self.predictions = predictions
+
+  def run(self, unused_fetches, unused_feed_dict):
+    return self.predictions
+
+
+class _FakeWrappedModel(object):
+
+  def __init__(self, predictions, separate_instruments=True):
+    self.hparams = _FakeHparams(separate_instruments=separate_instruments)
+    self.model = _FakeModel('predictions', 'pianorolls', 'masks')
+    self.sess = _FakeSession(predictions)
+
+
+class LibSamplingTest(parameterized.TestCase, tf.test.TestCase):
+
+  def setUp(self):
+    super(LibSamplingTest, self).setUp()
+    np.random.seed(0)
+    # bb, tt, pp, ii
+    self.shape = (2, 8, 5, 4)
+    self.masks = np.ones(self.shape, dtype=np.float32)
+    # The first instrument of the second example is not masked.
+    self.masks[1, :, :, 0] = 0.
+    predictions = np.random.random(self.shape)
+    self.predictions = predictions / predictions.sum(axis=2, keepdims=True)
+
+  def _selected_variables(self, selection, example):
+    """Returns the (time, instrument) pairs selected in an example."""
+    selection = np.broadcast_to(selection, self.shape).max(axis=2)
+    return list(zip(*[indices.tolist()
+                      for indices in np.nonzero(selection[example])]))
+
+  @parameterized.parameters(
+      (lib_sampling.ChronologicalSelector,),
+      (lib_sampling.OrderlessSelector,),
+      (lib_sampling.StridedSelector,),
+      (lib_sampling.ConfidenceSelector,))
+  def testSelectorsSelectMaskedVariables(self, selector_class):
+    for num_variables in (1, 4, 100):
+      selection = selector_class()(
+          self.predictions, self.masks, num_variables=num_variables)
+      for example, num_masked in enumerate((32, 24)):
+        selected = self._selected_variables(selection, example)
+        self.assertLen(selected, min(num_variables, num_masked))
+        self.assertTrue(
+            all(self.masks[example, t, 0, i] for t, i in selected))
+
+  def testChronologicalSelector(self):
+    selection = lib_sampling.ChronologicalSelector()(
+        self.predictions, self.masks, num_variables=4)
+    self.assertEqual([(0, 1), (0, 2), (0, 3), (1, 1)],
+                     self._selected_variables(selection, 1))
+
+  def testStridedSelector(self):
+    selection = lib_sampling.StridedSelector()(
+        self.predictions, self.masks, num_variables=4)
+    # Every sixth of the 24 masked variables, all in different time steps.
+    self.assertEqual([(0, 1), (2, 1), (4, 1), (6, 1)],
+                     self._selected_variables(selection, 1))
+
+  def testConfidenceSelector(self):
+    selection = lib_sampling.ConfidenceSelector()(
+        self.predictions, self.masks, num_variables=3)
+    confidences = self.predictions[0].max(axis=1)
+    expected = sorted(zip(*np.unravel_index(
+        np.argsort(-confidences, axis=None)[:3], confidences.shape)))
+    self.assertEqual([(int(t), int(i)) for t, i in expected],
+                     self._selected_variables(selection, 0))
+
+  @parameterized.parameters((1, 32), (3, 11), (8, 4), (32, 1))
+  def testAncestralSamplerBlockSize(self, block_size, num_evaluations):
+    sampler = lib_sampling.AncestralSampler(
+        wmodel=_FakeWrappedModel(self.predictions),
+        selector=lib_sampling.StridedSelector(),
+        block_size=block_size)
+    pianorolls = sampler(np.zeros(self.shape, dtype=np.float32), self.masks)
+    self.assertEqual(num_evaluations, sampler.num_model_evaluations)
+    # Each masked variable is sampled exactly once and nothing else changes.
+    np.testing.assert_array_equal(
+        self.masks.max(axis=2), pianorolls.sum(axis=2))
+
+  @parameterized.parameters((1, 40), (8, 5))
+  def testAncestralSamplerWithoutSeparateInstruments(self, block_size,
+                                                     num_evaluations):
+    # bb, tt, pp, 1
+    shape = (2, 8, 5, 1)
+    masks = np.ones(shape, dtype=np.float32)
+    # Only the first half of the second example is masked.
+    masks[1, 4:] = 0.
+    pianorolls = np.zeros(shape, dtype=np.float32)
+    pianorolls[1, 4:] = 1.
+    sampler = lib_sampling.AncestralSampler(
+        wmodel=_FakeWrappedModel(np.random.random(shape),
+                                 separate_instruments=False),
+        selector=lib_sampling.OrderlessSelector(),
+        block_size=block_size)
+    pianorolls = sampler(pianorolls, masks)
+    # Each pitch at each time step is a variable, sampled on its own pass.
+    self.assertEqual(num_evaluations, sampler.num_model_evaluations)
+    np.testing.assert_array_equal(np.ones((4, 5, 1)), pianorolls[1, 4:])
+
+  def testGibbsSamplerCountsInnerModelEvaluations(self):
+    wmodel = _FakeWrappedModel(self.predictions)
+    sampler = lib_sampling.GibbsSampler(
+        wmodel=wmodel,
+        masker=lib_sampling.BernoulliMasker(),
+        sampler=lib_sampling.IndependentSampler(wmodel=wmodel),
+        schedule=lib_sampling.ConstantSchedule(0.5),
+        num_steps=3)
+    sampler(np.zeros(self.shape, dtype=np.float32), self.masks)
+    self.assertEqual(0, sampler.num_model_evaluations)
+    self.assertEqual(3, sampler.total_model_evaluations)
+
+
+if __name__ == '__main__':
+  tf.test.main()
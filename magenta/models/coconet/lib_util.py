@@ -74,7 +74,8 @@ def sample_bernoulli(p, temperature=1):
                                                 np.percentile(p, 75),
                                                 np.max(p)))
 
-    sampled = np.random.random(p.shape) < p
+    # p[0] are the renormalized probabilities of the values being 1.
+    sampled = np.random.random(p[0].shape) < p[0]
   return sampled
 
 
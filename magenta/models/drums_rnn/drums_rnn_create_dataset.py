@@ -36,6 +36,13 @@ flags.DEFINE_float(
     'eval_ratio', 0.1,
     'Fraction of input to set aside for eval set. Partition is randomly '
     'selected.')
+flags.DEFINE_integer(
+    'num_workers', 1,
+    'Number of worker processes to run the pipeline with. If greater than 1, '
+    'inputs are processed in parallel.')
+flags.DEFINE_integer(
+    'num_shards', 1,
+    'Number of TFRecord files to write for each output dataset.')
 flags.DEFINE_string(
     'log', 'INFO',
     'The threshold for what messages will be logged DEBUG, INFO, WARN, ERROR, '
@@ -51,10 +58,18 @@ def main(unused_argv):
 
   FLAGS.input = os.path.expanduser(FLAGS.input)
   FLAGS.output_dir = os.path.expanduser(FLAGS.output_dir)
-  pipeline.run_pipeline_serial(
-      pipeline_instance,
-      pipeline.tf_record_iterator(FLAGS.input, pipeline_instance.input_type),
-      FLAGS.output_dir)
+  if FLAGS.num_workers > 1 or FLAGS.num_shards > 1:
+    pipeline.run_pipeline_parallel(
+        pipeline_instance,
+        pipeline.tf_record_iterator(FLAGS.input, pipeline_instance.input_type),
+        FLAGS.output_dir,
+        num_workers=FLAGS.num_workers,
+        num_shards=FLAGS.num_shards)
+  else:
+    pipeline.run_pipeline_serial(
+        pipeline_instance,
+        pipeline.tf_record_iterator(FLAGS.input, pipeline_instance.input_type),
+        FLAGS.output_dir)
 
 
 def console_entry_point():
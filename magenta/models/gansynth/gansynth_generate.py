@@ -50,6 +50,18 @@ absl.flags.DEFINE_integer('batch_size', 8, 'Batch size for generation.')
 absl.flags.DEFINE_float('secs_per_instrument', 6.0,
                         'In random interpolations, the seconds it takes to '
                         'interpolate from one instrument to another.')
+absl.flags.DEFINE_integer('note_cache_size', 256,
+                          'Maximum number of generated notes to keep for '
+                          'notes that repeat a pitch and latent vector.')
+absl.flags.DEFINE_integer('steps_per_instrument', 0,
+                          'If positive, the interpolation from one instrument '
+                          'to another is done in this many steps, so that '
+                          'notes of the same pitch that start in the same step '
+                          'share generated audio. Fewer steps repeat more '
+                          'notes, but the timbre changes in audible jumps '
+                          'rather than gradually. By default the '
+                          'interpolation is smooth, and only notes with '
+                          'identical latent vectors share audio.')
 
 FLAGS = absl.flags.FLAGS
 tf.logging.set_verbosity(tf.logging.INFO)
@@ -78,21 +90,19 @@ def main(unused_argv):
         secs_per_instrument=FLAGS.secs_per_instrument)
 
     # Get latent vectors for each note
-    z_notes = gu.get_z_notes(notes['start_times'], z_instruments, t_instruments)
+    z_notes = gu.get_z_notes(notes['start_times'], z_instruments, t_instruments,
+                             steps_per_instrument=FLAGS.steps_per_instrument)
 
-    # Generate audio for each note
+    # Generate audio for each note, reusing notes that repeat, and write
+    # them to a single audio clip as they are generated.
     print('Generating {} samples...'.format(len(z_notes)))
-    audio_notes = model.generate_samples_from_z(z_notes, notes['pitches'])
-
-    # Make a single audio clip
-    audio_clip = gu.combine_notes(audio_notes,
-                                  notes['start_times'],
-                                  notes['end_times'],
-                                  notes['velocities'])
-
-    # Write the wave files
+    note_cache = gu.NoteSynthesisCache(model,
+                                       max_notes=FLAGS.note_cache_size)
     fname = os.path.join(output_dir, 'generated_clip.wav')
-    gu.save_wav(audio_clip, fname)
+    gu.render_notes(note_cache, z_notes, notes, fname,
+                    batch_size=FLAGS.batch_size)
+    print('Generated {} of {} notes, the others were repeated.'.format(
+        note_cache.misses, len(z_notes)))
   else:
     # Otherwise, just generate a batch of random sounds
     waves = model.generate_samples(FLAGS.batch_size)
@@ -16,6 +16,9 @@
 """Helper functions for generating sounds.
 """
 
+import collections
+import struct
+
 from magenta.models.gansynth.lib import util
 import note_seq
 import numpy as np
@@ -57,8 +60,21 @@ def get_random_instruments(model, total_time, secs_per_instrument=2.0):
   return z_instruments, t_instruments
 
 
-def get_z_notes(start_times, z_instruments, t_instruments):
-  """Get interpolated latent vectors for each note."""
+def get_z_notes(start_times, z_instruments, t_instruments,
+                steps_per_instrument=0):
+  """Get interpolated latent vectors for each note.
+
+  Args:
+    start_times: The start time of each note.
+    z_instruments: The latent vectors of the instruments.
+    t_instruments: The times of the instruments.
+    steps_per_instrument: If positive, the interpolation between two
+      instruments is done in this many steps, so that the notes starting in the
+      same step get identical latent vectors. 0 to interpolate smoothly.
+
+  Returns:
+    The latent vectors of the notes [n_notes, n_latent dims].
+  """
   z_notes = []
   for t in start_times:
     idx = np.searchsorted(t_instruments, t, side='left') - 1
@@ -70,6 +86,8 @@ def get_z_notes(start_times, z_instruments, t_instruments):
     t_left = t_instruments[idx]
     t_right = t_instruments[idx + 1]
     interp = (t - t_left) / (t_right - t_left)
+    if steps_per_instrument:
+      interp = np.floor(interp * steps_per_instrument) / steps_per_instrument
     z_notes.append(slerp(z_instruments[idx], z_instruments[idx + 1], interp))
   z_notes = np.vstack(z_notes)
   return z_notes
@@ -90,6 +108,26 @@ def get_envelope(t_note_length, t_attack=0.010, t_release=0.3, sr=16000):
   return envelope
 
 
+def shape_note(audio_note, t_note_length, velocity, sr=16000):
+  """Applies the amplitude envelope and velocity of a note to its audio.
+
+  Args:
+    audio_note: Array of the generated audio of the note [audio_samples].
+    t_note_length: Length of the note in seconds.
+    velocity: Velocity value of the note.
+    sr: Integer, sample rate.
+
+  Returns:
+    The audio of the note, trimmed to the length of its envelope.
+  """
+  envelope = get_envelope(t_note_length, sr=sr)
+  audio_note = audio_note[:len(envelope)] * envelope
+  # Normalize
+  audio_note /= audio_note.max()
+  audio_note *= (velocity / MAX_VELOCITY)
+  return audio_note
+
+
 def combine_notes(audio_notes, start_times, end_times, velocities, sr=16000):
   """Combine audio from multiple notes into a single audio clip.
 
@@ -109,17 +147,10 @@ def combine_notes(audio_notes, start_times, end_times, velocities, sr=16000):
 
   for t_start, t_end, vel, i in zip(
       start_times, end_times, velocities, range(n_notes)):
-    # Generate an amplitude envelope
-    t_note_length = t_end - t_start
-    envelope = get_envelope(t_note_length)
-    length = len(envelope)
-    audio_note = audio_notes[i, :length] * envelope
-    # Normalize
-    audio_note /= audio_note.max()
-    audio_note *= (vel / MAX_VELOCITY)
+    audio_note = shape_note(audio_notes[i], t_end - t_start, vel, sr=sr)
     # Add to clip buffer
     clip_start = int(t_start * sr)
-    clip_end = clip_start + length
+    clip_end = clip_start + len(audio_note)
     audio_clip[clip_start:clip_end] += audio_note
 
   # Normalize
@@ -128,6 +159,203 @@ def combine_notes(audio_notes, start_times, end_times, velocities, sr=16000):
   return audio_clip
 
 
+class NoteSynthesisCache(object):
+  """LRU cache of generated notes keyed by latent vector and pitch.
+
+  Notes that repeat a pitch with an identical latent vector are only
+  generated once. Interpolate latent vectors in steps with `get_z_notes` to
+  have nearby notes share latent vectors.
+  """
+
+  def __init__(self, model, max_notes=256, max_audio_length=64000):
+    """Creates a NoteSynthesisCache.
+
+    Args:
+      model: The `Model` that generates the notes.
+      max_notes: Maximum number of notes to keep, least recently used notes are
+        evicted first.
+      max_audio_length: Integer, trim generated notes to this many samples.
+    """
+    self._model = model
+    self._max_notes = max_notes
+    self._max_audio_length = max_audio_length
+    self._notes = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get_notes(self, z, pitches):
+    """Returns the audio of notes, generating the ones that are not cached.
+
+    All notes that are not cached are generated with a single call to
+    `generate_samples_from_z`.
+
+    Args:
+      z: A numpy array of latent vectors [n_notes, n_latent dims].
+      pitches: An iterable list of integer MIDI pitches [n_notes].
+
+    Returns:
+      A list of float32 arrays with the audio of each note
+      [max_audio_length]. The arrays are shared with the cache and must not be
+      modified.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    pitches = [int(pitch) for pitch in pitches]
+    keys = [(pitch, z_note.tobytes()) for z_note, pitch in zip(z, pitches)]
+
+    audio_notes = [None] * len(keys)
+    missing = collections.OrderedDict()
+    for i, key in enumerate(keys):
+      if key in self._notes:
+        self._notes.move_to_end(key)
+        audio_notes[i] = self._notes[key]
+        self.hits += 1
+      elif key in missing:
+        self.hits += 1
+      else:
+        missing[key] = i
+        self.misses += 1
+
+    if missing:
+      indices = list(missing.values())
+      waves = self._model.generate_samples_from_z(
+          z[indices], [pitches[i] for i in indices], self._max_audio_length)
+      generated = dict(zip(missing, waves.astype(np.float32)))
+      for i, key in enumerate(keys):
+        if audio_notes[i] is None:
+          audio_notes[i] = generated[key]
+      for key, wave in generated.items():
+        self._notes[key] = wave
+        if len(self._notes) > self._max_notes:
+          self._notes.popitem(last=False)
+    return audio_notes
+
+
+class StreamingClipWriter(object):
+  """Mixes notes into a rolling buffer and writes the clip to a WAV file.
+
+  Audio is written in blocks as soon as no later note can overlap it, so only
+  `buffer_length` samples are held in memory. Notes must be added in order of
+  their start time. The clip is normalized in place when the writer is closed,
+  to the same level as `combine_notes`.
+  """
+
+  _HEADER_LENGTH = 44
+
+  def __init__(self, fname, clip_length, buffer_length, sr=16000):
+    """Creates a StreamingClipWriter.
+
+    Args:
+      fname: Path of the 32-bit float WAV file to write.
+      clip_length: Integer, number of samples in the clip.
+      buffer_length: Integer, number of samples in the rolling buffer. Must be
+        at least the length of the longest note.
+      sr: Integer, sample rate.
+    """
+    self._fname = fname
+    self._clip_length = clip_length
+    self._buffer = np.zeros(buffer_length)
+    # Index in the clip of the first sample of the buffer.
+    self._offset = 0
+    self._peak = -np.inf
+    self._file = open(fname, 'wb')
+    data_length = 4 * clip_length
+    # RIFF header with a 32-bit IEEE float format chunk.
+    self._file.write(struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', self._HEADER_LENGTH - 8 + data_length,
+        b'WAVE', b'fmt ', 16, 3, 1, sr, 4 * sr, 4, 32, b'data', data_length))
+
+  def add(self, audio_note, clip_start):
+    """Mixes a note into the clip.
+
+    Args:
+      audio_note: Array of the audio of the note [audio_samples].
+      clip_start: Integer, index in the clip of the first sample of the note.
+
+    Raises:
+      ValueError: If the note starts before a note that was already added, or
+        is longer than the buffer.
+    """
+    if clip_start < self._offset:
+      raise ValueError('Notes must be added in order of start time.')
+    if len(audio_note) > len(self._buffer):
+      raise ValueError('Note of %d samples is longer than the buffer of %d.' %
+                       (len(audio_note), len(self._buffer)))
+    audio_note = audio_note[:max(self._clip_length - clip_start, 0)]
+    clip_end = clip_start + len(audio_note)
+    if clip_end > self._offset + len(self._buffer):
+      self._write_until(clip_start)
+    start = clip_start - self._offset
+    self._buffer[start:start + len(audio_note)] += audio_note
+
+  def _write_until(self, clip_end):
+    """Writes the clip up to `clip_end` and advances the buffer."""
+    while self._offset < clip_end:
+      n = min(clip_end - self._offset, len(self._buffer))
+      block = self._buffer[:n]
+      self._peak = max(self._peak, block.max())
+      self._file.write(block.astype('<f4').tobytes())
+      self._buffer[:-n] = self._buffer[n:]
+      self._buffer[-n:] = 0.0
+      self._offset += n
+
+  def close(self):
+    """Writes the rest of the clip and normalizes it."""
+    if self._file is None:
+      return
+    self._write_until(self._clip_length)
+    self._file.close()
+    self._file = None
+    if self._clip_length:
+      # Normalize
+      clip = np.memmap(self._fname, dtype='<f4', mode='r+',
+                       offset=self._HEADER_LENGTH, shape=(self._clip_length,))
+      scale = 1.0 / (self._peak * 2.0)
+      for start in range(0, self._clip_length, len(self._buffer)):
+        clip[start:start + len(self._buffer)] *= scale
+      clip.flush()
+      del clip
+    print('Saved to {}'.format(self._fname))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def render_notes(note_cache, z_notes, notes, fname, batch_size=8, sr=16000):
+  """Synthesizes notes into a WAV file with bounded memory.
+
+  Notes are generated in batches in order of their start time, mixed into a
+  rolling buffer and written as soon as they are complete. The result is the
+  same as writing the clip from `combine_notes`.
+
+  Args:
+    note_cache: The `NoteSynthesisCache` that generates the notes.
+    z_notes: Array of latent vectors of the notes [n_notes, n_latent dims].
+    notes: Dict of note 'pitches', 'velocities', 'start_times' and
+      'end_times', as returned by `load_midi`.
+    fname: Path of the WAV file to write.
+    batch_size: Number of notes to generate at a time.
+    sr: Integer, sample rate.
+  """
+  start_times = notes['start_times']
+  end_times = notes['end_times']
+  order = np.argsort(start_times, kind='stable')
+  clip_length = int(end_times.max() + MAX_NOTE_LENGTH) * sr
+  max_note_length = len(get_envelope(MAX_NOTE_LENGTH, sr=sr))
+  with StreamingClipWriter(fname, clip_length, 2 * max_note_length,
+                           sr=sr) as writer:
+    for batch_start in range(0, len(order), batch_size):
+      indices = order[batch_start:batch_start + batch_size]
+      audio_notes = note_cache.get_notes(z_notes[indices],
+                                         notes['pitches'][indices])
+      for i, audio_note in zip(indices, audio_notes):
+        audio_note = shape_note(audio_note, end_times[i] - start_times[i],
+                                notes['velocities'][i], sr=sr)
+        writer.add(audio_note, int(start_times[i] * sr))
+
+
 def save_wav(audio, fname, sr=16000):
   wavfile.write(fname, sr, audio.astype('float32'))
   print('Saved to {}'.format(fname))
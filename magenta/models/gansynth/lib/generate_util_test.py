@@ -0,0 +1,122 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for generate_util."""
+import os
+
+from absl.testing import parameterized
+from magenta.models.gansynth.lib import generate_util as gu
+import numpy as np
+from scipy.io import wavfile
+import tensorflow.compat.v1 as tf
+
+
+class FakeModel(object):
+  """Generates a deterministic tone for each latent vector and pitch."""
+
+  def __init__(self):
+    self.calls = []
+
+  def generate_samples_from_z(self, z, pitches, max_audio_length=64000):
+    self.calls.append(list(pitches))
+    t = np.arange(max_audio_length) / 16000.0
+    return np.stack([
+        np.sin(2 * np.pi * 440.0 * 2**((pitch - 69) / 12.0) * t + z_note[0])
+        for z_note, pitch in zip(z, pitches)])
+
+
+class GenerateUtilTest(parameterized.TestCase, tf.test.TestCase):
+
+  def setUp(self):
+    super(GenerateUtilTest, self).setUp()
+    rng = np.random.RandomState(0)
+    n_notes = 12
+    self.start_times = np.sort(rng.uniform(0.0, 8.0, n_notes))
+    self.notes = {
+        'pitches': rng.choice([48, 60, 72], n_notes),
+        'velocities': rng.randint(20, 127, n_notes),
+        'start_times': self.start_times,
+        'end_times': self.start_times + rng.uniform(0.1, 4.0, n_notes),
+    }
+    # Two instruments, so that notes repeat latent vectors and pitches.
+    self.z_notes = np.stack([
+        np.full(4, 0.1 * (i % 2)) for i in range(n_notes)])
+
+  def testNoteSynthesisCache(self):
+    model = FakeModel()
+    cache = gu.NoteSynthesisCache(model, max_notes=2)
+    z = np.array([[0.0, 1.0], [0.0, 1.0], [1.0, 0.0]])
+    notes = cache.get_notes(z, [60, 60, 60])
+    self.assertEqual([[60, 60]], model.calls)
+    self.assertIs(notes[0], notes[1])
+    self.assertAllClose(model.generate_samples_from_z(z, [60] * 3), notes)
+
+    # The least recently used note is evicted.
+    cache.get_notes(z[:1], [60])
+    cache.get_notes(z[:1], [62])
+    self.assertEqual([[60, 60], [60] * 3, [62]], model.calls)
+    cache.get_notes(z[:1], [60])
+    cache.get_notes(z[2:], [60])
+    self.assertEqual([[60, 60], [60] * 3, [62], [60]], model.calls)
+    self.assertEqual(3, cache.hits)
+    self.assertEqual(4, cache.misses)
+
+  def testGetZNotesInSteps(self):
+    z_instruments = np.array([[1.0, 0.0], [0.0, 1.0]])
+    t_instruments = np.array([0.0, 4.0])
+    start_times = np.array([0.5, 0.9, 1.1, 3.9])
+    z_notes = gu.get_z_notes(start_times, z_instruments, t_instruments,
+                             steps_per_instrument=4)
+    self.assertAllEqual(z_notes[0], z_notes[1])
+    self.assertNotAllClose(z_notes[1], z_notes[2])
+    self.assertAllClose(
+        gu.get_z_notes(np.array([0.0, 1.0, 3.0]), z_instruments,
+                       t_instruments),
+        z_notes[1:])
+    # Without steps, the latent vectors are interpolated smoothly.
+    self.assertNotAllClose(
+        *gu.get_z_notes(start_times[:2], z_instruments, t_instruments))
+
+  @parameterized.parameters({'batch_size': 1}, {'batch_size': 5})
+  def testRenderNotesMatchesCombineNotes(self, batch_size):
+    model = FakeModel()
+    # Render the notes in a different order than their start times.
+    notes = {k: v[::-1] for k, v in self.notes.items()}
+    z_notes = self.z_notes[::-1]
+    fname = os.path.join(self.get_temp_dir(), 'clip.wav')
+    cache = gu.NoteSynthesisCache(model)
+    gu.render_notes(cache, z_notes, notes, fname, batch_size=batch_size)
+
+    expected = gu.combine_notes(
+        model.generate_samples_from_z(z_notes, notes['pitches']),
+        notes['start_times'], notes['end_times'], notes['velocities'])
+    sr, audio = wavfile.read(fname)
+    self.assertEqual(16000, sr)
+    self.assertEqual(np.float32, audio.dtype)
+    self.assertAllClose(expected, audio, atol=1e-6)
+    self.assertEqual(
+        len(set(zip(z_notes[:, 0], notes['pitches']))), cache.misses)
+
+  def testStreamingClipWriterRejectsNotesOutOfOrder(self):
+    fname = os.path.join(self.get_temp_dir(), 'clip.wav')
+    with gu.StreamingClipWriter(fname, 1000, 100) as writer:
+      writer.add(np.ones(100), 500)
+      with self.assertRaises(ValueError):
+        writer.add(np.ones(10), 100)
+      with self.assertRaises(ValueError):
+        writer.add(np.ones(101), 600)
+
+
+if __name__ == '__main__':
+  tf.test.main()
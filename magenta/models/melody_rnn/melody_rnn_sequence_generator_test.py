@@ -0,0 +1,94 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for melody_rnn_sequence_generator."""
+
+import copy
+import os
+import threading
+from unittest import mock
+
+from magenta.models.melody_rnn import melody_rnn_model
+from magenta.models.melody_rnn import melody_rnn_sequence_generator
+from note_seq import testing_lib
+from note_seq.protobuf import generator_pb2
+from note_seq.protobuf import music_pb2
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+
+class MelodyRnnSequenceGeneratorTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(MelodyRnnSequenceGeneratorTest, self).setUp()
+    self.config = copy.deepcopy(melody_rnn_model.default_configs['basic_rnn'])
+    self.config.hparams.rnn_layer_sizes = [16, 16]
+    self.config.hparams.batch_size = 1
+    # Save a checkpoint with randomly initialized weights.
+    self.checkpoint = os.path.join(self.get_temp_dir(), 'model.ckpt')
+    rnn_model = melody_rnn_model.MelodyRnnModel(self.config)
+    with tf.Graph().as_default():
+      tf.set_random_seed(0)
+      rnn_model._build_graph_for_generation()  # pylint:disable=protected-access
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, self.checkpoint)
+
+  def _generator(self):
+    return melody_rnn_sequence_generator.MelodyRnnSequenceGenerator(
+        melody_rnn_model.MelodyRnnModel(self.config), self.config.details,
+        steps_per_quarter=4, checkpoint=self.checkpoint)
+
+  def _generate(self, generator, pitches):
+    input_sequence = music_pb2.NoteSequence()
+    input_sequence.tempos.add(qpm=120)
+    testing_lib.add_track_to_sequence(
+        input_sequence, 0,
+        [(pitch, 100, 0.5 * i, 0.5 * (i + 1))
+         for i, pitch in enumerate(pitches)])
+    generator_options = generator_pb2.GeneratorOptions()
+    generator_options.generate_sections.add(start_time=2.0, end_time=10.0)
+    return generator.generate(input_sequence, generator_options)
+
+  # The threads share numpy's random state, so the most likely event is chosen
+  # at each step to make generation deterministic.
+  @mock.patch.object(np.random, 'choice', lambda n, p: np.argmax(p))
+  def testGenerateConcurrently(self):
+    inputs = [[60, 62, 64, 65], [72, 71, 69, 67]]
+    generator = self._generator()
+    generator.initialize()
+    expected = [self._generate(generator, pitches) for pitches in inputs]
+
+    results = [None] * len(inputs)
+    barrier = threading.Barrier(len(inputs))
+
+    def generate(i):
+      barrier.wait()
+      results[i] = self._generate(generator, inputs[i])
+
+    threads = [threading.Thread(target=generate, args=(i,))
+               for i in range(len(inputs))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    for expected_sequence, sequence in zip(expected, results):
+      self.assertEqual(expected_sequence, sequence)
+
+
+if __name__ == '__main__':
+  tf.test.main()
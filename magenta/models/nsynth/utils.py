@@ -180,6 +180,103 @@ def get_optimizer(learning_rate, hparams):
   }.get(hparams.optimizer)
 
 
+# Windows and squared window overlap-adds of batch_stft and batch_istft, which
+# are reused across calls.
+_STFT_WINDOWS = {}
+_WINDOW_SUMSQUARES = {}
+
+
+def _stft_window(n_fft):
+  """Returns the periodic Hann window used by `batch_stft`, cached by size."""
+  window = _STFT_WINDOWS.get(n_fft)
+  if window is None:
+    window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+    _STFT_WINDOWS[n_fft] = window
+  return window
+
+
+def _window_sumsquare(n_fft, hop_length, num_frames):
+  """Returns the squared window overlap-added over num_frames frames."""
+  key = (n_fft, hop_length, num_frames)
+  sumsquare = _WINDOW_SUMSQUARES.get(key)
+  if sumsquare is None:
+    frames = np.broadcast_to(_stft_window(n_fft)**2, (1, num_frames, n_fft))
+    sumsquare = _overlap_add(frames, hop_length)[0]
+    _WINDOW_SUMSQUARES[key] = sumsquare
+  return sumsquare
+
+
+def _overlap_add(frames, hop_length):
+  """Overlap-adds frames of shape [batch, frames, n_fft] with a stride."""
+  batch_size, num_frames, n_fft = frames.shape
+  length = n_fft + hop_length * (num_frames - 1)
+  if n_fft % hop_length:
+    audio = np.zeros((batch_size, length), dtype=frames.dtype)
+    for i in range(num_frames):
+      audio[:, i * hop_length:i * hop_length + n_fft] += frames[:, i]
+    return audio
+  # Each frame spans n_fft // hop_length hops, so the frames can be added
+  # one hop-sized segment at a time.
+  num_segments = n_fft // hop_length
+  segments = frames.reshape(batch_size, num_frames, num_segments, hop_length)
+  audio = np.zeros((batch_size, num_frames + num_segments - 1, hop_length),
+                   dtype=frames.dtype)
+  for j in range(num_segments):
+    audio[:, j:j + num_frames] += segments[:, :, j]
+  return audio.reshape(batch_size, length)
+
+
+def batch_stft(audio, n_fft=512, hop_length=None):
+  """Short-time Fourier transform of a batch of audio with NumPy FFTs.
+
+  Matches `librosa.stft` with a Hann window of `n_fft` samples, `center=True`
+  and zero padding.
+
+  Args:
+    audio: 2-D array of sound samples, [batch, samples].
+    n_fft: Size of the FFT.
+    hop_length: Stride of FFT. Defaults to n_fft/2.
+
+  Returns:
+    stft: Complex array of shape [batch, n_fft/2 + 1, frames].
+  """
+  if not hop_length:
+    hop_length = n_fft // 2
+  audio = np.asarray(audio)
+  padded = np.pad(audio, [(0, 0), (n_fft // 2, n_fft // 2)], mode="constant")
+  frames = np.lib.stride_tricks.sliding_window_view(
+      padded, n_fft, axis=1)[:, ::hop_length]
+  stft = np.fft.rfft(frames * _stft_window(n_fft), axis=2)
+  return np.swapaxes(stft, 1, 2)
+
+
+def batch_istft(stft, n_fft=512, hop_length=None):
+  """Inverse short-time Fourier transform of a batch with NumPy FFTs.
+
+  Matches `librosa.istft` with a Hann window of `n_fft` samples and
+  `center=True`.
+
+  Args:
+    stft: Complex array of shape [batch, n_fft/2 + 1, frames].
+    n_fft: Size of the FFT.
+    hop_length: Stride of FFT. Defaults to n_fft/2.
+
+  Returns:
+    audio: 2-D array of sound samples, [batch, hop_length * (frames - 1)].
+  """
+  if not hop_length:
+    hop_length = n_fft // 2
+  num_frames = stft.shape[2]
+  frames = np.fft.irfft(np.swapaxes(stft, 1, 2), n=n_fft, axis=2)
+  frames *= _stft_window(n_fft)
+  audio = _overlap_add(frames, hop_length)
+  sumsquare = _window_sumsquare(n_fft, hop_length, num_frames)
+  nonzero = sumsquare > np.finfo(frames.dtype).tiny
+  audio[:, nonzero] /= sumsquare[nonzero]
+  start = n_fft // 2
+  return audio[:, start:start + hop_length * (num_frames - 1)]
+
+
 def specgram(audio,
              n_fft=512,
              hop_length=None,
@@ -204,57 +301,70 @@ def specgram(audio,
     specgram: [n_fft/2 + 1, audio.size / hop_length, 2]. The first channel is
       the logamplitude and the second channel is the derivative of phase.
   """
-  if not hop_length:
-    hop_length = int(n_fft / 2.)
+  return batch_specgram(audio[np.newaxis], n_fft, hop_length, mask, log_mag,
+                        re_im, dphase, mag_only)[0]
 
-  fft_config = dict(
-      n_fft=n_fft, win_length=n_fft, hop_length=hop_length, center=True)
 
-  spec = librosa.stft(audio, **fft_config)
+def inv_magphase(mag, phase_angle):
+  phase = np.cos(phase_angle) + 1.j * np.sin(phase_angle)
+  return mag * phase
 
-  if re_im:
-    re = spec.real[:, :, np.newaxis]
-    im = spec.imag[:, :, np.newaxis]
-    spec_real = np.concatenate((re, im), axis=2)
 
-  else:
-    mag, phase = librosa.core.magphase(spec)
-    phase_angle = np.angle(phase)
+def batch_griffin_lim(mag, phase_angle, n_fft, hop, num_iters, momentum=0.0,
+                      tolerance=0.0):
+  """Griffin-Lim phase retrieval for a batch of magnitude spectrograms.
 
-    # Magnitudes, scaled 0-1
-    if log_mag:
-      mag = (librosa.power_to_db(
-          mag**2, amin=1e-13, top_db=120., ref=np.max) / 120.) + 1
-    else:
-      mag /= mag.max()
-
-    if dphase:
-      #  Derivative of phase
-      phase_unwrapped = np.unwrap(phase_angle)
-      p = phase_unwrapped[:, 1:] - phase_unwrapped[:, :-1]
-      p = np.concatenate([phase_unwrapped[:, 0:1], p], axis=1) / np.pi
-    else:
-      # Normal phase
-      p = phase_angle / np.pi
-    # Mask the phase
-    if log_mag and mask:
-      p = mag * p
-    # Return Mag and Phase
-    p = p.astype(np.float32)[:, :, np.newaxis]
-    mag = mag.astype(np.float32)[:, :, np.newaxis]
-    if mag_only:
-      spec_real = mag[:, :, np.newaxis]
-    else:
-      spec_real = np.concatenate((mag, p), axis=2)
-  return spec_real
+  With a nonzero `momentum`, this is the "fast Griffin-Lim" algorithm of
+  Perraudin et al. (2013), which usually needs far fewer iterations. Each
+  iteration runs one STFT and one inverse STFT over the whole batch.
 
+  Args:
+    mag: Magnitude spectrograms, [batch, n_fft/2 + 1, frames].
+    phase_angle: Initial condition for phase, the same shape as `mag`.
+    n_fft: Size of the FFT.
+    hop: Stride of FFT. Defaults to n_fft/2.
+    num_iters: Maximum number of Griffin-Lim iterations to perform.
+    momentum: Momentum of the fast Griffin-Lim update. 0 for the original
+      algorithm.
+    tolerance: Stop early once the spectral convergence of no example improves
+      by more than this fraction in an iteration. 0 to always run `num_iters`
+      iterations.
 
-def inv_magphase(mag, phase_angle):
-  phase = np.cos(phase_angle) + 1.j * np.sin(phase_angle)
-  return mag * phase
+  Returns:
+    audio: 2-D array of sound samples, [batch, samples].
+  """
+  if not hop:
+    hop = n_fft // 2
+  mag = np.asarray(mag)
+  mag_norm = np.maximum(np.linalg.norm(mag, axis=(1, 2)), 1e-13)
+  angles = inv_magphase(1.0, phase_angle)
+  rebuilt = 0.0
+  convergence = None
+  for i in range(num_iters):
+    audio = batch_istft(mag * angles, n_fft, hop)
+    if i == num_iters - 1:
+      break
+    previous = rebuilt
+    rebuilt = batch_stft(audio, n_fft, hop)
+    if tolerance:
+      # Spectral convergence of the audio of this iteration.
+      previous_convergence = convergence
+      convergence = np.linalg.norm(
+          mag - np.abs(rebuilt), axis=(1, 2)) / mag_norm
+      if (previous_convergence is not None and np.all(
+          previous_convergence - convergence <=
+          tolerance * previous_convergence)):
+        break
+    if momentum:
+      angles = rebuilt - (momentum / (1 + momentum)) * previous
+    else:
+      angles = rebuilt
+    angles = angles / np.maximum(np.abs(angles), 1e-16)
+  return audio
 
 
-def griffin_lim(mag, phase_angle, n_fft, hop, num_iters):
+def griffin_lim(mag, phase_angle, n_fft, hop, num_iters, momentum=0.0,
+                tolerance=0.0):
   """Iterative algorithm for phase retrieval from a magnitude spectrogram.
 
   Args:
@@ -263,21 +373,15 @@ def griffin_lim(mag, phase_angle, n_fft, hop, num_iters):
     n_fft: Size of the FFT.
     hop: Stride of FFT. Defaults to n_fft/2.
     num_iters: Griffin-Lim iterations to perform.
+    momentum: Momentum of the fast Griffin-Lim update, see
+      `batch_griffin_lim`.
+    tolerance: Early stopping tolerance, see `batch_griffin_lim`.
 
   Returns:
     audio: 1-D array of float32 sound samples.
   """
-  fft_config = dict(n_fft=n_fft, win_length=n_fft, hop_length=hop, center=True)
-  ifft_config = dict(win_length=n_fft, hop_length=hop, center=True)
-  complex_specgram = inv_magphase(mag, phase_angle)
-  for i in range(num_iters):
-    audio = librosa.istft(complex_specgram, **ifft_config)
-    if i != num_iters - 1:
-      complex_specgram = librosa.stft(audio, **fft_config)
-      _, phase = librosa.magphase(complex_specgram)
-      phase_angle = np.angle(phase)
-      complex_specgram = inv_magphase(mag, phase_angle)
-  return audio
+  return batch_griffin_lim(mag[np.newaxis], phase_angle[np.newaxis], n_fft,
+                           hop, num_iters, momentum, tolerance)[0]
 
 
 def ispecgram(spec,
@@ -288,7 +392,9 @@ def ispecgram(spec,
               re_im=False,
               dphase=True,
               mag_only=True,
-              num_iters=1000):
+              num_iters=1000,
+              momentum=0.0,
+              tolerance=0.0):
   """Inverse Spectrogram using librosa.
 
   Args:
@@ -301,43 +407,15 @@ def ispecgram(spec,
     dphase: Use derivative of phase instead of phase.
     mag_only: Specgram contains no phase.
     num_iters: Number of griffin-lim iterations for mag_only.
+    momentum: Momentum of fast griffin-lim for mag_only.
+    tolerance: Early stopping tolerance of griffin-lim for mag_only.
 
   Returns:
     audio: 1-D array of sound samples. Peak normalized to 1.
   """
-  if not hop_length:
-    hop_length = n_fft // 2
-
-  ifft_config = dict(win_length=n_fft, hop_length=hop_length, center=True)
-
-  if mag_only:
-    mag = spec[:, :, 0]
-    phase_angle = np.pi * np.random.rand(*mag.shape)
-  elif re_im:
-    spec_real = spec[:, :, 0] + 1.j * spec[:, :, 1]
-  else:
-    mag, p = spec[:, :, 0], spec[:, :, 1]
-    if mask and log_mag:
-      p /= (mag + 1e-13 * np.random.randn(*mag.shape))
-    if dphase:
-      # Roll up phase
-      phase_angle = np.cumsum(p * np.pi, axis=1)
-    else:
-      phase_angle = p * np.pi
-
-  # Magnitudes
-  if log_mag:
-    mag = (mag - 1.0) * 120.0
-    mag = 10**(mag / 20.0)
-  phase = np.cos(phase_angle) + 1.j * np.sin(phase_angle)
-  spec_real = mag * phase
-
-  if mag_only:
-    audio = griffin_lim(
-        mag, phase_angle, n_fft, hop_length, num_iters=num_iters)
-  else:
-    audio = librosa.core.istft(spec_real, **ifft_config)
-  return np.squeeze(audio / audio.max())
+  return batch_ispecgram(spec[np.newaxis], n_fft, hop_length, mask, log_mag,
+                         re_im, dphase, mag_only, num_iters, momentum,
+                         tolerance)[0]
 
 
 def batch_specgram(audio,
@@ -348,15 +426,57 @@ def batch_specgram(audio,
                    re_im=False,
                    dphase=True,
                    mag_only=False):
-  """Computes specgram in a batch."""
+  """Computes specgram in a batch.
+
+  Args:
+    audio: 2-D array of float32 sound samples, [batch, samples].
+    n_fft: Size of the FFT.
+    hop_length: Stride of FFT. Defaults to n_fft/2.
+    mask: Mask the phase derivative by the magnitude.
+    log_mag: Use the logamplitude.
+    re_im: Output Real and Imag. instead of logMag and dPhase.
+    dphase: Use derivative of phase instead of phase.
+    mag_only: Don't return phase.
+
+  Returns:
+    specgram: [batch, n_fft/2 + 1, audio.size / hop_length, 2], see
+      `specgram`.
+  """
   assert len(audio.shape) == 2
-  batch_size = audio.shape[0]
-  res = []
-  for b in range(batch_size):
-    res.append(
-        specgram(audio[b], n_fft, hop_length, mask, log_mag, re_im, dphase,
-                 mag_only))
-  return np.array(res)
+  spec = batch_stft(audio, n_fft, hop_length)
+
+  if re_im:
+    return np.stack((spec.real, spec.imag), axis=3).astype(np.float32)
+
+  mag = np.abs(spec)
+  phase_angle = np.angle(spec)
+
+  # Magnitudes, scaled 0-1
+  if log_mag:
+    # librosa.power_to_db(mag**2, amin=1e-13, top_db=120., ref=np.max) for
+    # each example.
+    log_power = 10.0 * np.log10(np.maximum(mag**2, 1e-13))
+    log_power -= log_power.max(axis=(1, 2), keepdims=True)
+    mag = np.maximum(log_power, -120.) / 120. + 1
+  else:
+    mag /= mag.max(axis=(1, 2), keepdims=True)
+
+  if dphase:
+    #  Derivative of phase
+    phase_unwrapped = np.unwrap(phase_angle, axis=2)
+    p = np.diff(phase_unwrapped, axis=2, prepend=0.0) / np.pi
+  else:
+    # Normal phase
+    p = phase_angle / np.pi
+  # Mask the phase
+  if log_mag and mask:
+    p = mag * p
+  # Return Mag and Phase
+  p = p.astype(np.float32)[:, :, :, np.newaxis]
+  mag = mag.astype(np.float32)[:, :, :, np.newaxis]
+  if mag_only:
+    return mag[:, :, :, np.newaxis]
+  return np.concatenate((mag, p), axis=3)
 
 
 def batch_ispecgram(spec,
@@ -367,16 +487,61 @@ def batch_ispecgram(spec,
                     re_im=False,
                     dphase=True,
                     mag_only=False,
-                    num_iters=1000):
-  """Computes inverse specgram in a batch."""
+                    num_iters=1000,
+                    momentum=0.0,
+                    tolerance=0.0):
+  """Computes inverse specgram in a batch.
+
+  Args:
+    spec: 4-D specgram array [batch, freqs, time, (mag_db, dphase)].
+    n_fft: Size of the FFT.
+    hop_length: Stride of FFT. Defaults to n_fft/2.
+    mask: Reverse the mask of the phase derivative by the magnitude.
+    log_mag: Use the logamplitude.
+    re_im: Output Real and Imag. instead of logMag and dPhase.
+    dphase: Use derivative of phase instead of phase.
+    mag_only: Specgram contains no phase.
+    num_iters: Number of griffin-lim iterations for mag_only.
+    momentum: Momentum of fast griffin-lim for mag_only.
+    tolerance: Early stopping tolerance of griffin-lim for mag_only.
+
+  Returns:
+    audio: 2-D array of sound samples, [batch, samples]. Each example is peak
+      normalized to 1.
+  """
   assert len(spec.shape) == 4
-  batch_size = spec.shape[0]
-  res = []
-  for b in range(batch_size):
-    res.append(
-        ispecgram(spec[b, :, :, :], n_fft, hop_length, mask, log_mag, re_im,
-                  dphase, mag_only, num_iters))
-  return np.array(res)
+  if not hop_length:
+    hop_length = n_fft // 2
+
+  if mag_only:
+    mag = spec[:, :, :, 0]
+    phase_angle = np.pi * np.random.rand(*mag.shape)
+  elif re_im:
+    spec_real = spec[:, :, :, 0] + 1.j * spec[:, :, :, 1]
+  else:
+    mag, p = spec[:, :, :, 0], spec[:, :, :, 1]
+    if mask and log_mag:
+      p /= (mag + 1e-13 * np.random.randn(*mag.shape))
+    if dphase:
+      # Roll up phase
+      phase_angle = np.cumsum(p * np.pi, axis=2)
+    else:
+      phase_angle = p * np.pi
+
+  # Magnitudes
+  if not re_im:
+    if log_mag:
+      mag = (mag - 1.0) * 120.0
+      mag = 10**(mag / 20.0)
+    spec_real = inv_magphase(mag, phase_angle)
+
+  if mag_only:
+    audio = batch_griffin_lim(
+        mag, phase_angle, n_fft, hop_length, num_iters=num_iters,
+        momentum=momentum, tolerance=tolerance)
+  else:
+    audio = batch_istft(spec_real, n_fft, hop_length)
+  return (audio / audio.max(axis=1, keepdims=True)).astype(np.float32)
 
 
 def tf_specgram(audio,
@@ -402,7 +567,9 @@ def tf_ispecgram(spec,
                  re_im=False,
                  dphase=True,
                  mag_only=False,
-                 num_iters=1000):
+                 num_iters=1000,
+                 momentum=0.0,
+                 tolerance=0.0):
   """Inverted Specgram tensorflow op (uses pyfunc)."""
   dims = spec.get_shape().as_list()
   # Add back in nyquist frequency
@@ -411,7 +578,8 @@ def tf_ispecgram(spec,
   else:
     x = spec
   audio = tf.py_func(batch_ispecgram, [
-      x, n_fft, hop_length, mask, log_mag, re_im, dphase, mag_only, num_iters
+      x, n_fft, hop_length, mask, log_mag, re_im, dphase, mag_only, num_iters,
+      momentum, tolerance
   ], tf.float32)
   return audio
 
@@ -816,33 +984,47 @@ def leaky_relu(leak=0.1):
   return lambda x: tf.maximum(x, leak * x)
 
 
-def causal_linear(x, n_inputs, n_outputs, name, filter_length, rate,
-                  batch_size):
-  """Applies dilated convolution using queues.
+def causal_linear_queues(n_inputs, rate, batch_size):
+  """Creates the queues that hold the past inputs of a dilated convolution.
 
-  Assumes a filter_length of 3.
+  Args:
+    n_inputs: The input number of channels.
+    rate: The rate or dilation.
+    batch_size: Non-symbolic value for batch_size.
+
+  Returns:
+    (q_1, q_2): Queues of the inputs `rate` and `2 * rate` steps ago.
+    (init_1, init_2): Initialization operations for the queues.
+  """
+  q_1 = tf.FIFOQueue(rate, dtypes=tf.float32, shapes=(batch_size, 1, n_inputs))
+  q_2 = tf.FIFOQueue(rate, dtypes=tf.float32, shapes=(batch_size, 1, n_inputs))
+  init_1 = q_1.enqueue_many(tf.zeros((rate, batch_size, 1, n_inputs)))
+  init_2 = q_2.enqueue_many(tf.zeros((rate, batch_size, 1, n_inputs)))
+  return (q_1, q_2), (init_1, init_2)
+
+
+def queued_causal_linear(x, queues, n_inputs, n_outputs, name, filter_length):
+  """Applies dilated convolution to one step of input using existing queues.
+
+  The initialized queues are full, so each push waits for the dequeue from the
+  same queue. The step can be built inside a `tf.while_loop` as long as the
+  next step waits for the pushes.
 
   Args:
-    x: The [mb, time, channels] tensor input.
+    x: The [mb, 1, channels] tensor input.
+    queues: The (q_1, q_2) queues returned by `causal_linear_queues`.
     n_inputs: The input number of channels.
     n_outputs: The output number of channels.
     name: The variable scope to provide to W and biases.
     filter_length: The length of the convolution, assumed to be 3.
-    rate: The rate or dilation
-    batch_size: Non-symbolic value for batch_size.
 
   Returns:
     y: The output of the operation
-    (init_1, init_2): Initialization operations for the queues
     (push_1, push_2): Push operations for the queues
   """
   assert filter_length == 3
+  q_1, q_2 = queues
 
-  # create queue
-  q_1 = tf.FIFOQueue(rate, dtypes=tf.float32, shapes=(batch_size, 1, n_inputs))
-  q_2 = tf.FIFOQueue(rate, dtypes=tf.float32, shapes=(batch_size, 1, n_inputs))
-  init_1 = q_1.enqueue_many(tf.zeros((rate, batch_size, 1, n_inputs)))
-  init_2 = q_2.enqueue_many(tf.zeros((rate, batch_size, 1, n_inputs)))
   state_1 = q_1.dequeue()
   push_1 = q_1.enqueue(x)
   state_2 = q_2.dequeue()
@@ -865,7 +1047,33 @@ def causal_linear(x, n_inputs, n_outputs, name, filter_length, rate,
           state_1[:, 0, :], w_q_1[0][0]) + tf.matmul(x[:, 0, :], w_x[0][0]), b)
 
   y = tf.expand_dims(y, 1)
-  return y, (init_1, init_2), (push_1, push_2)
+  return y, (push_1, push_2)
+
+
+def causal_linear(x, n_inputs, n_outputs, name, filter_length, rate,
+                  batch_size):
+  """Applies dilated convolution using queues.
+
+  Assumes a filter_length of 3.
+
+  Args:
+    x: The [mb, time, channels] tensor input.
+    n_inputs: The input number of channels.
+    n_outputs: The output number of channels.
+    name: The variable scope to provide to W and biases.
+    filter_length: The length of the convolution, assumed to be 3.
+    rate: The rate or dilation
+    batch_size: Non-symbolic value for batch_size.
+
+  Returns:
+    y: The output of the operation
+    (init_1, init_2): Initialization operations for the queues
+    (push_1, push_2): Push operations for the queues
+  """
+  queues, inits = causal_linear_queues(n_inputs, rate, batch_size)
+  y, pushs = queued_causal_linear(x, queues, n_inputs, n_outputs, name,
+                                  filter_length)
+  return y, inits, pushs
 
 
 def linear(x, n_inputs, n_outputs, name):
@@ -0,0 +1,98 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for nsynth.utils."""
+
+from absl.testing import parameterized
+from magenta.models.nsynth import utils
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+
+def _spectral_convergence(mag, audio, n_fft, hop_length):
+  rebuilt = np.abs(utils.batch_stft(audio, n_fft, hop_length))
+  return np.linalg.norm(mag - rebuilt) / np.linalg.norm(mag)
+
+
+class UtilsTest(parameterized.TestCase, tf.test.TestCase):
+
+  def setUp(self):
+    super(UtilsTest, self).setUp()
+    rng = np.random.RandomState(0)
+    t = np.arange(8000) / 16000.0
+    self.audio = np.stack([
+        0.5 * np.sin(2 * np.pi * 440.0 * t),
+        0.1 * rng.randn(8000),
+        0.3 * np.sin(2 * np.pi * 110.0 * t) * np.exp(-t),
+    ]).astype(np.float32)
+
+  @parameterized.parameters(
+      {'n_fft': 512, 'hop_length': None},
+      {'n_fft': 1024, 'hop_length': 256},
+      {'n_fft': 512, 'hop_length': 200},
+  )
+  def testStftRoundTrip(self, n_fft, hop_length):
+    stft = utils.batch_stft(self.audio, n_fft, hop_length)
+    hop_length = hop_length or n_fft // 2
+    self.assertEqual((3, n_fft // 2 + 1, 8000 // hop_length + 1), stft.shape)
+
+    audio = utils.batch_istft(stft, n_fft, hop_length)
+    length = audio.shape[1]
+    self.assertEqual(hop_length * (stft.shape[2] - 1), length)
+    self.assertAllClose(self.audio[:, :length], audio, atol=1e-5)
+
+  @parameterized.parameters(
+      {}, {'log_mag': False}, {'dphase': False}, {'re_im': True},
+      {'mag_only': True})
+  def testBatchSpecgramMatchesSpecgram(self, **kwargs):
+    batch = utils.batch_specgram(self.audio, **kwargs)
+    self.assertEqual(np.float32, batch.dtype)
+    for i in range(len(self.audio)):
+      self.assertAllClose(utils.specgram(self.audio[i], **kwargs), batch[i])
+
+  def testBatchIspecgramInvertsPhase(self):
+    spec = utils.batch_specgram(self.audio, log_mag=False)
+    audio = utils.batch_ispecgram(spec, log_mag=False)
+    self.assertEqual((3, 7936), audio.shape)
+    self.assertAllClose(np.ones(3), audio.max(axis=1))
+    expected = self.audio[:, :7936] / self.audio[:, :7936].max(
+        axis=1, keepdims=True)
+    self.assertAllClose(expected, audio, atol=1e-4)
+
+  def testGriffinLimMomentumConvergesFaster(self):
+    mag = np.abs(utils.batch_stft(self.audio))
+    phase_angle = np.pi * np.random.RandomState(1).rand(*mag.shape)
+
+    audio = utils.batch_griffin_lim(mag, phase_angle, 512, 256, num_iters=30)
+    fast_audio = utils.batch_griffin_lim(
+        mag, phase_angle, 512, 256, num_iters=30, momentum=0.99)
+    self.assertLess(_spectral_convergence(mag, fast_audio, 512, 256),
+                    _spectral_convergence(mag, audio, 512, 256))
+
+  def testGriffinLimEarlyStopping(self):
+    mag = np.abs(utils.batch_stft(self.audio))
+    phase_angle = np.pi * np.random.RandomState(1).rand(*mag.shape)
+
+    # Any tolerance of at least 1 stops after the second iteration.
+    audio = utils.batch_griffin_lim(
+        mag, phase_angle, 512, 256, num_iters=100, tolerance=1.0)
+    expected = utils.batch_griffin_lim(mag, phase_angle, 512, 256, num_iters=2)
+    self.assertAllClose(expected, audio)
+
+    single = utils.griffin_lim(mag[0], phase_angle[0], 512, 256, num_iters=2)
+    self.assertAllClose(expected[0], single)
+
+
+if __name__ == '__main__':
+  tf.test.main()
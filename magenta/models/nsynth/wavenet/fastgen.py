@@ -20,6 +20,11 @@ Ramachandran, P., Le Paine, T., Khorrami, P., Babaeizadeh, M.,
 Chang, S., Zhang, Y., ... Huang, T. (2017).
 Fast Generation For Convolutional Autoregressive Models, 1-5.
 """
+import collections
+import functools
+from multiprocessing import pool as multiprocessing_pool
+import time
+
 from magenta.models.nsynth import utils
 from magenta.models.nsynth.wavenet.h512_bo16 import Config
 from magenta.models.nsynth.wavenet.h512_bo16 import FastGenerationConfig
@@ -82,9 +87,45 @@ def load_fastgen_nsynth(batch_size=1):
   return graph
 
 
+def load_fastgen_nsynth_loop(batch_size=1):
+  """Load the NSynth fast generation network that runs many steps per call.
+
+  Args:
+    batch_size: Batch size number of observations to process. [1]
+  Returns:
+    graph: The network as a dict with the last generated audio placeholder in
+      {"X"}, the encodings placeholder in {"encoding"}, and the index of the
+      first sample and the number of samples to generate in {"start"} and
+      {"num_samples"}.
+  """
+  config = FastGenerationConfig(batch_size=batch_size)
+  with tf.device("/gpu:0"):
+    x = tf.placeholder(tf.float32, shape=[batch_size, 1])
+    encoding = tf.placeholder(
+        tf.float32, shape=[batch_size, None, config.num_z])
+    start = tf.placeholder(tf.int32, shape=[])
+    num_samples = tf.placeholder(tf.int32, shape=[])
+    graph = config.build_synthesis_loop({
+        "wav": x,
+        "encoding": encoding,
+        "start": start,
+        "num_samples": num_samples,
+    })
+    graph.update({
+        "X": x,
+        "encoding": encoding,
+        "start": start,
+        "num_samples": num_samples,
+    })
+  return graph
+
+
 def encode(wav_data, checkpoint_path, sample_length=64000):
   """Generate an array of encodings from an array of audio.
 
+  Restores the checkpoint on every call. Use `NSynthEncoder` to encode several
+  batches with the same model.
+
   Args:
     wav_data: Numpy array [batch_size, sample_length]
     checkpoint_path: Location of the pretrained model.
@@ -96,18 +137,175 @@ def encode(wav_data, checkpoint_path, sample_length=64000):
     wav_data = np.expand_dims(wav_data, 0)
   batch_size = wav_data.shape[0]
 
-  # Load up the model for encoding and find the encoding of "wav_data"
-  session_config = tf.ConfigProto(allow_soft_placement=True)
-  session_config.gpu_options.allow_growth = True
-  with tf.Graph().as_default(), tf.Session(config=session_config) as sess:
-    hop_length = Config().ae_hop_length
-    wav_data, sample_length = utils.trim_for_encoding(wav_data, sample_length,
-                                                      hop_length)
-    net = load_nsynth(batch_size=batch_size, sample_length=sample_length)
-    saver = tf.train.Saver()
-    saver.restore(sess, checkpoint_path)
-    encodings = sess.run(net["encoding"], feed_dict={net["X"]: wav_data})
-  return encodings
+  hop_length = Config().ae_hop_length
+  wav_data, sample_length = utils.trim_for_encoding(wav_data, sample_length,
+                                                    hop_length)
+  with NSynthEncoder(checkpoint_path, batch_size=batch_size) as encoder:
+    return np.array(encoder.encode(wav_data))
+
+
+class NSynthEncoder(object):
+  """Encodes audio with a WaveNet autoencoder that stays loaded between calls.
+
+  The checkpoint is restored once, into a session that is kept open until
+  `close` is called. Clips of any length are grouped by length and encoded in
+  batches of `batch_size`, padding partial batches with silent clips. An
+  encoder graph sharing the same variables is built for every clip length, up
+  to `max_graphs` of them. Beyond that the graph is rebuilt from scratch and
+  the checkpoint restored again, so memory use stays bounded.
+
+  By default, only clips of the same length are batched together, so each
+  encoding is the same as encoding the clip on its own. With a larger
+  `bucket_length`, clips are zero-padded to a multiple of it, which needs
+  fewer graphs and fuller batches. The encoder is not causal, so padding
+  changes the encodings.
+  """
+
+  def __init__(self, checkpoint_path, batch_size=16, bucket_length=None,
+               max_graphs=8):
+    """Creates an NSynthEncoder.
+
+    Args:
+      checkpoint_path: Location of the pretrained model.
+      batch_size: Number of clips encoded at once.
+      bucket_length: Clips are zero-padded to a multiple of this many samples.
+        Must be a multiple of the hop length of the encoder. Defaults to the
+        hop length, which encodes clips without padding.
+      max_graphs: Maximum number of encoder graphs for different padded clip
+        lengths to keep at once.
+
+    Raises:
+      ValueError: If `bucket_length` is not a multiple of the hop length.
+    """
+    self._config = Config()
+    self._hop_length = self._config.ae_hop_length
+    bucket_length = bucket_length or self._hop_length
+    if bucket_length <= 0 or bucket_length % self._hop_length:
+      raise ValueError("bucket_length must be a positive multiple of %d, "
+                       "got %d." % (self._hop_length, bucket_length))
+    self._checkpoint_path = checkpoint_path
+    self._batch_size = batch_size
+    self._bucket_length = bucket_length
+    self._max_graphs = max(max_graphs, 1)
+    self._graph = None
+    self._sess = None
+    # Encoder endpoints for each padded sample length.
+    self._nets = {}
+    self._reset()
+
+  def _reset(self):
+    """Replaces the graph and session with empty ones."""
+    if self._sess is not None:
+      self._sess.close()
+    self._graph = tf.Graph()
+    session_config = tf.ConfigProto(allow_soft_placement=True)
+    session_config.gpu_options.allow_growth = True
+    self._sess = tf.Session(graph=self._graph, config=session_config)
+    self._nets = {}
+
+  @property
+  def hop_length(self):
+    return self._hop_length
+
+  def _get_net(self, sample_length):
+    """Returns the encoder for padded clips of `sample_length` samples."""
+    net = self._nets.get(sample_length)
+    if net is not None:
+      return net
+    if len(self._nets) >= self._max_graphs:
+      # Ops cannot be removed from a graph, so start over with a new one.
+      tf.logging.info("Rebuilding the encoder after %d clip lengths.",
+                      len(self._nets))
+      self._reset()
+    with self._graph.as_default(), tf.device("/gpu:0"):
+      with tf.variable_scope(tf.get_variable_scope(), reuse=tf.AUTO_REUSE):
+        x = tf.placeholder(tf.float32,
+                           shape=[self._batch_size, sample_length])
+        net = self._config.build({"wav": x}, is_training=False,
+                                 include_decoder=False)
+      net["X"] = x
+      if not self._nets:
+        # All encoders share the variables restored for the first one.
+        tf.train.Saver().restore(self._sess, self._checkpoint_path)
+    self._nets[sample_length] = net
+    return net
+
+  def encode(self, wav_data):
+    """Encodes clips of audio.
+
+    Args:
+      wav_data: A list of 1-D arrays of audio, or an array of shape [clips,
+        samples]. Each clip is trimmed to a multiple of the hop length.
+
+    Returns:
+      A list with the encoding of each clip, in the order of `wav_data`. Each
+      encoding has shape [clip samples // hop length, bottleneck width].
+    """
+    clips = [np.asarray(clip, dtype=np.float32).reshape(-1)
+             for clip in wav_data]
+    lengths = [len(clip) // self._hop_length * self._hop_length
+               for clip in clips]
+    buckets = collections.defaultdict(list)
+    for i, length in enumerate(lengths):
+      num_buckets = max(-(-length // self._bucket_length), 1)
+      buckets[num_buckets * self._bucket_length].append(i)
+
+    encodings = [None] * len(clips)
+    for sample_length, indices in sorted(buckets.items()):
+      net = self._get_net(sample_length)
+      for start in range(0, len(indices), self._batch_size):
+        batch_indices = indices[start:start + self._batch_size]
+        batch = np.zeros([self._batch_size, sample_length], dtype=np.float32)
+        for j, i in enumerate(batch_indices):
+          batch[j, :lengths[i]] = clips[i][:lengths[i]]
+        batch_encodings = self._sess.run(net["encoding"],
+                                         feed_dict={net["X"]: batch})
+        for j, i in enumerate(batch_indices):
+          encodings[i] = batch_encodings[j, :lengths[i] // self._hop_length]
+    return encodings
+
+  def encode_files(self, files, sample_length=64000, num_loader_threads=4,
+                   lookahead_batches=8):
+    """Encodes audio files, loading the next files while encoding these.
+
+    Files are loaded `lookahead_batches` batches at a time, and clips of the
+    same padded length are batched together across all of them.
+
+    Args:
+      files: A list of paths to audio files.
+      sample_length: Maximum number of samples to encode from each file.
+      num_loader_threads: Number of threads that load and resample files.
+      lookahead_batches: Number of batches of files to group by length.
+
+    Yields:
+      A tuple of each file and its encoding, in the order of `files`.
+    """
+    load = functools.partial(utils.load_audio, sample_length=sample_length)
+    window_size = self._batch_size * max(lookahead_batches, 1)
+    windows = [files[i:i + window_size]
+               for i in range(0, len(files), window_size)]
+    pool = multiprocessing_pool.ThreadPool(num_loader_threads)
+    try:
+      loading = pool.map_async(load, windows[0]) if windows else None
+      for k, window in enumerate(windows):
+        wav_data = loading.get()
+        if k + 1 < len(windows):
+          loading = pool.map_async(load, windows[k + 1])
+        for f, encoding in zip(window, self.encode(wav_data)):
+          yield f, encoding
+    finally:
+      pool.terminate()
+      pool.join()
+
+  def close(self):
+    """Closes the session."""
+    self._sess.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
 
 
 def load_batch_audio(files, sample_length=64000):
@@ -199,7 +397,8 @@ def generate_audio_sample(sess, net, audio, encoding):
 def synthesize(encodings,
                save_paths,
                checkpoint_path="model.ckpt-200000",
-               samples_per_save=10000):
+               samples_per_save=10000,
+               samples_per_run=1):
   """Synthesize audio from an array of encodings.
 
   Args:
@@ -207,11 +406,17 @@ def synthesize(encodings,
     save_paths: Iterable of output file names.
     checkpoint_path: Location of the pretrained model. [model.ckpt-200000]
     samples_per_save: Save files after every amount of generated samples.
+    samples_per_run: Number of samples to generate in each session call. With
+      more than 1, the samples are drawn inside the graph by a
+      `tf.while_loop`, which avoids a session call per sample.
   """
   session_config = tf.ConfigProto(allow_soft_placement=True)
   session_config.gpu_options.allow_growth = True
   with tf.Graph().as_default(), tf.Session(config=session_config) as sess:
-    net = load_fastgen_nsynth(batch_size=encodings.shape[0])
+    if samples_per_run > 1:
+      net = load_fastgen_nsynth_loop(batch_size=encodings.shape[0])
+    else:
+      net = load_fastgen_nsynth(batch_size=encodings.shape[0])
     saver = tf.train.Saver()
     saver.restore(sess, checkpoint_path)
 
@@ -228,14 +433,38 @@ def synthesize(encodings,
         (batch_size, total_length), dtype=np.float32)
     audio = np.zeros([batch_size, 1])
 
-    for sample_i in range(total_length):
-      encoding_i = sample_i // hop_length
-      audio = generate_audio_sample(sess, net,
-                                    audio, encodings[:, encoding_i, :])
-      audio_batch[:, sample_i] = audio[:, 0]
-      if sample_i % 100 == 0:
-        tf.logging.info("Sample: %d" % sample_i)
-      if sample_i % samples_per_save == 0 and save_paths:
-        save_batch(audio_batch, save_paths)
+    start_time = time.time()
+    if samples_per_run > 1:
+      next_save = samples_per_save
+      for sample_i in range(0, total_length, samples_per_run):
+        num_samples = min(samples_per_run, total_length - sample_i)
+        audio_batch[:, sample_i:sample_i + num_samples] = sess.run(
+            net["audio"],
+            feed_dict={
+                net["X"]: audio,
+                net["encoding"]: encodings,
+                net["start"]: sample_i,
+                net["num_samples"]: num_samples,
+            })
+        samples_done = sample_i + num_samples
+        audio = audio_batch[:, samples_done - 1:samples_done]
+        tf.logging.info("Sample: %d (%.1f samples/second)" %
+                        (samples_done,
+                         samples_done / max(time.time() - start_time, 1e-6)))
+        if samples_done >= next_save and save_paths:
+          save_batch(audio_batch, save_paths)
+          next_save += samples_per_save
+    else:
+      for sample_i in range(total_length):
+        encoding_i = sample_i // hop_length
+        audio = generate_audio_sample(sess, net,
+                                      audio, encodings[:, encoding_i, :])
+        audio_batch[:, sample_i] = audio[:, 0]
+        if sample_i % 100 == 0:
+          tf.logging.info("Sample: %d (%.1f samples/second)" %
+                          (sample_i,
+                           sample_i / max(time.time() - start_time, 1e-6)))
+        if sample_i % samples_per_save == 0 and save_paths:
+          save_batch(audio_batch, save_paths)
 
     save_batch(audio_batch, save_paths)
@@ -19,6 +19,7 @@ from absl.testing import parameterized
 import librosa
 from magenta.models.nsynth.wavenet import fastgen
 import numpy as np
+from scipy.io import wavfile
 import tensorflow.compat.v1 as tf
 
 tf.disable_v2_behavior()
@@ -108,5 +109,100 @@ class FastegenTest(parameterized.TestCase, tf.test.TestCase):
       audio_gen = fastgen.generate_audio_sample(sess, net, audio, encoding)
       self.assertEqual(audio_gen.shape, audio.shape)
 
+  @parameterized.parameters(
+      {'batch_size': 1},
+      {'batch_size': 3},
+  )
+  def testSynthesisLoopMatchesStepByStep(self, batch_size, channels=16):
+    checkpoint_path = os.path.join(tf.test.get_temp_dir(), 'fastgen.ckpt')
+    session_config = tf.ConfigProto(allow_soft_placement=True)
+    rng = np.random.RandomState(0)
+    encodings = rng.randn(batch_size, 2, channels).astype(np.float32)
+    # The second run crosses into the second encoding.
+    runs = [(0, 6), (508, 8)]
+
+    with tf.Graph().as_default(), tf.Session(config=session_config) as sess:
+      net = fastgen.load_fastgen_nsynth_loop(batch_size=batch_size)
+      self.assertEqual(net['X'].shape, (batch_size, 1))
+      sess.run(tf.global_variables_initializer())
+      tf.train.Saver().save(sess, checkpoint_path)
+      sess.run(net['init_ops'])
+      audio = np.zeros([batch_size, 1], dtype=np.float32)
+      loop_audio, loop_predictions = [], []
+      for start, num_samples in runs:
+        run_audio, run_predictions = sess.run(
+            [net['audio'], net['predictions']],
+            feed_dict={net['X']: audio, net['encoding']: encodings,
+                       net['start']: start, net['num_samples']: num_samples})
+        self.assertEqual((batch_size, num_samples), run_audio.shape)
+        self.assertEqual((num_samples, batch_size, 256), run_predictions.shape)
+        audio = run_audio[:, -1:]
+        loop_audio.append(run_audio)
+        loop_predictions.append(run_predictions)
+
+    # Feeding the same audio one sample at a time gives the same predictions.
+    loop_audio = np.concatenate(loop_audio, axis=1)
+    loop_predictions = np.concatenate(loop_predictions, axis=0)
+    positions = np.concatenate([np.arange(start, start + num_samples)
+                                for start, num_samples in runs])
+    with tf.Graph().as_default(), tf.Session(config=session_config) as sess:
+      net = fastgen.load_fastgen_nsynth(batch_size=batch_size)
+      tf.train.Saver().restore(sess, checkpoint_path)
+      sess.run(net['init_ops'])
+      audio = np.zeros([batch_size, 1], dtype=np.float32)
+      for i, position in enumerate(positions):
+        predictions = sess.run(
+            [net['predictions'], net['push_ops']],
+            feed_dict={net['X']: audio,
+                       net['encoding']: encodings[:, position // 512]})[0]
+        self.assertAllClose(predictions, loop_predictions[i], atol=1e-5)
+        audio = loop_audio[:, i:i + 1]
+
+  def testNSynthEncoder(self):
+    checkpoint_path = os.path.join(tf.test.get_temp_dir(), 'model.ckpt')
+    session_config = tf.ConfigProto(allow_soft_placement=True)
+    with tf.Graph().as_default(), tf.Session(config=session_config) as sess:
+      fastgen.load_nsynth(batch_size=1, sample_length=1024)
+      sess.run(tf.global_variables_initializer())
+      tf.train.Saver().save(sess, checkpoint_path)
+
+    rng = np.random.RandomState(0)
+    clips = [0.1 * rng.randn(length).astype(np.float32)
+             for length in [1024, 600, 1100, 1024]]
+    files = []
+    for i, clip in enumerate(clips):
+      files.append(os.path.join(tf.test.get_temp_dir(), 'clip_%d.wav' % i))
+      wavfile.write(files[-1], 16000, clip)
+
+    with fastgen.NSynthEncoder(checkpoint_path, batch_size=2) as encoder:
+      encodings = encoder.encode(clips)
+      file_encodings = list(encoder.encode_files(files, lookahead_batches=1))
+    # With a single graph, it is rebuilt for each clip length.
+    with fastgen.NSynthEncoder(
+        checkpoint_path, batch_size=2, max_graphs=1) as encoder:
+      single_graph_encodings = encoder.encode(clips)
+      single_graph_file_encodings = list(encoder.encode_files(files))
+
+    self.assertEqual([(2, 16), (1, 16), (2, 16), (2, 16)],
+                     [encoding.shape for encoding in encodings])
+    # Batching clips gives the same encodings as encoding them one at a time.
+    for clip, encoding in zip(clips, encodings):
+      self.assertAllClose(
+          fastgen.encode(clip, checkpoint_path, sample_length=len(clip))[0],
+          encoding)
+    self.assertEqual(files, [f for f, _ in file_encodings])
+    for encoding, (_, file_encoding) in zip(encodings, file_encodings):
+      self.assertAllClose(encoding, file_encoding, atol=1e-4)
+    self.assertAllClose(encodings, single_graph_encodings)
+    self.assertEqual(files, [f for f, _ in single_graph_file_encodings])
+    for encoding, (_, file_encoding) in zip(encodings,
+                                            single_graph_file_encodings):
+      self.assertAllClose(encoding, file_encoding, atol=1e-4)
+
+  def testNSynthEncoderBucketLength(self):
+    with self.assertRaises(ValueError):
+      fastgen.NSynthEncoder('model.ckpt', bucket_length=1000)
+
+
 if __name__ == '__main__':
   tf.test.main()
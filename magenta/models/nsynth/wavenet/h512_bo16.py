@@ -24,79 +24,53 @@ import tensorflow.compat.v1 as tf
 class FastGenerationConfig(object):
   """Configuration object that helps manage the graph."""
 
+  num_stages = 10
+  num_layers = 30
+  filter_length = 3
+  width = 512
+  skip_width = 256
+  num_z = 16
+
   def __init__(self, batch_size=1):
     """."""
     self.batch_size = batch_size
 
-  def build(self, inputs):
-    """Build the graph for this configuration.
+  def _causal_layers(self):
+    """Returns the name, input channels and dilation of each causal layer."""
+    layers = [('startconv', 1, 1)]
+    for i in range(self.num_layers):
+      layers.append(('dilatedconv_%d' % (i + 1), self.width,
+                     2**(i % self.num_stages)))
+    return layers
+
+  def _decode_step(self, x_scaled, en, causal_layer):
+    """Builds one step of the WaveNet decoder.
 
     Args:
-      inputs: A dict of inputs. For training, should contain 'wav'.
+      x_scaled: The [mb, 1, 1] input sample, in mu-law and scaled to [-1, 1].
+      en: The [mb, 1, num_z] encoding of the step.
+      causal_layer: Function of the input, the number of output channels and
+        the layer name that applies a causal layer from `_causal_layers`.
 
     Returns:
-      A dict of outputs that includes the 'predictions',
-      'init_ops', the 'push_ops', and the 'quantized_input'.
+      The [mb, 256] logits of the next sample.
     """
-    num_stages = 10
-    num_layers = 30
-    filter_length = 3
-    width = 512
-    skip_width = 256
-    num_z = 16
-
-    # Encode the source with 8-bit Mu-Law.
-    x = inputs['wav']
-    batch_size = self.batch_size
-    x_quantized = utils.mu_law(x)
-    x_scaled = tf.cast(x_quantized, tf.float32) / 128.0
-    x_scaled = tf.expand_dims(x_scaled, 2)
-
-    encoding = tf.placeholder(
-        name='encoding', shape=[batch_size, num_z], dtype=tf.float32)
-    en = tf.expand_dims(encoding, 1)
-
-    init_ops, push_ops = [], []
+    width = self.width
+    skip_width = self.skip_width
+    num_z = self.num_z
 
     ###
     # The WaveNet Decoder.
     ###
-    l = x_scaled
-    l, inits, pushs = utils.causal_linear(
-        x=l,
-        n_inputs=1,
-        n_outputs=width,
-        name='startconv',
-        rate=1,
-        batch_size=batch_size,
-        filter_length=filter_length)
-
-    for init in inits:
-      init_ops.append(init)
-    for push in pushs:
-      push_ops.append(push)
+    l = causal_layer(x_scaled, width, 'startconv')
 
     # Set up skip connections.
     s = utils.linear(l, width, skip_width, name='skip_start')
 
     # Residual blocks with skip connections.
-    for i in range(num_layers):
-      dilation = 2**(i % num_stages)
-
+    for i in range(self.num_layers):
       # dilated masked cnn
-      d, inits, pushs = utils.causal_linear(
-          x=l,
-          n_inputs=width,
-          n_outputs=width * 2,
-          name='dilatedconv_%d' % (i + 1),
-          rate=dilation,
-          batch_size=batch_size,
-          filter_length=filter_length)
-
-      for init in inits:
-        init_ops.append(init)
-      for push in pushs:
-        push_ops.append(push)
+      d = causal_layer(l, width * 2, 'dilatedconv_%d' % (i + 1))
 
       # local conditioning
       d += utils.linear(en, num_z, width * 2, name='cond_map_%d' % (i + 1))
@@ -118,10 +92,51 @@ class FastGenerationConfig(object):
     s = tf.nn.relu(s)
 
     ###
-    # Compute the logits and get the loss.
+    # Compute the logits.
     ###
     logits = utils.linear(s, skip_width, 256, name='logits')
-    logits = tf.reshape(logits, [-1, 256])
+    return tf.reshape(logits, [-1, 256])
+
+  def build(self, inputs):
+    """Build the graph for this configuration.
+
+    Args:
+      inputs: A dict of inputs. For training, should contain 'wav'.
+
+    Returns:
+      A dict of outputs that includes the 'predictions',
+      'init_ops', the 'push_ops', and the 'quantized_input'.
+    """
+    # Encode the source with 8-bit Mu-Law.
+    x = inputs['wav']
+    batch_size = self.batch_size
+    x_quantized = utils.mu_law(x)
+    x_scaled = tf.cast(x_quantized, tf.float32) / 128.0
+    x_scaled = tf.expand_dims(x_scaled, 2)
+
+    encoding = tf.placeholder(
+        name='encoding', shape=[batch_size, self.num_z], dtype=tf.float32)
+    en = tf.expand_dims(encoding, 1)
+
+    init_ops, push_ops = [], []
+    layers = {name: (n_inputs, rate)
+              for name, n_inputs, rate in self._causal_layers()}
+
+    def causal_layer(x, n_outputs, name):
+      n_inputs, rate = layers[name]
+      y, inits, pushs = utils.causal_linear(
+          x=x,
+          n_inputs=n_inputs,
+          n_outputs=n_outputs,
+          name=name,
+          rate=rate,
+          batch_size=batch_size,
+          filter_length=self.filter_length)
+      init_ops.extend(inits)
+      push_ops.extend(pushs)
+      return y
+
+    logits = self._decode_step(x_scaled, en, causal_layer)
     probs = tf.nn.softmax(logits, name='softmax')
 
     return {
@@ -132,6 +147,75 @@ class FastGenerationConfig(object):
         'quantized_input': x_quantized,
     }
 
+  def build_synthesis_loop(self, inputs):
+    """Build a graph that generates many samples in one session call.
+
+    The samples are generated by a `tf.while_loop` that samples from the
+    predictions in the graph. The queues keep their state between calls, so
+    consecutive calls continue the same audio.
+
+    Args:
+      inputs: A dict of inputs. 'wav' is the [mb, 1] sample preceding the
+        samples to generate, 'encoding' the [mb, time, num_z] encodings of the
+        whole audio, 'start' the int32 index of the first sample to generate
+        and 'num_samples' the int32 number of samples to generate.
+
+    Returns:
+      A dict of outputs that includes the 'init_ops', the generated 'audio' of
+      shape [mb, num_samples] and the 'predictions' of shape [num_samples, mb,
+      256] that each sample was drawn from.
+    """
+    batch_size = self.batch_size
+    encodings = inputs['encoding']
+    start = inputs['start']
+    num_samples = inputs['num_samples']
+    hop_length = Config().ae_hop_length
+
+    queues, init_ops = {}, []
+    for name, n_inputs, rate in self._causal_layers():
+      layer_queues, inits = utils.causal_linear_queues(
+          n_inputs, rate, batch_size)
+      queues[name] = (layer_queues, n_inputs)
+      init_ops.extend(inits)
+
+    def body(i, x, audio, predictions):
+      """Generates the sample at index start + i."""
+      push_ops = []
+
+      def causal_layer(layer_input, n_outputs, name):
+        layer_queues, n_inputs = queues[name]
+        y, pushs = utils.queued_causal_linear(
+            layer_input, layer_queues, n_inputs, n_outputs, name,
+            self.filter_length)
+        push_ops.extend(pushs)
+        return y
+
+      x_quantized = utils.mu_law(x)
+      x_scaled = tf.expand_dims(tf.cast(x_quantized, tf.float32) / 128.0, 2)
+      en = tf.gather(encodings, [(start + i) // hop_length], axis=1)
+      logits = self._decode_step(x_scaled, en, causal_layer)
+      sample_bin = tf.random.categorical(logits, 1)
+      sample = utils.inv_mu_law(sample_bin - 128)
+      # The next step must dequeue the states pushed by this one.
+      with tf.control_dependencies(push_ops):
+        sample = tf.identity(sample)
+      return (i + 1, sample, audio.write(i, sample[:, 0]),
+              predictions.write(i, tf.nn.softmax(logits)))
+
+    _, _, audio, predictions = tf.while_loop(
+        lambda i, *_: i < num_samples,
+        body,
+        [tf.constant(0), inputs['wav'],
+         tf.TensorArray(tf.float32, size=num_samples),
+         tf.TensorArray(tf.float32, size=num_samples)],
+        parallel_iterations=1)
+
+    return {
+        'init_ops': init_ops,
+        'audio': tf.transpose(audio.stack()),
+        'predictions': predictions.stack(),
+    }
+
 
 class Config(object):
   """Configuration object that helps manage the graph."""
@@ -15,11 +15,12 @@
 # Lint as: python3
 """With a trained model, compute the embeddings on a directory of WAV files."""
 
+from multiprocessing import pool as multiprocessing_pool
 import os
 import sys
 
 from magenta.models.nsynth import utils
-from magenta.models.nsynth.wavenet.fastgen import encode
+from magenta.models.nsynth.wavenet import fastgen
 import numpy as np
 import tensorflow.compat.v1 as tf
 
@@ -36,7 +37,17 @@ tf.app.flags.DEFINE_string("expdir", "",
                            "The log directory for this experiment. Required if "
                            "`checkpoint_path` is not given.")
 tf.app.flags.DEFINE_integer("sample_length", 64000, "Sample length.")
-tf.app.flags.DEFINE_integer("batch_size", 16, "Sample length.")
+tf.app.flags.DEFINE_integer("batch_size", 16, "Number of files encoded at once.")
+tf.app.flags.DEFINE_integer("bucket_length", 0,
+                            "If positive, clips are zero-padded to a multiple "
+                            "of this many samples, which must be a multiple of "
+                            "512. Clips of different lengths then share fewer "
+                            "encoder graphs and fill batches better, but the "
+                            "padding changes their embeddings. By default "
+                            "clips are not padded.")
+tf.app.flags.DEFINE_integer("lookahead_batches", 8,
+                            "Number of batches of files that are loaded at "
+                            "once and grouped by length.")
 tf.app.flags.DEFINE_string("log", "INFO",
                            "The threshold for what messages will be logged."
                            "DEBUG, INFO, WARN, ERROR, or FATAL.")
@@ -86,39 +97,30 @@ def main(unused_argv=None):
       for fname in tf.gfile.ListDirectory(source_path) if is_wav(fname)
   ])
 
-  for start_file in range(0, len(wavfiles), batch_size):
-    batch_number = (start_file / batch_size) + 1
-    tf.logging.info("On file number %s (batch %d).", start_file, batch_number)
-    end_file = start_file + batch_size
-    wavefiles_batch = wavfiles[start_file:end_file]
-
-    # Ensure that files has batch_size elements.
-    batch_filler = batch_size - len(wavefiles_batch)
-    wavefiles_batch.extend(batch_filler * [wavefiles_batch[-1]])
-    wav_data = [utils.load_audio(f, sample_length) for f in wavefiles_batch]
-    min_len = min([x.shape[0] for x in wav_data])
-    wav_data = np.array([x[:min_len] for x in wav_data])
-    try:
-      tf.reset_default_graph()
-      # Load up the model for encoding and find the encoding
-      encoding = encode(wav_data, checkpoint_path, sample_length=sample_length)
-      if encoding.ndim == 2:
-        encoding = np.expand_dims(encoding, 0)
-
-      tf.logging.info("Encoding:")
-      tf.logging.info(encoding.shape)
-      tf.logging.info("Sample length: %d" % sample_length)
-
-      for num, (wavfile, enc) in enumerate(zip(wavefiles_batch, encoding)):
-        filename = "%s_embeddings.npy" % wavfile.split("/")[-1].strip(".wav")
-        with tf.gfile.Open(os.path.join(save_path, filename), "w") as f:
-          np.save(f, enc)
-
-        if num + batch_filler + 1 == batch_size:
-          break
-    except Exception as e:
-      tf.logging.info("Unexpected error happened: %s.", e)
-      raise
+  def save_embedding(wavfile, encoding):
+    filename = "%s_embeddings.npy" % wavfile.split("/")[-1].strip(".wav")
+    with tf.gfile.Open(os.path.join(save_path, filename), "w") as f:
+      np.save(f, encoding)
+
+  # Embeddings are written by a background thread while the next batch is
+  # encoded.
+  writer = multiprocessing_pool.ThreadPool(1)
+  writes = []
+  with fastgen.NSynthEncoder(
+      checkpoint_path, batch_size=batch_size,
+      bucket_length=FLAGS.bucket_length or None) as encoder:
+    for num, (wavfile, encoding) in enumerate(
+        encoder.encode_files(wavfiles, sample_length=sample_length,
+                             lookahead_batches=FLAGS.lookahead_batches)):
+      if num % batch_size == 0:
+        tf.logging.info("On file number %s (batch %d).", num,
+                        num // batch_size + 1)
+      writes.append(writer.apply_async(save_embedding, (wavfile, encoding)))
+  writer.close()
+  for write in writes:
+    # Raises any error from writing the embedding.
+    write.get()
+  writer.join()
 
 
 def console_entry_point():
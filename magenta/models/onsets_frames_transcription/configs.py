@@ -42,6 +42,9 @@ DEFAULT_HPARAMS = tf_utils.merge_hparams(
         spec_n_bins=229,
         spec_fmin=30.0,  # A0
         cqt_bins_per_octave=36,
+        # Local directory of a spectrogram_cache.SpectrogramCache, or '' to
+        # compute spectrograms on the fly.
+        spec_cache_dir='',
         truncated_length_secs=0.0,
         max_expected_train_example_len=0,
         onset_length=32,
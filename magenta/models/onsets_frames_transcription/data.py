@@ -34,6 +34,7 @@ from magenta.models.onsets_frames_transcription import audio_transform
 from magenta.models.onsets_frames_transcription import constants
 from magenta.models.onsets_frames_transcription import drum_mappings
 from magenta.models.onsets_frames_transcription import melspec_input
+from magenta.models.onsets_frames_transcription import spectrogram_cache
 from note_seq import audio_io
 from note_seq import sequences_lib
 from note_seq.protobuf import music_pb2
@@ -125,14 +126,32 @@ def wav_to_spec(wav_audio, hparams):
   return spec
 
 
-def wav_to_spec_op(wav_audio, hparams):
-  """Return an op for converting wav audio to a spectrogram."""
+def wav_to_spec_op(wav_audio, hparams, use_cache=True):
+  """Return an op for converting wav audio to a spectrogram.
+
+  Args:
+    wav_audio: A scalar string Tensor of wav data.
+    hparams: HParams object specifying hyperparameters. If `spec_cache_dir` is
+        set, CQT and mel spectrograms are read from and added to a
+        `spectrogram_cache.SpectrogramCache` in that directory.
+    use_cache: Whether the spectrogram cache may be used. Should be False for
+        audio that is augmented differently every time.
+
+  Returns:
+    A float32 Tensor of shape [frames, bins].
+  """
   if hparams.spec_type == 'tflite_compat_mel':
     assert hparams.spec_log_amplitude
     spec = tflite_compat_mel(wav_audio, hparams=hparams)
   else:
+    spec_fn = functools.partial(wav_to_spec, hparams=hparams)
+    if (use_cache and hparams.spec_cache_dir and
+        hparams.spec_type in ('cqt', 'mel')):
+      cache = spectrogram_cache.SpectrogramCache(hparams.spec_cache_dir,
+                                                 hparams)
+      spec_fn = functools.partial(cache.get_or_compute, spec_fn=spec_fn)
     spec = tf.py_func(
-        functools.partial(wav_to_spec, hparams=hparams),
+        spec_fn,
         [wav_audio],
         tf.float32,
         name='wav_to_spec')
@@ -361,7 +380,9 @@ def preprocess_example(example_proto, hparams, is_training):
         hparams=hparams,
         jitter_amount_sec=wav_jitter_amount_ms / 1000.)
 
-  spec = wav_to_spec_op(audio, hparams=hparams)
+  # Augmented audio differs on every epoch, so its spectrogram is not cached.
+  augmented = is_training and (wav_jitter_amount_ms or hparams.transform_audio)
+  spec = wav_to_spec_op(audio, hparams=hparams, use_cache=not augmented)
   spectrogram_hash = get_spectrogram_hash_op(spec)
 
   labels, label_weights, onsets, offsets, velocities = sequence_to_pianoroll_op(
@@ -567,7 +588,8 @@ def read_examples(examples, is_training, shuffle_examples,
 
   Args:
     examples: A string path to a TFRecord file of examples, a python list of
-      serialized examples, or a Tensor placeholder for serialized examples.
+      serialized examples, a Tensor placeholder for serialized examples, or a
+      tf.data.Dataset of serialized examples.
     is_training: Whether this is a training run.
     shuffle_examples: Whether examples should be shuffled.
     skip_n_initial_records: Skip this many records at first.
@@ -602,6 +624,8 @@ def read_examples(examples, is_training, shuffle_examples,
               tf.data.TFRecordDataset, sloppy=True, cycle_length=8))
     else:
       input_dataset = tf.data.TFRecordDataset(filenames)
+  elif isinstance(examples, tf.data.Dataset):
+    input_dataset = examples
   else:
     input_dataset = tf.data.Dataset.from_tensor_slices(examples)
 
@@ -713,7 +737,8 @@ def provide_batch(examples,
 
   Args:
     examples: A string path to a TFRecord file of examples, a python list of
-      serialized examples, or a Tensor placeholder for serialized examples.
+      serialized examples, a Tensor placeholder for serialized examples, or a
+      tf.data.Dataset of serialized examples.
     preprocess_examples: Whether to preprocess examples. If False, assume they
       have already been preprocessed.
     params: HParams object specifying hyperparameters. Called 'params' here
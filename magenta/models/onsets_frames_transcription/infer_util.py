@@ -25,9 +25,18 @@ from note_seq import sequences_lib
 import numpy as np
 
 
+# Number of frames whose transition losses are prepared at once by
+# `probs_to_pianoroll_viterbi`.
+_VITERBI_CHUNK_FRAMES = 1024
+
+
 def probs_to_pianoroll_viterbi(frame_probs, onset_probs, alpha=0.5):
   """Viterbi decoding of frame & onset probabilities to pianoroll.
 
+  All pitches are decoded together. Transition losses are prepared for chunks
+  of frames at a time, and each frame is then decoded with a few in-place
+  NumPy operations on preallocated buffers.
+
   Args:
     frame_probs: A numpy array (num-frames-by-num-pitches) of frame
       probabilities.
@@ -43,39 +52,51 @@ def probs_to_pianoroll_viterbi(frame_probs, onset_probs, alpha=0.5):
   """
   n, d = onset_probs.shape
 
-  loss_matrix = np.zeros([n, d, 2], dtype=np.float)
-  path_matrix = np.zeros([n, d, 2], dtype=np.bool)
-
+  # Losses are indexed by [frame, state, pitch], where state 1 is active.
   frame_losses = (1 - alpha) * -np.log(np.stack([1 - frame_probs,
-                                                 frame_probs], axis=-1))
+                                                 frame_probs], axis=1))
   onset_losses = alpha * -np.log(np.stack([1 - onset_probs,
-                                           onset_probs], axis=-1))
-
-  loss_matrix[0, :, :] = frame_losses[0, :, :] + onset_losses[0, :, :]
-
-  for i in range(1, n):
-    transition_loss = np.tile(loss_matrix[i - 1, :, :][:, :, np.newaxis],
-                              [1, 1, 2])
-
-    transition_loss[:, 0, 0] += onset_losses[i, :, 0]
-    transition_loss[:, 0, 1] += onset_losses[i, :, 1]
-    transition_loss[:, 1, 0] += onset_losses[i, :, 0]
-    transition_loss[:, 1, 1] += onset_losses[i, :, 0]
-
-    path_matrix[i, :, :] = np.argmin(transition_loss, axis=1)
-
-    loss_matrix[i, :, 0] = transition_loss[
-        np.arange(d), path_matrix[i, :, 0].astype(int), 0]
-    loss_matrix[i, :, 1] = transition_loss[
-        np.arange(d), path_matrix[i, :, 1].astype(int), 1]
-
-    loss_matrix[i, :, :] += frame_losses[i, :, :]
-
-  pianoroll = np.zeros([n, d], dtype=np.bool)
-  pianoroll[n - 1, :] = np.argmin(loss_matrix[n - 1, :, :], axis=-1)
+                                           onset_probs], axis=1))
+  # Comparisons only match argmin (which prefers NaN) if there are no NaNs.
+  has_nan = np.isnan(frame_losses).any() or np.isnan(onset_losses).any()
+
+  # path_matrix[i, state, pitch] is whether the best path to `state` at frame
+  # i comes from the active state at frame i - 1.
+  path_matrix = np.zeros([n, 2, d], dtype=np.bool_)
+  loss = np.empty([2, d], dtype=np.float64)
+  loss[:] = frame_losses[0] + onset_losses[0]
+
+  # transition_losses[i, from_state, to_state, pitch]. Only a transition from
+  # inactive to active incurs the onset loss.
+  chunk_frames = min(_VITERBI_CHUNK_FRAMES, max(n - 1, 1))
+  transition_losses = np.empty([chunk_frames, 2, 2, d], dtype=np.float64)
+  transition_loss = np.empty([2, 2, d], dtype=np.float64)
+  previous_loss = loss[:, np.newaxis, :]
+  from_inactive, from_active = transition_loss
+
+  for start in range(1, n, chunk_frames):
+    end = min(start + chunk_frames, n)
+    chunk_transition_losses = transition_losses[:end - start]
+    chunk_transition_losses[:, :, 0] = onset_losses[start:end, np.newaxis, 0]
+    chunk_transition_losses[:, 0, 1] = onset_losses[start:end, 1]
+    chunk_transition_losses[:, 1, 1] = onset_losses[start:end, 0]
+    chunk_frame_losses = frame_losses[start:end].astype(np.float64)
+
+    for frame_transition_losses, frame_loss, path in zip(
+        chunk_transition_losses, chunk_frame_losses, path_matrix[start:end]):
+      np.add(previous_loss, frame_transition_losses, out=transition_loss)
+      # Ties go to the inactive state.
+      np.less(from_active, from_inactive, out=path)
+      if has_nan:
+        path |= np.isnan(from_active) & ~np.isnan(from_inactive)
+      np.minimum(from_inactive, from_active, out=loss)
+      loss += frame_loss
+
+  pianoroll = np.zeros([n, d], dtype=np.bool_)
+  pianoroll[n - 1, :] = np.argmin(loss, axis=0)
   for i in range(n - 2, -1, -1):
-    pianoroll[i, :] = path_matrix[
-        i + 1, np.arange(d), pianoroll[i + 1, :].astype(int)]
+    np.copyto(pianoroll[i, :], path_matrix[i + 1, 0])
+    np.copyto(pianoroll[i, :], path_matrix[i + 1, 1], where=pianoroll[i + 1])
 
   return pianoroll
 
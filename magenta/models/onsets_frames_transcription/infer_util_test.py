@@ -12,12 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Tests for metrics."""
+"""Tests for infer_util."""
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
+
 from magenta.models.onsets_frames_transcription import infer_util
 
 import numpy as np
@@ -26,6 +28,54 @@ import tensorflow.compat.v1 as tf
 tf.disable_v2_behavior()
 
 
+def _probs_to_pianoroll_viterbi_reference(frame_probs, onset_probs, alpha=0.5):
+  """Original frame-by-frame implementation of probs_to_pianoroll_viterbi."""
+  n, d = onset_probs.shape
+
+  loss_matrix = np.zeros([n, d, 2], dtype=np.float64)
+  path_matrix = np.zeros([n, d, 2], dtype=np.bool_)
+
+  frame_losses = (1 - alpha) * -np.log(np.stack([1 - frame_probs,
+                                                 frame_probs], axis=-1))
+  onset_losses = alpha * -np.log(np.stack([1 - onset_probs,
+                                           onset_probs], axis=-1))
+
+  loss_matrix[0, :, :] = frame_losses[0, :, :] + onset_losses[0, :, :]
+
+  for i in range(1, n):
+    transition_loss = np.tile(loss_matrix[i - 1, :, :][:, :, np.newaxis],
+                              [1, 1, 2])
+
+    transition_loss[:, 0, 0] += onset_losses[i, :, 0]
+    transition_loss[:, 0, 1] += onset_losses[i, :, 1]
+    transition_loss[:, 1, 0] += onset_losses[i, :, 0]
+    transition_loss[:, 1, 1] += onset_losses[i, :, 0]
+
+    path_matrix[i, :, :] = np.argmin(transition_loss, axis=1)
+
+    loss_matrix[i, :, 0] = transition_loss[
+        np.arange(d), path_matrix[i, :, 0].astype(int), 0]
+    loss_matrix[i, :, 1] = transition_loss[
+        np.arange(d), path_matrix[i, :, 1].astype(int), 1]
+
+    loss_matrix[i, :, :] += frame_losses[i, :, :]
+
+  pianoroll = np.zeros([n, d], dtype=np.bool_)
+  pianoroll[n - 1, :] = np.argmin(loss_matrix[n - 1, :, :], axis=-1)
+  for i in range(n - 2, -1, -1):
+    pianoroll[i, :] = path_matrix[
+        i + 1, np.arange(d), pianoroll[i + 1, :].astype(int)]
+
+  return pianoroll
+
+
+def _random_probs(rng, num_frames, num_pitches, dtype=np.float64):
+  frame_probs = rng.uniform(size=[num_frames, num_pitches]).astype(dtype)
+  onset_probs = (rng.uniform(size=[num_frames, num_pitches]) ** 4).astype(
+      dtype)
+  return frame_probs, onset_probs
+
+
 class InferUtilTest(tf.test.TestCase):
 
   def testProbsToPianorollViterbi(self):
@@ -36,6 +86,59 @@ class InferUtilTest(tf.test.TestCase):
         [[False, False], [False, False], [True, False], [True, False]],
         pianoroll)
 
+  def testProbsToPianorollViterbiMatchesReference(self):
+    rng = np.random.RandomState(0)
+    for dtype in [np.float32, np.float64]:
+      for alpha in [0.0, 0.3, 0.5, 1.0]:
+        frame_probs, onset_probs = _random_probs(rng, 300, 88, dtype)
+        # Certain probabilities give infinite losses, or NaN losses when their
+        # weight is 0.
+        frame_probs[rng.uniform(size=frame_probs.shape) < 0.05] = 0.0
+        frame_probs[rng.uniform(size=frame_probs.shape) < 0.05] = 1.0
+        onset_probs[rng.uniform(size=onset_probs.shape) < 0.05] = 0.0
+        onset_probs[rng.uniform(size=onset_probs.shape) < 0.05] = 1.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+          expected = _probs_to_pianoroll_viterbi_reference(
+              frame_probs, onset_probs, alpha=alpha)
+          pianoroll = infer_util.probs_to_pianoroll_viterbi(
+              frame_probs, onset_probs, alpha=alpha)
+        np.testing.assert_array_equal(expected, pianoroll)
+
+  def testProbsToPianorollViterbiChunks(self):
+    rng = np.random.RandomState(1)
+    frame_probs, onset_probs = _random_probs(rng, 2500, 4)
+    np.testing.assert_array_equal(
+        _probs_to_pianoroll_viterbi_reference(frame_probs, onset_probs),
+        infer_util.probs_to_pianoroll_viterbi(frame_probs, onset_probs))
+    np.testing.assert_array_equal(
+        _probs_to_pianoroll_viterbi_reference(frame_probs[:1], onset_probs[:1]),
+        infer_util.probs_to_pianoroll_viterbi(frame_probs[:1], onset_probs[:1]))
+
+
+class InferUtilBenchmark(tf.test.Benchmark):
+  """Benchmarks Viterbi decoding against the frame-by-frame implementation.
+
+  Run with --benchmark_filter=InferUtilBenchmark.
+  """
+
+  def _benchmark_viterbi(self, name, viterbi_fn, num_frames=30000):
+    # About 16 minutes of audio at 31.25 frames per second.
+    frame_probs, onset_probs = _random_probs(
+        np.random.RandomState(0), num_frames, 88)
+    start_time = time.time()
+    viterbi_fn(frame_probs, onset_probs)
+    wall_time = time.time() - start_time
+    self.report_benchmark(
+        iters=1, wall_time=wall_time, name=name,
+        extras={'frames_per_second': num_frames / wall_time})
+
+  def benchmarkViterbiReference(self):
+    self._benchmark_viterbi('viterbi_reference',
+                            _probs_to_pianoroll_viterbi_reference)
+
+  def benchmarkViterbi(self):
+    self._benchmark_viterbi('viterbi', infer_util.probs_to_pianoroll_viterbi)
+
 
 if __name__ == '__main__':
   tf.test.main()
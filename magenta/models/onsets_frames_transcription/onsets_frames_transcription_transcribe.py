@@ -20,14 +20,11 @@ from __future__ import print_function
 
 import os
 
-from magenta.models.onsets_frames_transcription import audio_label_data_utils
 from magenta.models.onsets_frames_transcription import configs
 from magenta.models.onsets_frames_transcription import data
-from magenta.models.onsets_frames_transcription import infer_util
-from magenta.models.onsets_frames_transcription import train_util
+from magenta.models.onsets_frames_transcription import streaming_transcription
+from magenta.models.onsets_frames_transcription import transcription_engine
 from note_seq import midi_io
-from note_seq.protobuf import music_pb2
-import six
 import tensorflow.compat.v1 as tf
 
 FLAGS = tf.app.flags.FLAGS
@@ -50,28 +47,27 @@ tf.app.flags.DEFINE_boolean(
 tf.app.flags.DEFINE_string(
     'transcribed_file_suffix', '',
     'Optional suffix to add to transcribed files.')
+tf.app.flags.DEFINE_integer(
+    'num_preprocessing_threads', 4,
+    'Number of threads that read and resample audio files while earlier files '
+    'are transcribed.')
+tf.app.flags.DEFINE_float(
+    'chunk_secs', 0,
+    'If positive, transcribe each file in windows of this many seconds, with '
+    'memory use independent of the length of the file. Requires 16-bit or '
+    '32-bit float PCM WAV files.')
+tf.app.flags.DEFINE_float(
+    'chunk_overlap_secs', 5.0,
+    'Seconds of context audio on either side of each window when '
+    '--chunk_secs is set.')
 tf.app.flags.DEFINE_string(
     'log', 'INFO',
     'The threshold for what messages will be logged: '
     'DEBUG, INFO, WARN, ERROR, or FATAL.')
 
 
-def create_example(filename, sample_rate, load_audio_with_librosa):
-  """Processes an audio file into an Example proto."""
-  wav_data = tf.gfile.Open(filename, 'rb').read()
-  example_list = list(
-      audio_label_data_utils.process_record(
-          wav_data=wav_data,
-          sample_rate=sample_rate,
-          ns=music_pb2.NoteSequence(),
-          # decode to handle filenames with extended characters.
-          example_id=six.ensure_text(filename, 'utf-8'),
-          min_length=0,
-          max_length=-1,
-          allow_empty_notesequence=True,
-          load_audio_with_librosa=load_audio_with_librosa))
-  assert len(example_list) == 1
-  return example_list[0].SerializeToString()
+# Kept for backwards compatibility.
+create_example = transcription_engine.create_example
 
 
 def run(argv, config_map, data_fn):
@@ -81,71 +77,47 @@ def run(argv, config_map, data_fn):
   config = config_map[FLAGS.config]
   hparams = config.hparams
   hparams.parse(FLAGS.hparams)
-  hparams.batch_size = 1
-  hparams.truncated_length_secs = 0
-
-  with tf.Graph().as_default():
-    examples = tf.placeholder(tf.string, [None])
-
-    dataset = data_fn(
-        examples=examples,
-        preprocess_examples=True,
-        params=hparams,
-        is_training=False,
-        shuffle_examples=False,
-        skip_n_initial_records=0)
-
-    estimator = train_util.create_estimator(config.model_fn,
-                                            os.path.expanduser(FLAGS.model_dir),
-                                            hparams)
-
-    iterator = dataset.make_initializable_iterator()
-    next_record = iterator.get_next()
-
-    with tf.Session() as sess:
-      sess.run([
-          tf.initializers.global_variables(),
-          tf.initializers.local_variables()
-      ])
-
-      for filename in argv[1:]:
-        tf.logging.info('Starting transcription for %s...', filename)
-
-        # The reason we bounce between two Dataset objects is so we can use
-        # the data processing functionality in data.py without having to
-        # construct all the Example protos in memory ahead of time or create
-        # a temporary tfrecord file.
-        tf.logging.info('Processing file...')
-        sess.run(iterator.initializer,
-                 {examples: [
-                     create_example(filename, hparams.sample_rate,
-                                    FLAGS.load_audio_with_librosa)]})
-
-        def transcription_data(params):
-          del params
-          return tf.data.Dataset.from_tensors(sess.run(next_record))
-        input_fn = infer_util.labels_to_features_wrapper(transcription_data)
-
-        tf.logging.info('Running inference...')
-        checkpoint_path = None
-        if FLAGS.checkpoint_path:
-          checkpoint_path = os.path.expanduser(FLAGS.checkpoint_path)
-        prediction_list = list(
-            estimator.predict(
-                input_fn,
-                checkpoint_path=checkpoint_path,
-                yield_single_examples=False))
-        assert len(prediction_list) == 1
-
-        sequence_prediction = music_pb2.NoteSequence.FromString(
-            prediction_list[0]['sequence_predictions'][0])
-
-        midi_filename = filename + FLAGS.transcribed_file_suffix + '.midi'
-        midi_io.sequence_proto_to_midi_file(sequence_prediction, midi_filename)
 
+  checkpoint_path = None
+  if FLAGS.checkpoint_path:
+    checkpoint_path = os.path.expanduser(FLAGS.checkpoint_path)
+
+  # The engine restores the checkpoint once for all of the files, and reads
+  # the next files while the current one is transcribed.
+  with transcription_engine.TranscriptionEngine(
+      config, FLAGS.model_dir, hparams=hparams,
+      checkpoint_path=checkpoint_path, data_fn=data_fn,
+      load_audio_with_librosa=FLAGS.load_audio_with_librosa,
+      num_preprocessing_threads=FLAGS.num_preprocessing_threads) as engine:
+    if FLAGS.chunk_secs > 0:
+      transcriptions = _transcribe_streaming_to_midi(engine, argv[1:])
+    else:
+      transcriptions = engine.transcribe_to_midi(
+          argv[1:], FLAGS.transcribed_file_suffix)
+    for filename, midi_filename in transcriptions:
+      if midi_filename is None:
+        tf.logging.error('Could not transcribe %s.', filename)
+      else:
         tf.logging.info('Transcription written to %s.', midi_filename)
 
 
+def _transcribe_streaming_to_midi(engine, filenames):
+  """Transcribes files in windows, yielding the written MIDI filenames."""
+  for filename in filenames:
+    try:
+      sequence = streaming_transcription.notes_to_sequence(
+          engine.transcribe_streaming(
+              filename, chunk_secs=FLAGS.chunk_secs,
+              overlap_secs=FLAGS.chunk_overlap_secs))
+    except Exception as e:  # pylint:disable=broad-except
+      tf.logging.error('Failed to process %s: %s', filename, e)
+      yield filename, None
+      continue
+    midi_filename = filename + FLAGS.transcribed_file_suffix + '.midi'
+    midi_io.sequence_proto_to_midi_file(sequence, midi_filename)
+    yield filename, midi_filename
+
+
 def main(argv):
   run(argv, config_map=configs.CONFIG_MAP, data_fn=data.provide_batch)
 
@@ -0,0 +1,144 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Precompute the spectrograms of a dataset into a spectrogram cache.
+
+Usage:
+  onsets_frames_transcription_warm_spectrogram_cache \
+    --examples_path=/path/to/train.tfrecord* \
+    --spec_cache_dir=/path/to/spec_cache
+
+Then train or evaluate with `--hparams=spec_cache_dir=/path/to/spec_cache` and
+the same spectrogram hparams to read the spectrograms from the cache.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+
+from magenta.models.onsets_frames_transcription import configs
+from magenta.models.onsets_frames_transcription import data
+from magenta.models.onsets_frames_transcription import spectrogram_cache
+import tensorflow.compat.v1 as tf
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('config', 'onsets_frames',
+                           'Name of the config to use.')
+tf.app.flags.DEFINE_string(
+    'examples_path', None,
+    'Path to a TFRecord file of examples that have not been preprocessed. '
+    'May be a sharded filename or a glob pattern.')
+tf.app.flags.DEFINE_string('spec_cache_dir', None,
+                           'Local directory of the spectrogram cache.')
+tf.app.flags.DEFINE_integer(
+    'num_workers', multiprocessing.cpu_count(),
+    'Number of processes that compute spectrograms.')
+tf.app.flags.DEFINE_string(
+    'hparams', '',
+    'A comma-separated list of `name=value` hyperparameter values.')
+tf.app.flags.DEFINE_string(
+    'log', 'INFO',
+    'The threshold for what messages will be logged: '
+    'DEBUG, INFO, WARN, ERROR, or FATAL.')
+
+# The cache of each worker process, set by `_init_worker`.
+_worker_cache = None
+
+
+def _init_worker(cache_dir, hparams):
+  global _worker_cache
+  _worker_cache = spectrogram_cache.SpectrogramCache(cache_dir, hparams)
+
+
+def _warm_example(wav_data):
+  """Computes and caches a spectrogram. Returns whether it was cached."""
+  if _worker_cache.get(wav_data) is not None:
+    return True
+  spec = data.wav_to_spec(wav_data, _worker_cache.hparams)
+  _worker_cache.put(wav_data, spec)
+  return False
+
+
+def read_wav_data(examples_path):
+  """Yields the wav data of each example in TFRecord files."""
+  for pattern in data.generate_sharded_filenames(examples_path):
+    for filename in sorted(tf.gfile.Glob(pattern)):
+      for record in tf.python_io.tf_record_iterator(filename):
+        example = tf.train.Example.FromString(record)
+        yield example.features.feature['audio'].bytes_list.value[0]
+
+
+def warm_spectrogram_cache(examples_path, cache_dir, hparams, num_workers):
+  """Adds the spectrograms of all examples to a cache.
+
+  Args:
+    examples_path: Path to TFRecord files of examples that have not been
+        preprocessed.
+    cache_dir: Local directory of the spectrogram cache.
+    hparams: HParams object specifying hyperparameters.
+    num_workers: Number of processes that compute spectrograms.
+
+  Returns:
+    A tuple of the number of spectrograms computed and the number that were
+    already cached.
+  """
+  num_computed = num_cached = 0
+  pool = multiprocessing.Pool(
+      num_workers, initializer=_init_worker, initargs=(cache_dir, hparams))
+  try:
+    for was_cached in pool.imap_unordered(
+        _warm_example, read_wav_data(examples_path), chunksize=4):
+      if was_cached:
+        num_cached += 1
+      else:
+        num_computed += 1
+      if (num_computed + num_cached) % 100 == 0:
+        tf.logging.info('Processed %d examples.', num_computed + num_cached)
+  finally:
+    pool.terminate()
+    pool.join()
+  return num_computed, num_cached
+
+
+def main(argv):
+  del argv
+  tf.logging.set_verbosity(FLAGS.log)
+  if not FLAGS.examples_path:
+    raise ValueError('--examples_path is required.')
+  if not FLAGS.spec_cache_dir:
+    raise ValueError('--spec_cache_dir is required.')
+
+  hparams = configs.CONFIG_MAP[FLAGS.config].hparams
+  hparams.parse(FLAGS.hparams)
+  if hparams.spec_type not in ('cqt', 'mel'):
+    raise ValueError(
+        'Only cqt and mel spectrograms are cached, got spec_type %s.' %
+        hparams.spec_type)
+
+  num_computed, num_cached = warm_spectrogram_cache(
+      FLAGS.examples_path, FLAGS.spec_cache_dir, hparams, FLAGS.num_workers)
+  tf.logging.info('Computed %d spectrograms, %d were already cached.',
+                  num_computed, num_cached)
+
+
+def console_entry_point():
+  tf.disable_v2_behavior()
+  tf.app.run(main)
+
+
+if __name__ == '__main__':
+  console_entry_point()
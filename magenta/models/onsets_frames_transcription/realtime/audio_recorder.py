@@ -26,10 +26,16 @@ import time
 
 from absl import logging
 import numpy as np
-import pyaudio
 import scipy
 import six
 
+try:
+  pyaudio = importlib.import_module('pyaudio')
+except ModuleNotFoundError:
+  # Audio files can still be read and replayed without PyAudio, e.g. on
+  # headless machines.
+  pyaudio = None
+
 try:
   librosa = importlib.import_module('librosa')
   samplerate = None
@@ -75,7 +81,7 @@ class AudioRecorder(object):
   A frame in PortAudio is one audio sample across all channels, so one frame of
   16-bit stereo audio is four bytes of data as two 16-bit integers.
   """
-  pyaudio_format = pyaudio.paFloat32
+  pyaudio_format = pyaudio.paFloat32 if pyaudio else None
   numpy_format = np.float32
   num_channels = 1
 
@@ -94,6 +100,8 @@ class AudioRecorder(object):
                raw_audio_sample_rate_hz=48000,
                downsample_factor=3,
                device_index=None):
+    if pyaudio is None:
+      raise ModuleNotFoundError('PyAudio must be installed to record audio.')
     self._downsample_factor = downsample_factor
     self._raw_audio_sample_rate_hz = raw_audio_sample_rate_hz
     self.audio_sample_rate_hz = (
@@ -132,6 +140,8 @@ class AudioRecorder(object):
     logging.info('Stopped and closed audio stream.')
 
   def __del__(self):
+    if not hasattr(self, '_audio'):
+      return
     self._audio.terminate()
     logging.info('Terminated PyAudio/PortAudio.')
 
@@ -0,0 +1,105 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Replays recorded audio as if it were captured from a microphone.
+
+`AudioReplay` has the same interface as `audio_recorder.AudioRecorder`, so it
+can drive the realtime transcriber from a WAV file instead of PyAudio, e.g. to
+measure latency on machines without an audio device.
+"""
+
+import time
+
+from magenta.models.onsets_frames_transcription.realtime import audio_recorder
+import numpy as np
+
+
+class AudioReplay(object):
+  """Plays back audio samples at real-time or accelerated rate.
+
+  Like `AudioRecorder`, the class acts as a context manager: the replay clock
+  starts when entering the context. `get_audio` blocks until the requested
+  samples would have been recorded, then returns them. Once all samples have
+  been returned, `is_active` becomes False.
+  """
+
+  num_channels = 1
+
+  def __init__(self, samples, sample_rate_hz, speed=1.0):
+    """Creates an AudioReplay.
+
+    Args:
+      samples: A 1-D array of mono samples.
+      sample_rate_hz: Sample rate of `samples`.
+      speed: Playback rate relative to real time. 0 replays the samples as
+          fast as they are requested.
+    """
+    self._samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    self.audio_sample_rate_hz = sample_rate_hz
+    self._speed = speed
+    self._position = 0
+    self._start_time = None
+
+  @classmethod
+  def from_wav_file(cls, filename, sample_rate_hz, speed=1.0):
+    """Creates an AudioReplay of a WAV file, resampled to `sample_rate_hz`."""
+    with open(filename, 'rb') as f:
+      samples = audio_recorder.wav_data_to_samples(f.read(), sample_rate_hz)
+    return cls(samples, sample_rate_hz, speed=speed)
+
+  def __enter__(self):
+    self._start_time = time.time()
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    pass
+
+  @property
+  def is_active(self):
+    return self._position < len(self._samples)
+
+  @property
+  def duration_seconds(self):
+    return len(self._samples) / self.audio_sample_rate_hz
+
+  def _time_at(self, position):
+    """Returns the wall time at which the sample at `position` is recorded."""
+    if not self._speed:
+      return self._start_time
+    return self._start_time + (
+        position / (self.audio_sample_rate_hz * self._speed))
+
+  def get_audio(self, num_audio_frames):
+    """Waits for the next num_audio_frames samples and returns them.
+
+    Fewer samples are returned at the end of the replay.
+
+    Args:
+      num_audio_frames: Number of samples to return.
+
+    Returns:
+      A tuple of (audio, first_timestamp, last_timestamp), where audio has
+      shape [num_samples, 1].
+    """
+    if self._start_time is None:
+      raise ValueError('AudioReplay must be entered before reading audio.')
+    start = self._position
+    end = min(start + num_audio_frames, len(self._samples))
+    delay = self._time_at(end) - time.time()
+    if delay > 0:
+      time.sleep(delay)
+    self._position = end
+    audio = self._samples[start:end].reshape(-1, self.num_channels)
+    return audio, self._time_at(start), self._time_at(end)
@@ -0,0 +1,55 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for audio_replay."""
+
+import time
+
+from absl.testing import absltest
+from magenta.models.onsets_frames_transcription.realtime import audio_replay
+import numpy as np
+
+
+class AudioReplayTest(absltest.TestCase):
+
+  def testGetAudio(self):
+    replay = audio_replay.AudioReplay(np.arange(10), 100, speed=0)
+    with self.assertRaises(ValueError):
+      replay.get_audio(4)
+
+    chunks = []
+    with replay:
+      while replay.is_active:
+        chunks.append(replay.get_audio(4)[0])
+    self.assertEqual([(4, 1), (4, 1), (2, 1)], [c.shape for c in chunks])
+    np.testing.assert_array_equal(np.arange(10),
+                                  np.concatenate(chunks)[:, 0])
+    self.assertAlmostEqual(0.1, replay.duration_seconds)
+
+  def testRealTime(self):
+    # 0.2 seconds of audio replayed at twice real time.
+    replay = audio_replay.AudioReplay(np.zeros(200), 1000, speed=2.0)
+    with replay:
+      start_time = time.time()
+      _, first_timestamp, last_timestamp = replay.get_audio(100)
+      self.assertGreaterEqual(time.time() - start_time, 0.045)
+      self.assertAlmostEqual(0.05, last_timestamp - first_timestamp)
+      replay.get_audio(100)
+      self.assertGreaterEqual(time.time() - start_time, 0.095)
+      self.assertFalse(replay.is_active)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,161 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Ring buffer of audio samples in shared memory.
+
+A single process writes incoming audio into the buffer, and worker processes
+read windows of it by their absolute sample offset. Only offsets travel
+through queues, so audio is never pickled. Instances can be passed to worker
+processes, which attach to the same shared memory block.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# The block starts with the total number of samples ever written, followed by
+# the samples themselves.
+_HEADER_DTYPE = np.int64
+_HEADER_SIZE = np.dtype(_HEADER_DTYPE).itemsize
+
+
+class AudioRingBuffer(object):
+  """Fixed-capacity ring buffer of mono audio samples in shared memory.
+
+  Samples are addressed by absolute offset: the number of samples written
+  before them. Once more than `capacity` further samples have been written, a
+  sample is overwritten and can no longer be read.
+
+  Only one process may write to the buffer. Any number of processes may read.
+  """
+
+  def __init__(self, capacity, dtype=np.float32, name=None):
+    """Creates a ring buffer, or attaches to an existing one.
+
+    Args:
+      capacity: Number of samples the buffer holds.
+      dtype: Numpy dtype of the samples.
+      name: Name of an existing shared memory block to attach to. If None, a
+          new block is created, and this instance owns it.
+    """
+    self._capacity = capacity
+    self._dtype = np.dtype(dtype)
+    self._owner = name is None
+    size = _HEADER_SIZE + capacity * self._dtype.itemsize
+    if self._owner:
+      self._shm = shared_memory.SharedMemory(create=True, size=size)
+    else:
+      try:
+        # Attaching processes must not unlink the block when they exit.
+        self._shm = shared_memory.SharedMemory(name=name, track=False)
+      except TypeError:
+        # Python < 3.13 has no `track` argument.
+        self._shm = shared_memory.SharedMemory(name=name)
+    self._header = np.ndarray((1,), dtype=_HEADER_DTYPE, buffer=self._shm.buf)
+    self._samples = np.ndarray((capacity,), dtype=self._dtype,
+                               buffer=self._shm.buf, offset=_HEADER_SIZE)
+    if self._owner:
+      self._header[0] = 0
+
+  def __getstate__(self):
+    return {'capacity': self._capacity, 'dtype': self._dtype.str,
+            'name': self._shm.name}
+
+  def __setstate__(self, state):
+    self.__init__(state['capacity'], state['dtype'], name=state['name'])
+
+  @property
+  def name(self):
+    return self._shm.name
+
+  @property
+  def capacity(self):
+    return self._capacity
+
+  @property
+  def write_offset(self):
+    """Total number of samples written, the offset of the next sample."""
+    return int(self._header[0])
+
+  def write(self, samples):
+    """Appends samples to the buffer, overwriting the oldest ones.
+
+    Args:
+      samples: A 1-D array of samples.
+
+    Returns:
+      The offset of the first written sample.
+    """
+    samples = np.asarray(samples, dtype=self._dtype).reshape(-1)
+    offset = self.write_offset
+    if len(samples) > self._capacity:
+      # Only the most recent samples fit.
+      skipped = len(samples) - self._capacity
+      samples = samples[skipped:]
+      offset += skipped
+    start = offset % self._capacity
+    first = min(len(samples), self._capacity - start)
+    self._samples[start:start + first] = samples[:first]
+    self._samples[:len(samples) - first] = samples[first:]
+    # Publish the samples only after they have been copied.
+    self._header[0] = offset + len(samples)
+    return offset
+
+  def is_available(self, offset):
+    """Returns whether the sample at `offset` has not been overwritten."""
+    return offset >= self.write_offset - self._capacity
+
+  def read(self, offset, length):
+    """Returns `length` samples starting at `offset`.
+
+    When the window does not wrap around the end of the buffer, the result is
+    a view of the shared memory rather than a copy. The writer may overwrite
+    it at any time, so callers should check `is_available(offset)` after they
+    are done with the samples.
+
+    Args:
+      offset: Absolute offset of the first sample.
+      length: Number of samples to read.
+
+    Returns:
+      A 1-D array of samples, or None if part of the window has already been
+      overwritten.
+
+    Raises:
+      ValueError: If part of the window has not been written yet, or the
+          window is longer than the buffer.
+    """
+    if length > self._capacity:
+      raise ValueError('Cannot read %d samples from a buffer of %d.' %
+                       (length, self._capacity))
+    if offset + length > self.write_offset:
+      raise ValueError('Samples [%d, %d) have not been written yet.' %
+                       (offset, offset + length))
+    if not self.is_available(offset):
+      return None
+    start = offset % self._capacity
+    if start + length <= self._capacity:
+      return self._samples[start:start + length]
+    return np.concatenate(
+        (self._samples[start:], self._samples[:start + length - self._capacity]))
+
+  def close(self):
+    """Detaches from the shared memory, and frees it if this is the owner."""
+    # The numpy views must be released before the memory can be closed.
+    self._header = None
+    self._samples = None
+    self._shm.close()
+    if self._owner:
+      self._shm.unlink()
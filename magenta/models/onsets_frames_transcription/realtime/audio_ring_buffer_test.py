@@ -0,0 +1,80 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for audio_ring_buffer."""
+
+import multiprocessing
+import pickle
+
+from absl.testing import absltest
+from magenta.models.onsets_frames_transcription.realtime import audio_ring_buffer
+import numpy as np
+
+
+def _sum_window(ring_buffer, offset, length, result_queue):
+  result_queue.put(float(np.sum(ring_buffer.read(offset, length))))
+
+
+class AudioRingBufferTest(absltest.TestCase):
+
+  def setUp(self):
+    super(AudioRingBufferTest, self).setUp()
+    self.ring_buffer = audio_ring_buffer.AudioRingBuffer(8)
+    self.addCleanup(self.ring_buffer.close)
+
+  def testWriteAndRead(self):
+    self.assertEqual(0, self.ring_buffer.write(np.arange(5)))
+    self.assertEqual(5, self.ring_buffer.write(np.arange(5, 10)))
+    self.assertEqual(10, self.ring_buffer.write_offset)
+
+    np.testing.assert_array_equal([2, 3, 4], self.ring_buffer.read(2, 3))
+    # The window wraps around the end of the buffer.
+    np.testing.assert_array_equal([6, 7, 8, 9], self.ring_buffer.read(6, 4))
+    # Samples 0 and 1 have been overwritten.
+    self.assertIsNone(self.ring_buffer.read(1, 3))
+    self.assertFalse(self.ring_buffer.is_available(1))
+    self.assertTrue(self.ring_buffer.is_available(2))
+
+    with self.assertRaises(ValueError):
+      self.ring_buffer.read(8, 3)
+    with self.assertRaises(ValueError):
+      self.ring_buffer.read(0, 9)
+
+  def testWriteMoreThanCapacity(self):
+    self.assertEqual(4, self.ring_buffer.write(np.arange(12)))
+    self.assertEqual(12, self.ring_buffer.write_offset)
+    np.testing.assert_array_equal(np.arange(4, 12),
+                                  self.ring_buffer.read(4, 8))
+
+  def testReadFromOtherProcess(self):
+    self.ring_buffer.write(np.arange(6))
+    # Pickling the buffer attaches to the same shared memory.
+    attached = pickle.loads(pickle.dumps(self.ring_buffer))
+    self.ring_buffer.write([10, 11])
+    np.testing.assert_array_equal([5, 10, 11], attached.read(5, 3))
+    attached.close()
+
+    # A spawned process attaches by pickling rather than inheriting memory.
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(
+        target=_sum_window, args=(self.ring_buffer, 3, 4, result_queue))
+    process.start()
+    self.assertEqual(3 + 4 + 5 + 10, result_queue.get(timeout=60))
+    process.join()
+
+
+if __name__ == '__main__':
+  absltest.main()
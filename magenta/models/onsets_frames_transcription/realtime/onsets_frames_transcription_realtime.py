@@ -17,14 +17,18 @@
 
 import multiprocessing
 import threading
+import time
 
 from absl import app
 from absl import flags
+from absl import logging
 import attr
 from colorama import Fore
 from colorama import Style
 from magenta.models.onsets_frames_transcription.realtime import audio_recorder
+from magenta.models.onsets_frames_transcription.realtime import audio_ring_buffer
 from magenta.models.onsets_frames_transcription.realtime import tflite_model
+from magenta.models.onsets_frames_transcription.realtime import tflite_worker
 import numpy as np
 
 flags.DEFINE_string('model_path', 'onsets_frames_wavinput.tflite',
@@ -39,35 +43,29 @@ flags.DEFINE_integer(
     'Sample Rate. The model expects 16000. However, some microphones do not '
     'support sampling at this rate. In that case use --sample_rate_hz 48000 and'
     'the code will automatically downsample to 16000')
+flags.DEFINE_integer('num_workers', 4, 'Number of TFLite worker processes.')
+flags.DEFINE_integer(
+    'max_batch_size', 4,
+    'Maximum number of pending audio windows a worker transcribes per wakeup.')
+flags.DEFINE_float(
+    'ring_buffer_seconds', 10.0,
+    'Seconds of audio kept in the shared memory ring buffer. Windows that are '
+    'not transcribed before they are overwritten are dropped.')
+flags.DEFINE_integer(
+    'latency_report_interval', 100,
+    'Log latency percentiles every this many windows. 0 to disable.')
 FLAGS = flags.FLAGS
 
+TfLiteWorker = tflite_worker.TfLiteWorker
 
-class TfLiteWorker(multiprocessing.Process):
-  """Process for executing TFLite inference."""
-
-  def __init__(self, model_path, task_queue, result_queue):
-    multiprocessing.Process.__init__(self)
-    self._model_path = model_path
-    self._task_queue = task_queue
-    self._result_queue = result_queue
-    self._model = None
+# Number of model timesteps shared by consecutive windows.
+OVERLAP_TIMESTEPS = 4
 
-  def setup(self):
-    if self._model is not None:
-      return
 
-    self._model = tflite_model.Model(model_path=self._model_path)
-
-  def run(self):
-    self.setup()
-    while True:
-      task = self._task_queue.get()
-      if task is None:
-        self._task_queue.task_done()
-        return
-      task(self._model)
-      self._task_queue.task_done()
-      self._result_queue.put(task)
+def window_overlap(model):
+  """Returns the number of samples shared by consecutive windows."""
+  return (model.get_hop_size() * OVERLAP_TIMESTEPS +
+          model.get_window_length())
 
 
 @attr.s
@@ -77,47 +75,68 @@ class AudioChunk(object):
 
 
 class AudioQueue(object):
-  """Audio queue."""
+  """Writes recorded audio to a ring buffer and emits overlapping windows."""
 
   def __init__(self, callback, audio_device_index, sample_rate_hz,
-               model_sample_rate, frame_length, overlap):
-    # Initialize recorder.
-    downsample_factor = sample_rate_hz / model_sample_rate
-    self._recorder = audio_recorder.AudioRecorder(
-        sample_rate_hz,
-        downsample_factor=downsample_factor,
-        device_index=audio_device_index)
+               model_sample_rate, frame_length, overlap, ring_buffer,
+               audio_source=None, gain=1.0):
+    """Creates an AudioQueue.
+
+    Args:
+      callback: Called with a `tflite_worker.WindowTask` for each window.
+      audio_device_index: Index of the microphone to record from.
+      sample_rate_hz: Sample rate to record at.
+      model_sample_rate: Sample rate expected by the model.
+      frame_length: Number of samples in each window.
+      overlap: Number of samples shared by consecutive windows.
+      ring_buffer: `audio_ring_buffer.AudioRingBuffer` to write audio to.
+      audio_source: Optional source of audio with the interface of
+          `audio_recorder.AudioRecorder`, such as `audio_replay.AudioReplay`.
+          If None, audio is recorded from the microphone.
+      gain: Factor applied to the audio before it is written.
+    """
+    if audio_source is None:
+      # Initialize recorder.
+      downsample_factor = sample_rate_hz / model_sample_rate
+      audio_source = audio_recorder.AudioRecorder(
+          sample_rate_hz,
+          downsample_factor=downsample_factor,
+          device_index=audio_device_index)
+    self._recorder = audio_source
 
     self._frame_length = frame_length
     self._overlap = overlap
+    self._ring_buffer = ring_buffer
+    self._gain = gain
 
-    self._audio_buffer = np.array([], dtype=np.int16).reshape(0, 1)
+    self._next_window_offset = ring_buffer.write_offset
     self._chunk_counter = 0
     self._callback = callback
 
+  @property
+  def num_windows(self):
+    """Number of windows emitted so far."""
+    return self._chunk_counter
+
+  def add_samples(self, samples):
+    """Writes samples to the ring buffer and emits each completed window."""
+    self._ring_buffer.write(samples)
+    now = time.time()
+    while (self._next_window_offset + self._frame_length <=
+           self._ring_buffer.write_offset):
+      self._callback(
+          tflite_worker.WindowTask(self._chunk_counter,
+                                   self._next_window_offset, now))
+      self._chunk_counter += 1
+      self._next_window_offset += self._frame_length - self._overlap
+
   def start(self):
-    """Start processing the queue."""
+    """Start processing the queue, until the audio source is exhausted."""
     with self._recorder:
-      timed_out = False
-      while not timed_out:
-        assert self._recorder.is_active
+      while self._recorder.is_active:
         new_audio = self._recorder.get_audio(self._frame_length -
-                                             len(self._audio_buffer))
-        audio_samples = np.concatenate(
-            (self._audio_buffer, new_audio[0] * FLAGS.mic_amplify))
-
-        # Extract overlapping
-        first_unused_byte = 0
-        for pos in range(0, audio_samples.shape[0] - self._frame_length,
-                         self._frame_length - self._overlap):
-          self._callback(
-              AudioChunk(self._chunk_counter,
-                         audio_samples[pos:pos + self._frame_length]))
-          self._chunk_counter += 1
-          first_unused_byte = pos + self._frame_length
-
-        # Keep the remaining bytes for next time
-        self._audio_buffer = audio_samples[first_unused_byte:]
+                                             self._overlap)
+        self.add_samples(new_audio[0][:, 0] * self._gain)
 
 
 # This actually executes in each worker thread!
@@ -128,6 +147,10 @@ class OnsetsTask(object):
     self.audio_chunk = audio_chunk
     self.result = None
 
+  @property
+  def serial(self):
+    return self.audio_chunk.serial
+
   def __call__(self, model):
     samples = self.audio_chunk.samples[:, 0]
     self.result = model.infer(samples)
@@ -157,14 +180,24 @@ def result_collector(result_queue):
     ][n % 12]  #+ str(n//12)
 
   print('Listening to results..')
+  latency_stats = tflite_worker.LatencyStats()
   # TODO(mtyka) Ensure serial stitching of results (no guarantee that
   # the blocks come in in order but they are all timestamped)
   while True:
     result = result_queue.get()
-    serial = result.audio_chunk.serial
+    if isinstance(result, tflite_worker.WindowResult):
+      latency_stats.add(result)
+      num_windows = len(latency_stats) + latency_stats.num_dropped
+      if (FLAGS.latency_report_interval and
+          num_windows % FLAGS.latency_report_interval == 0):
+        logging.info(latency_stats.summary())
+      if result.result is None:
+        logging.warning('Dropped audio window %d.', result.serial)
+        continue
+    serial = result.serial
     result_roll = result.result
     if serial > 0:
-      result_roll = result_roll[4:]
+      result_roll = result_roll[OVERLAP_TIMESTEPS:]
     for notes in result_roll:
       for i in range(6, len(notes) - 6):
         note = notes[i]
@@ -183,9 +216,7 @@ def main(argv):
   results_thread.start()
 
   model = tflite_model.Model(model_path=FLAGS.model_path)
-  overlap_timesteps = 4
-  overlap_wav = model.get_hop_size(
-  ) * overlap_timesteps + model.get_window_length()
+  overlap_wav = window_overlap(model)
 
   if FLAGS.wav_file:
     wav_data = open(FLAGS.wav_file, 'rb').read()
@@ -207,25 +238,36 @@ def main(argv):
       results.put(task)
   else:
     tasks = multiprocessing.JoinableQueue()
+    ring_buffer = audio_ring_buffer.AudioRingBuffer(
+        int(FLAGS.ring_buffer_seconds * model.get_sample_rate()))
 
     ## Make and start the workers
-    num_workers = 4
     workers = [
-        TfLiteWorker(FLAGS.model_path, tasks, results)
-        for i in range(num_workers)
+        TfLiteWorker(FLAGS.model_path, tasks, results, ring_buffer,
+                     max_batch_size=FLAGS.max_batch_size, worker_id=i)
+        for i in range(FLAGS.num_workers)
     ]
     for w in workers:
       w.start()
 
     audio_feeder = AudioQueue(
-        callback=lambda audio_chunk: tasks.put(OnsetsTask(audio_chunk)),
+        callback=tasks.put,
         audio_device_index=FLAGS.mic if FLAGS.mic is None else int(FLAGS.mic),
         sample_rate_hz=int(FLAGS.sample_rate_hz),
         model_sample_rate=model.get_sample_rate(),
         frame_length=model.get_input_wav_length(),
-        overlap=overlap_wav)
-
-    audio_feeder.start()
+        overlap=overlap_wav,
+        ring_buffer=ring_buffer,
+        gain=FLAGS.mic_amplify)
+
+    try:
+      audio_feeder.start()
+    finally:
+      for _ in workers:
+        tasks.put(None)
+      for w in workers:
+        w.join()
+      ring_buffer.close()
 
 
 def console_entry_point():
@@ -0,0 +1,148 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Benchmarks the realtime transcription pipeline by replaying a WAV file.
+
+The file is fed through the same `AudioQueue`, shared memory ring buffer and
+`TfLiteWorker` processes as microphone input, at real-time or accelerated
+rate, so no audio device is needed. Reports window latency percentiles,
+dropped windows and the utilization of each worker.
+"""
+
+import collections
+import multiprocessing
+import time
+
+from absl import app
+from absl import flags
+from absl import logging
+from magenta.models.onsets_frames_transcription.realtime import audio_replay
+from magenta.models.onsets_frames_transcription.realtime import audio_ring_buffer
+from magenta.models.onsets_frames_transcription.realtime import onsets_frames_transcription_realtime as realtime
+from magenta.models.onsets_frames_transcription.realtime import tflite_model
+from magenta.models.onsets_frames_transcription.realtime import tflite_worker
+
+flags.DEFINE_string('replay_wav_file', None, 'WAV file to replay.')
+flags.DEFINE_float(
+    'replay_speed', 1.0,
+    'Replay rate relative to real time. 0 replays the file as fast as '
+    'possible.')
+FLAGS = flags.FLAGS
+
+# Outcome of a benchmark run. `latency_stats` is a `tflite_worker.LatencyStats`
+# of all windows, `utilization` maps each worker id to the fraction of the
+# run it spent in inference, `audio_secs` is the duration of the replayed
+# audio and `wall_secs` the time from the start of the replay until the last
+# window was transcribed.
+BenchmarkResult = collections.namedtuple(
+    'BenchmarkResult',
+    ['latency_stats', 'utilization', 'num_windows', 'audio_secs',
+     'wall_secs'])
+
+
+def run_benchmark(model, model_path, audio_source, num_workers=4,
+                  max_batch_size=4, ring_buffer_seconds=10.0,
+                  worker_class=tflite_worker.TfLiteWorker):
+  """Transcribes replayed audio with a pool of workers and measures latency.
+
+  Args:
+    model: A `tflite_model.Model`, used for the window geometry.
+    model_path: File path of the TFLite model loaded by each worker.
+    audio_source: An `audio_replay.AudioReplay` at the model sample rate.
+    num_workers: Number of worker processes.
+    max_batch_size: Maximum number of windows a worker transcribes at once.
+    ring_buffer_seconds: Seconds of audio kept in the ring buffer.
+    worker_class: Class of the worker processes.
+
+  Returns:
+    A `BenchmarkResult`.
+  """
+  tasks = multiprocessing.JoinableQueue()
+  results = multiprocessing.Queue()
+  ring_buffer = audio_ring_buffer.AudioRingBuffer(
+      int(ring_buffer_seconds * model.get_sample_rate()))
+  ready_events = [multiprocessing.Event() for _ in range(num_workers)]
+  workers = [
+      worker_class(model_path, tasks, results, ring_buffer,
+                   max_batch_size=max_batch_size, worker_id=i,
+                   ready_event=ready_events[i])
+      for i in range(num_workers)
+  ]
+  try:
+    for w in workers:
+      w.start()
+    # Model loading is not part of the measurement.
+    for event in ready_events:
+      event.wait()
+
+    audio_queue = realtime.AudioQueue(
+        callback=tasks.put,
+        audio_device_index=None,
+        sample_rate_hz=model.get_sample_rate(),
+        model_sample_rate=model.get_sample_rate(),
+        frame_length=model.get_input_wav_length(),
+        overlap=realtime.window_overlap(model),
+        ring_buffer=ring_buffer,
+        audio_source=audio_source)
+    latency_stats = tflite_worker.LatencyStats()
+    start_time = time.time()
+    audio_queue.start()
+    for _ in range(audio_queue.num_windows):
+      latency_stats.add(results.get())
+    wall_secs = time.time() - start_time
+  finally:
+    for _ in workers:
+      tasks.put(None)
+    for w in workers:
+      w.join()
+    ring_buffer.close()
+
+  return BenchmarkResult(
+      latency_stats=latency_stats,
+      utilization=latency_stats.utilization(wall_secs, range(num_workers)),
+      num_windows=audio_queue.num_windows,
+      audio_secs=audio_source.duration_seconds,
+      wall_secs=wall_secs)
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  if not FLAGS.replay_wav_file:
+    raise app.UsageError('--replay_wav_file is required.')
+
+  model = tflite_model.Model(model_path=FLAGS.model_path)
+  audio_source = audio_replay.AudioReplay.from_wav_file(
+      FLAGS.replay_wav_file, model.get_sample_rate(), speed=FLAGS.replay_speed)
+  result = run_benchmark(
+      model, FLAGS.model_path, audio_source,
+      num_workers=FLAGS.num_workers,
+      max_batch_size=FLAGS.max_batch_size,
+      ring_buffer_seconds=FLAGS.ring_buffer_seconds)
+
+  logging.info('Replayed %.1fs of audio in %.1fs (%d windows).',
+               result.audio_secs, result.wall_secs, result.num_windows)
+  logging.info(result.latency_stats.summary())
+  for worker_id, utilization in sorted(result.utilization.items()):
+    logging.info('Worker %d utilization: %.1f%%', worker_id,
+                 100 * utilization)
+
+
+def console_entry_point():
+  app.run(main)
+
+
+if __name__ == '__main__':
+  console_entry_point()
@@ -0,0 +1,76 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Tests for onsets_frames_transcription_realtime_benchmark."""
+
+from absl.testing import absltest
+from magenta.models.onsets_frames_transcription.realtime import audio_replay
+from magenta.models.onsets_frames_transcription.realtime import onsets_frames_transcription_realtime_benchmark as benchmark
+from magenta.models.onsets_frames_transcription.realtime import tflite_worker
+import numpy as np
+
+
+class FakeModel(object):
+  """Model with the interface of `tflite_model.Model` that sums its input."""
+
+  def get_sample_rate(self):
+    return 1000
+
+  def get_window_length(self):
+    return 20
+
+  def get_hop_size(self):
+    return 5
+
+  def get_input_wav_length(self):
+    return 100
+
+  def get_timestep(self):
+    return 5
+
+  def infer(self, samples):
+    return np.sum(samples)
+
+
+class FakeWorker(tflite_worker.TfLiteWorker):
+
+  def setup(self):
+    self._model = FakeModel()
+
+
+class BenchmarkTest(absltest.TestCase):
+
+  def testRunBenchmark(self):
+    model = FakeModel()
+    samples = np.ones(1000)
+    result = benchmark.run_benchmark(
+        model, None, audio_replay.AudioReplay(samples, 1000, speed=0),
+        num_workers=2, max_batch_size=2, ring_buffer_seconds=1.0,
+        worker_class=FakeWorker)
+
+    # Windows of 100 samples overlapping by 40 samples.
+    self.assertEqual(16, result.num_windows)
+    self.assertEqual(16, len(result.latency_stats) +
+                     result.latency_stats.num_dropped)
+    self.assertEqual(0, result.latency_stats.num_dropped)
+    self.assertEqual([0, 1], sorted(result.utilization))
+    for utilization in result.utilization.values():
+      self.assertBetween(utilization, 0.0, 1.0)
+    self.assertAlmostEqual(1.0, result.audio_secs)
+    self.assertGreater(result.wall_secs, 0.0)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,192 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Lint as: python3
+"""Worker processes that run TFLite inference on windows of a ring buffer."""
+
+import collections
+import multiprocessing
+import queue
+import time
+
+from magenta.models.onsets_frames_transcription.realtime import tflite_model
+import numpy as np
+
+# A window of audio to transcribe: `serial` numbers windows in the order they
+# were recorded, `offset` is the absolute offset of the window's first sample
+# in the ring buffer, and `enqueue_time` is when the window became available.
+WindowTask = collections.namedtuple('WindowTask',
+                                    ['serial', 'offset', 'enqueue_time'])
+
+# Latency of a single window, in seconds: time spent waiting in the task queue,
+# time spent in inference for the micro-batch containing the window, and the
+# total time from `enqueue_time` until the result was ready. `batch_size` is
+# the number of windows in the micro-batch.
+ChunkLatency = collections.namedtuple(
+    'ChunkLatency', ['queue_secs', 'inference_secs', 'total_secs',
+                     'batch_size'])
+
+# The transcription of a window. `result` is None if the window was
+# overwritten in the ring buffer before it could be transcribed.
+WindowResult = collections.namedtuple(
+    'WindowResult', ['serial', 'result', 'timestep', 'latency', 'worker_id'])
+
+
+class LatencyStats(object):
+  """Accumulates `ChunkLatency` measurements."""
+
+  def __init__(self):
+    self._latencies = []
+    self._busy_secs = collections.defaultdict(float)
+    self.num_dropped = 0
+
+  def add(self, window_result):
+    """Records the latency of a `WindowResult`, or that it was dropped."""
+    latency = window_result.latency
+    # Each window of a micro-batch accounts for its share of the inference.
+    self._busy_secs[window_result.worker_id] += (
+        latency.inference_secs / latency.batch_size)
+    if window_result.result is None:
+      self.num_dropped += 1
+    else:
+      self._latencies.append(window_result.latency)
+
+  def __len__(self):
+    return len(self._latencies)
+
+  def percentiles(self, field='total_secs', percents=(50, 90, 99)):
+    """Returns a dict mapping each percent to that percentile of `field`."""
+    if not self._latencies:
+      return {}
+    values = np.array([getattr(latency, field) for latency in self._latencies])
+    return dict(zip(percents, np.percentile(values, percents)))
+
+  def mean_batch_size(self):
+    if not self._latencies:
+      return 0.0
+    return float(np.mean([latency.batch_size for latency in self._latencies]))
+
+  def utilization(self, wall_secs, worker_ids=()):
+    """Returns the fraction of `wall_secs` each worker spent in inference.
+
+    Args:
+      wall_secs: Duration of the measurement, in seconds.
+      worker_ids: Ids of workers to include even if they produced no results.
+
+    Returns:
+      A dict mapping worker id to its utilization.
+    """
+    utilization = {worker_id: 0.0 for worker_id in worker_ids}
+    for worker_id, busy_secs in self._busy_secs.items():
+      utilization[worker_id] = busy_secs / wall_secs if wall_secs else 0.0
+    return utilization
+
+  def summary(self):
+    """Returns a one-line summary of the latencies in milliseconds."""
+    total = self.percentiles('total_secs')
+    inference = self.percentiles('inference_secs')
+    return (
+        'chunks=%d dropped=%d latency p50=%.1fms p90=%.1fms p99=%.1fms '
+        'inference p50=%.1fms mean_batch=%.2f' % (
+            len(self), self.num_dropped, 1000 * total.get(50, 0.0),
+            1000 * total.get(90, 0.0), 1000 * total.get(99, 0.0),
+            1000 * inference.get(50, 0.0), self.mean_batch_size()))
+
+
+class TfLiteWorker(multiprocessing.Process):
+  """Process for executing TFLite inference on windows of a ring buffer.
+
+  The worker takes `WindowTask`s from `task_queue`. When several tasks are
+  pending it takes up to `max_batch_size` of them at once, reads their windows
+  directly from the shared ring buffer and puts a `WindowResult` for each on
+  `result_queue`. A None task stops the worker.
+
+  If `ready_event` is given, it is set once the model has been loaded.
+  """
+
+  def __init__(self, model_path, task_queue, result_queue, ring_buffer,
+               max_batch_size=1, worker_id=0, ready_event=None):
+    multiprocessing.Process.__init__(self)
+    self._model_path = model_path
+    self._task_queue = task_queue
+    self._result_queue = result_queue
+    self._ring_buffer = ring_buffer
+    self._max_batch_size = max_batch_size
+    self._worker_id = worker_id
+    self._ready_event = ready_event
+    self._model = None
+
+  def setup(self):
+    if self._model is not None:
+      return
+
+    self._model = tflite_model.Model(model_path=self._model_path)
+
+  def _get_tasks(self):
+    """Blocks for a task, then takes any others pending up to the batch size.
+
+    Returns:
+      A tuple of the list of tasks and whether a stop task was received.
+    """
+    tasks = [self._task_queue.get()]
+    while tasks[-1] is not None and len(tasks) < self._max_batch_size:
+      try:
+        tasks.append(self._task_queue.get_nowait())
+      except queue.Empty:
+        break
+    if tasks[-1] is None:
+      return tasks[:-1], True
+    return tasks, False
+
+  def process_tasks(self, tasks):
+    """Transcribes the windows of `tasks` and returns their `WindowResult`s."""
+    window_length = self._model.get_input_wav_length()
+    start_time = time.time()
+    outputs = []
+    for task in tasks:
+      samples = self._ring_buffer.read(task.offset, window_length)
+      output = None
+      if samples is not None:
+        output = self._model.infer(samples)
+        if not self._ring_buffer.is_available(task.offset):
+          # The writer overwrote the window while it was being read.
+          output = None
+      outputs.append(output)
+    end_time = time.time()
+
+    timestep = self._model.get_timestep()
+    results = []
+    for task, output in zip(tasks, outputs):
+      latency = ChunkLatency(
+          queue_secs=start_time - task.enqueue_time,
+          inference_secs=end_time - start_time,
+          total_secs=end_time - task.enqueue_time,
+          batch_size=len(tasks))
+      results.append(
+          WindowResult(task.serial, output, timestep, latency,
+                       self._worker_id))
+    return results
+
+  def run(self):
+    self.setup()
+    if self._ready_event is not None:
+      self._ready_event.set()
+    stop = False
+    while not stop:
+      tasks, stop = self._get_tasks()
+      if tasks:
+        for result in self.process_tasks(tasks):
+          self._result_queue.put(result)
+      for _ in range(len(tasks) + stop):
+        self._task_queue.task_done()
@@ -0,0 +1,170 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of precomputed spectrograms.
+
+Spectrograms are stored as float16 `.npy` files, keyed by a hash of the wav
+data and of the hyperparameters that determine the spectrogram, and are
+memory-mapped when read. Spectrograms with values beyond the float16 range,
+such as mel spectrograms without log amplitude, are stored as float32.
+
+Set the `spec_cache_dir` hyperparameter to a local directory to have
+`data.provide_batch` read spectrograms from the cache and add the ones it
+computes. The cache can be filled ahead of training with
+`onsets_frames_transcription_warm_spectrogram_cache`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# Hyperparameters that affect the output of `data.wav_to_spec`.
+SPEC_HPARAM_NAMES = (
+    'sample_rate',
+    'spec_type',
+    'spec_mel_htk',
+    'spec_log_amplitude',
+    'spec_hop_length',
+    'spec_n_bins',
+    'spec_fmin',
+    'cqt_bins_per_octave',
+)
+
+_CACHE_FILE_EXTENSION = '.npy'
+
+_FLOAT16_MAX = np.finfo(np.float16).max
+
+
+def spectrogram_key(wav_data, hparams):
+  """Returns the cache key of the spectrogram of `wav_data`.
+
+  Args:
+    wav_data: The contents of a wav file.
+    hparams: HParams object specifying hyperparameters.
+
+  Returns:
+    A hex digest of the wav data and the spectrogram hyperparameters.
+  """
+  hasher = hashlib.sha1()
+  for name in SPEC_HPARAM_NAMES:
+    hasher.update(('%s=%r;' % (name, getattr(hparams, name))).encode('utf-8'))
+  hasher.update(wav_data)
+  return hasher.hexdigest()
+
+
+def _storage_dtype(spec):
+  """Returns float16, or float32 if `spec` has values beyond its range."""
+  if spec.size and np.nanmax(np.abs(spec)) > _FLOAT16_MAX:
+    return np.float32
+  return np.float16
+
+
+class SpectrogramCache(object):
+  """A directory of spectrograms keyed by wav data and hparams.
+
+  Entries are written atomically, so several processes may read and fill the
+  same cache concurrently.
+  """
+
+  def __init__(self, cache_dir, hparams):
+    """Creates a SpectrogramCache.
+
+    Args:
+      cache_dir: Local directory of the cache. It is created if it does not
+          exist.
+      hparams: HParams object specifying hyperparameters.
+    """
+    self._cache_dir = cache_dir
+    self._hparams = hparams
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    self.hits = 0
+    self.misses = 0
+
+  @property
+  def hparams(self):
+    return self._hparams
+
+  def path(self, wav_data):
+    """Returns the path of the cache entry for `wav_data`."""
+    key = spectrogram_key(wav_data, self._hparams)
+    # Spread entries over subdirectories to keep directory listings small.
+    return os.path.join(self._cache_dir, key[:2], key + _CACHE_FILE_EXTENSION)
+
+  def get(self, wav_data):
+    """Returns the cached spectrogram of `wav_data`, or None on a miss.
+
+    Args:
+      wav_data: The contents of a wav file.
+
+    Returns:
+      A read-only float16 or float32 array of shape [frames, bins]
+      memory-mapped from the cache, or None if the spectrogram is not cached.
+    """
+    try:
+      spec = np.load(self.path(wav_data), mmap_mode='r')
+    except (IOError, OSError, ValueError):
+      # Missing, or a corrupt entry that will be overwritten by `put`.
+      self.misses += 1
+      return None
+    self.hits += 1
+    return spec
+
+  def put(self, wav_data, spec):
+    """Stores the spectrogram of `wav_data` in the cache.
+
+    Args:
+      wav_data: The contents of a wav file.
+      spec: The spectrogram, an array of shape [frames, bins]. It is stored as
+          float16, or as float32 if it has values beyond the float16 range.
+    """
+    spec = np.asarray(spec)
+    path = self.path(wav_data)
+    entry_dir = os.path.dirname(path)
+    if not os.path.isdir(entry_dir):
+      try:
+        os.makedirs(entry_dir)
+      except OSError:
+        # Created by another process in the meantime.
+        pass
+    # Write to a temporary file first so that readers never see a partially
+    # written entry.
+    fd, temp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+      np.save(f, spec.astype(_storage_dtype(spec), copy=False))
+    os.rename(temp_path, path)
+
+  def get_or_compute(self, wav_data, spec_fn):
+    """Returns the spectrogram of `wav_data`, computing it on a miss.
+
+    Args:
+      wav_data: The contents of a wav file.
+      spec_fn: Function that computes the spectrogram from `wav_data`.
+
+    Returns:
+      The spectrogram as a float32 array, rounded to the precision it is
+      cached with whether or not it was cached.
+    """
+    spec = self.get(wav_data)
+    if spec is None:
+      spec = np.asarray(spec_fn(wav_data))
+      spec = spec.astype(_storage_dtype(spec), copy=False)
+      self.put(wav_data, spec)
+    return np.asarray(spec, dtype=np.float32)
@@ -0,0 +1,114 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for spectrogram_cache."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+
+from magenta.models.onsets_frames_transcription import configs
+from magenta.models.onsets_frames_transcription import data
+from magenta.models.onsets_frames_transcription import spectrogram_cache
+from note_seq import audio_io
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+
+class SpectrogramCacheTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SpectrogramCacheTest, self).setUp()
+    self.hparams = copy.deepcopy(configs.DEFAULT_HPARAMS)
+    self.cache_dir = os.path.join(self.get_temp_dir(), 'spec_cache')
+    t = np.arange(8000) / 16000.0
+    self.wav_data = audio_io.samples_to_wav_data(
+        0.5 * np.sin(2 * np.pi * 440.0 * t), 16000)
+
+  def testPutAndGet(self):
+    cache = spectrogram_cache.SpectrogramCache(self.cache_dir, self.hparams)
+    spec = np.random.RandomState(0).normal(size=[16, 229]) * 20
+    self.assertIsNone(cache.get(self.wav_data))
+
+    cache.put(self.wav_data, spec)
+    cached_spec = cache.get(self.wav_data)
+    self.assertEqual(np.float16, cached_spec.dtype)
+    np.testing.assert_array_equal(spec.astype(np.float16), cached_spec)
+    self.assertEqual(1, cache.hits)
+    self.assertEqual(1, cache.misses)
+
+    # Other audio or spectrogram hparams have their own entries.
+    self.assertIsNone(cache.get(self.wav_data + b'\0\0'))
+    hparams = copy.deepcopy(self.hparams)
+    hparams.spec_n_bins = 128
+    self.assertIsNone(spectrogram_cache.SpectrogramCache(
+        self.cache_dir, hparams).get(self.wav_data))
+    # Other hparams do not change the key.
+    hparams = copy.deepcopy(self.hparams)
+    hparams.onset_length = 1
+    self.assertEqual(
+        spectrogram_cache.spectrogram_key(self.wav_data, self.hparams),
+        spectrogram_cache.spectrogram_key(self.wav_data, hparams))
+
+  def testLargeValuesAreStoredAsFloat32(self):
+    cache = spectrogram_cache.SpectrogramCache(self.cache_dir, self.hparams)
+    # Mel power spectrograms without log amplitude can exceed 65504.
+    spec = np.array([[1e-3, 7e4], [1.5, 1e6]])
+
+    self.assertAllEqual(
+        spec.astype(np.float32),
+        cache.get_or_compute(self.wav_data, lambda _: spec))
+    cached_spec = cache.get(self.wav_data)
+    self.assertEqual(np.float32, cached_spec.dtype)
+    self.assertAllEqual(spec.astype(np.float32), cached_spec)
+
+  def testGetOrComputeReplacesCorruptEntry(self):
+    cache = spectrogram_cache.SpectrogramCache(self.cache_dir, self.hparams)
+    path = cache.path(self.wav_data)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+      f.write(b'not a spectrogram')
+
+    spec = cache.get_or_compute(self.wav_data, lambda _: np.full([4, 2], 1.5))
+    self.assertEqual(np.float32, spec.dtype)
+    np.testing.assert_array_equal(np.full([4, 2], 1.5), spec)
+    # The second call reads the rewritten entry.
+    spec = cache.get_or_compute(self.wav_data, lambda _: self.fail('computed'))
+    np.testing.assert_array_equal(np.full([4, 2], 1.5), spec)
+
+  def testWavToSpecOpUsesCache(self):
+    self.hparams.spec_cache_dir = self.cache_dir
+    expected_spec = data.wav_to_spec(self.wav_data, self.hparams)
+
+    with self.test_session() as sess:
+      spec = sess.run(data.wav_to_spec_op(
+          tf.constant(self.wav_data), hparams=self.hparams))
+      uncached_spec = sess.run(data.wav_to_spec_op(
+          tf.constant(self.wav_data + b'\0\0'), hparams=self.hparams,
+          use_cache=False))
+
+    np.testing.assert_allclose(expected_spec, spec, rtol=1e-3, atol=1e-2)
+    cache = spectrogram_cache.SpectrogramCache(self.cache_dir, self.hparams)
+    np.testing.assert_array_equal(spec, cache.get(self.wav_data))
+    self.assertIsNone(cache.get(self.wav_data + b'\0\0'))
+    self.assertEqual(expected_spec.shape, uncached_spec.shape)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,292 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities for transcribing long recordings in overlapping windows.
+
+A recording is split into windows of `chunk_frames` frames, each padded with up
+to `overlap_frames` frames of context on either side. Every window is
+transcribed on its own. The posteriors of the context frames are discarded,
+and the remaining frames are decoded into notes by a `StreamingNoteDecoder`,
+which carries active notes across window boundaries. Memory use depends on the
+window size rather than the length of the recording.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import librosa
+from magenta.models.onsets_frames_transcription import constants
+from magenta.models.onsets_frames_transcription import data
+from magenta.models.onsets_frames_transcription import infer_util
+import note_seq
+from note_seq import sequences_lib
+from note_seq.protobuf import music_pb2
+import numpy as np
+from scipy.io import wavfile
+
+# Audio of a single window. `samples` are mono samples at the model sample
+# rate, starting at frame `start_frame` of the recording. Only the frames in
+# [core_start_frame, core_end_frame) are kept; the others are context.
+AudioWindow = collections.namedtuple(
+    'AudioWindow',
+    ['samples', 'start_frame', 'core_start_frame', 'core_end_frame'])
+
+
+def _to_float_samples(y):
+  """Converts a slice of a WAV file to float32 mono samples."""
+  if y.dtype == np.int16:
+    y = y.astype(np.float32) / np.iinfo(np.int16).max
+  elif y.dtype == np.float32:
+    y = np.array(y)
+  else:
+    raise ValueError('WAV file not 16-bit or 32-bit float PCM, unsupported')
+  if y.ndim == 2:
+    y = np.mean(y, axis=1)
+  return y
+
+
+def read_wav_windows(filename, hparams, chunk_frames, overlap_frames):
+  """Reads a WAV file in overlapping windows.
+
+  The file is memory-mapped, so only the samples of the current window are
+  loaded. Each window is resampled to the model sample rate separately.
+
+  Args:
+    filename: Path to a 16-bit or 32-bit float PCM WAV file.
+    hparams: HParams object specifying hyperparameters.
+    chunk_frames: Number of frames to keep from each window.
+    overlap_frames: Number of context frames on either side of a window.
+
+  Yields:
+    An `AudioWindow` for each chunk of the file, in order.
+
+  Raises:
+    ValueError: If `chunk_frames` is not positive, or the file has an
+        unsupported sample format.
+  """
+  if chunk_frames <= 0:
+    raise ValueError('chunk_frames must be positive, got %d' % chunk_frames)
+  native_sample_rate, audio = wavfile.read(filename, mmap=True)
+  sample_rate = hparams.sample_rate
+  hop_length = hparams.spec_hop_length
+  num_samples = int(len(audio) * sample_rate / native_sample_rate)
+  # Matches the length of a transcription of the whole file.
+  num_frames = int(
+      len(audio) / native_sample_rate * data.hparams_frames_per_second(hparams))
+
+  for core_start_frame in range(0, num_frames, chunk_frames):
+    core_end_frame = min(core_start_frame + chunk_frames, num_frames)
+    start_frame = max(core_start_frame - overlap_frames, 0)
+    end_frame = min(core_end_frame + overlap_frames, num_frames)
+    start = start_frame * hop_length
+    # The last window also covers the partial frame at the end of the file.
+    end = num_samples if end_frame == num_frames else end_frame * hop_length
+
+    y = _to_float_samples(audio[
+        int(round(start * native_sample_rate / sample_rate)):
+        int(round(end * native_sample_rate / sample_rate))])
+    if native_sample_rate != sample_rate:
+      y = librosa.core.resample(
+          y, orig_sr=native_sample_rate, target_sr=sample_rate)
+      y = librosa.util.fix_length(y, size=end - start)
+
+    yield AudioWindow(
+        samples=y,
+        start_frame=start_frame,
+        core_start_frame=core_start_frame,
+        core_end_frame=core_end_frame)
+
+
+def window_pianorolls(prediction, window, hparams):
+  """Returns the pianorolls to decode for the kept frames of a window.
+
+  Mirrors the inputs that `infer_util.predict_sequence` passes to
+  `sequences_lib.pianoroll_to_note_sequence`. Viterbi decoding runs over the
+  whole window, including its context frames.
+
+  Args:
+    prediction: Estimator predictions for the window, with a batch of 1.
+    window: The `AudioWindow` that was transcribed.
+    hparams: HParams object specifying hyperparameters.
+
+  Returns:
+    A tuple of frames, onsets, offsets and velocities arrays of shape
+    [kept frames, pitches]. Onsets and offsets may be None.
+  """
+  begin = window.core_start_frame - window.start_frame
+  end = begin + window.core_end_frame - window.core_start_frame
+
+  if hparams.viterbi_decoding:
+    pianoroll = infer_util.probs_to_pianoroll_viterbi(
+        prediction['frame_probs'][0], prediction['onset_probs'][0],
+        alpha=hparams.viterbi_alpha)
+    onsets = np.concatenate([
+        pianoroll[:1, :], pianoroll[1:, :] & ~pianoroll[:-1, :]
+    ], axis=0)
+    frames = pianoroll
+    offsets = None
+  else:
+    frames = prediction['frame_predictions'][0]
+    onsets = None
+    if hparams.predict_onset_threshold:
+      onsets = prediction['onset_predictions'][0]
+    offsets = None
+    if hparams.predict_offset_threshold:
+      offsets = prediction['offset_predictions'][0]
+
+  def crop(pianoroll):
+    return None if pianoroll is None else pianoroll[begin:end]
+
+  return (crop(frames), crop(onsets), crop(offsets),
+          crop(prediction['velocity_values'][0]))
+
+
+class StreamingNoteDecoder(object):
+  """Decodes pianorolls into notes one chunk of frames at a time.
+
+  Decoding consecutive chunks gives the same notes, in the same order, as
+  `sequences_lib.pianoroll_to_note_sequence` on the concatenated chunks. Each
+  note is returned as soon as it ends.
+  """
+
+  def __init__(self, frames_per_second, min_duration_ms=0, velocity=70,
+               min_midi_pitch=constants.MIN_MIDI_PITCH, velocity_scale=80,
+               velocity_bias=10):
+    self._frame_length_seconds = 1 / frames_per_second
+    self._min_duration_ms = min_duration_ms
+    self._velocity = velocity
+    self._min_midi_pitch = min_midi_pitch
+    self._velocity_scale = velocity_scale
+    self._velocity_bias = velocity_bias
+    self._pitch_start_step = {}
+    self._onset_velocities = {}
+    self._previous_onsets = None
+    self._num_frames = 0
+
+  @property
+  def total_time(self):
+    """Total time of the decoded frames, including the final silent frame."""
+    return (self._num_frames + 1) * self._frame_length_seconds
+
+  def _end_pitch(self, pitch, end_frame, notes):
+    start_time = self._pitch_start_step.pop(pitch) * self._frame_length_seconds
+    end_time = end_frame * self._frame_length_seconds
+    if (end_time - start_time) * 1000 >= self._min_duration_ms:
+      note = music_pb2.NoteSequence.Note(
+          start_time=start_time,
+          end_time=end_time,
+          pitch=pitch + self._min_midi_pitch,
+          velocity=self._onset_velocities.get(pitch, 0))
+      notes.append(note)
+
+  def _start_onset(self, pitch, step, velocities, i):
+    """Starts a note at a predicted onset."""
+    self._pitch_start_step[pitch] = step
+    if velocities is not None:
+      # pylint:disable=protected-access
+      self._onset_velocities[pitch] = sequences_lib._unscale_velocity(
+          velocities[i, pitch], scale=self._velocity_scale,
+          bias=self._velocity_bias)
+      # pylint:enable=protected-access
+    else:
+      self._onset_velocities[pitch] = self._velocity
+
+  def decode(self, frames, onsets=None, offsets=None, velocities=None):
+    """Decodes the next chunk of frames.
+
+    Args:
+      frames: Numpy array of active frames, of shape [time, pitch].
+      onsets: Optional numpy array of onset predictions. If given, it must be
+          given for every chunk.
+      offsets: Optional numpy array of offset predictions.
+      velocities: Optional numpy array of velocity values.
+
+    Returns:
+      A list of the notes that ended within the chunk.
+    """
+    frames = np.asarray(frames, dtype=bool)
+    if onsets is not None:
+      onsets = np.asarray(onsets, dtype=bool)
+      # Ensure that any frame with an onset prediction is considered active.
+      frames = frames | onsets
+    if offsets is not None:
+      # If the frame and offset are both on, then turn it off.
+      frames = frames & ~np.asarray(offsets, dtype=bool)
+
+    notes = []
+    for i, frame in enumerate(frames):
+      step = self._num_frames + i
+      if onsets is not None:
+        previous_onsets = onsets[i - 1] if i else self._previous_onsets
+      for pitch in np.nonzero(frame | self._active_mask(len(frame)))[0]:
+        pitch = int(pitch)
+        active = frame[pitch]
+        if not active:
+          self._end_pitch(pitch, step, notes)
+        elif pitch not in self._pitch_start_step:
+          if onsets is None:
+            self._pitch_start_step[pitch] = step
+          elif onsets[i, pitch]:
+            self._start_onset(pitch, step, velocities, i)
+        elif (onsets is not None and onsets[i, pitch] and
+              (previous_onsets is None or not previous_onsets[pitch])):
+          # The pitch is already active, but this is a new onset, so end the
+          # note and start a new one.
+          self._end_pitch(pitch, step, notes)
+          self._start_onset(pitch, step, velocities, i)
+
+    self._num_frames += len(frames)
+    if onsets is not None and len(onsets):
+      self._previous_onsets = onsets[-1]
+    return notes
+
+  def _active_mask(self, num_pitches):
+    mask = np.zeros(num_pitches, dtype=bool)
+    mask[list(self._pitch_start_step)] = True
+    return mask
+
+  def finish(self):
+    """Ends all active notes after the last decoded frame.
+
+    Returns:
+      A list of the notes that were still active.
+    """
+    notes = []
+    for pitch in sorted(self._pitch_start_step):
+      self._end_pitch(pitch, self._num_frames, notes)
+    return notes
+
+
+def notes_to_sequence(notes, total_time=None):
+  """Returns a NoteSequence of decoded notes, like `predict_sequence`.
+
+  Args:
+    notes: An iterable of `NoteSequence.Note`s.
+    total_time: Total time of the sequence. If None, the end time of the last
+        note is used.
+
+  Returns:
+    A NoteSequence of the notes.
+  """
+  sequence = music_pb2.NoteSequence()
+  sequence.tempos.add().qpm = note_seq.DEFAULT_QUARTERS_PER_MINUTE
+  sequence.ticks_per_quarter = note_seq.STANDARD_PPQ
+  sequence.notes.extend(notes)
+  if total_time is None:
+    total_time = max([note.end_time for note in sequence.notes] or [0.0])
+  sequence.total_time = total_time
+  return sequence
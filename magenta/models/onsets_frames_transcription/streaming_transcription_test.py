@@ -0,0 +1,128 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for streaming_transcription."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+
+from magenta.models.onsets_frames_transcription import configs
+from magenta.models.onsets_frames_transcription import streaming_transcription
+from note_seq import sequences_lib
+import numpy as np
+from scipy.io import wavfile
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+
+class StreamingTranscriptionTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(StreamingTranscriptionTest, self).setUp()
+    self.hparams = configs.CONFIG_MAP['onsets_frames'].hparams
+
+  def _write_wav(self, samples, sample_rate):
+    filename = os.path.join(self.get_temp_dir(), 'audio.wav')
+    wavfile.write(filename, sample_rate, samples)
+    return filename
+
+  def testReadWavWindows(self):
+    # 10.5 frames of audio, with each sample holding its own index.
+    samples = np.arange(512 * 10 + 256, dtype=np.float32)
+    filename = self._write_wav(samples, 16000)
+
+    windows = list(streaming_transcription.read_wav_windows(
+        filename, self.hparams, chunk_frames=4, overlap_frames=1))
+
+    self.assertEqual(
+        [(0, 0, 4), (3, 4, 8), (7, 8, 10)],
+        [(w.start_frame, w.core_start_frame, w.core_end_frame)
+         for w in windows])
+    np.testing.assert_array_equal(samples[:512 * 5], windows[0].samples)
+    np.testing.assert_array_equal(samples[512 * 3:512 * 9], windows[1].samples)
+    # The last window includes the partial frame at the end.
+    np.testing.assert_array_equal(samples[512 * 7:], windows[2].samples)
+
+  def testReadWavWindowsResampled(self):
+    t = np.arange(44100) / 44100.0
+    samples = (0.5 * np.sin(2 * np.pi * 440.0 * t) * 32767).astype(np.int16)
+    filename = self._write_wav(samples, 44100)
+
+    windows = list(streaming_transcription.read_wav_windows(
+        filename, self.hparams, chunk_frames=10, overlap_frames=2))
+
+    self.assertLen(windows, 4)
+    self.assertEqual(31, windows[-1].core_end_frame)
+    self.assertLen(windows[0].samples, 512 * 12)
+    self.assertLen(windows[1].samples, 512 * 14)
+    # Windows whose context reaches the last frame include the partial frame
+    # at the end.
+    for window in windows[2:]:
+      self.assertLen(window.samples, 16000 - 512 * window.start_frame)
+
+  def testWindowPianorolls(self):
+    window = streaming_transcription.AudioWindow(
+        samples=None, start_frame=6, core_start_frame=8, core_end_frame=10)
+    frames = np.arange(6 * 3).reshape([1, 6, 3]) % 2 == 0
+    prediction = {
+        'frame_predictions': frames,
+        'onset_predictions': ~frames,
+        'offset_predictions': frames,
+        'velocity_values': np.ones([1, 6, 3]),
+    }
+    hparams = copy.deepcopy(self.hparams)
+    hparams.predict_offset_threshold = 0
+
+    frames_out, onsets, offsets, velocities = (
+        streaming_transcription.window_pianorolls(prediction, window, hparams))
+    np.testing.assert_array_equal(frames[0, 2:4], frames_out)
+    np.testing.assert_array_equal(~frames[0, 2:4], onsets)
+    self.assertIsNone(offsets)
+    self.assertEqual((2, 3), velocities.shape)
+
+  def testStreamingNoteDecoder(self):
+    rng = np.random.RandomState(0)
+    for use_onsets, use_offsets, use_velocities in [
+        (False, False, False), (True, False, True), (True, True, True),
+        (True, False, False), (False, True, True)]:
+      frames = rng.uniform(size=[200, 12]) < 0.5
+      onsets = rng.uniform(size=[200, 12]) < 0.2 if use_onsets else None
+      offsets = rng.uniform(size=[200, 12]) < 0.1 if use_offsets else None
+      velocities = rng.uniform(size=[200, 12]) if use_velocities else None
+      expected = sequences_lib.pianoroll_to_note_sequence(
+          frames, frames_per_second=31.25, min_duration_ms=40,
+          min_midi_pitch=21, onset_predictions=onsets,
+          offset_predictions=offsets, velocity_values=velocities)
+
+      decoder = streaming_transcription.StreamingNoteDecoder(
+          31.25, min_duration_ms=40, min_midi_pitch=21)
+      notes = []
+      for start, end in [(0, 1), (1, 50), (50, 51), (51, 199), (199, 200)]:
+        crop = lambda x: None if x is None else x[start:end]  # pylint:disable=cell-var-from-loop
+        notes.extend(decoder.decode(frames[start:end], crop(onsets),
+                                    crop(offsets), crop(velocities)))
+      notes.extend(decoder.finish())
+      sequence = streaming_transcription.notes_to_sequence(
+          notes, decoder.total_time)
+
+      self.assertProtoEquals(expected, sequence)
+
+
+if __name__ == '__main__':
+  tf.test.main()
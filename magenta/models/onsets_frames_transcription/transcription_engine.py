@@ -0,0 +1,356 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Long-lived transcription engine that restores the model once.
+
+`TranscriptionEngine` keeps a single `estimator.predict` call running for its
+whole lifetime, fed by a queue of serialized examples. The checkpoint is
+restored once, audio files are read and resampled by a pool of threads while
+earlier files are being transcribed, and each transcription is returned as soon
+as it is ready:
+
+  with transcription_engine.TranscriptionEngine(config, model_dir) as engine:
+    for filename, midi_filename in engine.transcribe_to_midi(filenames):
+      ...
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import copy
+from multiprocessing import pool as multiprocessing_pool
+import os
+import threading
+
+from magenta.models.onsets_frames_transcription import audio_label_data_utils
+from magenta.models.onsets_frames_transcription import constants
+from magenta.models.onsets_frames_transcription import data
+from magenta.models.onsets_frames_transcription import infer_util
+from magenta.models.onsets_frames_transcription import streaming_transcription
+from magenta.models.onsets_frames_transcription import train_util
+from note_seq import audio_io
+from note_seq import midi_io
+from note_seq.protobuf import music_pb2
+import six
+from six.moves import queue
+import tensorflow.compat.v1 as tf
+
+# Result of transcribing a single audio file. `sequence` is the transcribed
+# NoteSequence, or None if the file could not be processed.
+Transcription = collections.namedtuple('Transcription',
+                                       ['filename', 'sequence'])
+
+# Sentinel that ends the stream of examples fed to the model.
+_END_OF_EXAMPLES = None
+
+
+def create_example(filename, sample_rate, load_audio_with_librosa):
+  """Processes an audio file into an Example proto."""
+  wav_data = tf.gfile.Open(filename, 'rb').read()
+  example_list = list(
+      audio_label_data_utils.process_record(
+          wav_data=wav_data,
+          sample_rate=sample_rate,
+          ns=music_pb2.NoteSequence(),
+          # decode to handle filenames with extended characters.
+          example_id=six.ensure_text(filename, 'utf-8'),
+          min_length=0,
+          max_length=-1,
+          allow_empty_notesequence=True,
+          load_audio_with_librosa=load_audio_with_librosa))
+  assert len(example_list) == 1
+  return example_list[0].SerializeToString()
+
+
+def _imap_bounded(pool, func, iterable, window):
+  """Like `pool.imap`, but reads at most `window` items ahead of the results.
+
+  `ThreadPool.imap` consumes its whole iterable eagerly, which would read every
+  file of a long or endless stream of filenames as fast as possible.
+
+  Args:
+    pool: The `ThreadPool` to apply `func` in.
+    func: The function to apply to each item.
+    iterable: The items, which are only read as results are consumed.
+    window: Maximum number of items being processed at a time.
+
+  Yields:
+    The result of `func` for each item, in order.
+  """
+  results = collections.deque()
+  for item in iterable:
+    results.append(pool.apply_async(func, (item,)))
+    if len(results) >= window:
+      yield results.popleft().get()
+  while results:
+    yield results.popleft().get()
+
+
+class TranscriptionEngine(object):
+  """Transcribes audio files with a model that stays loaded between files.
+
+  The engine is not thread-safe; calls to `transcribe` are serialized.
+  """
+
+  def __init__(self, config, model_dir, hparams=None, checkpoint_path=None,
+               data_fn=data.provide_batch, load_audio_with_librosa=False,
+               num_preprocessing_threads=4):
+    """Constructs a TranscriptionEngine.
+
+    Args:
+      config: The config to use, an entry of `configs.CONFIG_MAP`.
+      model_dir: Path to look for acoustic checkpoints.
+      hparams: Optional HParams to use instead of `config.hparams`.
+      checkpoint_path: Filename of the checkpoint to use. If None, the latest
+          checkpoint in `model_dir` is used.
+      data_fn: The function that creates the input dataset.
+      load_audio_with_librosa: Whether to use librosa for sampling audio.
+      num_preprocessing_threads: Number of threads that read and resample audio
+          files ahead of inference.
+    """
+    hparams = copy.deepcopy(hparams if hparams is not None else config.hparams)
+    hparams.batch_size = 1
+    hparams.truncated_length_secs = 0
+    self._hparams = hparams
+    self._load_audio_with_librosa = load_audio_with_librosa
+    self._num_preprocessing_threads = num_preprocessing_threads
+
+    self._examples = queue.Queue()
+    self._lock = threading.Lock()
+
+    def examples_generator():
+      while True:
+        example = self._examples.get()
+        if example is _END_OF_EXAMPLES:
+          return
+        yield example
+
+    def transcription_data(params):
+      examples = tf.data.Dataset.from_generator(
+          examples_generator, output_types=tf.string,
+          output_shapes=tf.TensorShape([]))
+      dataset = data_fn(
+          examples=examples,
+          preprocess_examples=True,
+          params=params,
+          is_training=False,
+          shuffle_examples=False,
+          skip_n_initial_records=0)
+      # The generator blocks a thread while it waits for the next example.
+      # Give the dataset its own threads so that the preprocessing of the
+      # examples already fed is never starved by it, even on a single core.
+      options = tf.data.Options()
+      options.experimental_threading.private_threadpool_size = max(
+          num_preprocessing_threads, 2)
+      return dataset.with_options(options)
+
+    estimator = train_util.create_estimator(
+        config.model_fn, os.path.expanduser(model_dir), hparams)
+    # The predictions generator restores the checkpoint when it is first
+    # advanced, and then keeps the session open until the examples end.
+    self._predictions = estimator.predict(
+        infer_util.labels_to_features_wrapper(transcription_data),
+        checkpoint_path=checkpoint_path,
+        yield_single_examples=False)
+    self._pool = multiprocessing_pool.ThreadPool(num_preprocessing_threads)
+    self._closed = False
+
+  def _create_example(self, filename):
+    try:
+      return filename, create_example(
+          filename, self._hparams.sample_rate, self._load_audio_with_librosa)
+    except Exception as e:  # pylint:disable=broad-except
+      tf.logging.error('Failed to process %s: %s', filename, e)
+      return filename, None
+
+  def _predict(self, keyed_examples, max_pending=0):
+    """Feeds examples to the model, yielding each prediction when it is ready.
+
+    Examples are fed to the model from a background thread while earlier
+    predictions are consumed. Must be called with `self._lock` held.
+
+    Args:
+      keyed_examples: An iterable of (key, serialized example) tuples. The
+          example may be None if it could not be created.
+      max_pending: Maximum number of examples to create ahead of the
+          predictions being consumed. 0 for no limit.
+
+    Yields:
+      A tuple of the key and the prediction dict of each example, or None for
+      the prediction if the example was None.
+    """
+    # The keys are kept in the same order to pair them with predictions.
+    pending = queue.Queue(max_pending)
+    stop = threading.Event()
+    item = None
+
+    def feed():
+      try:
+        for key, example in keyed_examples:
+          if stop.is_set():
+            break
+          if example is not None:
+            self._examples.put(example)
+          pending.put((key, example is not None))
+      finally:
+        pending.put(None)
+
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    try:
+      while True:
+        item = pending.get()
+        if item is None:
+          break
+        key, has_example = item
+        yield key, next(self._predictions) if has_example else None
+    finally:
+      # If the caller stopped early, consume the predictions for the examples
+      # already fed so that later calls stay in step.
+      stop.set()
+      if item is not None:
+        for item in iter(pending.get, None):
+          if item[1]:
+            next(self._predictions, None)
+      feeder.join()
+
+  def transcribe(self, filenames):
+    """Transcribes audio files, yielding each transcription when it is ready.
+
+    Files are read and resampled in parallel while earlier files are
+    transcribed. `filenames` may be any iterable, including a generator that
+    produces filenames as they become available; only a few files are read
+    ahead of the transcriptions consumed.
+
+    Args:
+      filenames: An iterable of paths to audio files.
+
+    Yields:
+      A `Transcription` for each file, in the order of `filenames`.
+
+    Raises:
+      ValueError: If the engine has been closed.
+    """
+    if self._closed:
+      raise ValueError('TranscriptionEngine is closed.')
+    with self._lock:
+      keyed_examples = _imap_bounded(
+          self._pool, self._create_example, filenames,
+          window=2 * self._num_preprocessing_threads)
+      for filename, prediction in self._predict(
+          keyed_examples, max_pending=self._num_preprocessing_threads):
+        if prediction is None:
+          yield Transcription(filename, None)
+          continue
+        sequence = music_pb2.NoteSequence.FromString(
+            prediction['sequence_predictions'][0])
+        yield Transcription(filename, sequence)
+
+  def transcribe_streaming(self, filename, chunk_secs=30.0, overlap_secs=5.0,
+                           max_pending_windows=2):
+    """Transcribes a long audio file in overlapping windows.
+
+    Only a few windows of audio and posteriors are held in memory at a time,
+    so memory use does not grow with the length of the recording. Notes that
+    are still active at the end of a window are carried over to the next.
+
+    Args:
+      filename: Path to a 16-bit or 32-bit float PCM WAV file.
+      chunk_secs: Seconds of audio whose transcription is kept from each
+          window.
+      overlap_secs: Seconds of context audio on either side of each window.
+      max_pending_windows: Maximum number of windows to read ahead of the
+          window being transcribed.
+
+    Yields:
+      Each `NoteSequence.Note` as soon as it has been decoded, in the order of
+      `sequences_lib.pianoroll_to_note_sequence`.
+
+    Raises:
+      ValueError: If the engine has been closed.
+    """
+    if self._closed:
+      raise ValueError('TranscriptionEngine is closed.')
+    hparams = self._hparams
+    frames_per_second = data.hparams_frames_per_second(hparams)
+    windows = streaming_transcription.read_wav_windows(
+        filename, hparams,
+        chunk_frames=max(int(round(chunk_secs * frames_per_second)), 1),
+        overlap_frames=int(round(overlap_secs * frames_per_second)))
+    example_id = six.ensure_text(filename, 'utf-8')
+
+    def keyed_examples():
+      for window in windows:
+        wav_data = audio_io.samples_to_wav_data(window.samples,
+                                                hparams.sample_rate)
+        example = audio_label_data_utils.create_example(
+            example_id, music_pb2.NoteSequence(), wav_data)
+        yield window, example.SerializeToString()
+
+    decoder = streaming_transcription.StreamingNoteDecoder(
+        frames_per_second,
+        min_midi_pitch=constants.MIN_MIDI_PITCH,
+        velocity_scale=hparams.velocity_scale,
+        velocity_bias=hparams.velocity_bias)
+    with self._lock:
+      for window, prediction in self._predict(
+          keyed_examples(), max_pending=max_pending_windows):
+        frames, onsets, offsets, velocities = (
+            streaming_transcription.window_pianorolls(
+                prediction, window, hparams))
+        for note in decoder.decode(frames, onsets, offsets, velocities):
+          yield note
+      for note in decoder.finish():
+        yield note
+
+  def transcribe_to_midi(self, filenames, transcribed_file_suffix=''):
+    """Transcribes audio files and writes each transcription as a MIDI file.
+
+    Args:
+      filenames: An iterable of paths to audio files.
+      transcribed_file_suffix: Suffix to add to the transcribed file names,
+          before the '.midi' extension.
+
+    Yields:
+      A tuple of the audio filename and the written MIDI filename, or None for
+      the MIDI filename if the file could not be transcribed.
+    """
+    for transcription in self.transcribe(filenames):
+      if transcription.sequence is None:
+        yield transcription.filename, None
+        continue
+      midi_filename = (
+          transcription.filename + transcribed_file_suffix + '.midi')
+      midi_io.sequence_proto_to_midi_file(transcription.sequence, midi_filename)
+      yield transcription.filename, midi_filename
+
+  def close(self):
+    """Ends the prediction loop and releases the model."""
+    if self._closed:
+      return
+    self._closed = True
+    self._pool.close()
+    self._examples.put(_END_OF_EXAMPLES)
+    # Closing the predictions generator closes its session.
+    self._predictions.close()
+    self._pool.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
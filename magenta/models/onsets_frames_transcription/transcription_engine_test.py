@@ -0,0 +1,143 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for transcription_engine."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+from unittest import mock
+
+from magenta.models.onsets_frames_transcription import configs
+from magenta.models.onsets_frames_transcription import train_util
+from magenta.models.onsets_frames_transcription import transcription_engine
+import numpy as np
+from note_seq.protobuf import music_pb2
+from scipy.io import wavfile
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+
+class _StandInEstimator(object):
+  """Predicts an empty NoteSequence for each example fed to the engine."""
+
+  def __init__(self):
+    self.examples = None
+    self.num_predictions = 0
+
+  def predict(self, unused_input_fn, checkpoint_path, yield_single_examples):
+    del checkpoint_path, yield_single_examples
+    return self._predictions()
+
+  def _predictions(self):
+    for _ in iter(self.examples.get, transcription_engine._END_OF_EXAMPLES):  # pylint:disable=protected-access
+      self.num_predictions += 1
+      yield {'sequence_predictions': [
+          music_pb2.NoteSequence().SerializeToString()]}
+
+
+class TranscriptionEngineTest(tf.test.TestCase):
+
+  def _write_wav(self, directory, name, sample_rate=16000, num_seconds=0.5):
+    filename = os.path.join(directory, name)
+    t = np.arange(int(sample_rate * num_seconds)) / float(sample_rate)
+    samples = (0.5 * np.sin(2 * np.pi * 440.0 * t) * 32767).astype(np.int16)
+    wavfile.write(filename, sample_rate, samples)
+    return filename
+
+  def testTranscribeToMidi(self):
+    directory = self.get_temp_dir()
+    filenames = [self._write_wav(directory, 'a.wav'),
+                 os.path.join(directory, 'missing.wav'),
+                 self._write_wav(directory, 'b.wav')]
+
+    config = configs.CONFIG_MAP['onsets_frames']
+    # With no checkpoint in the model directory, predictions use randomly
+    # initialized weights.
+    with transcription_engine.TranscriptionEngine(
+        config, os.path.join(directory, 'model'),
+        num_preprocessing_threads=2) as engine:
+      results = list(engine.transcribe_to_midi(filenames, '.test'))
+      # The model stays loaded for later calls.
+      transcriptions = list(engine.transcribe(filenames[:1]))
+
+    self.assertEqual(
+        [(filenames[0], filenames[0] + '.test.midi'),
+         (filenames[1], None),
+         (filenames[2], filenames[2] + '.test.midi')],
+        results)
+    self.assertTrue(os.path.exists(filenames[0] + '.test.midi'))
+    self.assertTrue(os.path.exists(filenames[2] + '.test.midi'))
+    self.assertLen(transcriptions, 1)
+    self.assertEqual(filenames[0], transcriptions[0].filename)
+    self.assertIsNotNone(transcriptions[0].sequence)
+
+    with self.assertRaises(ValueError):
+      list(engine.transcribe(filenames))
+
+  def testTranscribeStreaming(self):
+    directory = self.get_temp_dir()
+    filename = self._write_wav(directory, 'long.wav', num_seconds=3)
+
+    config = configs.CONFIG_MAP['onsets_frames']
+    with transcription_engine.TranscriptionEngine(
+        config, os.path.join(directory, 'model')) as engine:
+      notes = list(engine.transcribe_streaming(
+          filename, chunk_secs=1.0, overlap_secs=0.5))
+      # Stopping early leaves the engine usable.
+      next(engine.transcribe_streaming(filename, chunk_secs=1.0), None)
+      self.assertLen(list(engine.transcribe(filenames=[filename])), 1)
+
+    for note in notes:
+      self.assertLess(note.start_time, note.end_time)
+      self.assertLessEqual(note.end_time, 3.0)
+
+  def testTranscribeReadsAheadInBoundedWindow(self):
+    filename = self._write_wav(self.get_temp_dir(), 'a.wav')
+    num_read = [0]
+
+    def filenames():
+      for _ in range(100):
+        num_read[0] += 1
+        yield filename
+
+    estimator = _StandInEstimator()
+    with mock.patch.object(train_util, 'create_estimator',
+                           return_value=estimator):
+      engine = transcription_engine.TranscriptionEngine(
+          configs.CONFIG_MAP['onsets_frames'], 'unused_model_dir',
+          num_preprocessing_threads=2)
+    estimator.examples = engine._examples  # pylint:disable=protected-access
+    with engine:
+      transcriptions = engine.transcribe(filenames())
+      self.assertEqual(filename, next(transcriptions).filename)
+      transcriptions.close()
+      # Only a window of files is read ahead of the transcriptions consumed,
+      # and only the examples already fed are transcribed after stopping.
+      self.assertLessEqual(num_read[0], 10)
+      self.assertLessEqual(estimator.num_predictions, num_read[0])
+
+      # The engine stays in step for later calls.
+      num_predictions = estimator.num_predictions
+      self.assertEqual(
+          [filename] * 3,
+          [t.filename for t in engine.transcribe([filename] * 3)])
+      self.assertEqual(num_predictions + 3, estimator.num_predictions)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -17,6 +17,8 @@
 import collections
 import copy
 import functools
+import hashlib
+import threading
 
 from magenta.common import beam_search
 from magenta.common import state_util
@@ -24,6 +26,7 @@ from magenta.contrib import training as contrib_training
 from magenta.models.shared import events_rnn_graph
 from magenta.models.shared import model
 import note_seq
+from note_seq import events_lib
 import numpy as np
 import tensorflow.compat.v1 as tf
 
@@ -33,11 +36,123 @@ import tensorflow.compat.v1 as tf
 ModelState = collections.namedtuple(
     'ModelState', ['inputs', 'rnn_state', 'control_events', 'control_state'])
 
+# A reference to row `index` of `batch`, a numpy array or nested structure of
+# numpy arrays whose first dimensions are the batch dimension. Generation steps
+# store the inputs and RNN state of each event sequence this way so that they
+# can be fed to the next step without unbatching and restacking them.
+_BatchRow = collections.namedtuple('_BatchRow', ['batch', 'index'])
+
+
+def _batch_rows(values):
+  """Combines per-sequence inputs or RNN states into a single batch.
+
+  When every value is a `_BatchRow` of the same batch, the result is gathered
+  with a single indexing operation per array, or is the batch itself when the
+  rows are already in order.
+
+  Args:
+    values: A list of `_BatchRow` tuples or individual (unbatched) RNN state
+        structures.
+
+  Returns:
+    A numpy array or nested structure of numpy arrays whose first dimensions
+    are `len(values)`.
+  """
+  batch = values[0].batch if isinstance(values[0], _BatchRow) else None
+  if batch is not None and all(
+      isinstance(value, _BatchRow) and value.batch is batch
+      for value in values):
+    indices = np.array([value.index for value in values])
+    if (np.array_equal(indices, np.arange(len(values))) and
+        all(x.shape[0] == len(values) for x in tf.nest.flatten(batch))):
+      return batch
+    return tf.nest.map_structure(lambda x: x[indices], batch)
+  values = [
+      state_util.extract_state(value.batch, value.index)
+      if isinstance(value, _BatchRow) else value
+      for value in values]
+  return state_util.batch(values)
+
 
 class EventSequenceRnnModelError(Exception):
   pass
 
 
+def _input_prefix_keys(inputs):
+  """Returns a key for each prefix of a sequence of model inputs.
+
+  Args:
+    inputs: A numpy array of model inputs for a single sequence, with the
+        sequence length as first dimension.
+
+  Returns:
+    A list of hex digests, where the i-th one identifies `inputs[:i + 1]`.
+  """
+  hasher = hashlib.sha1()
+  keys = []
+  for row in inputs:
+    hasher.update(np.ascontiguousarray(row).tobytes())
+    keys.append(hasher.hexdigest())
+  return keys
+
+
+class _RnnStateCache(object):
+  """A thread-safe LRU cache of RNN states keyed by the inputs fed to get them.
+
+  The states are only valid for the session they were computed with, so the
+  cache is cleared whenever it is used with a different session.
+
+  Args:
+    max_size: The maximum number of states to keep.
+  """
+
+  def __init__(self, max_size):
+    self._max_size = max_size
+    self._lock = threading.Lock()
+    self._session = None
+    self._states = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def _check_session(self, session):
+    """Clears the cache if `session` is not the one it was filled with."""
+    if session is not self._session:
+      self._session = session
+      self._states.clear()
+
+  def longest_prefix(self, session, prefix_keys):
+    """Looks up the state of the longest cached prefix of some inputs.
+
+    Args:
+      session: The session the states are computed with.
+      prefix_keys: The keys of the prefixes of the inputs, as returned by
+          `_input_prefix_keys`.
+
+    Returns:
+      A tuple of the length of the longest cached prefix and its RNN state, or
+      (0, None) if no prefix is cached.
+    """
+    with self._lock:
+      self._check_session(session)
+      for length in range(len(prefix_keys), 0, -1):
+        state = self._states.get(prefix_keys[length - 1])
+        if state is not None:
+          self._states.move_to_end(prefix_keys[length - 1])
+          self.hits += 1
+          return length, state
+      self.misses += 1
+      return 0, None
+
+  def put(self, session, key, state):
+    """Stores the RNN state after feeding the inputs with key `key`."""
+    with self._lock:
+      self._check_session(session)
+      self._states[key] = state
+      self._states.move_to_end(key)
+      while len(self._states) > self._max_size:
+        self._states.popitem(last=False)
+
+
 def _extend_control_events_default(control_events, events, state):
   """Default function for extending control event sequence.
 
@@ -59,6 +174,148 @@ def _extend_control_events_default(control_events, events, state):
   return state
 
 
+def _copy_events(events):
+  """Returns a copy of an event sequence that shares its events.
+
+  Events are never modified in place, so only the lists holding them need to be
+  copied for the copy to be extended independently of the original. For long
+  sequences this is much cheaper than `copy.deepcopy`.
+
+  Args:
+    events: An EventSequence, a list of events, or None.
+
+  Returns:
+    A copy of `events`.
+  """
+  if events is None:
+    return None
+  if isinstance(events, list):
+    return list(events)
+  events_copy = copy.copy(events)
+  for name, value in vars(events).items():
+    if isinstance(value, (list, events_lib.EventSequence)):
+      # Lead sheets hold their melody and chords as nested event sequences.
+      setattr(events_copy, name, _copy_events(value))
+  return events_copy
+
+
+def _copy_model_state(model_state):
+  """Returns a copy of a `ModelState` for a new beam search branch.
+
+  Inputs and RNN states are replaced rather than modified by each generation
+  step, so they are shared with the original. The control events may be
+  extended in place and are copied like event sequences.
+
+  Args:
+    model_state: The ModelState to copy.
+
+  Returns:
+    A copy of `model_state`.
+  """
+  return model_state._replace(
+      control_events=_copy_events(model_state.control_events),
+      control_state=copy.deepcopy(model_state.control_state))
+
+
+class _GenerationStepBatcher(object):
+  """Combines the generation steps of concurrent `_generate_events` calls.
+
+  Each participating thread submits its event sequences to `generate_step` and
+  blocks. Once every participant that has not yet exited has submitted, the
+  last one to arrive evaluates all submitted steps together and wakes the
+  others.
+  """
+
+  def __init__(self, rnn_model, num_participants):
+    self._model = rnn_model
+    self._num_active = num_participants
+    self._condition = threading.Condition()
+    self._pending = []
+    self._local = threading.local()
+
+  def enter(self):
+    """Marks the calling thread as a participant."""
+    self._local.participant = True
+
+  def exit(self):
+    """Removes the calling thread from the participants."""
+    self._local.participant = False
+    with self._condition:
+      self._num_active -= 1
+      if self._pending and len(self._pending) >= self._num_active:
+        self._run_pending()
+
+  def is_participant(self):
+    """Returns whether the calling thread is a participant."""
+    return getattr(self._local, 'participant', False)
+
+  def generate_step(self, event_sequences, model_states, logliks,
+                    temperature):
+    """Extends event sequences by a single step along with other participants.
+
+    Args:
+      event_sequences: A list of event sequence objects, which are extended by
+          this method.
+      model_states: A list of model states, each of which contains model inputs
+          and initial RNN states.
+      logliks: A list containing the current log-likelihood for each event
+          sequence.
+      temperature: The softmax temperature.
+
+    Returns:
+      final_states: A list of `_BatchRow` tuples referring to the resulting RNN
+          state of each event sequence.
+      logliks: A numpy array containing the updated log-likelihood for each
+          event sequence.
+    """
+    request = {'args': (event_sequences, model_states, logliks, temperature)}
+    with self._condition:
+      self._pending.append(request)
+      if len(self._pending) >= self._num_active:
+        self._run_pending()
+      while 'result' not in request and 'error' not in request:
+        self._condition.wait()
+    if 'error' in request:
+      raise request['error']
+    return request['result']
+
+  def _run_pending(self):
+    """Evaluates the pending steps. Must be called holding the condition."""
+    pending, self._pending = self._pending, []
+    # Steps can only share a batch if they feed the same temperature and
+    # inputs of the same length.
+    groups = collections.OrderedDict()
+    for request in pending:
+      _, model_states, _, temperature = request['args']
+      inputs = model_states[0].inputs
+      key = (temperature, inputs.batch.shape[1:])
+      groups.setdefault(key, []).append(request)
+    for (temperature, _), requests in groups.items():
+      event_sequences = []
+      model_states = []
+      logliks = []
+      for request in requests:
+        event_sequences.extend(request['args'][0])
+        model_states.extend(request['args'][1])
+        logliks.extend(request['args'][2])
+      try:
+        # pylint:disable=protected-access
+        final_states, logliks = self._model._generate_step_for_batches(
+            event_sequences, model_states, logliks, temperature)
+        # pylint:enable=protected-access
+      except Exception as e:  # pylint:disable=broad-except
+        for request in requests:
+          request['error'] = e
+        continue
+      offset = 0
+      for request in requests:
+        num_seqs = len(request['args'][0])
+        request['result'] = (final_states[offset:offset + num_seqs],
+                             logliks[offset:offset + num_seqs])
+        offset += num_seqs
+    self._condition.notify_all()
+
+
 class EventSequenceRnnModel(model.BaseModel):
   """Class for RNN event sequence generation models.
 
@@ -67,15 +324,78 @@ class EventSequenceRnnModel(model.BaseModel):
   at a later time.
   """
 
-  def __init__(self, config):
+  def __init__(self, config, primer_state_cache_size=16):
     """Initialize the EventSequenceRnnModel.
 
     Args:
       config: An EventSequenceRnnConfig containing the encoder/decoder and
         HParams to use.
+      primer_state_cache_size: The number of RNN states of encoded primers to
+        keep, so that generating from a primer that extends a previous one only
+        feeds the new events. 0 disables the cache.
     """
     super(EventSequenceRnnModel, self).__init__()
     self._config = config
+    self._step_batcher = None
+    self._step_batcher_lock = threading.Lock()
+    self._primer_state_cache = (
+        _RnnStateCache(primer_state_cache_size)
+        if primer_state_cache_size else None)
+
+  def generate_concurrently(self, generate_fns):
+    """Calls functions that each generate with this model, stepping together.
+
+    Each function runs in its own thread. Generation steps of the event
+    sequences being generated by the functions are combined and evaluated
+    together in the model batch dimension, so that e.g. several generator
+    requests share each `session.run` call. Steps can only be combined when
+    they use the same temperature and input length, so the first step after
+    primers of different lengths is evaluated separately.
+
+    Args:
+      generate_fns: A list of functions that take no arguments and generate
+          with this model.
+
+    Returns:
+      A list of the return values of `generate_fns`, in the same order.
+
+    Raises:
+      Exception: The first exception raised by any of `generate_fns`.
+    """
+    if len(generate_fns) < 2:
+      return super(EventSequenceRnnModel, self).generate_concurrently(
+          generate_fns)
+
+    results = [None] * len(generate_fns)
+    errors = [None] * len(generate_fns)
+
+    with self._step_batcher_lock:
+      batcher = _GenerationStepBatcher(self, len(generate_fns))
+
+      def run(index):
+        batcher.enter()
+        try:
+          results[index] = generate_fns[index]()
+        except Exception as e:  # pylint:disable=broad-except
+          errors[index] = e
+        finally:
+          batcher.exit()
+
+      self._step_batcher = batcher
+      try:
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(len(generate_fns))]
+        for thread in threads:
+          thread.start()
+        for thread in threads:
+          thread.join()
+      finally:
+        self._step_batcher = None
+
+    for error in errors:
+      if error is not None:
+        raise error
+    return results
 
   def _build_graph_for_generation(self):
     events_rnn_graph.get_build_graph_fn('generate', self._config)()
@@ -84,6 +404,53 @@ class EventSequenceRnnModel(model.BaseModel):
     """Extracts the batch size from the graph."""
     return int(self._session.graph.get_collection('inputs')[0].shape[0])
 
+  def _encode_inputs(self, inputs, initial_state):
+    """Feeds the inputs of a single sequence through the RNN.
+
+    Args:
+      inputs: A numpy array of model inputs with first dimension 1.
+      initial_state: The unbatched RNN state to start from.
+
+    Returns:
+      The unbatched RNN state after feeding `inputs`.
+    """
+    batch_size = self._batch_size()
+    graph_inputs = self._session.graph.get_collection('inputs')[0]
+    graph_initial_state = self._session.graph.get_collection('initial_state')
+    graph_final_state = self._session.graph.get_collection('final_state')
+    # The graph has a fixed batch size, so the sequence is fed to each row.
+    final_state = self._session.run(graph_final_state, {
+        graph_inputs: np.repeat(inputs, batch_size, axis=0),
+        tuple(graph_initial_state): state_util.batch(
+            [initial_state] * batch_size)})
+    return state_util.extract_state(final_state, 0)
+
+  def _encode_primer(self, inputs, initial_state):
+    """Feeds all but the last primer input, resuming from cached RNN states.
+
+    The RNN state after all but the last input is cached, so that a later
+    primer that extends this one only feeds its new inputs.
+
+    Args:
+      inputs: A numpy array of the full-length model inputs of the primer with
+          first dimension 1.
+      initial_state: The unbatched initial RNN state.
+
+    Returns:
+      inputs: The model inputs for the first generation step, the last primer
+          input.
+      rnn_state: The unbatched RNN state to feed along with them.
+    """
+    prefix_keys = _input_prefix_keys(inputs[0, :-1])
+    num_cached, rnn_state = self._primer_state_cache.longest_prefix(
+        self._session, prefix_keys)
+    if rnn_state is None:
+      rnn_state = initial_state
+    if num_cached < len(prefix_keys):
+      rnn_state = self._encode_inputs(inputs[:, num_cached:-1], rnn_state)
+      self._primer_state_cache.put(self._session, prefix_keys[-1], rnn_state)
+    return inputs[:, -1:], rnn_state
+
   def _generate_step_for_batch(self, event_sequences, inputs, initial_state,
                                temperature):
     """Extends a batch of event sequences by a single step each.
@@ -94,7 +461,7 @@ class EventSequenceRnnModel(model.BaseModel):
       event_sequences: A list of event sequences, each of which is a Python
           list-like object. The list of event sequences should have length equal
           to `self._batch_size()`. These are extended by this method.
-      inputs: A Python list of model inputs, with length equal to
+      inputs: A numpy array of model inputs, with first dimension equal to
           `self._batch_size()`.
       initial_state: A numpy array containing the initial RNN state, where
           `initial_state.shape[0]` is equal to `self._batch_size()`.
@@ -128,13 +495,10 @@ class EventSequenceRnnModel(model.BaseModel):
 
     if isinstance(softmax, list):
       if softmax[0].shape[1] > 1:
-        softmaxes = []
-        for beam in range(softmax[0].shape[0]):
-          beam_softmaxes = []
-          for event in range(softmax[0].shape[1] - 1):
-            beam_softmaxes.append(
-                [softmax[s][beam, event] for s in range(len(softmax))])
-          softmaxes.append(beam_softmaxes)
+        # Regroup the per-class softmaxes by sequence and then by step, as
+        # expected by the encoder/decoder.
+        softmaxes = [list(zip(*[s[beam, :-1] for s in softmax]))
+                     for beam in range(softmax[0].shape[0])]
         loglik = self._config.encoder_decoder.evaluate_log_likelihood(
             event_sequences, softmaxes)
       else:
@@ -160,6 +524,63 @@ class EventSequenceRnnModel(model.BaseModel):
 
     return final_state, loglik + np.log(p)
 
+  def _generate_step_for_batches(self, event_sequences, model_states, logliks,
+                                 temperature):
+    """Extends a list of event sequences by a single step each.
+
+    The sequences are split into batches of the model batch size, padding the
+    final batch. This method modifies the event sequences in place.
+
+    Args:
+      event_sequences: A list of event sequence objects, which are extended by
+          this method.
+      model_states: A list of model states, each of which contains model inputs
+          and initial RNN states.
+      logliks: A list containing the current log-likelihood for each event
+          sequence.
+      temperature: The softmax temperature.
+
+    Returns:
+      final_states: A list of `_BatchRow` tuples referring to the resulting RNN
+          state of each event sequence.
+      logliks: A numpy array containing the updated log-likelihood for each
+          event sequence.
+    """
+    # Split the sequences to extend into batches matching the model batch size.
+    batch_size = self._batch_size()
+    num_seqs = len(event_sequences)
+    num_batches = int(np.ceil(num_seqs / float(batch_size)))
+
+    # Extract inputs and RNN states from the model states.
+    inputs = [model_state.inputs for model_state in model_states]
+    initial_states = [model_state.rnn_state for model_state in model_states]
+
+    final_states = []
+    logliks = np.array(logliks, dtype=np.float32)
+
+    # Add padding to fill the final batch. The padding sequences are extended
+    # and then discarded, so they only need to share events with the original.
+    pad_amt = -len(event_sequences) % batch_size
+    padded_event_sequences = event_sequences + [
+        _copy_events(event_sequences[-1]) for _ in range(pad_amt)]
+    padded_inputs = inputs + [inputs[-1]] * pad_amt
+    padded_initial_states = initial_states + [initial_states[-1]] * pad_amt
+
+    for b in range(num_batches):
+      i, j = b * batch_size, (b + 1) * batch_size
+      pad_amt = max(0, j - num_seqs)
+      # Generate a single step for one batch of event sequences.
+      batch_final_state, batch_loglik = self._generate_step_for_batch(
+          padded_event_sequences[i:j],
+          _batch_rows(padded_inputs[i:j]),
+          _batch_rows(padded_initial_states[i:j]),
+          temperature)
+      final_states += [_BatchRow(batch_final_state, k)
+                       for k in range(j - i - pad_amt)]
+      logliks[i:j - pad_amt] += batch_loglik[:j - i - pad_amt]
+
+    return final_states, logliks
+
   def _generate_step(self, event_sequences, model_states, logliks, temperature,
                      extend_control_events_callback=None,
                      modify_events_callback=None):
@@ -196,44 +617,20 @@ class EventSequenceRnnModel(model.BaseModel):
       logliks: A list containing the updated log-likelihood for each event
           sequence.
     """
-    # Split the sequences to extend into batches matching the model batch size.
-    batch_size = self._batch_size()
-    num_seqs = len(event_sequences)
-    num_batches = int(np.ceil(num_seqs / float(batch_size)))
-
-    # Extract inputs and RNN states from the model states.
-    inputs = [model_state.inputs for model_state in model_states]
-    initial_states = [model_state.rnn_state for model_state in model_states]
+    if self._step_batcher is not None and self._step_batcher.is_participant():
+      # Step together with the other concurrent generations.
+      final_states, logliks = self._step_batcher.generate_step(
+          event_sequences, model_states, logliks, temperature)
+    else:
+      final_states, logliks = self._generate_step_for_batches(
+          event_sequences, model_states, logliks, temperature)
 
-    # Also extract control sequences and states.
+    # Extract control sequences and states.
     control_sequences = [
         model_state.control_events for model_state in model_states]
     control_states = [
         model_state.control_state for model_state in model_states]
 
-    final_states = []
-    logliks = np.array(logliks, dtype=np.float32)
-
-    # Add padding to fill the final batch.
-    pad_amt = -len(event_sequences) % batch_size
-    padded_event_sequences = event_sequences + [
-        copy.deepcopy(event_sequences[-1]) for _ in range(pad_amt)]
-    padded_inputs = inputs + [inputs[-1]] * pad_amt
-    padded_initial_states = initial_states + [initial_states[-1]] * pad_amt
-
-    for b in range(num_batches):
-      i, j = b * batch_size, (b + 1) * batch_size
-      pad_amt = max(0, j - num_seqs)
-      # Generate a single step for one batch of event sequences.
-      batch_final_state, batch_loglik = self._generate_step_for_batch(
-          padded_event_sequences[i:j],
-          padded_inputs[i:j],
-          state_util.batch(padded_initial_states[i:j], batch_size),
-          temperature)
-      final_states += state_util.unbatch(
-          batch_final_state, batch_size)[:j - i - pad_amt]
-      logliks[i:j - pad_amt] += batch_loglik[:j - i - pad_amt]
-
     # Construct inputs for next step.
     if extend_control_events_callback is not None:
       # We are conditioning on control sequences.
@@ -253,12 +650,14 @@ class EventSequenceRnnModel(model.BaseModel):
       modify_events_callback(
           self._config.encoder_decoder, event_sequences, next_inputs)
 
-    model_states = [ModelState(inputs=inputs, rnn_state=final_state,
+    next_inputs = np.array(next_inputs)
+    model_states = [ModelState(inputs=_BatchRow(next_inputs, idx),
+                               rnn_state=final_state,
                                control_events=control_events,
                                control_state=control_state)
-                    for inputs, final_state, control_events, control_state
-                    in zip(next_inputs, final_states,
-                           control_sequences, control_states)]
+                    for idx, (final_state, control_events, control_state)
+                    in enumerate(zip(final_states, control_sequences,
+                                     control_states))]
 
     return event_sequences, model_states, logliks
 
@@ -353,12 +752,19 @@ class EventSequenceRnnModel(model.BaseModel):
 
     graph_initial_state = self._session.graph.get_collection('initial_state')
     initial_states = state_util.unbatch(self._session.run(graph_initial_state))
+    inputs = np.array(inputs)
+    rnn_state = initial_states[0]
+
+    if self._primer_state_cache is not None and inputs.shape[1] > 1:
+      # Only the last primer input is fed by the first step. The log-likelihood
+      # of the primer, which is the same for all beams, is then not included.
+      inputs, rnn_state = self._encode_primer(inputs, rnn_state)
 
     # Beam search will maintain a state for each sequence consisting of the next
     # inputs to feed the model, and the current RNN state. We start out with the
-    # initial full inputs batch and the zero state.
+    # initial inputs batch and the RNN state after the preceding inputs.
     initial_state = ModelState(
-        inputs=inputs[0], rnn_state=initial_states[0],
+        inputs=_BatchRow(inputs, 0), rnn_state=rnn_state,
         control_events=control_events, control_state=control_state)
 
     generate_step_fn = functools.partial(
@@ -375,7 +781,9 @@ class EventSequenceRnnModel(model.BaseModel):
         num_steps=num_steps - len(primer_events),
         beam_size=beam_size,
         branch_factor=branch_factor,
-        steps_per_iteration=steps_per_iteration)
+        steps_per_iteration=steps_per_iteration,
+        copy_sequence_fn=_copy_events,
+        copy_state_fn=_copy_model_state)
 
     tf.logging.info('Beam search yields sequence with log-likelihood: %f ',
                     loglik)
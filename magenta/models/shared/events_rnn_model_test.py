@@ -0,0 +1,203 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for events_rnn_model."""
+
+from magenta.contrib import training as contrib_training
+from magenta.models.shared import events_rnn_model
+import note_seq
+from note_seq import events_lib
+from note_seq import testing_lib
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+tf.disable_v2_behavior()
+
+
+class EventSequenceRnnModelTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(EventSequenceRnnModelTest, self).setUp()
+    self.config = events_rnn_model.EventSequenceRnnConfig(
+        None,
+        note_seq.OneHotEventSequenceEncoderDecoder(
+            testing_lib.TrivialOneHotEncoding(12)),
+        contrib_training.HParams(
+            batch_size=4,
+            rnn_layer_sizes=[16, 16],
+            dropout_keep_prob=1.0,
+            clip_norm=5,
+            learning_rate=0.01))
+
+  def _initialized_model(self):
+    """Returns a model with randomly initialized weights."""
+    rnn_model = events_rnn_model.EventSequenceRnnModel(self.config)
+    with tf.Graph().as_default():
+      tf.set_random_seed(0)
+      rnn_model._build_graph_for_generation()
+      rnn_model._session = tf.Session()
+      rnn_model._session.run(tf.global_variables_initializer())
+    return rnn_model
+
+  def testCopyEvents(self):
+    melody = note_seq.Melody([60, -2, 62])
+    melody_copy = events_rnn_model._copy_events(melody)
+    melody_copy.append(64)
+    self.assertEqual([60, -2, 62], list(melody))
+    self.assertEqual([60, -2, 62, 64], list(melody_copy))
+    self.assertEqual(3, melody.end_step)
+    self.assertEqual(4, melody_copy.end_step)
+
+    lead_sheet = note_seq.LeadSheet(
+        note_seq.Melody([60, -2]), note_seq.ChordProgression(['C', 'C']))
+    lead_sheet_copy = events_rnn_model._copy_events(lead_sheet)
+    lead_sheet_copy.append((62, 'G'))
+    self.assertLen(lead_sheet, 2)
+    self.assertEqual([60, -2], list(lead_sheet.melody))
+    self.assertEqual(['C', 'C'], list(lead_sheet.chords))
+    self.assertLen(lead_sheet_copy, 3)
+
+    self.assertIsNone(events_rnn_model._copy_events(None))
+    control_events = [1, 2]
+    self.assertEqual(control_events,
+                     events_rnn_model._copy_events(control_events))
+    self.assertIsNot(control_events,
+                     events_rnn_model._copy_events(control_events))
+
+  def testBatchRows(self):
+    batch = (np.arange(6).reshape(3, 2), np.arange(3))
+    rows = [events_rnn_model._BatchRow(batch, i) for i in range(3)]
+    self.assertIs(batch, events_rnn_model._batch_rows(rows))
+
+    gathered = events_rnn_model._batch_rows([rows[2], rows[0], rows[2]])
+    np.testing.assert_array_equal([[4, 5], [0, 1], [4, 5]], gathered[0])
+    np.testing.assert_array_equal([2, 0, 2], gathered[1])
+
+    other_batch = (np.array([[6, 7]]), np.array([3]))
+    mixed = events_rnn_model._batch_rows(
+        [rows[1], events_rnn_model._BatchRow(other_batch, 0),
+         (np.array([8, 9]), np.array(4))])
+    np.testing.assert_array_equal([[2, 3], [6, 7], [8, 9]], mixed[0])
+    np.testing.assert_array_equal([1, 3, 4], mixed[1])
+
+  def testGenerateEventsBeamSearch(self):
+    rnn_model = self._initialized_model()
+    primer = events_lib.SimpleEventSequence(pad_event=0, events=[1, 2])
+    events = rnn_model._generate_events(
+        num_steps=8, primer_events=primer, beam_size=3, branch_factor=2)
+    self.assertLen(events, 8)
+    self.assertEqual([1, 2], list(events)[:2])
+    # The primer is not extended in place.
+    self.assertEqual([1, 2], list(primer))
+
+  def testGenerateEventsPrimerStateCache(self):
+    rnn_model = self._initialized_model()
+    encoded_lengths = []
+    encode_inputs = rnn_model._encode_inputs
+
+    def recording_encode_inputs(inputs, initial_state):
+      encoded_lengths.append(inputs.shape[1])
+      return encode_inputs(inputs, initial_state)
+
+    rnn_model._encode_inputs = recording_encode_inputs
+
+    def generate(primer_events):
+      np.random.seed(0)
+      return list(rnn_model._generate_events(
+          num_steps=len(primer_events) + 4,
+          primer_events=events_lib.SimpleEventSequence(
+              pad_event=0, events=primer_events)))
+
+    events = generate([1, 2, 3, 4])
+    self.assertEqual(events, generate([1, 2, 3, 4]))
+    extended_events = generate([1, 2, 3, 4, 5, 6])
+    generate([7, 8, 9])
+    # Only the inputs that are not cached are fed before the first step.
+    self.assertEqual([3, 2, 2], encoded_lengths)
+    self.assertEqual(2, rnn_model._primer_state_cache.hits)
+    self.assertEqual(2, rnn_model._primer_state_cache.misses)
+
+    # Generation matches generation without the cache.
+    uncached_model = self._initialized_model()
+    uncached_model._primer_state_cache = None
+    np.random.seed(0)
+    self.assertEqual(extended_events, list(uncached_model._generate_events(
+        num_steps=10,
+        primer_events=events_lib.SimpleEventSequence(
+            pad_event=0, events=[1, 2, 3, 4, 5, 6]))))
+
+  def testRnnStateCacheEviction(self):
+    cache = events_rnn_model._RnnStateCache(2)
+    session = object()
+    keys = events_rnn_model._input_prefix_keys(np.eye(3))
+    self.assertLen(set(keys), 3)
+    cache.put(session, keys[0], 'a')
+    cache.put(session, keys[1], 'ab')
+    self.assertEqual((2, 'ab'), cache.longest_prefix(session, keys))
+    self.assertEqual((1, 'a'), cache.longest_prefix(session, keys[:1]))
+    # The least recently used state is evicted.
+    cache.put(session, keys[2], 'abc')
+    self.assertEqual((1, 'a'), cache.longest_prefix(session, keys[:2]))
+    # States of other sessions are not used.
+    self.assertEqual((0, None), cache.longest_prefix(object(), keys))
+
+  def testGenerateConcurrently(self):
+    rnn_model = self._initialized_model()
+    num_batches = [0]
+    generate_step_for_batch = rnn_model._generate_step_for_batch
+
+    def counting_generate_step_for_batch(*args):
+      num_batches[0] += 1
+      return generate_step_for_batch(*args)
+
+    rnn_model._generate_step_for_batch = counting_generate_step_for_batch
+
+    def generate_fn(primer_events, num_steps, beam_size=1):
+      return lambda: rnn_model._generate_events(
+          num_steps=num_steps,
+          primer_events=events_lib.SimpleEventSequence(
+              pad_event=0, events=primer_events),
+          beam_size=beam_size)
+
+    results = rnn_model.generate_concurrently([
+        generate_fn([1, 2], 10),
+        generate_fn([3, 4], 10),
+        generate_fn([5, 6, 7], 6, beam_size=2)])
+
+    self.assertEqual([10, 10, 6], [len(events) for events in results])
+    self.assertEqual([1, 2], list(results[0])[:2])
+    self.assertEqual([3, 4], list(results[1])[:2])
+    self.assertEqual([5, 6, 7], list(results[2])[:3])
+    # The primers are encoded separately, so every step combines all 4
+    # sequences into one batch until the third generation finishes.
+    self.assertEqual(8, num_batches[0])
+
+  def testGenerateConcurrentlyError(self):
+    rnn_model = self._initialized_model()
+
+    def failing_fn():
+      raise ValueError('generation failed')
+
+    def generate_fn():
+      return rnn_model._generate_events(
+          num_steps=5,
+          primer_events=events_lib.SimpleEventSequence(
+              pad_event=0, events=[1]))
+
+    with self.assertRaisesRegex(ValueError, 'generation failed'):
+      rnn_model.generate_concurrently([generate_fn, failing_fn])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -41,6 +41,21 @@ class BaseModel(object, metaclass=abc.ABCMeta):
     """
     pass
 
+  def generate_concurrently(self, generate_fns):
+    """Calls functions that each generate with this model.
+
+    Models that can evaluate several generations together in their batch
+    dimension override this to run the functions concurrently. By default they
+    are called one at a time.
+
+    Args:
+      generate_fns: A list of functions that take no arguments.
+
+    Returns:
+      A list of the return values of `generate_fns`, in the same order.
+    """
+    return [generate_fn() for generate_fn in generate_fns]
+
   def initialize_with_checkpoint(self, checkpoint_file):
     """Builds the TF graph given a checkpoint file.
 
@@ -18,6 +18,7 @@ Provides a uniform interface for interacting with generators for any model.
 """
 
 import abc
+import functools
 import os
 import tempfile
 
@@ -106,6 +107,26 @@ class BaseSequenceGenerator(object):
     """
     pass
 
+  def _generate_batch(self, input_sequences, generator_options_list):
+    """Implementation for generating several independent sequences.
+
+    By default each request is generated by `_generate`, and requests are run
+    concurrently by the model's `generate_concurrently` so that models which
+    support it can evaluate them together in the batch dimension. Subclasses
+    can override this to pack requests differently.
+
+    Args:
+      input_sequences: A list of input NoteSequences.
+      generator_options_list: A list of GeneratorOptions protos, one for each
+          input sequence.
+    Returns:
+      A list of generated NoteSequence protos, one for each input sequence.
+    """
+    return self._model.generate_concurrently([
+        functools.partial(self._generate, input_sequence, generator_options)
+        for input_sequence, generator_options
+        in zip(input_sequences, generator_options_list)])
+
   def initialize(self):
     """Builds the TF graph and loads the checkpoint.
 
@@ -180,7 +201,12 @@ class BaseSequenceGenerator(object):
   def generate(self, input_sequence, generator_options):
     """Generates a sequence from the model based on sequence and options.
 
-    Also initializes the TF graph if not yet initialized.
+    Also initializes the TF graph if not yet initialized. Initialization is not
+    thread-safe, but once the generator is initialized, `generate` may be
+    called from several threads at once: the TF session is shared and the
+    state of each generation is local to its call. Subclasses whose models
+    keep per-generation state on the model must serialize generation
+    themselves.
 
     Args:
       input_sequence: An input NoteSequence to base the generation on.
@@ -193,6 +219,33 @@ class BaseSequenceGenerator(object):
     self.initialize()
     return self._generate(input_sequence, generator_options)
 
+  def generate_batch(self, input_sequences, generator_options_list):
+    """Generates several independent sequences from the model.
+
+    This is equivalent to calling `generate` on each input sequence and its
+    options, but lets the model step the requests together, amortizing session
+    overhead across them. Also initializes the TF graph if not yet initialized.
+
+    Args:
+      input_sequences: A list of input NoteSequences to base the generations
+          on.
+      generator_options_list: A list of GeneratorOptions protos, one for each
+          input sequence.
+
+    Returns:
+      A list of generated NoteSequence protos, one for each input sequence.
+
+    Raises:
+      SequenceGeneratorError: If the number of input sequences and options
+          differ.
+    """
+    if len(input_sequences) != len(generator_options_list):
+      raise SequenceGeneratorError(
+          'Got %d input sequences but %d generator options' % (
+              len(input_sequences), len(generator_options_list)))
+    self.initialize()
+    return self._generate_batch(input_sequences, generator_options_list)
+
   def create_bundle_file(self, bundle_file, bundle_description=None):
     """Writes a generator_pb2.GeneratorBundle file in the specified location.
 
@@ -17,6 +17,7 @@
 from magenta.models.shared import model
 from magenta.models.shared import sequence_generator
 from note_seq.protobuf import generator_pb2
+from note_seq.protobuf import music_pb2
 import tensorflow.compat.v1 as tf
 
 tf.disable_v2_behavior()
@@ -41,8 +42,8 @@ class SeuenceGenerator(sequence_generator.BaseSequenceGenerator):
         Model(), details, checkpoint=checkpoint,
         bundle=bundle)
 
-  def _generate(self):
-    pass
+  def _generate(self, input_sequence, generator_options):
+    return input_sequence
 
 
 class SequenceGeneratorTest(tf.test.TestCase):
@@ -93,6 +94,20 @@ class SequenceGeneratorTest(tf.test.TestCase):
     seq_gen = SeuenceGenerator(bundle=bundle)
     self.assertEqual(bundle_details, seq_gen.bundle_details)
 
+  def testGenerateBatch(self):
+    seq_gen = SeuenceGenerator(checkpoint='foo.ckpt')
+    input_sequences = [music_pb2.NoteSequence(id='a'),
+                       music_pb2.NoteSequence(id='b')]
+    with self.assertRaises(sequence_generator.SequenceGeneratorError):
+      seq_gen.generate_batch(input_sequences,
+                             [generator_pb2.GeneratorOptions()])
+
+    seq_gen._initialized = True
+    self.assertEqual(
+        input_sequences,
+        seq_gen.generate_batch(input_sequences,
+                               [generator_pb2.GeneratorOptions()] * 2))
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -35,8 +35,11 @@ from __future__ import division
 from __future__ import print_function
 
 import itertools
+import time
 
 from magenta.pipelines import pipeline
+from magenta.pipelines import profiling
+from magenta.pipelines import statistics
 import six
 
 
@@ -382,6 +385,34 @@ class DAGPipeline(pipeline.Pipeline):
     call_list.reverse()
     assert call_list[0] == self.input
 
+    # For `iter_transform`, map each unit to the (destination, key, input name)
+    # triples which consume its outputs. `key` is the PipelineKey key or None,
+    # and `input name` is the destination's dictionary input name or None.
+    # Units taking dictionary inputs are run only after all of their
+    # dependencies are done, in topological order.
+    self._consumers = dict((unit, []) for unit in call_list)
+    self._fan_in_units = []
+    for unit in call_list[1:]:
+      dependency = self.dag[unit]
+      if isinstance(dependency, dict):
+        self._fan_in_units.append(unit)
+        subordinates = dependency.items()
+      else:
+        subordinates = [(None, dependency)]
+      for input_name, subordinate in subordinates:
+        key = None
+        if isinstance(subordinate, pipeline.PipelineKey):
+          key = subordinate.key
+        self._consumers[self._validate_subordinate(subordinate)].append(
+            (unit, key, input_name))
+
+    # An optional `profiling.PipelineProfiler` which records each call to a
+    # unit's `transform`.
+    self.profiler = None
+    # An optional `pipeline_cache.PipelineCache` which stores the outputs of
+    # units so that later runs with the same inputs can skip them.
+    self.cache = None
+
   def _expand_dag_shorthands(self, dag):
     """Expand DAG shorthand.
 
@@ -489,12 +520,12 @@ class DAGPipeline(pipeline.Pipeline):
     """
     def stats_accumulator(unit, unit_inputs, cumulative_stats):
       for single_input in unit_inputs:
-        results_ = unit.transform(single_input)
-        stats = unit.get_stats()
-        cumulative_stats.extend(stats)
+        results_ = self._transform_unit(unit, single_input, cumulative_stats)
         yield results_
 
-    stats = []
+    # Statistics of the same name produced by a unit over many inputs are
+    # merged as they are produced, rather than kept as one per call.
+    stats = statistics.StatisticsAccumulator()
     results = {self.input: [input_object]}
     for unit in self.call_list[1:]:
       # Compute transformation.
@@ -511,11 +542,140 @@ class DAGPipeline(pipeline.Pipeline):
         unjoined_outputs = list(
             stats_accumulator(unit, unit_inputs, stats))
         unit_outputs = self._join_lists_or_dicts(unjoined_outputs, unit)
+        if self.profiler is not None:
+          self.profiler.record_objects(
+              unit.name, profiling.count_outputs(unit_outputs))
       results[unit] = unit_outputs
 
     self._set_stats(stats)
     return dict((output.name, results[output]) for output in self.outputs)
 
+  def iter_transform(self, input_object):
+    """Runs the DAG on the given input, yielding outputs as they are produced.
+
+    Unlike `transform`, the outputs of every unit are not collected before
+    running the next unit. Each object a unit outputs is fed through the rest
+    of the DAG before the unit's next input is processed, so only the outputs
+    of the units currently being run are held in memory. Units which take a
+    dictionary input still need all of the outputs of their dependencies and
+    run only after those are done.
+
+    The outputs are the same as those of `transform`, but may be in a
+    different order. Statistics are available from `get_stats` once the
+    generator is exhausted or closed.
+
+    Args:
+      input_object: Any object. The required type depends on implementation.
+
+    Yields:
+      (name, output) tuples, where `name` is a DAG output name and `output` is
+      an object produced for that output.
+
+    Raises:
+      InvalidTransformOutputError: If a unit's outputs do not match its
+          `output_type`.
+    """
+    stats = statistics.StatisticsAccumulator()
+    fan_in_inputs = dict(
+        (unit, dict((name, []) for name in self.dag[unit]))
+        for unit in self._fan_in_units)
+    try:
+      for output in self._feed_consumers(
+          self.input, input_object, stats, fan_in_inputs):
+        yield output
+      for unit in self._fan_in_units:
+        unit_inputs = fan_in_inputs.pop(unit)
+        names = list(unit_inputs.keys())
+        for values in itertools.product(
+            *[unit_inputs[name] for name in names]):
+          for output in self._run_unit(
+              unit, dict(zip(names, values)), stats, fan_in_inputs):
+            yield output
+    finally:
+      self._set_stats(stats)
+
+  def _run_unit(self, unit, unit_input, stats, fan_in_inputs):
+    """Runs `unit` on a single input and feeds its outputs downstream."""
+    unit_outputs = self._join_lists_or_dicts(
+        [self._transform_unit(unit, unit_input, stats)], unit)
+    for output in self._feed_consumers(
+        unit, unit_outputs, stats, fan_in_inputs):
+      yield output
+
+  def _transform_unit(self, unit, unit_input, stats):
+    """Calls `unit.transform` and merges the unit's Statistics into `stats`.
+
+    If `cache` is set, the outputs and Statistics of the call are looked up in
+    and stored to the cache, and a hit or miss is counted in `stats`. If
+    `profiler` is set, the call is recorded with it.
+
+    Args:
+      unit: The `Pipeline` to run.
+      unit_input: The input to `unit`.
+      stats: A `StatisticsAccumulator` to merge the unit's Statistics into.
+
+    Returns:
+      The outputs of `unit.transform(unit_input)`.
+    """
+    if self.profiler is not None:
+      start_time = time.time()
+
+    cache_key = None
+    cached = None
+    if self.cache is not None and self.cache.is_cached_unit(unit):
+      cache_key = self.cache.make_key(unit, unit_input)
+      if cache_key is not None:
+        cached = self.cache.get(cache_key)
+        stats.add(statistics.Counter(
+            unit.name + ('_cache_hits' if cached is not None
+                         else '_cache_misses'), 1))
+
+    if cached is not None:
+      unit_outputs, unit_stats = cached
+    else:
+      unit_outputs = unit.transform(unit_input)
+      unit_stats = unit.get_stats()
+      if cache_key is not None:
+        self.cache.put(cache_key, (unit_outputs, unit_stats))
+    stats.merge(unit_stats)
+
+    if self.profiler is not None:
+      self.profiler.record_call(unit.name, start_time, time.time() - start_time,
+                                profiling.count_outputs(unit_outputs))
+    return unit_outputs
+
+  def _feed_consumers(self, unit, unit_outputs, stats, fan_in_inputs):
+    """Feeds the outputs of one call to `unit` to the units consuming them.
+
+    Args:
+      unit: The `Pipeline` or `DagInput` which produced `unit_outputs`.
+      unit_outputs: The outputs of one call to `unit`. A list, or dictionary
+          mapping names to lists. For `DagInput`, the input object.
+      stats: The `StatisticsAccumulator` unit Statistics are merged into.
+      fan_in_inputs: A dictionary mapping each unit which takes a dictionary
+          input to a dictionary mapping its input names to lists of objects
+          gathered for it so far.
+
+    Yields:
+      (name, output) tuples for every DAG output produced downstream.
+    """
+    for consumer, key, input_name in self._consumers[unit]:
+      if isinstance(unit, DagInput):
+        objects = [unit_outputs]
+      elif key is not None:
+        objects = unit_outputs[key]
+      else:
+        objects = unit_outputs
+      if isinstance(consumer, DagOutput):
+        for obj in objects:
+          yield consumer.name, obj
+      elif input_name is not None:
+        fan_in_inputs[consumer][input_name].extend(objects)
+      else:
+        for obj in objects:
+          for output in self._run_unit(consumer, obj, stats, fan_in_inputs):
+            yield output
+
   def _get_outputs_as_signature(self, dependency, outputs):
     """Returns a list or dict which matches the type signature of dependency.
 
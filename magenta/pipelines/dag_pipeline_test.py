@@ -438,17 +438,76 @@ class DAGPipelineTest(absltest.TestCase):
       for stat in stats_1:
         self.assertIsInstance(stat, statistics.Counter)
 
+      # Statistics from the `z` calls to UnitR are merged into one.
       names = sorted([stat.name for stat in stats_1])
       self.assertEqual(
           names,
-          (['DAGPipelineName_UnitQ_output_count'] +
-           ['DAGPipelineName_UnitR_input_count'] * z))
+          ['DAGPipelineName_UnitQ_output_count',
+           'DAGPipelineName_UnitR_input_count'])
 
       for stat in stats_1:
-        if stat.name == 'DAGPipelineName_UnitQ_output_count':
-          self.assertEqual(stat.count, z)
-        else:
-          self.assertEqual(stat.count, 1)
+        self.assertEqual(stat.count, z)
+
+  def testIterTransform(self):
+    # Tests that `iter_transform` produces the same outputs and statistics as
+    # `transform`, including for units with dictionary inputs.
+
+    class UnitQ(pipeline.Pipeline):
+
+      def __init__(self):
+        pipeline.Pipeline.__init__(self, Type0, {'xy': Type1, 'z': Type2})
+
+      def transform(self, input_object):
+        self._set_stats([statistics.Counter('output_count', input_object.z)])
+        return {'xy': [Type1(x=input_object.x + i, y=input_object.y + i)
+                       for i in range(input_object.z)],
+                'z': [Type2(z=i) for i in [-input_object.z, input_object.z]]}
+
+    class UnitR(pipeline.Pipeline):
+
+      def __init__(self):
+        pipeline.Pipeline.__init__(self, Type1, Type3)
+
+      def transform(self, input_object):
+        self._set_stats([statistics.Counter('input_count', 1)])
+        if input_object.x < 0:
+          return []
+        return [Type3(s=input_object.x, t=input_object.y)]
+
+    class UnitS(pipeline.Pipeline):
+
+      def __init__(self):
+        pipeline.Pipeline.__init__(self, {'st': Type3, 'z': Type2}, Type4)
+
+      def transform(self, input_dict):
+        return [Type4(input_dict['st'].s, input_dict['st'].t,
+                      input_dict['z'].z)]
+
+    q, r, s = UnitQ(), UnitR(), UnitS()
+    dag = {q: dag_pipeline.DagInput(q.input_type),
+           r: q['xy'],
+           s: {'st': r, 'z': q['z']},
+           dag_pipeline.DagOutput('xy'): q['xy'],
+           dag_pipeline.DagOutput('st'): r,
+           dag_pipeline.DagOutput('stz'): s}
+    dag_pipe_obj = dag_pipeline.DAGPipeline(dag)
+
+    for input_object in [Type0(-3, 0, 8), Type0(1, 2, 0)]:
+      expected_outputs = dag_pipe_obj.transform(input_object)
+      expected_stats = sorted(
+          (stat.name, stat.count) for stat in dag_pipe_obj.get_stats())
+
+      outputs = dict((name, []) for name in dag_pipe_obj.output_type)
+      for name, output in dag_pipe_obj.iter_transform(input_object):
+        outputs[name].append(output)
+      for name in outputs:
+        self.assertCountEqual(expected_outputs[name], outputs[name])
+      self.assertEqual(
+          expected_stats,
+          sorted((stat.name, stat.count)
+                 for stat in dag_pipe_obj.get_stats()))
+
+    self.assertLen(dag_pipe_obj.transform(Type0(-3, 0, 8))['stz'], 10)
 
   def testInvalidDAGError(self):
     class UnitQ(pipeline.Pipeline):
@@ -843,6 +902,8 @@ class DAGPipelineTest(absltest.TestCase):
       dag_pipe_obj = dag_pipeline.DAGPipeline(dag)
       with self.assertRaises(dag_pipeline.InvalidTransformOutputError):
         dag_pipe_obj.transform(Type0(1, 2, 3))
+      with self.assertRaises(dag_pipeline.InvalidTransformOutputError):
+        list(dag_pipe_obj.iter_transform(Type0(1, 2, 3)))
 
   def testInvalidStatisticsError(self):
     class UnitQ(pipeline.Pipeline):
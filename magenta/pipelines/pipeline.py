@@ -20,7 +20,10 @@ from __future__ import print_function
 
 import abc
 import inspect
+import multiprocessing
 import os.path
+import random
+import time
 
 from magenta.pipelines import statistics
 import six
@@ -73,7 +76,7 @@ class PipelineKey(object):
 
 def _guarantee_dict(given, default_name):
   if not isinstance(given, dict):
-    return {default_name: list}
+    return {default_name: given}
   return given
 
 
@@ -221,6 +224,30 @@ class Pipeline(object):
     """
     pass
 
+  def iter_transform(self, input_object):
+    """Runs the pipeline on the given input, yielding outputs one at a time.
+
+    The default implementation calls `transform` and yields its outputs.
+    Pipelines that can produce outputs lazily, such as `DAGPipeline`, override
+    this to avoid holding all of their outputs in memory at once.
+
+    Statistics for the run are available from `get_stats` once the generator
+    is exhausted.
+
+    Args:
+      input_object: An object or dictionary mapping names to objects.
+          The object types must match `input_type`.
+
+    Yields:
+      (name, output) tuples, where `name` is a key of `output_type_as_dict`
+      and `output` is an object of the type mapped to that name.
+    """
+    outputs = _guarantee_dict(self.transform(input_object),
+                              list(self.output_type_as_dict.keys())[0])
+    for name, output_list in outputs.items():
+      for output in output_list:
+        yield name, output
+
   def _set_stats(self, stats):
     """Overwrites the current Statistics returned by `get_stats`.
 
@@ -311,10 +338,34 @@ def tf_record_iterator(tfrecord_file, proto):
     yield proto.FromString(raw_bytes)
 
 
+def _assert_serializable_output_type(pipeline):
+  """Checks that every output type of `pipeline` can be written to TFRecord.
+
+  Args:
+    pipeline: A Pipeline instance.
+
+  Raises:
+    ValueError: If any of `pipeline`'s output types do not have a
+        SerializeToString method.
+  """
+  if isinstance(pipeline.output_type, dict):
+    for name, type_ in pipeline.output_type.items():
+      if not hasattr(type_, 'SerializeToString'):
+        raise ValueError(
+            'Pipeline output "%s" does not have method SerializeToString. '
+            'Output type = %s' % (name, pipeline.output_type))
+  else:
+    if not hasattr(pipeline.output_type, 'SerializeToString'):
+      raise ValueError(
+          'Pipeline output type %s does not have method SerializeToString.'
+          % pipeline.output_type)
+
+
 def run_pipeline_serial(pipeline,
                         input_iterator,
                         output_dir,
-                        output_file_base=None):
+                        output_file_base=None,
+                        profiler=None):
   """Runs the a pipeline on a data source and writes to a directory.
 
   Run the pipeline on each input from the iterator one at a time.
@@ -335,22 +386,16 @@ def run_pipeline_serial(pipeline,
         directory does not exist, it will be created.
     output_file_base: An optional string prefix for all datasets output by this
         run. The prefix will also be followed by an underscore.
+    profiler: An optional `profiling.PipelineProfiler`. If given, each call to
+        `pipeline` is recorded under `pipeline.name`, and the profile is logged
+        along with the Statistics. To also profile the units of a
+        `DAGPipeline`, set its `profiler` attribute to the same profiler.
 
   Raises:
     ValueError: If any of `pipeline`'s output types do not have a
         SerializeToString method.
   """
-  if isinstance(pipeline.output_type, dict):
-    for name, type_ in pipeline.output_type.items():
-      if not hasattr(type_, 'SerializeToString'):
-        raise ValueError(
-            'Pipeline output "%s" does not have method SerializeToString. '
-            'Output type = %s' % (name, pipeline.output_type))
-  else:
-    if not hasattr(pipeline.output_type, 'SerializeToString'):
-      raise ValueError(
-          'Pipeline output type %s does not have method SerializeToString.'
-          % pipeline.output_type)
+  _assert_serializable_output_type(pipeline)
 
   if not tf.gfile.Exists(output_dir):
     tf.gfile.MakeDirs(output_dir)
@@ -370,19 +415,184 @@ def run_pipeline_serial(pipeline,
 
   total_inputs = 0
   total_outputs = 0
-  stats = []
+  stats = statistics.StatisticsAccumulator()
   for input_ in input_iterator:
     total_inputs += 1
-    for name, outputs in _guarantee_dict(pipeline.transform(input_),
-                                         list(output_names)[0]).items():
-      for output in outputs:  # pylint:disable=not-an-iterable
-        writers[name].write(output.SerializeToString())
-      total_outputs += len(outputs)
-    stats = statistics.merge_statistics(stats + pipeline.get_stats())
+    start_time = time.time()
+    num_outputs = 0
+    for name, output in pipeline.iter_transform(input_):
+      writers[name].write(output.SerializeToString())
+      num_outputs += 1
+    if profiler is not None:
+      profiler.record_call(pipeline.name, start_time, time.time() - start_time,
+                           num_outputs)
+    total_outputs += num_outputs
+    stats.merge(pipeline.get_stats())
     if total_inputs % 500 == 0:
       tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
                       total_inputs, total_outputs)
       statistics.log_statistics_list(stats, tf.logging.info)
+      if profiler is not None:
+        profiler.log(tf.logging.info)
+  tf.logging.info('\n\nCompleted.\n')
+  tf.logging.info('Processed %d inputs total. Produced %d outputs.',
+                  total_inputs, total_outputs)
+  statistics.log_statistics_list(stats, tf.logging.info)
+  if profiler is not None:
+    profiler.log(tf.logging.info)
+
+
+# Pipeline instance owned by each worker process of `run_pipeline_parallel`.
+# It is set once per worker by `_init_parallel_worker` so the pipeline is
+# pickled when the pool starts instead of once per input.
+_worker_pipeline = None
+
+
+def _init_parallel_worker(pipeline):
+  global _worker_pipeline
+  _worker_pipeline = pipeline
+  # Forked workers inherit the parent's random state. Reseed so that random
+  # pipelines (e.g. `RandomPartition`) do not make identical choices in every
+  # worker.
+  random.seed()
+
+
+def _transform_batch_in_worker(inputs):
+  """Runs the worker's pipeline on a batch of inputs.
+
+  Args:
+    inputs: A list of inputs to feed to the pipeline's `transform` method.
+
+  Returns:
+    A tuple (outputs, stats, num_inputs). `outputs` maps each dataset name to
+    a list of serialized outputs, `stats` is a `StatisticsAccumulator` holding
+    the Statistics produced while transforming the batch, and `num_inputs` is
+    the number of inputs in the batch.
+  """
+  outputs = dict((name, []) for name in _worker_pipeline.output_type_as_dict)
+  stats = statistics.StatisticsAccumulator()
+  for input_ in inputs:
+    for name, output in _worker_pipeline.iter_transform(input_):
+      outputs[name].append(output.SerializeToString())
+    stats.merge(_worker_pipeline.get_stats())
+  return outputs, stats, len(inputs)
+
+
+def _batch_iterator(iterator, batch_size):
+  """Generator that groups items from `iterator` into lists of `batch_size`."""
+  batch = []
+  for item in iterator:
+    batch.append(item)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def run_pipeline_parallel(pipeline,
+                          input_iterator,
+                          output_dir,
+                          output_file_base=None,
+                          num_workers=None,
+                          num_shards=1,
+                          ordered=False,
+                          batch_size=16):
+  """Runs a pipeline on a data source in parallel and writes to a directory.
+
+  Like `run_pipeline_serial`, but inputs are distributed in batches of
+  `batch_size` across a pool of `num_workers` worker processes. Each worker
+  holds its own copy of `pipeline`, serializes its outputs, and merges the
+  Statistics for its batch before sending them back to the main process, which
+  writes the outputs and merges the Statistics from all workers.
+
+  Each dataset name specified by the pipeline is written to `num_shards`
+  TFRecord files. Outputs are assigned to shards round robin. If `num_shards`
+  is 1, a single file named as in `run_pipeline_serial` is written. Otherwise
+  the shards are named `<dataset>.tfrecord-<shard>-of-<num_shards>`.
+
+  `pipeline` must be picklable, and its output types must be protocol buffers
+  or objects that have a SerializeToString method.
+
+  Args:
+    pipeline: A Pipeline instance. `pipeline.output_type` must be a protocol
+        buffer or a dictionary mapping names to protocol buffers.
+    input_iterator: Iterates over the input data. Items returned by it are fed
+        directly into the pipeline's `transform` method.
+    output_dir: Path to directory where datasets will be written. If the
+        directory does not exist, it will be created.
+    output_file_base: An optional string prefix for all datasets output by this
+        run. The prefix will also be followed by an underscore.
+    num_workers: Number of worker processes. If None, the number of CPUs is
+        used.
+    num_shards: Number of TFRecord files to write for each dataset name.
+    ordered: If True, outputs are written in the order of their inputs, so the
+        contents of every shard are deterministic for deterministic pipelines.
+        If False, batches are written as soon as any worker finishes them.
+    batch_size: Number of inputs sent to a worker at a time.
+
+  Raises:
+    ValueError: If any of `pipeline`'s output types do not have a
+        SerializeToString method, or if `num_shards` or `batch_size` is less
+        than 1.
+  """
+  _assert_serializable_output_type(pipeline)
+  if num_shards < 1:
+    raise ValueError('num_shards must be at least 1, got %d' % num_shards)
+  if batch_size < 1:
+    raise ValueError('batch_size must be at least 1, got %d' % batch_size)
+
+  if not tf.gfile.Exists(output_dir):
+    tf.gfile.MakeDirs(output_dir)
+
+  output_names = list(pipeline.output_type_as_dict.keys())
+
+  writers = {}
+  for name in output_names:
+    if output_file_base is None:
+      dataset_base = name
+    else:
+      dataset_base = '%s_%s' % (output_file_base, name)
+    if num_shards == 1:
+      output_paths = [os.path.join(output_dir, dataset_base + '.tfrecord')]
+    else:
+      output_paths = [
+          os.path.join(output_dir, '%s.tfrecord-%05d-of-%05d' % (
+              dataset_base, shard, num_shards))
+          for shard in range(num_shards)]
+    writers[name] = [tf.python_io.TFRecordWriter(path)
+                     for path in output_paths]
+  records_written = dict((name, 0) for name in output_names)
+
+  total_inputs = 0
+  total_outputs = 0
+  stats = statistics.StatisticsAccumulator()
+  try:
+    with multiprocessing.Pool(num_workers,
+                              initializer=_init_parallel_worker,
+                              initargs=(pipeline,)) as pool:
+      map_fn = pool.imap if ordered else pool.imap_unordered
+      for outputs, batch_stats, num_inputs in map_fn(
+          _transform_batch_in_worker,
+          _batch_iterator(input_iterator, batch_size)):
+        previous_inputs = total_inputs
+        total_inputs += num_inputs
+        for name, serialized_outputs in outputs.items():
+          shard_writers = writers[name]
+          for serialized in serialized_outputs:
+            shard = records_written[name] % num_shards
+            shard_writers[shard].write(serialized)
+            records_written[name] += 1
+          total_outputs += len(serialized_outputs)
+        stats.merge(batch_stats)
+        if total_inputs // 500 > previous_inputs // 500:
+          tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
+                          total_inputs, total_outputs)
+          statistics.log_statistics_list(stats, tf.logging.info)
+  finally:
+    for shard_writers in writers.values():
+      for writer in shard_writers:
+        writer.close()
   tf.logging.info('\n\nCompleted.\n')
   tf.logging.info('Processed %d inputs total. Produced %d outputs.',
                   total_inputs, total_outputs)
@@ -408,15 +618,13 @@ def load_pipeline(pipeline, input_iterator):
   aggregated_outputs = dict((name, []) for name in pipeline.output_type_as_dict)
   total_inputs = 0
   total_outputs = 0
-  stats = []
+  stats = statistics.StatisticsAccumulator()
   for input_object in input_iterator:
     total_inputs += 1
-    outputs = _guarantee_dict(pipeline.transform(input_object),
-                              list(aggregated_outputs.keys())[0])
-    for name, output_list in outputs.items():
-      aggregated_outputs[name].extend(output_list)
-      total_outputs += len(output_list)
-    stats = statistics.merge_statistics(stats + pipeline.get_stats())
+    for name, output in pipeline.iter_transform(input_object):
+      aggregated_outputs[name].append(output)
+      total_outputs += 1
+    stats.merge(pipeline.get_stats())
     if total_inputs % 500 == 0:
       tf.logging.info('Processed %d inputs so far. Produced %d outputs.',
                       total_inputs, total_outputs)
@@ -0,0 +1,246 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of pipeline unit outputs.
+
+A `PipelineCache` stores the outputs and Statistics of calls to a `Pipeline`'s
+`transform`, keyed by the unit's name, a fingerprint of the unit's
+configuration, and a fingerprint of the input. Set it as the `cache` attribute
+of a `DAGPipeline` to skip recomputing expensive units whose configuration and
+inputs have not changed since a previous run:
+
+  cache = pipeline_cache.PipelineCache(
+      '/tmp/pipeline_cache',
+      unit_names=['Quantizer_training', 'Quantizer_eval'])
+  dag_pipeline_instance.cache = cache
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+
+import tensorflow.compat.v1 as tf
+
+_CACHE_FILE_EXTENSION = '.pkl'
+
+
+class UncacheableError(Exception):
+  """Thrown when a unit or input cannot be fingerprinted for the cache."""
+  pass
+
+
+def _update_fingerprint(hasher, obj):
+  """Adds a deterministic encoding of `obj` to `hasher`.
+
+  Protocol buffers are encoded with `SerializeToString`, dictionaries by their
+  sorted items, and anything else with pickle.
+
+  Args:
+    hasher: A hashlib hash object.
+    obj: The object to fingerprint.
+
+  Raises:
+    UncacheableError: If `obj` cannot be encoded.
+  """
+  hasher.update(('%s.%s:' % (type(obj).__module__,
+                             type(obj).__name__)).encode('utf-8'))
+  if isinstance(obj, dict):
+    for key in sorted(obj):
+      _update_fingerprint(hasher, key)
+      _update_fingerprint(hasher, obj[key])
+  elif hasattr(obj, 'SerializeToString'):
+    hasher.update(obj.SerializeToString())
+  else:
+    try:
+      hasher.update(pickle.dumps(obj, protocol=2))
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+      raise UncacheableError('Cannot fingerprint %s: %s' % (obj, e))
+
+
+def unit_fingerprint(unit):
+  """Returns a fingerprint of a `Pipeline`'s class and configuration.
+
+  The configuration is every instance attribute of the unit except the
+  Statistics it holds from its last call to `transform`.
+
+  Args:
+    unit: A `Pipeline` instance.
+
+  Returns:
+    A hex digest string.
+
+  Raises:
+    UncacheableError: If the unit's attributes cannot be fingerprinted.
+  """
+  hasher = hashlib.sha1()
+  _update_fingerprint(hasher, '%s.%s' % (type(unit).__module__,
+                                         type(unit).__name__))
+  _update_fingerprint(
+      hasher, dict((name, value) for name, value in vars(unit).items()
+                   if name != '_stats'))
+  return hasher.hexdigest()
+
+
+class PipelineCache(object):
+  """A size-bounded, least recently used on-disk cache of unit outputs.
+
+  Each entry is a file in `cache_dir` named by the hash of its key. Entries
+  already in `cache_dir` are reused, and the least recently used entries are
+  deleted when the total size of the entries exceeds `max_size_bytes`.
+
+  The size bound is enforced by each process using the cache independently, so
+  processes sharing a directory may together exceed it until one of them next
+  evicts entries.
+  """
+
+  def __init__(self, cache_dir, unit_names=None, max_size_bytes=2**30):
+    """Constructs a `PipelineCache`.
+
+    Args:
+      cache_dir: Path to a local directory to store entries in. It is created
+          if it does not exist.
+      unit_names: An optional collection of the names of the units to cache.
+          If None, every unit is cached.
+      max_size_bytes: Maximum total size in bytes of the cache entries.
+    """
+    self._cache_dir = cache_dir
+    self._unit_names = None if unit_names is None else frozenset(unit_names)
+    self._max_size_bytes = max_size_bytes
+    self._unit_fingerprints = {}
+    self.hits = 0
+    self.misses = 0
+
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    # Maps entry file names to sizes in bytes, least recently used first.
+    self._entries = collections.OrderedDict()
+    self._total_size = 0
+    existing = []
+    for filename in os.listdir(cache_dir):
+      if filename.endswith(_CACHE_FILE_EXTENSION):
+        path = os.path.join(cache_dir, filename)
+        existing.append((os.path.getmtime(path), filename,
+                         os.path.getsize(path)))
+    for _, filename, size in sorted(existing):
+      self._entries[filename] = size
+      self._total_size += size
+    self._evict()
+
+  @property
+  def size_bytes(self):
+    """Total size in bytes of the cache entries."""
+    return self._total_size
+
+  def is_cached_unit(self, unit):
+    """Returns whether calls to `unit` should be cached."""
+    return self._unit_names is None or unit.name in self._unit_names
+
+  def make_key(self, unit, unit_input):
+    """Returns the cache key for calling `unit.transform` on `unit_input`.
+
+    Args:
+      unit: A `Pipeline` instance.
+      unit_input: An input for `unit`.
+
+    Returns:
+      A string key, or None if `unit` or `unit_input` cannot be fingerprinted.
+    """
+    if id(unit) not in self._unit_fingerprints:
+      try:
+        fingerprint = unit_fingerprint(unit)
+      except UncacheableError as e:
+        tf.logging.warning('Not caching %s: %s', unit.name, e)
+        fingerprint = None
+      # The unit is kept alongside its fingerprint so that its id is not
+      # reused by another object.
+      self._unit_fingerprints[id(unit)] = (unit, fingerprint)
+    fingerprint = self._unit_fingerprints[id(unit)][1]
+    if fingerprint is None:
+      return None
+    hasher = hashlib.sha1()
+    _update_fingerprint(hasher, unit.name)
+    hasher.update(fingerprint.encode('utf-8'))
+    try:
+      _update_fingerprint(hasher, unit_input)
+    except UncacheableError as e:
+      tf.logging.warning('Not caching input to %s: %s', unit.name, e)
+      return None
+    return hasher.hexdigest()
+
+  def get(self, key):
+    """Returns the value stored under `key`, or None if there is none.
+
+    Args:
+      key: A key returned by `make_key`.
+
+    Returns:
+      The stored value, or None on a cache miss.
+    """
+    filename = key + _CACHE_FILE_EXTENSION
+    if filename not in self._entries:
+      self.misses += 1
+      return None
+    path = os.path.join(self._cache_dir, filename)
+    try:
+      with open(path, 'rb') as f:
+        value = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+      # The entry was evicted by another process or is corrupt.
+      self._remove(filename)
+      self.misses += 1
+      return None
+    os.utime(path, None)
+    self._entries.move_to_end(filename)
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    """Stores `value` under `key`, evicting old entries if needed.
+
+    Args:
+      key: A key returned by `make_key`.
+      value: A picklable value.
+    """
+    try:
+      data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+      tf.logging.warning('Not caching unpicklable value: %s', e)
+      return
+    if len(data) > self._max_size_bytes:
+      return
+    filename = key + _CACHE_FILE_EXTENSION
+    # Write to a temporary file first so that readers never see a partially
+    # written entry.
+    fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.rename(temp_path, os.path.join(self._cache_dir, filename))
+    if filename in self._entries:
+      self._total_size -= self._entries.pop(filename)
+    self._entries[filename] = len(data)
+    self._total_size += len(data)
+    self._evict()
+
+  def _remove(self, filename):
+    self._total_size -= self._entries.pop(filename)
+    try:
+      os.remove(os.path.join(self._cache_dir, filename))
+    except OSError:
+      pass
+
+  def _evict(self):
+    while self._total_size > self._max_size_bytes:
+      self._remove(next(iter(self._entries)))
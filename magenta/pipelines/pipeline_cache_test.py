@@ -0,0 +1,135 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for pipeline_cache."""
+
+import os
+
+from absl.testing import absltest
+from magenta.common import testing_lib
+from magenta.pipelines import dag_pipeline
+from magenta.pipelines import pipeline
+from magenta.pipelines import pipeline_cache
+from magenta.pipelines import statistics
+
+MockStringProto = testing_lib.MockStringProto  # pylint: disable=invalid-name
+
+
+class Repeater(pipeline.Pipeline):
+
+  def __init__(self, num_repeats):
+    super(Repeater, self).__init__(input_type=str, output_type=str)
+    self._num_repeats = num_repeats
+    self.num_calls = 0
+
+  def transform(self, input_object):
+    self.num_calls += 1
+    self._set_stats([statistics.Counter('repeated', self._num_repeats)])
+    return [input_object + str(i) for i in range(self._num_repeats)]
+
+
+class ToProto(pipeline.Pipeline):
+
+  def __init__(self):
+    super(ToProto, self).__init__(input_type=str, output_type=MockStringProto)
+
+  def transform(self, input_object):
+    return [MockStringProto(input_object)]
+
+
+def _make_dag(num_repeats, cache):
+  repeater = Repeater(num_repeats)
+  to_proto = ToProto()
+  dag_pipe_obj = dag_pipeline.DAGPipeline(
+      {repeater: dag_pipeline.DagInput(str),
+       to_proto: repeater,
+       dag_pipeline.DagOutput('output'): to_proto})
+  dag_pipe_obj.cache = cache
+  return dag_pipe_obj, repeater
+
+
+def _stats_dict(stats):
+  return dict((stat.name, stat.count) for stat in stats)
+
+
+class PipelineCacheTest(absltest.TestCase):
+
+  def testDAGPipelineCache(self):
+    cache_dir = self.create_tempdir().full_path
+    cache = pipeline_cache.PipelineCache(cache_dir, unit_names=['Repeater'])
+
+    dag_pipe_obj, repeater = _make_dag(3, cache)
+    expected = dag_pipe_obj.transform('abc')
+    self.assertEqual(repeater.num_calls, 1)
+    self.assertEqual(
+        _stats_dict(dag_pipe_obj.get_stats()),
+        {'DAGPipeline_Repeater_repeated': 3,
+         'DAGPipeline_Repeater_cache_misses': 1})
+
+    # A new DAG with the same configuration reuses the cached outputs, even
+    # with a new `PipelineCache` instance.
+    cache = pipeline_cache.PipelineCache(cache_dir, unit_names=['Repeater'])
+    dag_pipe_obj, repeater = _make_dag(3, cache)
+    self.assertEqual(expected, dag_pipe_obj.transform('abc'))
+    self.assertCountEqual(
+        expected['output'],
+        [output for _, output in dag_pipe_obj.iter_transform('abc')])
+    self.assertEqual(repeater.num_calls, 0)
+    self.assertEqual(
+        _stats_dict(dag_pipe_obj.get_stats()),
+        {'DAGPipeline_Repeater_repeated': 3,
+         'DAGPipeline_Repeater_cache_hits': 1})
+    self.assertEqual(cache.hits, 2)
+
+    # Changing the unit's configuration or input misses the cache.
+    dag_pipe_obj, repeater = _make_dag(2, cache)
+    dag_pipe_obj.transform('abc')
+    self.assertEqual(repeater.num_calls, 1)
+    dag_pipe_obj.transform('abcd')
+    self.assertEqual(repeater.num_calls, 2)
+    self.assertEqual(cache.misses, 2)
+
+  def testUnitFingerprint(self):
+    self.assertEqual(pipeline_cache.unit_fingerprint(Repeater(3)),
+                     pipeline_cache.unit_fingerprint(Repeater(3)))
+    self.assertNotEqual(pipeline_cache.unit_fingerprint(Repeater(3)),
+                        pipeline_cache.unit_fingerprint(Repeater(4)))
+
+  def testLRUEviction(self):
+    cache_dir = self.create_tempdir().full_path
+    cache = pipeline_cache.PipelineCache(cache_dir, max_size_bytes=2000)
+    repeater = Repeater(1)
+    keys = [cache.make_key(repeater, str(i)) for i in range(3)]
+    value = 'x' * 800
+
+    cache.put(keys[0], value)
+    cache.put(keys[1], value)
+    self.assertIsNotNone(cache.get(keys[0]))
+    cache.put(keys[2], value)
+
+    # keys[1] was the least recently used entry.
+    self.assertIsNone(cache.get(keys[1]))
+    self.assertEqual(cache.get(keys[0]), value)
+    self.assertEqual(cache.get(keys[2]), value)
+    self.assertLessEqual(cache.size_bytes, 2000)
+    self.assertLen(
+        [f for f in os.listdir(cache_dir) if f.endswith('.pkl')], 2)
+
+    # Existing entries are picked up by a new instance.
+    cache = pipeline_cache.PipelineCache(cache_dir, max_size_bytes=2000)
+    self.assertEqual(cache.get(keys[2]), value)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -123,6 +123,37 @@ class PipelineTest(absltest.TestCase):
         set(('serialized:%s_C' % s).encode('utf-8') for s in strings),
         set(dataset_2_reader))
 
+  def testRunPipelineParallel(self):
+    strings = ['abcdefg', 'helloworld!', 'qwerty', 'zxcvb', '12345']
+    root_dir = self.create_tempdir().full_path
+    pipeline.run_pipeline_parallel(
+        MockPipeline(), iter(strings), root_dir, num_workers=2, num_shards=2,
+        ordered=True, batch_size=2)
+
+    dataset_1_paths = [
+        os.path.join(root_dir, 'dataset_1.tfrecord-%05d-of-00002' % shard)
+        for shard in range(2)]
+    dataset_2_paths = [
+        os.path.join(root_dir, 'dataset_2.tfrecord-%05d-of-00002' % shard)
+        for shard in range(2)]
+    for path in dataset_1_paths + dataset_2_paths:
+      self.assertTrue(tf.gfile.Exists(path))
+
+    # Outputs are written in input order and assigned to shards round robin.
+    dataset_1_outputs = []
+    for s in strings:
+      dataset_1_outputs.append(('serialized:%s_A' % s).encode('utf-8'))
+      dataset_1_outputs.append(('serialized:%s_B' % s).encode('utf-8'))
+    dataset_2_outputs = [
+        ('serialized:%s_C' % s).encode('utf-8') for s in strings]
+    for shard in range(2):
+      self.assertEqual(
+          dataset_1_outputs[shard::2],
+          list(tf.python_io.tf_record_iterator(dataset_1_paths[shard])))
+      self.assertEqual(
+          dataset_2_outputs[shard::2],
+          list(tf.python_io.tf_record_iterator(dataset_2_paths[shard])))
+
   def testPipelineIterator(self):
     strings = ['abcdefg', 'helloworld!', 'qwerty']
     result = pipeline.load_pipeline(MockPipeline(), iter(strings))
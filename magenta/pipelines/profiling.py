@@ -0,0 +1,221 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-unit profiling for pipeline runs.
+
+A `PipelineProfiler` records how long each `Pipeline` spends in `transform`,
+how many times it is called, and how many objects it produces. Give one to
+`run_pipeline_serial` to time the whole pipeline, and set it as the `profiler`
+attribute of a `DAGPipeline` to time each unit in the DAG:
+
+  profiler = profiling.PipelineProfiler(trace=True)
+  dag_pipeline_instance.profiler = profiler
+  pipeline.run_pipeline_serial(dag_pipeline_instance, inputs, output_dir,
+                               profiler=profiler)
+  profiler.write_chrome_trace('/tmp/trace.json')
+"""
+
+import json
+import os
+
+import tensorflow.compat.v1 as tf
+
+
+def count_outputs(outputs):
+  """Returns the number of objects in the return value of `transform`.
+
+  Args:
+    outputs: A list of objects, or a dictionary mapping names to lists of
+        objects. Anything else counts as zero objects.
+
+  Returns:
+    The total number of objects in `outputs`.
+  """
+  if isinstance(outputs, dict):
+    return sum(len(value) for value in outputs.values()
+               if isinstance(value, list))
+  if isinstance(outputs, list):
+    return len(outputs)
+  return 0
+
+
+class UnitProfile(object):
+  """Timing and fan-out measurements for a single pipeline unit.
+
+  Attributes:
+    name: String name of the unit.
+    calls: Number of calls to the unit's `transform`.
+    outputs: Total number of objects the unit produced.
+    total_time: Total wall time in seconds spent in `transform`.
+    max_time: Longest wall time in seconds of a single `transform` call.
+    peak_objects: The largest number of the unit's outputs held at once. For
+        `DAGPipeline.transform` this is all of the unit's outputs for one DAG
+        input, otherwise the outputs of a single call.
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.calls = 0
+    self.outputs = 0
+    self.total_time = 0.0
+    self.max_time = 0.0
+    self.peak_objects = 0
+
+  @property
+  def mean_time(self):
+    """Mean wall time in seconds of a `transform` call."""
+    return self.total_time / self.calls if self.calls else 0.0
+
+  @property
+  def fan_out(self):
+    """Mean number of outputs produced per input."""
+    return float(self.outputs) / self.calls if self.calls else 0.0
+
+  def merge_from(self, other):
+    """Adds the measurements of another `UnitProfile` into this instance."""
+    self.calls += other.calls
+    self.outputs += other.outputs
+    self.total_time += other.total_time
+    self.max_time = max(self.max_time, other.max_time)
+    self.peak_objects = max(self.peak_objects, other.peak_objects)
+
+  def to_dict(self):
+    return {
+        'name': self.name,
+        'calls': self.calls,
+        'outputs': self.outputs,
+        'fan_out': self.fan_out,
+        'total_time_secs': self.total_time,
+        'mean_time_secs': self.mean_time,
+        'max_time_secs': self.max_time,
+        'peak_objects': self.peak_objects,
+    }
+
+
+class PipelineProfiler(object):
+  """Records per-unit wall time, call counts and fan-out of pipeline runs."""
+
+  def __init__(self, trace=False, max_trace_events=1000000):
+    """Constructs a `PipelineProfiler`.
+
+    Args:
+      trace: If True, every recorded call is also kept as a trace event that
+          can be written with `write_chrome_trace`.
+      max_trace_events: The maximum number of trace events to keep. Calls
+          recorded after this many events are only included in the totals.
+    """
+    self._profiles = {}
+    self._trace = trace
+    self._max_trace_events = max_trace_events
+    self._trace_events = []
+
+  def _get_profile(self, unit_name):
+    profile = self._profiles.get(unit_name)
+    if profile is None:
+      profile = self._profiles[unit_name] = UnitProfile(unit_name)
+    return profile
+
+  def record_call(self, unit_name, start_time, duration, num_outputs):
+    """Records a single call to a unit's `transform`.
+
+    Args:
+      unit_name: String name of the unit.
+      start_time: Time in seconds since the epoch at which the call started.
+      duration: Wall time in seconds the call took.
+      num_outputs: Number of objects the call produced.
+    """
+    profile = self._get_profile(unit_name)
+    profile.calls += 1
+    profile.outputs += num_outputs
+    profile.total_time += duration
+    profile.max_time = max(profile.max_time, duration)
+    profile.peak_objects = max(profile.peak_objects, num_outputs)
+    if self._trace and len(self._trace_events) < self._max_trace_events:
+      self._trace_events.append((unit_name, start_time, duration, num_outputs))
+
+  def record_objects(self, unit_name, num_objects):
+    """Records that `num_objects` outputs of a unit are held at once.
+
+    Args:
+      unit_name: String name of the unit.
+      num_objects: Number of the unit's outputs held in memory.
+    """
+    profile = self._get_profile(unit_name)
+    profile.peak_objects = max(profile.peak_objects, num_objects)
+
+  def profiles(self):
+    """Returns a list of `UnitProfile` objects sorted by total time."""
+    return sorted(self._profiles.values(), key=lambda p: p.total_time,
+                  reverse=True)
+
+  def merge_from(self, other):
+    """Adds the measurements and trace events of another profiler."""
+    for profile in other.profiles():
+      self._get_profile(profile.name).merge_from(profile)
+    if self._trace:
+      room = self._max_trace_events - len(self._trace_events)
+      self._trace_events.extend(other._trace_events[:max(room, 0)])  # pylint:disable=protected-access
+
+  def log(self, logger_fn=tf.logging.info):
+    """Calls the given logger function on a summary line for each unit.
+
+    Args:
+      logger_fn: The function which will be called on the string summary of
+          each unit, slowest unit first.
+    """
+    profiles = self.profiles()
+    if not profiles:
+      return
+    # The outermost pipeline's time includes all of its units, so percentages
+    # are relative to the slowest entry.
+    reference_time = profiles[0].total_time or 1.0
+    for profile in profiles:
+      logger_fn(
+          '%s profile: calls=%d time=%.3fs (%.1f%%) mean=%.3fms max=%.3fms '
+          'outputs=%d fan_out=%.2f peak_objects=%d' % (
+              profile.name, profile.calls, profile.total_time,
+              100.0 * profile.total_time / reference_time,
+              1000.0 * profile.mean_time, 1000.0 * profile.max_time,
+              profile.outputs, profile.fan_out, profile.peak_objects))
+
+  def to_dict(self):
+    """Returns the measurements of every unit as a JSON serializable dict."""
+    return {'units': [profile.to_dict() for profile in self.profiles()]}
+
+  def write_json(self, path):
+    """Writes the measurements of every unit to a JSON file.
+
+    Args:
+      path: Path of the file to write.
+    """
+    with tf.gfile.GFile(path, 'w') as f:
+      json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+  def write_chrome_trace(self, path):
+    """Writes recorded calls in the Chrome trace event format.
+
+    The file can be opened with chrome://tracing or Perfetto. Only calls
+    recorded while `trace` was enabled are included.
+
+    Args:
+      path: Path of the file to write.
+    """
+    pid = os.getpid()
+    events = [
+        {'name': unit_name, 'cat': 'pipeline', 'ph': 'X', 'pid': pid,
+         'tid': 0, 'ts': start_time * 1e6, 'dur': duration * 1e6,
+         'args': {'outputs': num_outputs}}
+        for unit_name, start_time, duration, num_outputs in self._trace_events]
+    with tf.gfile.GFile(path, 'w') as f:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
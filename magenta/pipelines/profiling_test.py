@@ -0,0 +1,132 @@
+# Copyright 2020 The Magenta Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for profiling."""
+
+import json
+import os
+
+from absl.testing import absltest
+from magenta.common import testing_lib
+from magenta.pipelines import dag_pipeline
+from magenta.pipelines import pipeline
+from magenta.pipelines import profiling
+
+MockStringProto = testing_lib.MockStringProto  # pylint: disable=invalid-name
+
+
+class Repeater(pipeline.Pipeline):
+
+  def __init__(self):
+    super(Repeater, self).__init__(input_type=str, output_type=str)
+
+  def transform(self, input_object):
+    return [input_object + str(i) for i in range(len(input_object))]
+
+
+class ToProto(pipeline.Pipeline):
+
+  def __init__(self):
+    super(ToProto, self).__init__(input_type=str, output_type=MockStringProto)
+
+  def transform(self, input_object):
+    return [MockStringProto(input_object)]
+
+
+class ProfilingTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ProfilingTest, self).setUp()
+    repeater, to_proto = Repeater(), ToProto()
+    self.dag_pipe_obj = dag_pipeline.DAGPipeline(
+        {repeater: dag_pipeline.DagInput(str),
+         to_proto: repeater,
+         dag_pipeline.DagOutput('output'): to_proto},
+        'Profiled')
+
+  def testCountOutputs(self):
+    self.assertEqual(profiling.count_outputs([1, 2, 3]), 3)
+    self.assertEqual(profiling.count_outputs({'a': [1], 'b': [2, 3]}), 3)
+    self.assertEqual(profiling.count_outputs(None), 0)
+
+  def testDAGPipelineProfile(self):
+    profiler = profiling.PipelineProfiler(trace=True)
+    self.dag_pipe_obj.profiler = profiler
+    self.dag_pipe_obj.transform('abc')
+    list(self.dag_pipe_obj.iter_transform('abcd'))
+
+    profiles = dict((p.name, p) for p in profiler.profiles())
+    self.assertEqual(set(profiles.keys()), set(['Repeater', 'ToProto']))
+    self.assertEqual(profiles['Repeater'].calls, 2)
+    self.assertEqual(profiles['Repeater'].outputs, 7)
+    self.assertEqual(profiles['Repeater'].fan_out, 3.5)
+    self.assertEqual(profiles['Repeater'].peak_objects, 4)
+    self.assertEqual(profiles['ToProto'].calls, 7)
+    self.assertEqual(profiles['ToProto'].outputs, 7)
+    # `transform` holds all 3 of ToProto's outputs for 'abc' at once.
+    self.assertEqual(profiles['ToProto'].peak_objects, 3)
+
+    log_lines = []
+    profiler.log(log_lines.append)
+    self.assertLen(log_lines, 2)
+    self.assertTrue(all('calls=' in line for line in log_lines))
+
+    other = profiling.PipelineProfiler()
+    other.record_call('Repeater', 0.0, 1.5, 10)
+    profiler.merge_from(other)
+    profiles = dict((p.name, p) for p in profiler.profiles())
+    self.assertEqual(profiles['Repeater'].calls, 3)
+    self.assertEqual(profiles['Repeater'].peak_objects, 10)
+    self.assertEqual(profiler.profiles()[0].name, 'Repeater')
+
+  def testRunPipelineSerialProfile(self):
+    profiler = profiling.PipelineProfiler(trace=True)
+    self.dag_pipe_obj.profiler = profiler
+    root_dir = self.create_tempdir().full_path
+    pipeline.run_pipeline_serial(
+        self.dag_pipe_obj, iter(['ab', 'cde']), root_dir, profiler=profiler)
+
+    profiles = dict((p.name, p) for p in profiler.profiles())
+    self.assertEqual(profiles['Profiled'].calls, 2)
+    self.assertEqual(profiles['Profiled'].outputs, 5)
+    self.assertEqual(profiles['ToProto'].calls, 5)
+
+    json_path = os.path.join(root_dir, 'profile.json')
+    profiler.write_json(json_path)
+    with open(json_path) as f:
+      units = json.load(f)['units']
+    self.assertEqual(
+        set(unit['name'] for unit in units),
+        set(['Profiled', 'Repeater', 'ToProto']))
+
+    trace_path = os.path.join(root_dir, 'trace.json')
+    profiler.write_chrome_trace(trace_path)
+    with open(trace_path) as f:
+      events = json.load(f)['traceEvents']
+    self.assertLen(events, 2 + 2 + 5)
+    self.assertTrue(all(event['ph'] == 'X' for event in events))
+
+  def testMaxTraceEvents(self):
+    profiler = profiling.PipelineProfiler(trace=True, max_trace_events=2)
+    for _ in range(5):
+      profiler.record_call('unit', 0.0, 0.1, 1)
+    trace_path = os.path.join(self.create_tempdir().full_path, 'trace.json')
+    profiler.write_chrome_trace(trace_path)
+    with open(trace_path) as f:
+      self.assertLen(json.load(f)['traceEvents'], 2)
+    self.assertEqual(profiler.profiles()[0].calls, 5)
+
+
+if __name__ == '__main__':
+  absltest.main()
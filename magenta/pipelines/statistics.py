@@ -125,11 +125,91 @@ def merge_statistics(stats_list):
   return list(name_map.values())
 
 
+class StatisticsAccumulator(object):
+  """A mutable collection of `Statistic` objects indexed by name.
+
+  `merge_statistics` rebuilds its whole output on every call, so using it to
+  keep a running total over many calls to `transform` costs time proportional
+  to the number of Statistics accumulated so far. A `StatisticsAccumulator`
+  holds one `Statistic` per name and merges new Statistics into it in place.
+
+  The first `Statistic` seen for each name is copied, so Statistics owned by
+  a `Pipeline` are never modified by the accumulator. Accumulators can be
+  pickled, so an accumulator filled in one process can be sent to another and
+  merged there.
+  """
+
+  def __init__(self, stats=None):
+    """Constructs a `StatisticsAccumulator`.
+
+    Args:
+      stats: An optional iterable of `Statistic` objects to start with.
+    """
+    self._stats = {}
+    if stats is not None:
+      self.merge(stats)
+
+  def add(self, stat):
+    """Merges a single `Statistic` into the accumulator.
+
+    Args:
+      stat: A `Statistic` object.
+
+    Raises:
+      MergeStatisticsError: If `stat` is not a `Statistic`, or cannot be merged
+          with the accumulated `Statistic` of the same name.
+    """
+    if not isinstance(stat, Statistic):
+      raise MergeStatisticsError(
+          'Cannot merge with non-Statistic of type %s' % type(stat))
+    existing = self._stats.get(stat.name)
+    if existing is None:
+      self._stats[stat.name] = stat.copy()
+    else:
+      existing.merge_from(stat)
+
+  def merge(self, stats):
+    """Merges an iterable of `Statistic` objects into the accumulator.
+
+    Args:
+      stats: An iterable of `Statistic` objects, such as a list returned by
+          `Pipeline.get_stats` or another `StatisticsAccumulator`.
+    """
+    for stat in stats:
+      self.add(stat)
+
+  def snapshot(self):
+    """Returns a list of copies of the accumulated Statistics.
+
+    Later merges into the accumulator do not change the returned Statistics.
+
+    Returns:
+      A list of `Statistic` objects. Each name appears only once.
+    """
+    return [stat.copy() for stat in self._stats.values()]
+
+  def clear(self):
+    """Removes all accumulated Statistics."""
+    self._stats.clear()
+
+  def __getitem__(self, name):
+    return self._stats[name]
+
+  def __contains__(self, name):
+    return name in self._stats
+
+  def __iter__(self):
+    return iter(self._stats.values())
+
+  def __len__(self):
+    return len(self._stats)
+
+
 def log_statistics_list(stats_list, logger_fn=tf.logging.info):
   """Calls the given logger function on each `Statistic` in the list.
 
   Args:
-    stats_list: A list of `Statistic` objects.
+    stats_list: A list of `Statistic` objects or a `StatisticsAccumulator`.
     logger_fn: The function which will be called on the string representation
         of each `Statistic`.
   """
@@ -269,4 +349,6 @@ class Histogram(Statistic):
          if self.verbose_pretty_print or self.counters[lower]])
 
   def copy(self):
-    return copy.copy(self)
+    stat_copy = copy.copy(self)
+    stat_copy.counters = dict(self.counters)
+    return stat_copy
@@ -94,6 +94,55 @@ class StatisticsTest(absltest.TestCase):
     with self.assertRaises(statistics.MergeStatisticsError):
       counter_1.merge_from(counter_2)
 
+  def testHistogramCopyIsIndependent(self):
+    histo = statistics.Histogram('name_123', [1, 2])
+    histo_copy = histo.copy()
+    histo_copy.increment(1)
+    self.assertEqual(histo.counters, {float('-inf'): 0, 1: 0, 2: 0})
+    self.assertEqual(histo_copy.counters, {float('-inf'): 0, 1: 1, 2: 0})
+
+  def testStatisticsAccumulator(self):
+    counter_1 = statistics.Counter('counter_1', 3)
+    histo = statistics.Histogram('histo', [0, 10])
+    histo.increment(5)
+
+    accumulator = statistics.StatisticsAccumulator([counter_1, histo])
+    accumulator.merge([statistics.Counter('counter_1', 2),
+                       statistics.Counter('counter_2', 7)])
+    accumulator.add(histo)
+
+    self.assertLen(accumulator, 3)
+    self.assertIn('counter_2', accumulator)
+    self.assertEqual(accumulator['counter_1'].count, 5)
+    self.assertEqual(accumulator['counter_2'].count, 7)
+    self.assertEqual(accumulator['histo'].counters,
+                     {float('-inf'): 0, 0: 2, 10: 0})
+
+    # Statistics given to the accumulator are not modified.
+    self.assertEqual(counter_1.count, 3)
+    self.assertEqual(histo.counters, {float('-inf'): 0, 0: 1, 10: 0})
+
+    snapshot = accumulator.snapshot()
+    accumulator.add(statistics.Counter('counter_1', 10))
+    self.assertEqual(
+        sorted((stat.name, str(stat)) for stat in snapshot
+               if isinstance(stat, statistics.Counter)),
+        [('counter_1', 'counter_1: 5'), ('counter_2', 'counter_2: 7')])
+    self.assertEqual(accumulator['counter_1'].count, 15)
+
+    other = statistics.StatisticsAccumulator(
+        [statistics.Counter('counter_2', 1)])
+    accumulator.merge(other)
+    self.assertEqual(accumulator['counter_2'].count, 8)
+
+    with self.assertRaises(statistics.MergeStatisticsError):
+      accumulator.add(statistics.Histogram('counter_1', [0]))
+    with self.assertRaises(statistics.MergeStatisticsError):
+      accumulator.add(5)
+
+    accumulator.clear()
+    self.assertEmpty(accumulator)
+
 
 if __name__ == '__main__':
   absltest.main()
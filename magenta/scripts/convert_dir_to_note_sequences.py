@@ -22,9 +22,15 @@ Example usage:
     --input_dir=/path/to/input/dir \
     --output_file=/path/to/tfrecord/file \
     --log=INFO
+
+To convert files in parallel, pass --num_workers. The output is then written to
+TFRecord shards named <output_file>-00000, <output_file>-00001, etc. Pass
+--manifest_file to make the conversion resumable: files already listed in the
+manifest by a previous run are skipped.
 """
 
 import hashlib
+import multiprocessing
 import os
 
 from note_seq import abc_parser
@@ -41,6 +47,18 @@ tf.app.flags.DEFINE_string('output_file', None,
                            'if it already exists.')
 tf.app.flags.DEFINE_bool('recursive', False,
                          'Whether or not to recurse into subdirectories.')
+tf.app.flags.DEFINE_integer('num_workers', 1,
+                            'Number of worker processes converting files. If '
+                            'greater than 1, or if --manifest_file is given, '
+                            'output is written to TFRecord shards.')
+tf.app.flags.DEFINE_integer('files_per_shard', 1000,
+                            'Number of input files whose NoteSequences are '
+                            'written to each output shard.')
+tf.app.flags.DEFINE_string('manifest_file', None,
+                           'Path to a manifest of converted files. Files '
+                           'listed in it are skipped, and newly converted '
+                           'files are added to it, so an interrupted '
+                           'conversion can be resumed.')
 tf.app.flags.DEFINE_string('log', 'INFO',
                            'The threshold for what messages will be logged '
                            'DEBUG, INFO, WARN, ERROR, or FATAL.')
@@ -65,6 +83,47 @@ def generate_note_sequence_id(filename, collection_name, source_type):
       source_type.lower(), collection_name, filename_fingerprint.hexdigest())
 
 
+def _get_converter(full_file_path):
+  """Returns the conversion function for a file based on its extension.
+
+  Args:
+    full_file_path: The path to the file to convert.
+
+  Returns:
+    One of `convert_midi`, `convert_musicxml` or `convert_abc`, or None if the
+    file type is not supported.
+  """
+  lower_file_path = full_file_path.lower()
+  if lower_file_path.endswith('.mid') or lower_file_path.endswith('.midi'):
+    return convert_midi
+  if lower_file_path.endswith('.xml') or lower_file_path.endswith('.mxl'):
+    return convert_musicxml
+  if lower_file_path.endswith('.abc'):
+    return convert_abc
+  return None
+
+
+def convert_file(root_dir, sub_dir, full_file_path):
+  """Converts a single file to NoteSequence protos.
+
+  Args:
+    root_dir: A string specifying the root directory for the files being
+        converted.
+    sub_dir: The directory being converted currently.
+    full_file_path: the full path to the file to convert. It must have a
+        supported extension.
+
+  Returns:
+    A list of NoteSequence protos, empty if the file could not be converted.
+  """
+  sequences = _get_converter(full_file_path)(root_dir, sub_dir, full_file_path)
+  if not sequences:
+    return []
+  if not isinstance(sequences, list):
+    sequences = [sequences]
+  return sequences
+
+
 def convert_files(root_dir, sub_dir, writer, recursive=False):
   """Converts files.
 
@@ -88,33 +147,14 @@ def convert_files(root_dir, sub_dir, writer, recursive=False):
     tf.logging.log_every_n(tf.logging.INFO, '%d files converted.',
                            1000, written_count)
     full_file_path = os.path.join(dir_to_convert, file_in_dir)
-    if (full_file_path.lower().endswith('.mid') or
-        full_file_path.lower().endswith('.midi')):
-      try:
-        sequence = convert_midi(root_dir, sub_dir, full_file_path)
-      except Exception as exc:  # pylint: disable=broad-except
-        tf.logging.fatal('%r generated an exception: %s', full_file_path, exc)
-        continue
-      if sequence:
-        writer.write(sequence.SerializeToString())
-    elif (full_file_path.lower().endswith('.xml') or
-          full_file_path.lower().endswith('.mxl')):
+    if _get_converter(full_file_path) is not None:
       try:
-        sequence = convert_musicxml(root_dir, sub_dir, full_file_path)
+        sequences = convert_file(root_dir, sub_dir, full_file_path)
       except Exception as exc:  # pylint: disable=broad-except
         tf.logging.fatal('%r generated an exception: %s', full_file_path, exc)
         continue
-      if sequence:
+      for sequence in sequences:
         writer.write(sequence.SerializeToString())
-    elif full_file_path.lower().endswith('.abc'):
-      try:
-        sequences = convert_abc(root_dir, sub_dir, full_file_path)
-      except Exception as exc:  # pylint: disable=broad-except
-        tf.logging.fatal('%r generated an exception: %s', full_file_path, exc)
-        continue
-      if sequences:
-        for sequence in sequences:
-          writer.write(sequence.SerializeToString())
     else:
       if recursive and tf.gfile.IsDirectory(full_file_path):
         recurse_sub_dirs.append(os.path.join(sub_dir, file_in_dir))
@@ -126,6 +166,36 @@ def convert_files(root_dir, sub_dir, writer, recursive=False):
     convert_files(root_dir, recurse_sub_dir, writer, recursive)
 
 
+def _list_files(root_dir, sub_dir, recursive=False):
+  """Generator over the files with a converter under a directory.
+
+  Args:
+    root_dir: A string specifying a root directory.
+    sub_dir: A string specifying a path to a directory under `root_dir` in which
+        to list files.
+    recursive: A boolean specifying whether or not to list files contained in
+        subdirectories of the specified directory.
+
+  Yields:
+    (sub_dir, full_file_path) tuples for each file that can be converted.
+  """
+  dir_to_convert = os.path.join(root_dir, sub_dir)
+  recurse_sub_dirs = []
+  for file_in_dir in tf.gfile.ListDirectory(dir_to_convert):
+    full_file_path = os.path.join(dir_to_convert, file_in_dir)
+    if _get_converter(full_file_path) is not None:
+      yield sub_dir, full_file_path
+    elif recursive and tf.gfile.IsDirectory(full_file_path):
+      recurse_sub_dirs.append(os.path.join(sub_dir, file_in_dir))
+    else:
+      tf.logging.warning(
+          'Unable to find a converter for file %s', full_file_path)
+
+  for recurse_sub_dir in recurse_sub_dirs:
+    for sub_dir_and_path in _list_files(root_dir, recurse_sub_dir, recursive):
+      yield sub_dir_and_path
+
+
 def convert_midi(root_dir, sub_dir, full_file_path):
   """Converts a midi file to a sequence proto.
 
@@ -236,6 +306,179 @@ def convert_directory(root_dir, output_file, recursive=False):
     convert_files(root_dir, '', writer, recursive)
 
 
+def read_manifest(manifest_file):
+  """Reads a manifest written by `convert_directory_parallel`.
+
+  Each line of the manifest holds the tab separated shard index, the SHA-1 hash
+  of the converted file's contents, and the path of the converted file relative
+  to the root directory.
+
+  Args:
+    manifest_file: Path to the manifest file.
+
+  Returns:
+    A tuple (converted_files, next_shard), where `converted_files` is a set of
+    (filename, file sha1) tuples, and `next_shard` is the index of the first
+    shard not referenced by the manifest.
+  """
+  converted_files = set()
+  next_shard = 0
+  if tf.gfile.Exists(manifest_file):
+    with tf.gfile.GFile(manifest_file, 'r') as f:
+      for line in f:
+        line = line.rstrip('\n')
+        if not line:
+          continue
+        shard, file_hash, filename = line.split('\t', 2)
+        converted_files.add((filename, file_hash))
+        next_shard = max(next_shard, int(shard) + 1)
+  return converted_files, next_shard
+
+
+class _ShardedWriter(object):
+  """Writes converted NoteSequences to TFRecord shards.
+
+  Each shard holds the NoteSequences of up to `files_per_shard` input files.
+  Input files are added to the manifest only once their shard has been closed,
+  so every file listed in the manifest is fully written to a complete shard.
+  A shard left incomplete by an interrupted run is overwritten when resuming.
+  """
+
+  def __init__(self, output_file, files_per_shard, first_shard, manifest):
+    self._output_file = output_file
+    self._files_per_shard = files_per_shard
+    self._shard = first_shard
+    self._manifest = manifest
+    self._writer = None
+    self._shard_files = []
+
+  def add(self, filename, file_hash, serialized_sequences):
+    """Writes the serialized NoteSequences converted from a single file."""
+    if self._writer is None:
+      self._writer = tf.io.TFRecordWriter(
+          '%s-%05d' % (self._output_file, self._shard))
+    for serialized_sequence in serialized_sequences:
+      self._writer.write(serialized_sequence)
+    self._shard_files.append((filename, file_hash))
+    if len(self._shard_files) >= self._files_per_shard:
+      self._close_shard()
+
+  def _close_shard(self):
+    self._writer.close()
+    self._writer = None
+    if self._manifest is not None:
+      for filename, file_hash in self._shard_files:
+        self._manifest.write('%d\t%s\t%s\n' % (self._shard, file_hash,
+                                                filename))
+      self._manifest.flush()
+    self._shard_files = []
+    self._shard += 1
+
+  def close(self):
+    if self._writer is not None:
+      self._close_shard()
+
+
+# Set of (filename, file sha1) tuples already converted, owned by each worker
+# process of `convert_directory_parallel`.
+_converted_files = None
+
+
+def _init_conversion_worker(converted_files):
+  global _converted_files
+  _converted_files = converted_files
+
+
+def _convert_file_in_worker(root_dir_sub_dir_and_path):
+  """Converts a single file in a worker process.
+
+  Args:
+    root_dir_sub_dir_and_path: A (root_dir, sub_dir, full_file_path) tuple.
+
+  Returns:
+    A tuple (filename, file_hash, serialized_sequences). `serialized_sequences`
+    is None if the file was already converted, and `file_hash` is None if
+    conversion failed.
+  """
+  root_dir, sub_dir, full_file_path = root_dir_sub_dir_and_path
+  filename = os.path.join(sub_dir, os.path.basename(full_file_path))
+  try:
+    with tf.gfile.GFile(full_file_path, 'rb') as f:
+      file_hash = hashlib.sha1(f.read()).hexdigest()
+    if (filename, file_hash) in _converted_files:
+      return filename, file_hash, None
+    sequences = convert_file(root_dir, sub_dir, full_file_path)
+  except Exception as exc:  # pylint: disable=broad-except
+    tf.logging.error('%r generated an exception: %s', full_file_path, exc)
+    return filename, None, []
+  return (filename, file_hash,
+          [sequence.SerializeToString() for sequence in sequences])
+
+
+def convert_directory_parallel(root_dir, output_file, recursive=False,
+                               num_workers=None, files_per_shard=1000,
+                               manifest_file=None):
+  """Converts files to NoteSequences using a pool of worker processes.
+
+  Like `convert_directory`, but files are converted by `num_workers` worker
+  processes and the NoteSequences are written to TFRecord shards named
+  `<output_file>-00000`, `<output_file>-00001`, etc.
+
+  If `manifest_file` is given, every converted file is recorded in it along
+  with the SHA-1 hash of its contents. Files whose path and contents match an
+  entry already in the manifest are skipped, and new shards are numbered after
+  the ones referenced by the manifest, so rerunning an interrupted conversion
+  with the same arguments converts only the remaining files.
+
+  Args:
+    root_dir: A string specifying a root directory.
+    output_file: Path prefix of the TFRecord shards to write results to.
+    recursive: A boolean specifying whether or not recursively convert files
+        contained in subdirectories of the specified directory.
+    num_workers: Number of worker processes. If None, the number of CPUs is
+        used.
+    files_per_shard: Number of input files whose NoteSequences are written to
+        each shard.
+    manifest_file: Optional path to the manifest of converted files.
+  """
+  converted_files, first_shard = set(), 0
+  manifest = None
+  if manifest_file:
+    converted_files, first_shard = read_manifest(manifest_file)
+    manifest = tf.gfile.GFile(manifest_file, 'a')
+  if converted_files:
+    tf.logging.info('Skipping %d files already converted according to %s.',
+                    len(converted_files), manifest_file)
+
+  writer = _ShardedWriter(output_file, files_per_shard, first_shard, manifest)
+  converted_count = 0
+  skipped_count = 0
+  try:
+    with multiprocessing.Pool(num_workers,
+                              initializer=_init_conversion_worker,
+                              initargs=(converted_files,)) as pool:
+      work = ((root_dir, sub_dir, full_file_path)
+              for sub_dir, full_file_path in _list_files(
+                  root_dir, '', recursive))
+      for filename, file_hash, serialized_sequences in pool.imap_unordered(
+          _convert_file_in_worker, work, chunksize=16):
+        if serialized_sequences is None:
+          skipped_count += 1
+          continue
+        if file_hash is None:
+          continue
+        writer.add(filename, file_hash, serialized_sequences)
+        converted_count += 1
+        tf.logging.log_every_n(tf.logging.INFO, '%d files converted.',
+                               1000, converted_count)
+  finally:
+    writer.close()
+    if manifest is not None:
+      manifest.close()
+  tf.logging.info('Converted %d files. Skipped %d already converted files.',
+                  converted_count, skipped_count)
+
+
 def main(unused_argv):
   tf.logging.set_verbosity(FLAGS.log)
 
@@ -253,7 +496,17 @@ def main(unused_argv):
   if output_dir:
     tf.gfile.MakeDirs(output_dir)
 
-  convert_directory(input_dir, output_file, FLAGS.recursive)
+  if FLAGS.num_workers > 1 or FLAGS.manifest_file:
+    manifest_file = FLAGS.manifest_file
+    if manifest_file:
+      manifest_file = os.path.expanduser(manifest_file)
+    convert_directory_parallel(
+        input_dir, output_file, FLAGS.recursive,
+        num_workers=FLAGS.num_workers,
+        files_per_shard=FLAGS.files_per_shard,
+        manifest_file=manifest_file)
+  else:
+    convert_directory(input_dir, output_file, FLAGS.recursive)
 
 
 def console_entry_point():
@@ -105,6 +105,45 @@ class ConvertMidiDirToSequencesTest(tf.test.TestCase):
     self.runTest('sub_1/sub', recursive=True)
     self.runTest('sub_2', recursive=True)
 
+  def _read_shards(self, output_prefix):
+    filenames = []
+    for path in tf.gfile.Glob(output_prefix + '-*'):
+      for serialized_sequence in tf.python_io.tf_record_iterator(path):
+        sequence = music_pb2.NoteSequence.FromString(serialized_sequence)
+        self.assertNotEqual(0, len(sequence.notes))
+        filenames.append(sequence.filename)
+    return filenames
+
+  def testConvertDirectoryParallel(self):
+    output_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    output_prefix = os.path.join(output_dir, 'notesequences.tfrecord')
+    manifest_file = os.path.join(output_dir, 'manifest.tsv')
+
+    convert_dir_to_note_sequences.convert_directory_parallel(
+        self.root_dir, output_prefix, recursive=True, num_workers=2,
+        files_per_shard=4, manifest_file=manifest_file)
+    expected_filenames = [
+        'midi_1.mid', 'midi_2.mid', 'sub_1/midi_3.mid', 'sub_2/midi_3.mid',
+        'sub_2/midi_4.mid', 'sub_1/sub/midi_5.mid']
+    self.assertCountEqual(expected_filenames, self._read_shards(output_prefix))
+    self.assertLen(tf.gfile.Glob(output_prefix + '-*'), 2)
+    converted_files, next_shard = (
+        convert_dir_to_note_sequences.read_manifest(manifest_file))
+    self.assertCountEqual(expected_filenames,
+                          [filename for filename, _ in converted_files])
+    self.assertEqual(2, next_shard)
+
+    # Resuming converts only files not already in the manifest.
+    midi_filename = os.path.join(tf.resource_loader.get_data_files_path(),
+                                 '../testdata/example.mid')
+    tf.gfile.Copy(midi_filename, os.path.join(self.root_dir, 'midi_6.mid'))
+    convert_dir_to_note_sequences.convert_directory_parallel(
+        self.root_dir, output_prefix, recursive=True, num_workers=2,
+        files_per_shard=4, manifest_file=manifest_file)
+    self.assertCountEqual(expected_filenames + ['midi_6.mid'],
+                          self._read_shards(output_prefix))
+    self.assertLen(tf.gfile.Glob(output_prefix + '-*'), 3)
+
 
 if __name__ == '__main__':
   tf.test.main()
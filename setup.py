@@ -99,7 +99,9 @@ CONSOLE_SCRIPTS = [
     'magenta.models.onsets_frames_transcription.onsets_frames_transcription_infer',
     'magenta.models.onsets_frames_transcription.onsets_frames_transcription_train',
     'magenta.models.onsets_frames_transcription.onsets_frames_transcription_transcribe',
+    'magenta.models.onsets_frames_transcription.onsets_frames_transcription_warm_spectrogram_cache',
     'magenta.models.onsets_frames_transcription.realtime.onsets_frames_transcription_realtime',
+    'magenta.models.onsets_frames_transcription.realtime.onsets_frames_transcription_realtime_benchmark',
     'magenta.models.performance_rnn.performance_rnn_create_dataset',
     'magenta.models.performance_rnn.performance_rnn_generate',
     'magenta.models.performance_rnn.performance_rnn_train',